@@ -0,0 +1,293 @@
+"""Connection admission in front of the SSH honeypot.
+
+Every accepted connection is counted per source address and per source network
+(/24 for IPv4, /48 for IPv6, whose single "address" is the /64) in a sliding
+window. The busier of the two picks the policy: accept and log, sample 1-in-N,
+tarpit (hold the socket open and drip junk banner lines) or drop. Connections
+that are not accepted are only counted, per network, and reported in aggregate.
+"""
+import heapq
+import logging
+import os
+import random
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ACCEPT = 'accept'
+SAMPLED_OUT = 'sampled_out'
+TARPIT = 'tarpit'
+DROP = 'drop'
+ACTIONS = (ACCEPT, SAMPLED_OUT, TARPIT, DROP)
+
+IPV6_TAG = 1 << 128  # keeps IPv6 keys apart from IPv4 ones in the same tables
+
+def address_keys(ip):
+    """Integer keys (source, network) for an address string"""
+    try:
+        return _ipv4_keys(socket.inet_pton(socket.AF_INET, ip))
+    except OSError:
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, ip)
+    except OSError:
+        return None, None
+    if packed[:12] == b'\x00' * 10 + b'\xff\xff':
+        return _ipv4_keys(packed[12:])  # IPv4-mapped, as dual-stack listeners report them
+    value = int.from_bytes(packed, 'big')
+    return IPV6_TAG | value >> 64, IPV6_TAG | value >> 80
+
+def _ipv4_keys(packed):
+    value = int.from_bytes(packed, 'big')
+    return value, value >> 8
+
+def network_label(ip):
+    """Human-readable network of an address, matching the keys used for counting"""
+    if ':' in ip and not ip.startswith('::ffff:'):
+        try:
+            packed = socket.inet_pton(socket.AF_INET6, ip)
+        except OSError:
+            return ip
+        return socket.inet_ntop(socket.AF_INET6, packed[:6] + bytes(10)) + '/48'
+    return ip.rsplit(':', 1)[-1].rsplit('.', 1)[0] + '.0/24'
+
+class SlidingWindowCounter:
+    """Approximate per-key event counts over a sliding window
+
+    Counts live in two plain dicts, one per fixed window: the current one and the
+    one before. The sliding count is current + previous weighted by how much of
+    the previous window still overlaps. When a window ends the older dict is
+    dropped whole, so idle keys disappear without any per-key expiry, and a full
+    current dict stops admitting new keys (hit() returns None for them) instead
+    of growing: memory is bounded by two windows of at most capacity keys each.
+    """
+
+    def __init__(self, window=60.0, capacity=100000, clock=time.monotonic):
+        self.window = window
+        self.capacity = capacity
+        self.clock = clock
+        self.index = int(clock() // window)
+        self.current = {}
+        self.previous = {}
+        self.untracked = 0  # hits on new keys while the table was full
+
+    def _roll(self, now):
+        index = int(now // self.window)
+        if index != self.index:
+            self.previous = self.current if index == self.index + 1 else {}
+            self.current = {}
+            self.index = index
+        return now / self.window - index  # fraction of the current window elapsed
+
+    def hit(self, key):
+        """Count one event for key; returns its sliding-window count, or None if the table is full"""
+        elapsed = self._roll(self.clock())
+        count = self.current.get(key)
+        if count is None:
+            if len(self.current) >= self.capacity:
+                self.untracked += 1
+                return None
+            count = 0
+        count += 1
+        self.current[key] = count
+        return count + self.previous.get(key, 0) * (1.0 - elapsed)
+
+    def __len__(self):
+        return len(self.current) + len(self.previous)
+
+class AdmissionController:
+    """Per-source and per-network connection policy
+
+    Thresholds are connections per window from one source; network thresholds
+    are prefix_factor times higher. admit() is not locked: callers accepting on
+    several threads serialize it themselves.
+    """
+
+    def __init__(self, window=60.0, sample_rate=30, sample_every=10, tarpit_rate=120, drop_rate=600,
+                 prefix_factor=4, capacity=100000, max_suppressed_networks=10000, report_interval=60.0,
+                 clock=time.monotonic):
+        self.sample_rate = sample_rate
+        self.sample_every = sample_every
+        self.tarpit_rate = tarpit_rate
+        self.drop_rate = drop_rate
+        self.prefix_factor = prefix_factor
+        self.max_suppressed_networks = max_suppressed_networks
+        self.report_interval = report_interval
+        self.clock = clock
+        self._next_report = clock() + report_interval
+        self.sources = SlidingWindowCounter(window, capacity, clock)
+        self.networks = SlidingWindowCounter(window, capacity, clock)
+
+        self.counts = dict.fromkeys(ACTIONS, 0)
+        # Suppressed connections since the last drain: network label -> [count, last address]
+        self.suppressed = {}
+        self.suppressed_overflow = 0
+        self._untracked_hits = 0
+
+    def _level(self, count, factor):
+        if count is None:
+            return 1  # table full: sample rather than let an unbounded flood through
+        if count <= self.sample_rate * factor:
+            return 0
+        if count <= self.tarpit_rate * factor:
+            return 1
+        if count <= self.drop_rate * factor:
+            return 2
+        return 3
+
+    def admit(self, ip):
+        """Decide what to do with a new connection from ip: one of ACTIONS"""
+        source, network = address_keys(ip)
+        if source is None:
+            action = ACCEPT
+        else:
+            source_count = self.sources.hit(source)
+            level = max(self._level(source_count, 1),
+                        self._level(self.networks.hit(network), self.prefix_factor))
+            if level == 0:
+                action = ACCEPT
+            elif level == 1:
+                if source_count is None:
+                    self._untracked_hits += 1
+                    sample = self._untracked_hits
+                else:
+                    sample = int(source_count)
+                action = ACCEPT if sample % self.sample_every == 0 else SAMPLED_OUT
+            else:
+                action = TARPIT if level == 2 else DROP
+
+        self.counts[action] += 1
+        if action != ACCEPT:
+            self._record_suppressed(ip)
+        return action
+
+    def _record_suppressed(self, ip):
+        label = network_label(ip)
+        entry = self.suppressed.get(label)
+        if entry is not None:
+            entry[0] += 1
+            entry[1] = ip
+        elif len(self.suppressed) < self.max_suppressed_networks:
+            self.suppressed[label] = [1, ip]
+        else:
+            self.suppressed_overflow += 1
+
+    def report_due(self):
+        """True at most once per report_interval, when there are suppressed connections to report"""
+        now = self.clock()
+        if now < self._next_report:
+            return False
+        self._next_report = now + self.report_interval
+        return bool(self.suppressed or self.suppressed_overflow)
+
+    def drain_suppressed(self):
+        """Suppressed counts since the last call: ([(network, last address, count)], overflow count)"""
+        suppressed, self.suppressed = self.suppressed, {}
+        overflow, self.suppressed_overflow = self.suppressed_overflow, 0
+        return [(label, ip, count) for label, (count, ip) in suppressed.items()], overflow
+
+    def get_stats(self):
+        return {
+            **self.counts,
+            'tracked_sources': len(self.sources),
+            'tracked_networks': len(self.networks),
+            'untracked_hits': self.sources.untracked + self.networks.untracked,
+            'pending_suppressed_networks': len(self.suppressed)
+        }
+
+class Tarpit:
+    """Holds sockets open on one thread, sending a junk pre-version line every interval
+
+    SSH clients must skip lines before the server's version string (RFC 4253
+    4.2), so a scanner sits waiting while costing us one heap entry.
+    """
+
+    def __init__(self, interval=10.0, duration=300.0, max_connections=1000):
+        self.interval = interval
+        self.duration = duration
+        self.max_connections = max_connections
+        self._heap = []  # (next drip time, sequence, socket, deadline)
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self.running = False
+
+    def add(self, sock):
+        """Take ownership of sock; returns False (and closes it) when the tarpit is full"""
+        with self._condition:
+            if len(self._heap) >= self.max_connections or not self.running:
+                sock.close()
+                return False
+            sock.setblocking(False)
+            now = time.monotonic()
+            self._sequence += 1
+            heapq.heappush(self._heap, (now, self._sequence, sock, now + self.duration))
+            self._condition.notify()
+        return True
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name='ssh-tarpit', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self.running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+        for _, _, sock, _ in self._heap:
+            sock.close()
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self.running and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                if not self.running:
+                    return
+                _, sequence, sock, deadline = heapq.heappop(self._heap)
+            now = time.monotonic()
+            try:
+                if now >= deadline:
+                    raise OSError("tarpit time is up")
+                sock.send(junk_line())
+            except OSError:
+                sock.close()
+                continue
+            with self._condition:
+                heapq.heappush(self._heap, (now + self.interval, sequence, sock, deadline))
+
+def junk_line():
+    """A short pre-version banner line that can never be mistaken for 'SSH-'"""
+    return b'%x\r\n' % random.getrandbits(32)
+
+def create_admission_controller():
+    """Build the admission controller from environment settings; None when disabled"""
+    if os.environ.get('HONEYPOT_ADMISSION', '1') != '1':
+        return None
+    return AdmissionController(
+        window=float(os.environ.get('ADMISSION_WINDOW', 60)),
+        sample_rate=int(os.environ.get('ADMISSION_SAMPLE_RATE', 30)),
+        sample_every=int(os.environ.get('ADMISSION_SAMPLE_EVERY', 10)),
+        tarpit_rate=int(os.environ.get('ADMISSION_TARPIT_RATE', 120)),
+        drop_rate=int(os.environ.get('ADMISSION_DROP_RATE', 600)),
+        prefix_factor=int(os.environ.get('ADMISSION_PREFIX_FACTOR', 4)),
+        capacity=int(os.environ.get('ADMISSION_TABLE_SIZE', 100000)),
+        report_interval=float(os.environ.get('ADMISSION_REPORT_INTERVAL', 60))
+    )
+
+def create_tarpit():
+    """Build the tarpit from environment settings"""
+    return Tarpit(
+        interval=float(os.environ.get('TARPIT_INTERVAL', 10)),
+        duration=float(os.environ.get('TARPIT_DURATION', 300)),
+        max_connections=int(os.environ.get('TARPIT_MAX_CONNECTIONS', 1000))
+    )
@@ -4,13 +4,17 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+import schema
+from storage import storage
+from metrics import metrics
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging; LOG_LEVEL=DEBUG brings back the per-connection lines
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
 logger = logging.getLogger(__name__)
 
 class Base(DeclarativeBase):
-    pass
+    # Models map onto the Core tables the Flask-free storage layer also writes
+    metadata = schema.metadata
 
 db = SQLAlchemy(model_class=Base)
 
@@ -20,12 +24,8 @@ app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-prod
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 # Configure the database
-database_url = os.environ.get("DATABASE_URL", "sqlite:///honeypot.db")
-app.config["SQLALCHEMY_DATABASE_URI"] = database_url
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+app.config["SQLALCHEMY_DATABASE_URI"] = storage.url.render_as_string(hide_password=False)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = storage.engine_options
 
 # Initialize the app with the extension
 db.init_app(app)
@@ -33,8 +33,46 @@ db.init_app(app)
 with app.app_context():
     # Import models to ensure tables are created
     import models
+    from sqlalchemy import inspect
+    from migrations import pending_migrations, stamp_current
+    import partitions
+    import dimensions
+    import rollups
+    
+    fresh_database = not inspect(db.engine).has_table('attack_logs')
+    if fresh_database and partitions.PARTITION_PERIOD:
+        partitions.create_layout(db.engine, partitions.PARTITION_PERIOD)
+    elif fresh_database and dimensions.NORMALIZED:
+        dimensions.create_layout(db.engine)
     db.create_all()
     logger.info("Database initialized successfully")
+    
+    # New databases get the full schema from the models; existing ones get
+    # new indexes through the migrate command
+    if fresh_database:
+        stamp_current(db.engine)
+    elif pending_migrations(db.engine):
+        logger.warning("Database schema has pending migrations, run 'flask migrate'")
+    
+    with db.engine.connect() as connection:
+        if partitions.PARTITION_PERIOD and dimensions.NORMALIZED:
+            logger.warning("ATTACK_LOG_DIMENSIONS is ignored while ATTACK_PARTITION_PERIOD is set")
+        elif partitions.PARTITION_PERIOD and not partitions.is_partitioned(connection):
+            logger.warning("attack_logs is a single table, run 'flask partition-attack-logs' to partition it")
+        elif dimensions.NORMALIZED and not dimensions.is_normalized(connection):
+            logger.warning("attack_logs is not normalized, run 'flask normalize-attack-logs'")
+
+        if rollups.ROLLUPS_ENABLED and not rollups.covers_attack_logs(connection):
+            # Rows folded in before the backfill would be missing from every rollup-backed endpoint
+            logger.warning("The rollups do not cover attack_logs, run 'flask backfill-rollups'; "
+                           "reading attack_logs until this process restarts")
+            rollups.ROLLUPS_ENABLED = False
 
 # Import routes after app creation
 import routes
+
+# Register CLI commands
+import commands
+
+# Share this worker's metrics with the other processes when METRICS_DIR is set
+metrics.start_exporter()
@@ -0,0 +1,414 @@
+"""Columnar archive of old attack_logs rows.
+
+Rows older than the retention period are moved out of the hot table into one
+file per day in ARCHIVE_DIR, written column by column with every text column
+dictionary-encoded. Parquet (country/username/password and the other text
+columns dictionary-encoded, zstd) is used when pyarrow is installed; otherwise
+the built-in .hpcol format: a JSON header followed by zlib-compressed
+little-endian arrays, where text columns are integer codes into a dictionary
+whose per-value row counts are kept in the header.
+
+Aggregating a column over the archive reads those header counts for days that
+are wholly inside the requested range and counts codes for the rest, so the
+dashboard's top-N endpoints can span archived days without touching their rows.
+Given the hot database, the aggregations skip archived days whose rows are
+still in attack_logs (exported with --keep-rows, or partitions not dropped
+yet), so those are counted once, from the hot table. Archiving a day again
+merges its rows into the day's file by id instead of adding another one.
+The rollup tables are left alone when rows are archived: rollup-backed
+endpoints keep counting them, and backfill-rollups only recomputes the days
+still in the hot table.
+"""
+import array
+import bisect
+import importlib.util
+import json
+import logging
+import math
+import os
+import struct
+import sys
+import threading
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func
+from schema import attack_logs
+import partitions
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'HPCOL001'
+HEADER_LENGTH = struct.Struct('<I')
+FORMATS = ('hpcol', 'parquet')
+
+# attack_logs columns in file order with their storage kind
+COLUMNS = [
+    ('id', 'int'), ('timestamp', 'time'), ('source_ip', 'text'), ('source_port', 'int'),
+    ('username', 'text'), ('password', 'text'), ('command', 'text'), ('session_id', 'text'),
+    ('attack_type', 'text'), ('country', 'text'), ('city', 'text'), ('latitude', 'float'),
+    ('longitude', 'float'), ('user_agent', 'text')
+]
+COLUMN_KINDS = dict(COLUMNS)
+TYPECODES = {'int': 'q', 'time': 'q', 'float': 'd', 'text': 'I'}
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+DAY = timedelta(days=1)
+
+def _microseconds(timestamp):
+    return (timestamp - EPOCH) // MICROSECOND
+
+def _encode_column(kind, values):
+    """Column values as a little-endian array, plus dictionary metadata for text columns"""
+    metadata = {}
+    if kind == 'text':
+        codes = {None: 0}  # code 0 is NULL
+        dictionary = []
+        counts = []
+        data = array.array('I')
+        for value in values:
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(dictionary) + 1
+                dictionary.append(value)
+                counts.append(0)
+            if code:
+                counts[code - 1] += 1
+            data.append(code)
+        metadata = {'dictionary': dictionary, 'counts': counts}
+    elif kind == 'time':
+        data = array.array('q', (_microseconds(value) for value in values))
+    elif kind == 'float':
+        data = array.array('d', (math.nan if value is None else value for value in values))
+    else:
+        data = array.array('q', values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes(), metadata
+
+def write_hpcol(path, day, columns):
+    """Write one day of rows ({column: [values]}, ordered by timestamp) as an .hpcol file"""
+    header = {'day': day.date().isoformat(), 'rows': len(columns['id']), 'columns': {}}
+    blocks = []
+    offset = 0
+    for name, kind in COLUMNS:
+        data, metadata = _encode_column(kind, columns[name])
+        block = zlib.compress(data, 1)
+        header['columns'][name] = dict(metadata, offset=offset, length=len(block))
+        blocks.append(block)
+        offset += len(block)
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    with open(path, 'wb') as f:
+        f.write(MAGIC + HEADER_LENGTH.pack(len(header_bytes)) + header_bytes)
+        for block in blocks:
+            f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+
+def write_parquet(path, day, columns):
+    """Write one day of rows as a Parquet file with dictionary-encoded text columns"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    types = {'int': pa.int64(), 'time': pa.timestamp('us'), 'float': pa.float64(), 'text': pa.string()}
+    table = pa.Table.from_pydict(
+        {name: columns[name] for name, _ in COLUMNS},
+        schema=pa.schema([(name, types[kind]) for name, kind in COLUMNS])
+    )
+    pq.write_table(table, path, compression='zstd',
+                   use_dictionary=[name for name, kind in COLUMNS if kind == 'text'])
+
+class HpcolPartition:
+    """One archived day in the built-in format; columns are read on demand"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an attack archive file")
+            length, = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+            self.header = json.loads(f.read(length))
+        self.data_offset = len(MAGIC) + HEADER_LENGTH.size + length
+        self.start = datetime.fromisoformat(self.header['day'])
+        self.end = self.start + DAY
+        self.rows = self.header['rows']
+        self._first_id = None
+
+    @property
+    def first_id(self):
+        """id of the day's first row, to tell whether the hot table still holds the day"""
+        if self._first_id is None:
+            self._first_id = self.read_column('id')[0]
+        return self._first_id
+
+    def read_column(self, name):
+        """The column's raw array: text columns as dictionary codes, timestamps as epoch microseconds"""
+        metadata = self.header['columns'][name]
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_offset + metadata['offset'])
+            block = f.read(metadata['length'])
+        data = array.array(TYPECODES[COLUMN_KINDS[name]])
+        data.frombytes(zlib.decompress(block))
+        if sys.byteorder != 'little':
+            data.byteswap()
+        return data
+
+    def value_counts(self, name, since=None, until=None):
+        """{value: rows} of a text column, from the header when the whole day is in range"""
+        metadata = self.header['columns'][name]
+        dictionary = metadata['dictionary']
+        if (since is None or since <= self.start) and (until is None or until >= self.end):
+            return dict(zip(dictionary, metadata['counts']))
+
+        # Rows are stored in timestamp order, so the range is one slice
+        timestamps = self.read_column('timestamp')
+        low = bisect.bisect_left(timestamps, _microseconds(since)) if since else 0
+        high = bisect.bisect_left(timestamps, _microseconds(until)) if until else len(timestamps)
+        counts = Counter(self.read_column(name)[low:high])
+        counts.pop(0, None)
+        return {dictionary[code - 1]: count for code, count in counts.items()}
+
+    def time_counts(self, step, since=None, until=None):
+        """{bucket start in Unix seconds: rows} for epoch-aligned buckets `step` seconds wide"""
+        if step % 86400 == 0 and (since is None or since <= self.start) and (until is None or until >= self.end):
+            day = _microseconds(self.start) // 1000000
+            return {day - day % step: self.rows}
+
+        timestamps = self.read_column('timestamp')
+        low = bisect.bisect_left(timestamps, _microseconds(since)) if since else 0
+        high = bisect.bisect_left(timestamps, _microseconds(until)) if until else len(timestamps)
+        step_us = step * 1000000
+        counts = Counter(timestamp // step_us for timestamp in timestamps[low:high])
+        return {bucket * step: count for bucket, count in counts.items()}
+
+    def iter_rows(self):
+        """Decode every row back into an attack_logs dict"""
+        columns = {}
+        for name, kind in COLUMNS:
+            data = self.read_column(name)
+            if kind == 'text':
+                dictionary = [None] + self.header['columns'][name]['dictionary']
+                columns[name] = [dictionary[code] for code in data]
+            elif kind == 'time':
+                columns[name] = [EPOCH + value * MICROSECOND for value in data]
+            elif kind == 'float':
+                columns[name] = [None if math.isnan(value) else value for value in data]
+            else:
+                columns[name] = data.tolist()
+        names = [name for name, _ in COLUMNS]
+        for values in zip(*(columns[name] for name in names)):
+            yield dict(zip(names, values))
+
+class ParquetPartition:
+    """One archived day in Parquet, aggregated with Arrow compute kernels"""
+
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+        self.path = path
+        self.start = datetime.strptime(os.path.basename(path)[:10], '%Y-%m-%d')
+        self.end = self.start + DAY
+        self.rows = pq.ParquetFile(path).metadata.num_rows
+        self._first_id = None
+
+    @property
+    def first_id(self):
+        if self._first_id is None:
+            import pyarrow.parquet as pq
+            self._first_id = pq.ParquetFile(self.path).read_row_group(0, columns=['id']).column('id')[0].as_py()
+        return self._first_id
+
+    def value_counts(self, name, since=None, until=None):
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        filters = []
+        if since is not None and since > self.start:
+            filters.append(('timestamp', '>=', since))
+        if until is not None and until < self.end:
+            filters.append(('timestamp', '<', until))
+        table = pq.read_table(self.path, columns=[name], filters=filters or None)
+        counts = pc.value_counts(table.column(name))
+        return {value: count for value, count in zip(counts.field('values').to_pylist(),
+                                                     counts.field('counts').to_pylist())
+                if value is not None}
+
+    def time_counts(self, step, since=None, until=None):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        filters = []
+        if since is not None and since > self.start:
+            filters.append(('timestamp', '>=', since))
+        if until is not None and until < self.end:
+            filters.append(('timestamp', '<', until))
+        table = pq.read_table(self.path, columns=['timestamp'], filters=filters or None)
+        buckets = pc.divide(pc.cast(table.column('timestamp'), pa.int64()), step * 1000000)
+        counts = pc.value_counts(buckets)
+        return {bucket * step: count for bucket, count in zip(counts.field('values').to_pylist(),
+                                                              counts.field('counts').to_pylist())}
+
+    def iter_rows(self):
+        import pyarrow.parquet as pq
+        yield from pq.read_table(self.path).to_pylist()
+
+PARTITION_TYPES = {'.hpcol': HpcolPartition, '.parquet': ParquetPartition}
+
+class AttackArchive:
+    """Day-partitioned columnar files holding attack rows moved out of attack_logs"""
+
+    def __init__(self, directory, file_format=None):
+        self.directory = directory
+        if file_format is None:
+            file_format = 'parquet' if importlib.util.find_spec('pyarrow') else 'hpcol'
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown archive format: {file_format}")
+        self.file_format = file_format
+        self._partitions = {}  # path -> partition; only archive_day replaces a file, and drops it from here
+        self._lock = threading.Lock()
+
+    def partitions(self, since=None, until=None, connection=None):
+        """Archived partitions overlapping [since, until), oldest first
+
+        Given a connection to the hot database, days whose rows attack_logs
+        still holds are left out.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        selected = []
+        with self._lock:
+            for name in sorted(os.listdir(self.directory)):
+                extension = os.path.splitext(name)[1]
+                if extension not in PARTITION_TYPES:
+                    continue
+                path = os.path.join(self.directory, name)
+                partition = self._partitions.get(path)
+                if partition is None:
+                    partition = self._partitions[path] = PARTITION_TYPES[extension](path)
+                if (since is None or partition.end > since) and (until is None or partition.start < until):
+                    selected.append(partition)
+        if connection is not None:
+            selected = self._moved(connection, selected)
+        return selected
+
+    def _moved(self, connection, selected):
+        """The partitions whose rows are gone from attack_logs"""
+        # Only days from the oldest hot row on can still be there; one of each day's ids tells
+        oldest = partitions.oldest_timestamp(connection)
+        candidates = [partition.first_id for partition in selected if oldest is not None and partition.end > oldest]
+        if not candidates:
+            return selected
+        still_hot = set(connection.execute(
+            select(attack_logs.c.id).where(attack_logs.c.id.in_(candidates))
+        ).scalars())
+        return [partition for partition in selected if partition.first_id not in still_hot]
+
+    def value_counts(self, column, since=None, until=None, connection=None):
+        """Rows per value of a text column across the archive"""
+        if COLUMN_KINDS.get(column) != 'text':
+            raise ValueError(f"Cannot aggregate archive column {column}")
+        totals = Counter()
+        for partition in self.partitions(since, until, connection):
+            totals.update(partition.value_counts(column, since, until))
+        return totals
+
+    def time_counts(self, step, since=None, until=None, connection=None):
+        """Archived rows per epoch-aligned bucket of `step` seconds, keyed by its start in Unix seconds"""
+        totals = Counter()
+        for partition in self.partitions(since, until, connection):
+            totals.update(partition.time_counts(step, since, until))
+        return totals
+
+    def top_values(self, column, limit=10, hot_counts=(), since=None, until=None, connection=None):
+        """Most frequent values over the archive plus (value, count) pairs from the hot table"""
+        totals = self.value_counts(column, since, until, connection)
+        for value, count in hot_counts:
+            if value is not None:
+                totals[value] += count
+        return totals.most_common(limit)
+
+    def _day_paths(self, day):
+        """Existing files for the day: its file, in either format, and any numbered ones older versions wrote"""
+        if not os.path.isdir(self.directory):
+            return []
+        prefix = f"{day:%Y-%m-%d}."
+        return [
+            os.path.join(self.directory, name) for name in sorted(os.listdir(self.directory))
+            if name.startswith(prefix) and os.path.splitext(name)[1] in PARTITION_TYPES
+        ]
+
+    def archive_day(self, engine, day, keep_rows=False, chunk_size=50000):
+        """Merge one day of attack_logs into the day's file, then delete those rows; returns the rows newly archived
+
+        Rows already in the file (by id) are not written again, so archiving a
+        day twice, e.g. after an export with keep_rows, leaves it unchanged.
+        """
+        table = attack_logs
+        window = (table.c.timestamp >= day, table.c.timestamp < day + DAY)
+        with engine.connect() as connection:
+            result = connection.execution_options(yield_per=chunk_size).execute(
+                select(*(table.c[name] for name, _ in COLUMNS)).where(*window)
+            )
+            hot = [dict(row._mapping) for row in result]
+        if not hot:
+            return 0
+
+        existing = self._day_paths(day)
+        rows = {}
+        for old_path in existing:
+            for row in PARTITION_TYPES[os.path.splitext(old_path)[1]](old_path).iter_rows():
+                rows[row['id']] = row
+        new = [row for row in hot if row['id'] not in rows]
+
+        path = os.path.join(self.directory, f"{day:%Y-%m-%d}.{self.file_format}")
+        if new or existing != [path]:
+            rows.update((row['id'], row) for row in new)
+            ordered = sorted(rows.values(), key=lambda row: (row['timestamp'], row['id']))
+            columns = {name: [row[name] for row in ordered] for name, _ in COLUMNS}
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = path + '.tmp'
+            (write_parquet if self.file_format == 'parquet' else write_hpcol)(temporary, day, columns)
+            with self._lock:
+                os.replace(temporary, path)
+                for old_path in existing:
+                    if old_path != path:
+                        os.remove(old_path)
+                for old_path in existing + [path]:
+                    self._partitions.pop(old_path, None)
+
+        if not keep_rows:
+            # Only the ids now in the file, so rows inserted meanwhile stay in the hot table
+            ids = [row['id'] for row in hot]
+            with engine.begin() as connection:
+                for partition in partitions.tables_for(connection, day, day + DAY):
+                    for start in range(0, len(ids), 500):
+                        connection.execute(delete(partition).where(partition.c.id.in_(ids[start:start + 500])))
+        logger.info(f"Archived {len(new)} new attack rows from {day:%Y-%m-%d} to {path}")
+        return len(new)
+
+    def archive_before(self, engine, cutoff, keep_rows=False):
+        """Archive every whole day before cutoff that still has rows in attack_logs; returns rows archived"""
+        with engine.connect() as connection:
+            oldest = connection.execute(
+                select(func.min(attack_logs.c.timestamp)).where(attack_logs.c.timestamp < cutoff)
+            ).scalar()
+        if oldest is None:
+            return 0
+        if isinstance(oldest, str):
+            oldest = datetime.fromisoformat(oldest)
+        day = oldest.replace(hour=0, minute=0, second=0, microsecond=0)
+        total = 0
+        while day + DAY <= cutoff:
+            total += self.archive_day(engine, day, keep_rows)
+            day += DAY
+        return total
+
+def create_attack_archive():
+    """Build the archive from environment settings; None unless ARCHIVE_DIR is set"""
+    directory = os.environ.get('ARCHIVE_DIR')
+    if not directory:
+        return None
+    return AttackArchive(directory, os.environ.get('ARCHIVE_FORMAT') or None)
+
+# Global instance
+attack_archive = create_attack_archive()
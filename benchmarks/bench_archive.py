@@ -0,0 +1,98 @@
+"""Top-N aggregation over the columnar archive vs. GROUP BY over attack_logs.
+
+Fills attack_logs with synthetic rows spread over --days days, exports every
+day to the archive (rows kept in the table so both sides hold the same data),
+then times, for country / username / password:
+  * sql: the GROUP BY count the dashboard runs without rollups
+  * archive (whole days): merging per-partition dictionary counts
+  * archive (partial day): the same with a range starting mid-day, which scans
+    the first day's timestamp and code columns
+
+Runs against a throwaway SQLite file unless DATABASE_URL is set.
+
+Usage:
+    python benchmarks/bench_archive.py --rows 2000000 --days 60
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_archive.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from datetime import timedelta
+from sqlalchemy import select, func, desc
+from app import app, db
+from archive import AttackArchive
+from datagen import populate_attack_logs
+from schema import attack_logs
+
+DIMENSIONS = ['country', 'username', 'password']
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, result
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--format', choices=['hpcol', 'parquet'], default=None)
+    args = parser.parse_args()
+
+    with app.app_context():
+        start = time.perf_counter()
+        populate_attack_logs(db, args.rows, days=args.days)
+        print(f"{args.rows:,} rows over {args.days} days (populated in {time.perf_counter() - start:.0f}s)")
+        engine = db.engine
+
+    archive = AttackArchive(os.path.join(tempfile.mkdtemp(), 'archive'), args.format)
+    with engine.connect() as connection:
+        newest = connection.execute(select(func.max(attack_logs.c.timestamp))).scalar()
+    start = time.perf_counter()
+    archived = archive.archive_before(engine, newest + timedelta(days=1), keep_rows=True)
+    elapsed = time.perf_counter() - start
+    partitions = archive.partitions()
+    print(f"archived {archived:,} rows into {len(partitions)} {archive.file_format} partitions in {elapsed:.0f}s "
+          f"({archived / elapsed:,.0f} rows/s), {directory_size(archive.directory) / 1e6:.1f} MB")
+    if engine.dialect.name == 'sqlite':
+        print(f"sqlite database: {os.path.getsize(engine.url.database) / 1e6:.1f} MB")
+
+    mid_day = partitions[0].start + timedelta(hours=12)
+    print(f"\n{'dimension':<10} {'sql ms':>10} {'archive ms':>11} {'partial ms':>11}  top value matches")
+    for dimension in DIMENSIONS:
+        column = attack_logs.c[dimension]
+
+        def sql_top():
+            with engine.connect() as connection:
+                return connection.execute(
+                    select(column, func.count().label('count')).where(column.isnot(None))
+                    .group_by(column).order_by(desc('count')).limit(10)
+                ).all()
+
+        sql_ms, sql_result = timed(sql_top, args.repeat)
+        archive_ms, archive_result = timed(lambda: archive.top_values(dimension, 10), args.repeat)
+        partial_ms, _ = timed(lambda: archive.top_values(dimension, 10, since=mid_day), args.repeat)
+        matches = [tuple(row) for row in sql_result] == archive_result
+        print(f"{dimension:<10} {sql_ms:>10.1f} {archive_ms:>11.1f} {partial_ms:>11.1f}  {matches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Load generator comparing the thread-per-connection and asyncio honeypot engines.
+
+Starts a HoneypotServer in a child process (database logging disabled so only the
+connection engine is measured), opens N concurrent scripted SSH clients against it
+(each doing a real key exchange, so client-side crypto shares this process's CPU)
+and reports completed sessions/sec and the server's peak resident memory.
+
+Usage:
+    python benchmarks/bench_connections.py --modes thread asyncio --clients 1000 5000 10000
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ssh_client import ScriptedSSHClient
+
+
+def raise_fd_limit():
+    """Raise the open file limit as far as the hard limit allows"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        pass
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_server(mode, port, backlog, max_sessions):
+    """Child process entry point"""
+    raise_fd_limit()
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    from honeypot import HoneypotServer, SSHHoneypot
+
+    threading.stack_size(256 * 1024)
+    SSHHoneypot.log_attack_attempt = lambda self: None
+
+    server = HoneypotServer(host='127.0.0.1', port=port, mode=mode,
+                            backlog=backlog, max_sessions=max_sessions)
+    server.start()
+
+
+def read_rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+async def scripted_client(port, results):
+    """One attacker: key exchange followed by three password attempts"""
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        client = ScriptedSSHClient(passwords=['password0', 'password1', 'password2'])
+        writer.write(client.start())
+        await writer.drain()
+        while not client.closed:
+            data = await reader.read(4096)
+            if not data:
+                break
+            output = client.receive(data)
+            if output:
+                writer.write(output)
+                await writer.drain()
+        writer.close()
+        if not client.passwords:  # every attempt was sent before the server hung up
+            results['ok'] += 1
+        else:
+            results['failed'] += 1
+    except Exception:
+        results['failed'] += 1
+
+
+async def run_clients(port, clients, ramp):
+    results = {'ok': 0, 'failed': 0}
+    tasks = []
+    for i in range(clients):
+        tasks.append(asyncio.create_task(scripted_client(port, results)))
+        if ramp and i % ramp == ramp - 1:
+            await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return results
+
+
+def bench(mode, clients, backlog, ramp):
+    port = free_port()
+    proc = multiprocessing.Process(target=run_server, args=(mode, port, backlog, clients * 2), daemon=True)
+    proc.start()
+
+    # Wait for the listener
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    time.sleep(4)  # let the probe session drain
+
+    baseline_rss = read_rss_kb(proc.pid)
+    peak_rss = [baseline_rss]
+    sampling = [True]
+
+    def sample():
+        while sampling[0]:
+            peak_rss[0] = max(peak_rss[0], read_rss_kb(proc.pid))
+            time.sleep(0.1)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+
+    start = time.perf_counter()
+    results = asyncio.run(run_clients(port, clients, ramp))
+    elapsed = time.perf_counter() - start
+
+    sampling[0] = False
+    sampler.join()
+    proc.terminate()
+    proc.join()
+
+    return {
+        'mode': mode,
+        'clients': clients,
+        'ok': results['ok'],
+        'failed': results['failed'],
+        'elapsed': elapsed,
+        'sessions_per_sec': results['ok'] / elapsed if elapsed else 0,
+        'baseline_rss_mb': baseline_rss / 1024,
+        'peak_rss_mb': peak_rss[0] / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['thread', 'asyncio'])
+    parser.add_argument('--clients', nargs='+', type=int, default=[1000, 5000, 10000])
+    parser.add_argument('--backlog', type=int, default=4096)
+    parser.add_argument('--ramp', type=int, default=500, help='clients opened per event loop tick')
+    args = parser.parse_args()
+
+    limit = raise_fd_limit()
+    print(f"open file limit: {limit}")
+    print(f"{'mode':<8} {'clients':>8} {'ok':>8} {'failed':>8} {'secs':>8} {'sess/s':>10} {'base MB':>9} {'peak MB':>9}")
+    for clients in args.clients:
+        for mode in args.modes:
+            r = bench(mode, clients, args.backlog, args.ramp)
+            print(f"{r['mode']:<8} {r['clients']:>8} {r['ok']:>8} {r['failed']:>8} {r['elapsed']:>8.2f} "
+                  f"{r['sessions_per_sec']:>10.1f} {r['baseline_rss_mb']:>9.1f} {r['peak_rss_mb']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
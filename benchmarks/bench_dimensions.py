@@ -0,0 +1,113 @@
+"""Normalized attack_logs vs. the single table: storage size, insert rate and top-N aggregations.
+
+Writes --rows attacks through the storage write path into two throwaway
+SQLite databases (or --single-url / --normalized-url, e.g. two local
+PostgreSQL databases), one with attack_logs as a single table and one with
+the text columns moved into dimension tables (dimensions.py). Then, for each
+layout:
+  * insert: rows per second through Storage.write_attack_rows in --batch
+    batches, with the interner's hit rate for the normalized one
+  * size: the database file after VACUUM (on PostgreSQL, attack_logs or
+    attack_log_rows and the dimension tables, with their indexes)
+  * queries: median ms for the top-10 usernames, passwords and countries as
+    the dashboard runs them (dimensions.value_counts)
+The database files are deleted afterwards.
+
+Usage:
+    python benchmarks/bench_dimensions.py --rows 1000000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from storage import Storage
+import dimensions
+from datagen import synthetic_rows
+
+QUERIES = ['username', 'password', 'country']
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def table_bytes(storage):
+    """Bytes used by the attack tables, their indexes and (if any) the dimension tables"""
+    with storage.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            tables = ['attack_logs']
+            if dimensions.is_normalized(connection):
+                tables = ['attack_log_rows'] + [table.name for table in dimensions.dimension_tables.values()]
+            return sum(connection.execute(
+                text("SELECT pg_total_relation_size(:table)"), {'table': table}
+            ).scalar() for table in tables)
+        connection.execute(text("VACUUM"))
+        page_count = connection.execute(text("PRAGMA page_count")).scalar()
+        page_size = connection.execute(text("PRAGMA page_size")).scalar()
+        return page_count * page_size
+
+
+def run(label, storage, rows, args):
+    start = time.perf_counter()
+    for i in range(0, len(rows), args.batch):
+        storage.write_attack_rows(rows[i:i + args.batch])
+    rate = len(rows) / (time.perf_counter() - start)
+    stats = storage.interner.get_stats()
+    interned = stats['hits'] + stats['misses']
+    hit_rate = f" ({stats['hits'] / interned:.1%} interner hits)" if interned else ''
+    print(f"{label:<12} insert {rate:>12,.0f} rows/s{hit_rate}")
+    print(f"{label:<12} size   {table_bytes(storage) / 1048576:>12,.1f} MB")
+
+    with Session(storage.engine) as session:
+        for name in QUERIES:
+            query = lambda: dimensions.value_counts(session, name).limit(10).all()
+            query()  # warm the page cache
+            print(f"{label:<12} top 10 by {name:<9} {timed(query, args.repeat):>10.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--single-url', default=None)
+    parser.add_argument('--normalized-url', default=None)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    single = Storage(args.single_url or f"sqlite:///{directory}/single.db")
+    normalized = Storage(args.normalized_url or f"sqlite:///{directory}/normalized.db")
+    dimensions.create_layout(normalized.engine)
+
+    rows = sorted(synthetic_rows(args.rows, days=args.days), key=lambda row: row['timestamp'])
+    print(f"{args.rows:,} rows over {args.days} days\n")
+    try:
+        run('single', single, rows, args)
+        print()
+        run('normalized', normalized, rows, args)
+    finally:
+        for storage in (single, normalized):
+            storage.engine.dispose()
+        if not (args.single_url or args.normalized_url):
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""End-to-end ingest latency with inline geolocation vs. the background enrichment worker.
+
+Geolocation is served by the local stub provider with a configurable simulated
+provider latency, so no network is involved. For each mode it reports the time
+spent on the connection hot path (log_attack_attempt), the time until every row
+is in the database and the time until every row carries a location.
+
+Usage:
+    python benchmarks/bench_enrichment.py --attacks 2000 --distinct-ips 200 --provider-latency 0.05
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_enrichment.db")
+os.environ['GEOLOCATION_PROVIDER'] = 'stub'
+os.environ['GEO_CACHE_PATH'] = ''
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import honeypot
+from app import app, db
+from models import AttackLog
+from geolocation import geolocation_service
+from ingest import attack_queue
+from enrichment import geo_enricher
+
+
+def count_rows(only_enriched=False):
+    with app.app_context():
+        query = db.session.query(AttackLog)
+        if only_enriched:
+            query = query.filter(AttackLog.country.isnot(None))
+        return query.count()
+
+
+def wait_for(target, only_enriched, timeout=600):
+    start = time.perf_counter()
+    while count_rows(only_enriched) < target and time.perf_counter() - start < timeout:
+        time.sleep(0.05)
+    return time.perf_counter()
+
+
+def bench(mode, attacks, distinct_ips):
+    with app.app_context():
+        db.session.query(AttackLog).delete()
+        db.session.commit()
+    geolocation_service.cache.clear()
+    honeypot.ENRICHMENT_MODE = mode
+
+    attack_queue.start()
+    if mode != 'inline':
+        attack_queue.prepare = geo_enricher.fill_resolved
+        geo_enricher.start()
+
+    hot_path = []
+    start = time.perf_counter()
+    for i in range(attacks):
+        ip_index = i % distinct_ips
+        session = honeypot.SSHHoneypot(None, (f"203.0.{ip_index // 256}.{ip_index % 256}", 40000 + i))
+        t0 = time.perf_counter()
+        session.log_attack_attempt()
+        hot_path.append(time.perf_counter() - t0)
+
+    written_at = wait_for(attacks, only_enriched=False)
+    enriched_at = wait_for(attacks, only_enriched=True)
+
+    attack_queue.stop()
+    geo_enricher.stop()
+
+    hot_path.sort()
+    return {
+        'mode': mode,
+        'hot_p50_ms': statistics.median(hot_path) * 1000,
+        'hot_p99_ms': hot_path[int(len(hot_path) * 0.99) - 1] * 1000,
+        'written_s': written_at - start,
+        'enriched_s': enriched_at - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--attacks', type=int, default=2000)
+    parser.add_argument('--distinct-ips', type=int, default=200)
+    parser.add_argument('--provider-latency', type=float, default=0.05,
+                        help='simulated seconds per stub provider lookup')
+    parser.add_argument('--modes', nargs='+', default=['inline', 'async'])
+    args = parser.parse_args()
+
+    geolocation_service.stub_latency = args.provider_latency
+    geo_enricher.interval = 0.2
+
+    print(f"{args.attacks} attacks from {args.distinct_ips} IPs, provider latency {args.provider_latency * 1000:.0f} ms")
+    print(f"{'mode':<8} {'hot p50 ms':>11} {'hot p99 ms':>11} {'all written s':>14} {'all enriched s':>15}")
+    for mode in args.modes:
+        r = bench(mode, args.attacks, args.distinct_ips)
+        print(f"{r['mode']:<8} {r['hot_p50_ms']:>11.3f} {r['hot_p99_ms']:>11.3f} {r['written_s']:>14.2f} {r['enriched_s']:>15.2f}")
+
+
+if __name__ == '__main__':
+    main()
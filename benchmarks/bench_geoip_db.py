@@ -0,0 +1,87 @@
+"""Lookup throughput and memory of the offline GeoIP range database.
+
+Generates a synthetic table of contiguous IPv4 and IPv6 ranges, compiles it to
+the binary format, memory-maps it and measures open time, lookups/sec and
+resident memory.
+
+Usage:
+    python benchmarks/bench_geoip_db.py --v4-ranges 3000000 --v6-ranges 300000
+"""
+import argparse
+import array
+import ipaddress
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geoip_db import GeoIPDatabase, _FixedWidthKeys
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def build(v4_count, v6_count, location_count):
+    locations = [(f"Country{i % 250}", f"City{i}", random.uniform(-90, 90), random.uniform(-180, 180))
+                 for i in range(location_count)]
+
+    step = (2 ** 32) // v4_count
+    v4_starts = array.array('I', range(0, step * v4_count, step))
+    v4_ends = array.array('I', (s + step - 1 for s in v4_starts))
+    v4_locations = array.array('I', (random.randrange(location_count) for _ in range(v4_count)))
+
+    base = int(ipaddress.ip_address('2001::'))
+    step6 = 2 ** 80
+    v6_starts = b''.join((base + i * step6).to_bytes(16, 'big') for i in range(v6_count))
+    v6_ends = b''.join((base + (i + 1) * step6 - 1).to_bytes(16, 'big') for i in range(v6_count))
+    v6_locations = array.array('I', (random.randrange(location_count) for _ in range(v6_count)))
+
+    return GeoIPDatabase(v4_starts, v4_ends, v4_locations,
+                         _FixedWidthKeys(v6_starts, v6_count), _FixedWidthKeys(v6_ends, v6_count),
+                         v6_locations, locations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--v4-ranges', type=int, default=3000000)
+    parser.add_argument('--v6-ranges', type=int, default=300000)
+    parser.add_argument('--locations', type=int, default=50000)
+    parser.add_argument('--lookups', type=int, default=500000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'geoip.bin')
+    start = time.perf_counter()
+    build(args.v4_ranges, args.v6_ranges, args.locations).save(path)
+    print(f"built + saved {args.v4_ranges + args.v6_ranges} ranges in {time.perf_counter() - start:.1f}s "
+          f"({os.path.getsize(path) / 2 ** 20:.1f} MB on disk)")
+
+    # Drop the build-time objects before measuring the loaded table
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    database = GeoIPDatabase.open(path)
+    print(f"mmap open: {(time.perf_counter() - start) * 1000:.1f} ms, RSS +{rss_mb() - rss_before:.1f} MB")
+
+    v4_ips = [str(ipaddress.IPv4Address(random.getrandbits(32))) for _ in range(args.lookups)]
+    v6_ips = [str(ipaddress.IPv6Address(int(ipaddress.ip_address('2001::')) + random.randrange(args.v6_ranges * 2 ** 80)))
+              for _ in range(args.lookups // 10)]
+
+    for label, ips in (('IPv4', v4_ips), ('IPv6', v6_ips)):
+        start = time.perf_counter()
+        hits = sum(1 for ip in ips if database.lookup(ip))
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {len(ips) / elapsed:,.0f} lookups/s, {elapsed / len(ips) * 1e6:.2f} us/lookup, "
+              f"{hits}/{len(ips)} hits")
+
+    print(f"RSS after lookups: +{rss_mb() - rss_before:.1f} MB over pre-open baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Geolocation throughput and tail latency against a local fake provider.
+
+Starts benchmarks/fake_geo_provider.py in this process with --latency seconds
+per request and resolves --ips distinct addresses from --threads threads:
+  * per-ip, new connection: one requests.get per IP without a Session, the
+    request pattern of the old resolver (which on top slept a global second
+    between lookups, capping it at 1 IP/s)
+  * per-ip, pooled: single lookups through the keep-alive session
+  * batched: GeoResolver with ip-api's batch endpoint, 100 IPs a request
+reporting IPs/s, p50/p99 latency per call and TCP connections opened. Then:
+  * breaker: the first provider fails every request; how many requests it still
+    receives before its circuit opens and the second provider takes over
+  * rate limit: requests/s the token bucket lets through from all threads
+    against the configured rate
+
+Usage:
+    python benchmarks/bench_geolocation.py --ips 5000 --threads 8 --latency 0.02
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import requests
+from fake_geo_provider import start_fake_provider
+from geo_providers import CircuitBreaker, GeoResolver, IpApiProvider, IpapiCoProvider, create_http_session
+
+UNLIMITED = 1e9  # requests a minute
+
+
+def synthetic_ips(count, offset=0):
+    return [f'{(i >> 16) % 200 + 11}.{(i >> 8) & 255}.{i & 255}.{(i * 7) % 250 + 1}'
+            for i in range(offset, offset + count)]
+
+
+def run_threads(calls, threads):
+    """Run the callables from `threads` threads; returns (elapsed, per-call latencies)"""
+    latencies = []
+    lock = threading.Lock()
+    position = [0]
+
+    def worker():
+        while True:
+            with lock:
+                if position[0] >= len(calls):
+                    return
+                call = calls[position[0]]
+                position[0] += 1
+            start = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start, latencies
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def report(label, server, ips, calls, threads):
+    connections = server.connections
+    elapsed, latencies = run_threads(calls, threads)
+    print(f"{label:<26} {len(ips) / elapsed:>10,.0f} {statistics.median(latencies) * 1000:>9.1f} "
+          f"{percentile(latencies, 0.99) * 1000:>9.1f} {server.connections - connections:>12,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ips', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.005)
+    parser.add_argument('--rate', type=float, default=600, help='requests a minute for the rate limit check')
+    args = parser.parse_args()
+
+    server = start_fake_provider(latency=args.latency, jitter=args.jitter)
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    session = create_http_session(pool_size=args.threads)
+    ips = synthetic_ips(args.ips)
+
+    print(f"{'':<26} {'IPs/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'connections':>12}")
+    legacy = ips[:max(args.ips // 5, args.threads)]  # a new handshake per IP is slow; a sample will do
+    report('per-ip, new connection', server, legacy,
+           [lambda ip=ip: requests.get(f'{url}/json/{ip}', timeout=5).json() for ip in legacy], args.threads)
+    pooled = IpApiProvider(session, url, UNLIMITED, max_wait=None)
+    report('per-ip, pooled', server, ips, [lambda ip=ip: pooled.resolve([ip]) for ip in ips], args.threads)
+    resolver = GeoResolver([IpApiProvider(session, url, UNLIMITED, batch_rate_per_minute=UNLIMITED, max_wait=None)])
+    batches = [ips[i:i + 100] for i in range(0, len(ips), 100)]
+    report('batched (100 per request)', server, ips, [lambda batch=batch: resolver.resolve(batch) for batch in batches],
+           args.threads)
+
+    failing = start_fake_provider(error_rate=1.0)
+    failing_url = f'http://127.0.0.1:{failing.server_address[1]}'
+    resolver = GeoResolver([
+        IpApiProvider(session, failing_url, UNLIMITED, batch_rate_per_minute=UNLIMITED, max_wait=None,
+                      breaker=CircuitBreaker(failure_threshold=5)),
+        IpapiCoProvider(session, url, UNLIMITED, max_wait=None)
+    ])
+    breaker_ips = synthetic_ips(min(args.ips, 2000), offset=args.ips)
+    batches = [breaker_ips[i:i + 100] for i in range(0, len(breaker_ips), 100)]
+    elapsed, _ = run_threads([lambda batch=batch: resolver.resolve(batch) for batch in batches], args.threads)
+    print(f"\nbreaker: {len(breaker_ips):,} IPs in {elapsed:.1f}s via the fallback; the failing provider got "
+          f"{failing.requests} of {len(batches)} batch requests (circuit opened {resolver.providers[0].breaker.opens}x)")
+
+    limited = IpApiProvider(session, url, args.rate, max_wait=None)
+    before = server.requests
+    deadline = time.monotonic() + 5
+    elapsed, _ = run_threads([lambda: limited.resolve(['198.51.100.1']) if time.monotonic() < deadline else None
+                              for _ in range(int(args.rate))], args.threads)
+    sent = server.requests - before
+    print(f"rate limit: {sent / elapsed * 60:,.0f} requests a minute from {args.threads} threads "
+          f"(configured {args.rate:,.0f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Query plans and latencies of the route queries without and with the attack_logs indexes.
+
+Runs against a throwaway SQLite file, or against DATABASE_URL (e.g. a local
+Postgres: DATABASE_URL=postgresql://localhost/honeypot_bench). The indexes are
+dropped first, then re-created through the versioned migrations.
+
+Usage:
+    python benchmarks/bench_indexes.py --rows 1000000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_indexes.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from app import app, db
+from models import AttackLog, SchemaMigration
+import migrations
+from datagen import populate_attack_logs
+
+
+def time_queries(repeat):
+    results = {}
+    for name, statement in migrations.route_queries().items():
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            db.session.execute(statement).all()
+            samples.append(time.perf_counter() - start)
+        results[name] = (statistics.median(samples) * 1000, migrations.explain(db.session.connection(), statement))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--plans', action='store_true', help='print full query plans')
+    args = parser.parse_args()
+
+    with app.app_context():
+        print(f"database: {db.engine.url.render_as_string(hide_password=True)}")
+        for index in AttackLog.__table__.indexes:
+            index.drop(db.engine, checkfirst=True)
+        db.session.query(SchemaMigration).delete()
+        db.session.commit()
+
+        if db.session.query(AttackLog).count() < args.rows:
+            populate_attack_logs(db, args.rows - db.session.query(AttackLog).count())
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(db.text('ANALYZE attack_logs'))
+            db.session.commit()
+
+        before = time_queries(args.repeat)
+        start = time.perf_counter()
+        migrations.upgrade(db.engine)
+        print(f"migrations applied in {time.perf_counter() - start:.1f}s")
+        # Fresh connections so no prepared statement planned against the old schema is reused
+        db.session.remove()
+        db.engine.dispose()
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(db.text('ANALYZE attack_logs'))
+            db.session.commit()
+        after = time_queries(args.repeat)
+
+        print(f"\n{'query':<26} {'no index ms':>12} {'indexed ms':>11}  plan (indexed)")
+        for name in before:
+            plan = after[name][1]
+            summary = '; '.join(plan) if args.plans else plan[0]
+            print(f"{name:<26} {before[name][0]:>12.1f} {after[name][0]:>11.1f}  {summary}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Insert throughput of per-row commits vs. the batched write-behind ingest queue.
+
+Runs against a throwaway SQLite file unless DATABASE_URL is set (e.g. a local
+Postgres), in which case the attack_logs table there is used and truncated first.
+
+Usage:
+    python benchmarks/bench_ingest.py --rows 20000 --batch-sizes 100 1000 10000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_ingest.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from app import app, db
+from models import AttackLog
+from ingest import AttackIngestQueue, write_attack_rows
+
+USERNAMES = ['root', 'admin', 'user', 'test', 'oracle', 'ubuntu', 'pi', 'git']
+PASSWORDS = ['123456', 'password', 'admin', 'root', '12345', 'qwerty', 'letmein']
+COUNTRIES = ['China', 'United States', 'Russia', 'Brazil', 'India', 'Germany']
+
+
+def make_row(i):
+    return {
+        'timestamp': datetime.utcnow(),
+        'source_ip': f"10.{i % 256}.{(i // 256) % 256}.{i % 251}",
+        'source_port': 1024 + i % 60000,
+        'username': random.choice(USERNAMES),
+        'password': random.choice(PASSWORDS),
+        'command': None,
+        'session_id': f"{i:032x}",
+        'attack_type': 'ssh_login',
+        'country': random.choice(COUNTRIES),
+        'city': 'Unknown',
+        'latitude': random.uniform(-60, 60),
+        'longitude': random.uniform(-180, 180),
+        'user_agent': None,
+    }
+
+
+def reset_table():
+    with app.app_context():
+        db.session.query(AttackLog).delete()
+        db.session.commit()
+
+
+def bench_per_row(rows):
+    reset_table()
+    start = time.perf_counter()
+    with app.app_context():
+        for row in rows:
+            db.session.add(AttackLog(**row))
+            db.session.commit()
+    return time.perf_counter() - start
+
+
+def bench_batched(rows, batch_size):
+    reset_table()
+    ingest = AttackIngestQueue(writer=write_attack_rows, max_size=len(rows) + 1,
+                               batch_size=batch_size, flush_interval=0.5)
+    start = time.perf_counter()
+    for row in rows:
+        ingest.submit(dict(row))
+    ingest.stop()
+    elapsed = time.perf_counter() - start
+    assert ingest.written == len(rows), ingest.get_stats()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--per-row-rows', type=int, default=2000,
+                        help='rows for the per-row commit baseline (it is slow)')
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    with app.app_context():
+        print(f"database: {db.engine.url.render_as_string(hide_password=True)}")
+
+    rows = [make_row(i) for i in range(args.rows)]
+
+    elapsed = bench_per_row(rows[:args.per_row_rows])
+    print(f"{'per-row commit':<22} {args.per_row_rows:>8} rows {elapsed:>8.2f}s {args.per_row_rows / elapsed:>10.0f} rows/s")
+
+    for batch_size in args.batch_sizes:
+        elapsed = bench_batched(rows, batch_size)
+        label = f"batched ({batch_size}/flush)"
+        print(f"{label:<22} {args.rows:>8} rows {elapsed:>8.2f}s {args.rows / elapsed:>10.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
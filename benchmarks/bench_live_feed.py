@@ -0,0 +1,175 @@
+"""Database queries per second with polling dashboards vs. the /api/live push feed.
+
+Runs the same synthetic ingest load (batches through write_attack_rows) twice:
+  * poll: every simulated dashboard re-fetches the five endpoints dashboard.js
+    polls, once per --interval seconds, staggered
+  * push: every simulated dashboard holds an /api/live connection and counts
+    the attack deltas it receives
+
+Queries issued by the ingest writer are counted separately, since both modes pay them.
+
+Usage:
+    python benchmarks/bench_live_feed.py --subscribers 200 --interval 5 --duration 20
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_live_feed.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from sqlalchemy import event
+from app import app, db
+import routes
+from events import event_bus
+from ingest import write_attack_rows
+from storage import storage
+from rollups import rebuild_rollups
+from datagen import populate_attack_logs, synthetic_rows
+
+POLLED_ENDPOINTS = [
+    '/api/attacks/by-hour?hours=24',
+    '/api/attacks/by-country',
+    '/api/top-credentials',
+    '/api/attacks/map-data',
+    '/api/attacks/recent?hours=1',
+]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ingest_thread = None
+        self.ingest = 0
+        self.reads = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        with self.lock:
+            if threading.get_ident() == self.ingest_thread:
+                self.ingest += 1
+            else:
+                self.reads += 1
+
+    def reset(self):
+        with self.lock:
+            self.ingest = self.reads = 0
+
+
+def ingest_load(counter, stop, rate, batch_size):
+    """Write `rate` attacks per second in batches until stopped; returns rows written"""
+    counter.ingest_thread = threading.get_ident()
+    rows = synthetic_rows(10 ** 9, days=0.01, seed=7)
+    written = 0
+    pause = batch_size / rate
+    while not stop.is_set():
+        write_attack_rows([next(rows) for _ in range(batch_size)])
+        written += batch_size
+        stop.wait(pause)
+    return written
+
+
+def poller(stop, interval, result):
+    client = app.test_client()
+    stop.wait(random.random() * interval)
+    while not stop.is_set():
+        for url in POLLED_ENDPOINTS:
+            client.get(url).get_data()
+        result['cycles'] += 1
+        stop.wait(interval)
+
+
+def subscriber(deadline, connected, result):
+    client = app.test_client()
+    response = client.get('/api/live', buffered=False)
+    connected.release()
+    try:
+        for chunk in response.response:
+            if chunk.startswith(b'event: attacks'):
+                result['deltas'] += chunk.count(b'"source_ip"')
+            if time.monotonic() >= deadline:
+                break
+    finally:
+        response.close()
+
+
+def run(mode, args, counter):
+    stop = threading.Event()
+    results = [{'cycles': 0, 'deltas': 0} for _ in range(args.subscribers)]
+    deadline = time.monotonic() + args.duration
+    connected = threading.Semaphore(0)
+
+    if mode == 'poll':
+        threads = [threading.Thread(target=poller, args=(stop, args.interval, r)) for r in results]
+    else:
+        threads = [threading.Thread(target=subscriber, args=(deadline, connected, r)) for r in results]
+    for thread in threads:
+        thread.start()
+    if mode == 'push':
+        for _ in threads:
+            connected.acquire()
+
+    counter.reset()
+    written = []
+    ingest = threading.Thread(target=lambda: written.append(
+        ingest_load(counter, stop, args.rate, args.batch_size)))
+    start = time.monotonic()
+    ingest.start()
+    stop.wait(args.duration)
+    stop.set()
+    ingest.join()
+    elapsed = time.monotonic() - start
+    for thread in threads:
+        thread.join()
+
+    return {
+        'read_qps': counter.reads / elapsed,
+        'ingest_qps': counter.ingest / elapsed,
+        'written': written[0],
+        'cycles': sum(r['cycles'] for r in results),
+        'deltas': sum(r['deltas'] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--subscribers', type=int, default=200)
+    parser.add_argument('--interval', type=float, default=5.0, help='poll interval per dashboard (s)')
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--rate', type=float, default=200.0, help='ingested attacks per second')
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+
+    # Short heartbeats let idle subscribers notice the deadline
+    routes.LIVE_HEARTBEAT_INTERVAL = 1
+    routes.LIVE_MAX_STREAMS = args.subscribers
+
+    with app.app_context():
+        populate_attack_logs(db, args.rows, days=1)
+        rebuild_rollups(db.session)
+        db.session.remove()
+
+    counter = QueryCounter()
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', counter)
+    # The ingest writer has its own engine
+    event.listen(storage.engine, 'before_cursor_execute', counter)
+
+    print(f"{args.subscribers} dashboards, {args.rate:.0f} attacks/s ingested, {args.duration:.0f}s\n")
+    print(f"{'mode':<6} {'read q/s':>10} {'ingest q/s':>11} {'written':>8} {'poll cycles':>12} {'deltas seen':>12}")
+    for mode in ('poll', 'push'):
+        stats = run(mode, args, counter)
+        print(f"{mode:<6} {stats['read_qps']:>10.1f} {stats['ingest_qps']:>11.1f} {stats['written']:>8} "
+              f"{stats['cycles']:>12} {stats['deltas']:>12}")
+    print(f"\nbus: {event_bus.get_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Response time and peak Python memory of /api/attacks/map-data.
+
+Compares the SQL aggregation served by the endpoint with the previous approach
+of loading every located AttackLog as an ORM object and grouping in Python
+(reproduced here as the baseline), at growing table sizes.
+
+Usage:
+    python benchmarks/bench_map_data.py --rows 100000 1000000 10000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_map.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from app import app, db
+from models import AttackLog
+from datagen import populate_attack_logs
+
+
+def legacy_map_data():
+    """The original implementation: every row into Python, grouped by a formatted key"""
+    attacks = db.session.query(AttackLog).filter(
+        AttackLog.latitude.isnot(None),
+        AttackLog.longitude.isnot(None),
+        AttackLog.latitude != 0,
+        AttackLog.longitude != 0
+    ).all()
+    location_counts = {}
+    for attack in attacks:
+        key = f"{attack.latitude},{attack.longitude}"
+        if key not in location_counts:
+            location_counts[key] = {'count': 0, 'recent_attacks': []}
+        location_counts[key]['count'] += 1
+        if len(location_counts[key]['recent_attacks']) < 5:
+            location_counts[key]['recent_attacks'].append(attack.source_ip)
+    return list(location_counts.values())
+
+
+def measure(fn):
+    """Wall time of one call, then peak traced allocations of a second call (tracing distorts timing)"""
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 2 ** 20, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', nargs='+', type=int, default=[100000, 1000000, 10000000])
+    parser.add_argument('--skip-legacy-above', type=int, default=2000000,
+                        help='skip the Python-grouping baseline above this many rows')
+    args = parser.parse_args()
+
+    client = app.test_client()
+    loaded = 0
+    print(f"{'rows':>10} {'variant':<22} {'ms':>10} {'peak MB':>9} {'locations':>10} {'bytes':>10}")
+    for target in sorted(args.rows):
+        with app.app_context():
+            populate_attack_logs(db, target - loaded, seed=target)
+            loaded = target
+
+            if target <= args.skip_legacy_above:
+                ms, peak, result = measure(legacy_map_data)
+                print(f"{target:>10,} {'python grouping':<22} {ms:>10.1f} {peak:>9.1f} {len(result):>10} {'-':>10}")
+            db.session.remove()
+
+        for label, query in (('sql exact', ''), ('sql zoom=3', '?zoom=3')):
+            ms, peak, response = measure(lambda: client.get(f'/api/attacks/map-data{query}'))
+            print(f"{target:>10,} {label:<22} {ms:>10.1f} {peak:>9.1f} {len(response.json):>10} {len(response.data):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Overhead of the metrics instrumentation itself.
+
+Three measurements:
+  * per operation: ns for a counter increment, a labelled increment, a gauge
+    inc/dec pair and a histogram observation, against the no-op metric that
+    METRICS_ENABLED=0 substitutes, single-threaded and with --threads threads
+    contending for the same series
+  * end to end: in-memory SSH sessions (key exchange plus three passwords through
+    SSHHoneypot.process and the server's admission and session accounting) and
+    dashboard requests through the Flask test client, each in a fresh process
+    with METRICS_ENABLED=1 and =0, alternating for --rounds rounds and keeping
+    the best of each (differences below a few percent are noise)
+  * scrape: time to render /metrics for a registry with --series label series,
+    and the size of the output
+
+Runs against a throwaway SQLite file unless DATABASE_URL is set.
+
+Usage:
+    python benchmarks/bench_metrics.py --ops 1000000 --sessions 300 --requests 5000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_metrics.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from metrics import MetricsRegistry
+
+PATHS = ['/api/cache/stats', '/api/attacks/by-country']
+
+
+def per_op_ns(operation, ops, threads):
+    """Wall-clock ns per operation with `threads` threads each doing ops // threads"""
+    share = ops // threads
+
+    def run():
+        for _ in range(share):
+            operation()
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (share * threads) * 1e9
+
+
+def operations(registry):
+    counter = registry.counter('bench_total', 'bench')
+    labelled = registry.counter('bench_labelled_total', 'bench', ['action'])
+    gauge = registry.gauge('bench_gauge', 'bench')
+    histogram = registry.histogram('bench_seconds', 'bench')
+
+    def gauge_pair():
+        gauge.inc()
+        gauge.dec()
+
+    return [
+        ('counter.inc()', counter.inc),
+        ("labels('accept').inc()", lambda: labelled.labels('accept').inc()),
+        ('gauge inc + dec', gauge_pair),
+        ('histogram.observe()', lambda: histogram.observe(0.003)),
+    ]
+
+
+def run_sessions(count):
+    from honeypot import HoneypotServer, SSHHoneypot
+    from ssh_client import ScriptedSSHClient
+
+    server = HoneypotServer(host='127.0.0.1', port=0)
+    start = time.perf_counter()
+    for i in range(count):
+        server._admit('203.0.113.7')
+        server._acquire_session()
+        honeypot = SSHHoneypot(None, ('203.0.113.7', 40000 + i))
+        client = ScriptedSSHClient(passwords=['123456', 'admin', 'root'])
+        to_client = honeypot.session.start()
+        to_server = client.start()
+        while (to_client or to_server) and not (honeypot.session.closed and client.closed):
+            reply = honeypot.process(to_server)[0] if to_server else b''
+            to_server = client.receive(to_client + reply) if (to_client or reply) else b''
+            to_client = b''
+        server._release_session()
+    return count / (time.perf_counter() - start)
+
+
+def run_requests(count):
+    from app import app
+    results = {}
+    with app.test_client() as client:
+        for path in PATHS:
+            client.get(path)  # warm the response cache and the connection pool
+            start = time.perf_counter()
+            for _ in range(count):
+                client.get(path)
+            results[path] = count / (time.perf_counter() - start)
+    return results
+
+
+def measure(args):
+    """Pool entry point: one benchmark in a fresh process with metrics on or off"""
+    enabled, kind, count = args
+    os.environ['METRICS_ENABLED'] = '1' if enabled else '0'
+    if kind == 'sessions':
+        return run_sessions(count)
+    return run_requests(count)
+
+
+def in_fresh_process(enabled, kind, count):
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(measure, ((enabled, kind, count),))
+
+
+def best_of(rounds, kind, count):
+    """Best rate with metrics on and off, alternating the two"""
+    results = {True: [], False: []}
+    for _ in range(rounds):
+        for enabled in (True, False):
+            results[enabled].append(in_fresh_process(enabled, kind, count))
+    if kind == 'sessions':
+        return max(results[True]), max(results[False])
+    return tuple({path: max(run[path] for run in results[enabled]) for path in PATHS} for enabled in (True, False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ops', type=int, default=1000000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--sessions', type=int, default=300)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--series', type=int, default=1000)
+    args = parser.parse_args()
+
+    enabled, disabled = operations(MetricsRegistry()), operations(MetricsRegistry(enabled=False))
+    print(f"{'operation':<26} {'ns/op':>8} {f'{args.threads} threads':>10} {'disabled':>9}")
+    for (name, operation), (_, null_operation) in zip(enabled, disabled):
+        print(f"{name:<26} {per_op_ns(operation, args.ops, 1):>8.0f} "
+              f"{per_op_ns(operation, args.ops, args.threads):>10.0f} {per_op_ns(null_operation, args.ops, 1):>9.0f}")
+
+    print(f"\n{'end to end':<30} {'metrics on':>12} {'metrics off':>12} {'overhead':>9}")
+    on, off = best_of(args.rounds, 'sessions', args.sessions)
+    print(f"{'SSH sessions/s':<30} {on:>12,.0f} {off:>12,.0f} {(off - on) / off:>9.1%}")
+    on, off = best_of(args.rounds, 'requests', args.requests)
+    for path in PATHS:
+        print(f"{path + ' req/s':<30} {on[path]:>12,.0f} {off[path]:>12,.0f} "
+              f"{(off[path] - on[path]) / off[path]:>9.1%}")
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram('bench_request_seconds', 'bench', ['endpoint'])
+    counter = registry.counter('bench_connections_total', 'bench', ['action'])
+    for i in range(args.series // 2):
+        histogram.labels(f'endpoint_{i}').observe(0.01)
+        counter.labels(f'action_{i}').inc()
+    start = time.perf_counter()
+    text = registry.render()
+    elapsed = time.perf_counter() - start
+    print(f"\nscrape: {args.series} series ({len(text.splitlines()):,} lines, {len(text) / 1024:.0f} KB) "
+          f"rendered in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
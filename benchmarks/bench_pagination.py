@@ -0,0 +1,109 @@
+"""Deep-page latency (OFFSET vs. keyset) and peak memory of /api/attacks/recent.
+
+Populates a 24h window of synthetic attacks, then:
+  * times fetching page N of /logs-style results with OFFSET vs. a (timestamp, id) cursor
+  * measures peak RSS of serving the whole window as one materialized jsonify list
+    (the previous implementation) vs. the streamed endpoint, each in a fresh child process
+
+Usage:
+    python benchmarks/bench_pagination.py --rows 1000000 --pages 1 100 1000 10000
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_pagination.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from flask import jsonify
+from sqlalchemy import desc
+from app import app, db
+from models import AttackLog
+from pagination import keyset_page, encode_cursor
+from datagen import populate_attack_logs
+
+PER_PAGE = 50
+
+
+def current_rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def page_latency(page):
+    query = db.session.query(AttackLog)
+    ordered = query.order_by(desc(AttackLog.timestamp), desc(AttackLog.id))
+
+    start = time.perf_counter()
+    rows = ordered.offset((page - 1) * PER_PAGE).limit(PER_PAGE).all()
+    offset_ms = (time.perf_counter() - start) * 1000
+
+    # The cursor a client would hold after walking to this page
+    anchor = ordered.offset((page - 1) * PER_PAGE - 1).limit(1).first() if page > 1 else None
+    cursor = encode_cursor(anchor) if anchor else None
+    start = time.perf_counter()
+    keyset = keyset_page(query, AttackLog, PER_PAGE, before=cursor)
+    keyset_ms = (time.perf_counter() - start) * 1000
+
+    assert [r.id for r in rows] == [r.id for r in keyset.items]
+    return offset_ms, keyset_ms
+
+
+def serve_window(variant, result):
+    baseline = current_rss_kb()
+    start = time.perf_counter()
+    with app.test_request_context():
+        if variant == 'materialized':
+            since = datetime.utcnow() - timedelta(hours=24)
+            attacks = db.session.query(AttackLog).filter(AttackLog.timestamp >= since).order_by(
+                desc(AttackLog.timestamp)).all()
+            size = len(jsonify([attack.to_dict() for attack in attacks]).get_data())
+        else:
+            client = app.test_client()
+            response = client.get('/api/attacks/recent?hours=24', buffered=False)
+            size = sum(len(chunk) for chunk in response.response)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result.put((time.perf_counter() - start, (peak - baseline) / 1024, size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--pages', nargs='+', type=int, default=[1, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    with app.app_context():
+        populate_attack_logs(db, args.rows, days=1)
+
+        print(f"{'page':>8} {'offset ms':>10} {'keyset ms':>10}")
+        for page in args.pages:
+            if (page - 1) * PER_PAGE >= args.rows:
+                continue
+            offset_ms, keyset_ms = page_latency(page)
+            print(f"{page:>8} {offset_ms:>10.1f} {keyset_ms:>10.1f}")
+        db.session.remove()
+
+    print(f"\n{'24h window':<14} {'seconds':>8} {'peak RSS +MB':>13} {'bytes':>12}")
+    ctx = multiprocessing.get_context('fork')
+    for variant in ('materialized', 'streamed'):
+        result = ctx.Queue()
+        process = ctx.Process(target=serve_window, args=(variant, result))
+        process.start()
+        elapsed, peak_mb, size = result.get()
+        process.join()
+        print(f"{variant:<14} {elapsed:>8.1f} {peak_mb:>13.1f} {size:>12,}")
+
+
+if __name__ == '__main__':
+    main()
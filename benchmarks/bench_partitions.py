@@ -0,0 +1,129 @@
+"""Partitioned attack_logs vs. the single table: insert rate, time-window queries and retention purge.
+
+Writes --rows attacks spread over --days days through the storage write path
+into two throwaway SQLite databases (or --single-url / --partitioned-url, e.g.
+two local PostgreSQL databases), one with attack_logs as a single table and
+one partitioned by --period. Then, for each layout:
+  * insert: rows per second through Storage.write_attack_rows in --batch batches
+  * queries: median ms for counting the last hour and the last day, the 50
+    newest rows of the last day, and a 7-day hourly series
+  * purge: dropping everything older than --retain days, as a DELETE on the
+    single table and as dropped partitions, with the rows removed
+The database files are deleted afterwards.
+
+Usage:
+    python benchmarks/bench_partitions.py --rows 2000000 --days 60 --retain 30
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from sqlalchemy import delete, desc, select, func
+from schema import attack_logs
+from storage import Storage
+import partitions
+import timeseries
+from datagen import synthetic_rows
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def newest(connection, since, limit=50):
+    return connection.execute(
+        select(attack_logs).where(attack_logs.c.timestamp >= since)
+        .order_by(desc(attack_logs.c.timestamp), desc(attack_logs.c.id)).limit(limit)
+    ).all()
+
+
+def row_count(storage):
+    with storage.connect() as connection:
+        return connection.execute(select(func.count()).select_from(attack_logs)).scalar()
+
+
+def run(label, storage, rows, args, now):
+    start = time.perf_counter()
+    for i in range(0, len(rows), args.batch):
+        storage.write_attack_rows(rows[i:i + args.batch])
+    rate = len(rows) / (time.perf_counter() - start)
+    print(f"{label:<12} insert {rate:>12,.0f} rows/s")
+
+    hour, day = now - timedelta(hours=1), now - timedelta(days=1)
+    queries = [
+        ('count 1h', lambda c: partitions.count_rows(c, hour)),
+        ('count 24h', lambda c: partitions.count_rows(c, day)),
+        ('newest 50 of 24h', lambda c: newest(c, day)),
+        ('7d series 1h', lambda c: timeseries.count_rows(c, 3600, now - timedelta(days=7), now)),
+    ]
+    with storage.connect() as connection:
+        for name, query in queries:
+            query(connection)  # warm the page cache
+            print(f"{label:<12} {name:<18} {timed(lambda: query(connection), args.repeat):>10.2f} ms")
+
+    before = row_count(storage)
+    cutoff = datetime(now.year, now.month, now.day) - timedelta(days=args.retain)
+    start = time.perf_counter()
+    with storage.connect() as connection:
+        partitioned = partitions.is_partitioned(connection)
+    if partitioned:
+        dropped = len(partitions.drop_partitions(storage.engine, cutoff))
+    else:
+        with storage.begin() as connection:
+            connection.execute(delete(attack_logs).where(attack_logs.c.timestamp < cutoff))
+        dropped = 0
+    elapsed = time.perf_counter() - start
+    removed = before - row_count(storage)
+    how = f"{dropped} partitions dropped" if partitioned else "DELETE"
+    print(f"{label:<12} purge  {elapsed * 1000:>12.0f} ms for {removed:,} rows ({how})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--retain', type=int, default=30)
+    parser.add_argument('--period', choices=sorted(partitions.PERIODS), default='day')
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--single-url', default=None)
+    parser.add_argument('--partitioned-url', default=None)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    single = Storage(args.single_url or f"sqlite:///{directory}/single.db")
+    partitioned = Storage(args.partitioned_url or f"sqlite:///{directory}/partitioned.db")
+    partitions.create_layout(partitioned.engine, args.period)
+
+    now = datetime.utcnow()
+    # Written in time order, as the sensor would
+    rows = sorted(synthetic_rows(args.rows, days=args.days), key=lambda row: row['timestamp'])
+    print(f"{args.rows:,} rows over {args.days} days, {args.period} partitions, retaining {args.retain} days\n")
+    try:
+        run('single', single, rows, args, now)
+        print()
+        run('partitioned', partitioned, rows, args, now)
+    finally:
+        for storage in (single, partitioned):
+            storage.engine.dispose()
+        if not (args.single_url or args.partitioned_url):
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+
+
+if __name__ == '__main__':
+    main()
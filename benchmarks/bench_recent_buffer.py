@@ -0,0 +1,140 @@
+"""Live dashboard views served from the shared recent-attack buffer vs. the database.
+
+Populates a throwaway SQLite database (or DATABASE_URL) with --rows attacks older
+than a day, then writes --live attacks spread over the last 24 hours through the
+ingest path, which also appends them to the buffer. The buffer is created with
+its horizon backdated to the start of that day, as if the dashboard had been
+running all along (nothing in the database is newer than that yet). Then /,
+/api/attacks/recent?hours=1 and the same with limit=50 are timed with the buffer
+on and off: median and p99 latency and SQL statements per request. Also reports
+what appending costs the ingest path.
+
+Usage:
+    python benchmarks/bench_recent_buffer.py --rows 1000000 --live 20000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_recent_buffer.db")
+os.environ.setdefault('RECENT_BUFFER_PATH', os.path.join(tempfile.mkdtemp(), 'recent'))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from jinja2 import FileSystemLoader
+from sqlalchemy import event, insert
+from app import app, db
+from models import AttackLog
+import recent_buffer
+import routes
+from ingest import write_attack_rows
+from datagen import synthetic_rows
+
+ENDPOINTS = ['/', '/api/attacks/recent?hours=1', '/api/attacks/recent?hours=1&limit=50']
+
+# The templates live next to the modules in this tree
+app.jinja_loader = FileSystemLoader(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+queries = [0]
+
+
+def count_query(*args):
+    queries[0] += 1
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def time_endpoint(client, path, repeat):
+    samples = []
+    statements = []
+    for _ in range(repeat):
+        queries[0] = 0
+        start = time.perf_counter()
+        response = client.get(path)
+        response.get_data()  # the API streams its body
+        # Closing tears the app context down and returns the connection, as a WSGI server would
+        response.close()
+        samples.append(time.perf_counter() - start)
+        statements.append(queries[0])
+        assert response.status_code == 200, (path, response.status_code)
+    return statistics.median(samples) * 1000, percentile(samples, 0.99) * 1000, statistics.mean(statements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--live', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    buffer = recent_buffer.recent_buffer
+    if buffer is None:
+        sys.exit("RECENT_BUFFER_SIZE is 0")
+    now = datetime.utcnow()
+    day_ago = now - timedelta(days=1)
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        chunk = []
+        for row in synthetic_rows(args.rows, days=30):
+            row['timestamp'] = min(row['timestamp'], day_ago - timedelta(seconds=1))
+            chunk.append(row)
+            if len(chunk) >= 50000:
+                db.session.execute(insert(AttackLog), chunk)
+                db.session.commit()
+                chunk = []
+        if chunk:
+            db.session.execute(insert(AttackLog), chunk)
+            db.session.commit()
+        print(f"{args.rows:,} older rows in {time.perf_counter() - start:.0f}s")
+
+        mapping = buffer._open()
+        header = list(recent_buffer.HEADER.unpack_from(mapping))
+        header[6] = header[7] = recent_buffer._to_us(day_ago)  # horizon, created
+        recent_buffer.HEADER.pack_into(mapping, 0, *header)
+
+        live = list(synthetic_rows(args.live, days=1, seed=2))
+        for i, row in enumerate(live):
+            row['timestamp'] = day_ago + timedelta(days=1) * (i + 1) / (args.live + 1)
+        start = time.perf_counter()
+        for i in range(0, len(live), args.batch):
+            write_attack_rows(live[i:i + args.batch])
+        elapsed = time.perf_counter() - start
+
+        # The append on its own, into a scratch buffer of the same size
+        scratch = recent_buffer.RecentAttackBuffer(os.path.join(tempfile.mkdtemp(), 'scratch'),
+                                                   capacity=buffer.capacity, hours=buffer.hours)
+        start = time.perf_counter()
+        for i in range(0, len(live), args.batch):
+            scratch.append(live[i:i + args.batch], range(i, i + args.batch))
+        appending = time.perf_counter() - start
+        print(f"{args.live:,} live rows through ingest in {elapsed:.1f}s; appending to the buffer is "
+              f"{appending / args.live * 1e6:.1f} us a row ({appending / elapsed:.1%} of the write path)")
+        print(f"buffer: {buffer.get_stats()}")
+
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+
+    client = app.test_client()
+    print(f"\n{'endpoint':<42} {'':>7} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for path in ENDPOINTS:
+        for label, state in (('buffer', buffer), ('sql', None)):
+            routes.recent_buffer = state
+            client.get(path).close()  # warm up
+            p50, p99, statements = time_endpoint(client, path, args.repeat)
+            print(f"{path:<42} {label:>7} {p50:>8.2f} {p99:>8.2f} {statements:>8.1f}")
+    routes.recent_buffer = buffer
+
+
+if __name__ == '__main__':
+    main()
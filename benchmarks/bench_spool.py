@@ -0,0 +1,99 @@
+"""Append throughput of the attack spool and how fast a spooled backlog replays.
+
+Three measurements:
+  * append: rows/s and MB/s through SpoolWriter.append for several batch sizes,
+    with fsync on every append and batched once per second
+  * scan: rows/s decoding the whole backlog through mmap, no database
+  * replay: rows/s loading the backlog into attack_logs (rollups included), with
+    and without the session_id duplicate check
+
+Runs against a throwaway SQLite file unless DATABASE_URL is set.
+
+Usage:
+    python benchmarks/bench_spool.py --rows 200000 --batch-sizes 1 100 500
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_spool.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from sqlalchemy import delete
+from datagen import synthetic_rows
+from spool import SpoolWriter, SpoolReplayer, list_segments, read_segment
+from storage import storage
+from ingest import write_attack_rows
+import schema
+
+
+def bench_append(rows, batch_size, fsync_interval, directory):
+    shutil.rmtree(directory, ignore_errors=True)
+    writer = SpoolWriter(directory, fsync_interval=fsync_interval)
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        writer.append(rows[i:i + batch_size])
+    writer.close()
+    return time.perf_counter() - start, writer
+
+
+def bench_scan(directory):
+    start = time.perf_counter()
+    count = 0
+    for _, path in list_segments(directory):
+        for rows, _ in read_segment(path):
+            count += len(rows)
+    return time.perf_counter() - start, count
+
+
+def bench_replay(directory, batch_size, dedupe):
+    with storage.begin() as connection:
+        for table in (schema.attack_logs, schema.attack_rollups, schema.attack_rollup_dimensions):
+            connection.execute(delete(table))
+    backup = directory + '.bak'
+    shutil.rmtree(backup, ignore_errors=True)
+    shutil.copytree(directory, backup)  # replay removes the segments it loads
+    replayer = SpoolReplayer(backup, write_attack_rows, batch_size=batch_size, dedupe=dedupe)
+    start = time.perf_counter()
+    written = replayer.replay(active_sequence=0)
+    return time.perf_counter() - start, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 100, 500])
+    parser.add_argument('--replay-batch', type=int, default=5000)
+    args = parser.parse_args()
+
+    rows = list(synthetic_rows(args.rows, days=1))
+    directory = os.path.join(tempfile.mkdtemp(), 'spool')
+
+    print(f"{'append batch':>12} {'fsync':>10} {'rows/s':>12} {'MB/s':>8} {'syncs':>7}")
+    for batch_size in args.batch_sizes:
+        for label, interval in (('every', 0), ('1s', 1.0)):
+            count = min(len(rows), batch_size * 2000) if interval == 0 else len(rows)
+            elapsed, writer = bench_append(rows[:count], batch_size, interval, directory)
+            print(f"{batch_size:>12} {label:>10} {count / elapsed:>12,.0f} "
+                  f"{writer.appended_bytes / elapsed / 1e6:>8.1f} {writer.syncs:>7}")
+
+    elapsed, writer = bench_append(rows, args.batch_sizes[-1], 1.0, directory)
+    print(f"\nbacklog: {len(rows):,} rows, {writer.appended_bytes / 1e6:.1f} MB "
+          f"({writer.appended_bytes / len(rows):.0f} bytes/row) in {writer.segments} segment(s)")
+
+    elapsed, count = bench_scan(directory)
+    print(f"{'mmap scan':<24} {count / elapsed:>12,.0f} rows/s")
+    for dedupe in (False, True):
+        elapsed, written = bench_replay(directory, args.replay_batch, dedupe)
+        label = 'replay' + (' + dedupe' if dedupe else '')
+        print(f"{label:<24} {written / elapsed:>12,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
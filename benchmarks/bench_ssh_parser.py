@@ -0,0 +1,126 @@
+"""Packets parsed per second by the incremental SSH packet buffer.
+
+Measures SSHPacketBuffer.read_packet() over streams delivered in different chunk
+sizes, for unencrypted KEXINIT packets (the version/KEXINIT phase every scanner
+goes through) and for encrypted userauth packets under each supported cipher.
+A naive bytes-slicing parser of the unencrypted framing is included as a reference
+point, and the full-handshake rate shows the CPU cost of a whole session.
+
+Usage:
+    python benchmarks/bench_ssh_parser.py --packets 20000 --chunks 64 1460 65536
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ssh_crypto import Ed25519PrivateKey, create_cipher
+from ssh_protocol import (SSHPacketBuffer, SSHPacketWriter, SSHServerSession, SERVER_ALGORITHMS,
+                          build_kexinit, encode_string, MSG_USERAUTH_REQUEST)
+from ssh_client import ScriptedSSHClient, converse
+
+# A client KEXINIT the size of a current OpenSSH one
+CLIENT_ALGORITHMS = dict(SERVER_ALGORITHMS, kex_algorithms=[
+    'sntrup761x25519-sha512@openssh.com', 'curve25519-sha256', 'curve25519-sha256@libssh.org',
+    'ecdh-sha2-nistp256', 'ecdh-sha2-nistp384', 'ecdh-sha2-nistp521', 'diffie-hellman-group-exchange-sha256',
+    'diffie-hellman-group16-sha512', 'diffie-hellman-group18-sha512', 'diffie-hellman-group14-sha256',
+    'ext-info-c'
+])
+USERAUTH = (bytes([MSG_USERAUTH_REQUEST]) + encode_string('root') + encode_string('ssh-connection')
+            + encode_string('password') + b'\x00' + encode_string('correct horse battery staple'))
+
+CIPHER_SETUPS = {
+    'chacha20-poly1305': ('chacha20-poly1305@openssh.com', 64, 0, None),
+    'aes128-ctr+hmac-sha2-256': ('aes128-ctr', 16, 16, 'hmac-sha2-256'),
+}
+
+
+def make_cipher(setup):
+    name, key_length, iv_length, mac_name = setup
+    return create_cipher(name, b'k' * key_length, b'i' * iv_length if iv_length else None,
+                         mac_name, b'm' * 32 if mac_name else None)
+
+
+def build_stream(payload, count, setup=None):
+    writer = SSHPacketWriter()
+    if setup:
+        writer.cipher = make_cipher(setup)
+    return b''.join(writer.build(payload) for _ in range(count))
+
+
+def parse_stream(stream, chunk_size, setup=None):
+    buffer = SSHPacketBuffer()
+    if setup:
+        buffer.cipher = make_cipher(setup)
+    view = memoryview(stream)
+    packets = 0
+    start = time.perf_counter()
+    for offset in range(0, len(stream), chunk_size):
+        buffer.feed(view[offset:offset + chunk_size])
+        while True:
+            payload = buffer.read_packet()
+            if payload is None:
+                break
+            payload.release()
+            packets += 1
+    return packets, time.perf_counter() - start
+
+
+def naive_parse(stream, chunk_size):
+    """Unencrypted framing with bytes concatenation and slicing, for comparison"""
+    buffer = b''
+    packets = 0
+    start = time.perf_counter()
+    for offset in range(0, len(stream), chunk_size):
+        buffer += stream[offset:offset + chunk_size]
+        while len(buffer) >= 4:
+            length = int.from_bytes(buffer[:4], 'big')
+            if len(buffer) < 4 + length:
+                break
+            buffer = buffer[4 + length:]
+            packets += 1
+    return packets, time.perf_counter() - start
+
+
+def handshake_rate(seconds=3.0):
+    host_key = Ed25519PrivateKey(bytes(32))
+    sessions = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        server = SSHServerSession(host_key)
+        converse(server, ScriptedSSHClient(passwords=['a', 'b', 'c']))
+        assert len(server.auth_attempts) == 3
+        sessions += 1
+    return sessions / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packets', type=int, default=20000)
+    parser.add_argument('--chunks', nargs='+', type=int, default=[64, 1460, 65536])
+    args = parser.parse_args()
+
+    kexinit_stream = build_stream(build_kexinit(bytes(16), CLIENT_ALGORITHMS), args.packets)
+    print(f"{'stream':<28} {'chunk':>6} {'packets/s':>12} {'MB/s':>8}")
+    for chunk in args.chunks:
+        for label, parse in (('kexinit (memoryview)', lambda: parse_stream(kexinit_stream, chunk)),
+                             ('kexinit (naive bytes)', lambda: naive_parse(kexinit_stream, chunk))):
+            packets, elapsed = parse()
+            assert packets == args.packets
+            print(f"{label:<28} {chunk:>6} {packets / elapsed:>12,.0f} {len(kexinit_stream) / elapsed / 1e6:>8.1f}")
+
+    encrypted_packets = max(args.packets // 10, 1)
+    for label, setup in CIPHER_SETUPS.items():
+        stream = build_stream(USERAUTH, encrypted_packets, setup)
+        for chunk in args.chunks:
+            packets, elapsed = parse_stream(stream, chunk, setup)
+            assert packets == encrypted_packets
+            print(f"{'userauth ' + label:<28} {chunk:>6} {packets / elapsed:>12,.0f} {len(stream) / elapsed / 1e6:>8.1f}")
+
+    print(f"\nfull handshakes (kex + 3 password attempts), one core: {handshake_rate():.1f}/s")
+
+
+if __name__ == '__main__':
+    main()
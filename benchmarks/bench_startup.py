@@ -0,0 +1,131 @@
+"""Sensor startup cost and per-batch write overhead without the Flask app.
+
+Three measurements:
+  * imports: `python -X importtime -c "import <module>"` for the sensor modules
+    and for app (the dashboard), reporting cumulative import time, modules loaded
+    and whether Flask / SQLAlchemy came along
+  * time to listen: wall time from starting a fresh interpreter until a
+    honeypot accepts on its port, for the sensor on its own and with `import app`
+    first (the import graph honeypot.py used to have)
+  * writes: one batch of attack rows through storage.write_attack_rows (Core
+    connection) and through the dashboard's Flask-SQLAlchemy session inside an
+    app context, for several batch sizes
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 5 --batch-sizes 1 10 100
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_startup.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from bench_connections import free_port
+
+IMPORT_TARGETS = ['honeypot', 'runner', 'ingest', 'storage', 'app']
+HEAVY_PACKAGES = ['flask', 'jinja2', 'sqlalchemy', 'sqlalchemy.orm', 'requests']
+IMPORTTIME_LINE = re.compile(r'import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def import_profile(module):
+    """Cumulative import time (ms) of a module in a fresh interpreter, plus what it pulled in"""
+    probe = (f"import {module}, sys; print(len(sys.modules)); "
+             f"print(','.join(m for m in {HEAVY_PACKAGES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    total = 0
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and not match.group(2) and match.group(3) == module:
+            total = int(match.group(1)) / 1000
+    modules, heavy = result.stdout.splitlines()[:2]
+    return total, int(modules), heavy
+
+
+def time_to_listen(preload):
+    """Seconds from interpreter start until a honeypot accepts connections"""
+    port = free_port()
+    code = (f"{'import app; ' if preload else ''}from honeypot import create_honeypot_server; "
+            f"create_honeypot_server(host='127.0.0.1', port={port}, admission=None).start()")
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.05).close()
+                return time.perf_counter() - start
+            except OSError:
+                if proc.poll() is not None:
+                    raise RuntimeError("honeypot process exited before listening")
+                time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def bench_writes(batch_sizes, repeat):
+    from sqlalchemy import insert
+    from datagen import synthetic_rows
+    from storage import storage
+    from app import app, db
+    from models import AttackLog
+    import rollups
+
+    def flask_session_write(rows):
+        with app.app_context():
+            db.session.execute(insert(AttackLog), rows)
+            rollups.apply_attack_rows(db.session, rows)
+            db.session.commit()
+
+    rows = synthetic_rows(10 ** 9, days=0.01, seed=3)  # one hour bucket, so rollup work stays constant
+    results = []
+    for batch_size in batch_sizes:
+        timings = {}
+        for label, write in (('storage (Core)', storage.write_attack_rows), ('Flask session', flask_session_write)):
+            samples = []
+            for _ in range(repeat):
+                batch = [next(rows) for _ in range(batch_size)]
+                start = time.perf_counter()
+                write(batch)
+                samples.append(time.perf_counter() - start)
+            timings[label] = statistics.median(samples) * 1000
+        results.append((batch_size, timings))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 10, 100])
+    args = parser.parse_args()
+
+    print(f"{'import':<10} {'ms':>8} {'modules':>8}  heavy packages loaded")
+    for module in IMPORT_TARGETS:
+        profiles = [import_profile(module) for _ in range(args.repeat)]
+        print(f"{module:<10} {statistics.median(p[0] for p in profiles):>8.0f} {profiles[0][1]:>8}  "
+              f"{profiles[0][2] or '-'}")
+
+    print(f"\n{'time to listen':<24} {'ms':>8}")
+    for label, preload in (('sensor', False), ('sensor + import app', True)):
+        samples = [time_to_listen(preload) for _ in range(args.repeat)]
+        print(f"{label:<24} {statistics.median(samples) * 1000:>8.0f}")
+
+    print(f"\n{'batch':>6} {'storage (Core) ms':>18} {'Flask session ms':>17}")
+    for batch_size, timings in bench_writes(args.batch_sizes, args.repeat * 4):
+        print(f"{batch_size:>6} {timings['storage (Core)']:>18.2f} {timings['Flask session']:>17.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Attacks-over-time queries: the old strftime grouping vs. the time-series layer.
+
+Populates a throwaway SQLite database (or DATABASE_URL, e.g. a local
+PostgreSQL) with --rows attacks spread over --days days, builds the rollups,
+then times 7-day and 90-day series three ways:
+  * strftime: the hourly GROUP BY on a formatted timestamp the endpoint used to
+    run (SQLite only; Postgres has no strftime), missing hours omitted
+  * rows: the dialect's native bucket expression over attack_logs
+  * rollups: the same buckets summed from the hour/day rollup tables
+each at 1h and at the resolution auto picks, reporting the median time and the
+number of points returned.
+
+Usage:
+    python benchmarks/bench_timeseries.py --rows 10000000
+    DATABASE_URL=postgresql://localhost/honeypot_bench python benchmarks/bench_timeseries.py
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench_timeseries.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from sqlalchemy import func
+from app import app, db
+from models import AttackLog
+import rollups
+import timeseries
+from datagen import populate_attack_logs
+
+WINDOWS = [('7d', 7 * 24), ('90d', 90 * 24)]
+
+
+def strftime_series(hours):
+    since = datetime.utcnow() - timedelta(hours=hours)
+    return db.session.query(
+        func.strftime('%Y-%m-%d %H:00:00', AttackLog.timestamp).label('hour'),
+        func.count(AttackLog.id).label('count')
+    ).filter(
+        AttackLog.timestamp >= since
+    ).group_by('hour').order_by('hour').all()
+
+
+def layer_series(hours, resolution, use_rollups):
+    rollups.ROLLUPS_ENABLED = use_rollups
+    return timeseries.attack_series(db.session, hours, resolution)[1]
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        populate_attack_logs(db, args.rows, days=args.days)
+        print(f"{args.rows:,} rows over {args.days} days in {time.perf_counter() - start:.0f}s")
+        start = time.perf_counter()
+        rollups.rebuild_rollups(db.session, chunk_size=50000)
+        print(f"rollup backfill: {time.perf_counter() - start:.0f}s")
+        dialect = db.engine.dialect.name
+
+        print(f"\n{'window':<7} {'method':<10} {'resolution':<12} {'ms':>10} {'points':>7}")
+        for label, hours in WINDOWS:
+            runs = []
+            if dialect == 'sqlite':
+                runs.append(('strftime', '1h -> 1h', lambda: strftime_series(hours)))
+            for resolution in ('1h', 'auto'):
+                step = timeseries.choose_step(hours * 3600, resolution)
+                name = f"{resolution} -> {step // 3600}h" if step >= 3600 else f"{resolution} -> {step // 60}m"
+                runs.append(('rows', name, lambda resolution=resolution: layer_series(hours, resolution, False)))
+                runs.append(('rollups', name, lambda resolution=resolution: layer_series(hours, resolution, True)))
+            for method, name, function in runs:
+                elapsed, points = timed(function, args.repeat)
+                print(f"{label:<7} {method:<10} {name:<12} {elapsed:>10.1f} {points:>7}")
+
+
+if __name__ == '__main__':
+    main()
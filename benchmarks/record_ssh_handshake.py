@@ -0,0 +1,112 @@
+"""Record SSH handshakes into the replay/fuzz corpus (benchmarks/ssh_corpus/).
+
+The server side runs with a fixed host key and a seeded random stream, so the
+recorded client bytes (encrypted parts included) decrypt identically when
+replayed by fuzz_ssh_protocol.py.
+
+Usage:
+    # wait for one connection from a real client, e.g.
+    #   ssh -p 2299 -o UserKnownHostsFile=/dev/null root@127.0.0.1
+    python benchmarks/record_ssh_handshake.py --port 2299 --name openssh_password
+    # or generate a handshake with the built-in scripted client
+    python benchmarks/record_ssh_handshake.py --scripted --cipher aes128-ctr --name scripted_aes128
+"""
+import argparse
+import base64
+import json
+import os
+import socket
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ssh_crypto import Ed25519PrivateKey
+from ssh_protocol import SSHServerSession
+from ssh_client import ScriptedSSHClient, converse, deterministic_random
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ssh_corpus')
+HOST_KEY_SEED = bytes(range(32))
+
+
+def new_session(random_seed, shell_factory=None):
+    return SSHServerSession(Ed25519PrivateKey(HOST_KEY_SEED), random_bytes=deterministic_random(random_seed),
+                            shell_factory=shell_factory)
+
+
+def expected_capture(session):
+    return {
+        'client_version': session.client_version,
+        'auth_attempts': session.auth_attempts,
+        'error': session.error,
+    }
+
+
+def record_connection(port, random_seed):
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', port))
+    listener.listen(1)
+    print(f"Waiting for one SSH connection on 127.0.0.1:{port}")
+    connection, _ = listener.accept()
+    connection.settimeout(30)
+    session = new_session(random_seed)
+    received = []
+    try:
+        connection.sendall(session.start())
+        while not session.closed:
+            data = connection.recv(4096)
+            if not data:
+                break
+            received.append(data)
+            output = session.receive(data)
+            if output:
+                connection.sendall(output)
+    except OSError:
+        pass
+    finally:
+        connection.close()
+        listener.close()
+    return session, received
+
+
+def record_scripted(args, random_seed):
+    session = new_session(random_seed)
+    client = ScriptedSSHClient(username=args.username, passwords=args.passwords, ciphers=args.cipher,
+                               random_bytes=deterministic_random(random_seed + b'client'))
+    received = []
+    converse(session, client, received)
+    return session, [chunk for chunk in received if chunk]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--name', required=True)
+    parser.add_argument('--description', default='')
+    parser.add_argument('--port', type=int, default=2299)
+    parser.add_argument('--scripted', action='store_true', help='use the built-in client instead of listening')
+    parser.add_argument('--cipher', action='append')
+    parser.add_argument('--username', default='root')
+    parser.add_argument('--passwords', nargs='+', default=['123456', 'admin', 'password'])
+    args = parser.parse_args()
+
+    random_seed = args.name.encode()
+    if args.scripted:
+        session, received = record_scripted(args, random_seed)
+    else:
+        session, received = record_connection(args.port, random_seed)
+
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    path = os.path.join(CORPUS_DIR, f"{args.name}.json")
+    with open(path, 'w') as f:
+        json.dump({
+            'description': args.description,
+            'random_seed': random_seed.decode(),
+            'chunks': [base64.b64encode(chunk).decode() for chunk in received],
+            'expected': expected_capture(session),
+        }, f, indent=2)
+        f.write('\n')
+    print(f"Wrote {path}: {expected_capture(session)}")
+
+
+if __name__ == '__main__':
+    main()
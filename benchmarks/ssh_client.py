@@ -0,0 +1,166 @@
+"""Minimal scripted SSH client shared by the SSH benchmarks and the corpus tools.
+
+Sans-IO like SSHServerSession: start() returns the opening bytes, receive() returns
+replies. It performs a real curve25519 key exchange (without verifying the host
+key) and then tries each password in turn. If a password is accepted and commands
+were given, it opens a pty shell and types them one per prompt, then exits.
+"""
+import hashlib
+import os
+
+from ssh_crypto import x25519, X25519_BASE
+from ssh_protocol import (
+    SSHPacketBuffer, SSHPacketWriter, SSHReader, SERVER_ALGORITHMS, build_kexinit, parse_kexinit,
+    negotiate, compute_exchange_hash, derive_ciphers, encode_string, encode_mpint,
+    MSG_DISCONNECT, MSG_KEXINIT, MSG_NEWKEYS, MSG_KEX_ECDH_INIT, MSG_KEX_ECDH_REPLY,
+    MSG_SERVICE_REQUEST, MSG_SERVICE_ACCEPT, MSG_USERAUTH_REQUEST, MSG_USERAUTH_FAILURE,
+    MSG_USERAUTH_SUCCESS, MSG_CHANNEL_OPEN, MSG_CHANNEL_OPEN_CONFIRMATION, MSG_CHANNEL_DATA,
+    MSG_CHANNEL_CLOSE, MSG_CHANNEL_REQUEST, encode_uint32
+)
+
+PROMPT_ENDINGS = (b'# ', b'$ ')
+
+
+def deterministic_random(seed):
+    """os.urandom stand-in producing a reproducible stream, for recordable handshakes"""
+    state = {'counter': 0}
+
+    def random_bytes(length):
+        state['counter'] += 1
+        return hashlib.shake_256(seed + state['counter'].to_bytes(8, 'big')).digest(length)
+    return random_bytes
+
+
+class ScriptedSSHClient:
+    def __init__(self, username='root', passwords=('123456',), version='SSH-2.0-libssh_0.9.6',
+                 ciphers=None, random_bytes=os.urandom, commands=None, paused=False):
+        self.username = username
+        self.passwords = list(passwords)
+        self.commands = list(commands or [])
+        self.paused = paused  # hold commands at the first prompt until resume()
+        self.at_prompt = False
+        self.output = bytearray()
+        self.version = version
+        self.random_bytes = random_bytes
+        algorithms = dict(SERVER_ALGORITHMS)
+        if ciphers:
+            algorithms['encryption_client_to_server'] = list(ciphers)
+            algorithms['encryption_server_to_client'] = list(ciphers)
+        self.algorithms = algorithms
+        self.kexinit = build_kexinit(random_bytes(16), algorithms)
+        self.reader = SSHPacketBuffer()
+        self.writer = SSHPacketWriter(random_bytes)
+        self.state = 'version'
+        self.server_version = None
+        self.private = None
+        self.incoming = None
+        self.failures = 0
+        self.closed = False
+
+    def start(self):
+        return self.version.encode() + b'\r\n' + self.writer.build(self.kexinit)
+
+    def receive(self, data):
+        self.reader.feed(data)
+        output = []
+        if self.state == 'version':
+            line = self.reader.read_line()
+            if line is None:
+                return b''
+            self.server_version = line.decode()
+            self.state = 'kexinit'
+        while not self.closed:
+            payload = self.reader.read_packet()
+            if payload is None:
+                break
+            self._handle(bytes(payload), output)
+            payload.release()
+        return b''.join(output)
+
+    def _handle(self, payload, output):
+        message = payload[0]
+        if message == MSG_DISCONNECT:
+            self.closed = True
+        elif message == MSG_KEXINIT:
+            self.server_kexinit = payload
+            self.negotiated = negotiate(self.algorithms, parse_kexinit(payload))
+            self.private = self.random_bytes(32)
+            self.public = x25519(self.private, X25519_BASE)
+            output.append(self.writer.build(bytes([MSG_KEX_ECDH_INIT]) + encode_string(self.public)))
+        elif message == MSG_KEX_ECDH_REPLY:
+            reader = SSHReader(payload[1:])
+            host_key_blob = bytes(reader.read_string())
+            server_public = bytes(reader.read_string())
+            secret = encode_mpint(int.from_bytes(x25519(self.private, server_public), 'big'))
+            exchange_hash = compute_exchange_hash(
+                self.version, self.server_version, self.kexinit, self.server_kexinit,
+                host_key_blob, self.public, server_public, secret)
+            outgoing, self.incoming = derive_ciphers(self.negotiated, secret, exchange_hash, exchange_hash)
+            output.append(self.writer.build(bytes([MSG_NEWKEYS])))
+            self.writer.cipher = outgoing
+            output.append(self.writer.build(bytes([MSG_SERVICE_REQUEST]) + encode_string('ssh-userauth')))
+        elif message == MSG_NEWKEYS:
+            self.reader.cipher = self.incoming
+        elif message == MSG_SERVICE_ACCEPT:
+            self._next_password(output)
+        elif message == MSG_USERAUTH_FAILURE:
+            self.failures += 1
+            self._next_password(output)
+        elif message == MSG_USERAUTH_SUCCESS:
+            self.passwords = []
+            output.append(self.writer.build(
+                bytes([MSG_CHANNEL_OPEN]) + encode_string('session') + encode_uint32(0)
+                + encode_uint32(2 ** 21) + encode_uint32(32768)))
+        elif message == MSG_CHANNEL_OPEN_CONFIRMATION:
+            channel = payload[5:9]
+            output.append(self.writer.build(
+                bytes([MSG_CHANNEL_REQUEST]) + channel + encode_string('pty-req') + b'\x00'
+                + encode_string('xterm') + encode_uint32(80) + encode_uint32(24) + encode_uint32(0)
+                + encode_uint32(0) + encode_string(b'\x00')))
+            output.append(self.writer.build(
+                bytes([MSG_CHANNEL_REQUEST]) + channel + encode_string('shell') + b'\x00'))
+            self.channel = channel
+        elif message == MSG_CHANNEL_DATA:
+            self.output += SSHReader(payload[5:]).read_string()
+            if self.output.endswith(PROMPT_ENDINGS):
+                self.at_prompt = True
+                if not self.paused:
+                    self._next_command(output)
+        elif message == MSG_CHANNEL_CLOSE:
+            output.append(self.writer.build(bytes([MSG_CHANNEL_CLOSE]) + self.channel))
+            self.closed = True
+
+    def resume(self):
+        """Start typing the commands held at the prompt; returns the bytes to send"""
+        self.paused = False
+        output = []
+        if self.at_prompt:
+            self._next_command(output)
+        return b''.join(output)
+
+    def _next_command(self, output):
+        self.at_prompt = False
+        command = self.commands.pop(0) if self.commands else 'exit'
+        output.append(self.writer.build(
+            bytes([MSG_CHANNEL_DATA]) + self.channel + encode_string(command.encode() + b'\r')))
+
+    def _next_password(self, output):
+        if not self.passwords:
+            self.closed = True
+            return
+        output.append(self.writer.build(
+            bytes([MSG_USERAUTH_REQUEST]) + encode_string(self.username) + encode_string('ssh-connection')
+            + encode_string('password') + b'\x00' + encode_string(self.passwords.pop(0))))
+
+
+def converse(server, client, record=None):
+    """Run a client and server session against each other in memory; optionally record client bytes"""
+    to_client = server.start()
+    to_server = client.start()
+    while (to_client or to_server) and not (server.closed and client.closed):
+        if record is not None:
+            record.append(to_server)
+        reply = server.receive(to_server) if to_server else b''
+        to_server = client.receive(to_client + reply) if (to_client or reply) else b''
+        to_client = b''
+    return server
@@ -0,0 +1,123 @@
+import click
+from app import app, db
+from rollups import rebuild_rollups
+from response_cache import response_cache
+
+@app.cli.command('backfill-rollups')
+@click.option('--chunk-size', default=10000, show_default=True, help='Attack rows folded per transaction')
+def backfill_rollups_command(chunk_size):
+    """Rebuild the hourly/daily rollups, top-k sketches and HoneypotStats from existing attack logs"""
+    from sketch_rollups import rebuild_sketches
+    total = rebuild_rollups(db.session, chunk_size=chunk_size)
+    rebuild_sketches(db.session, chunk_size=chunk_size)
+    response_cache.bump()
+    click.echo(f"Rolled up {total} attack rows")
+
+@app.cli.command('migrate')
+@click.option('--target', type=int, default=None, help='Stop after this migration version')
+def migrate_command(target):
+    """Apply pending schema migrations (indexes etc.) to an existing database"""
+    from migrations import current_version, upgrade
+    applied = upgrade(db.engine, target=target)
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    click.echo(f"Schema version: {current_version(db.engine)}")
+
+@app.cli.command('explain-queries')
+@click.option('--fail-on-scan', is_flag=True, help='Exit non-zero if any route query scans attack_logs')
+def explain_queries_command(fail_on_scan):
+    """Print the query plan of each route query and flag full table scans"""
+    from migrations import check_query_plans
+    full_scans = 0
+    for name, (plan, full_scan) in check_query_plans(db.session.connection()).items():
+        full_scans += full_scan
+        click.echo(f"{'FULL SCAN ' if full_scan else ''}{name}")
+        for line in plan:
+            click.echo(f"    {line}")
+    if fail_on_scan and full_scans:
+        raise SystemExit(1)
+
+@app.cli.command('replay-spool')
+@click.argument('directory')
+@click.option('--batch-size', default=5000, show_default=True, help='Attack rows written per transaction')
+def replay_spool_command(directory, batch_size):
+    """Load an attack spool directory (e.g. copied from a stopped sensor) into the database"""
+    from spool import SpoolReplayer
+    from ingest import write_attack_rows
+    replayer = SpoolReplayer(directory, write_attack_rows, batch_size=batch_size)
+    # No live writer here: every segment is complete, including the newest
+    written = replayer.replay(active_sequence=0)
+    click.echo(f"Replayed {written} attack rows ({replayer.duplicates} already stored, "
+               f"{replayer.corrupt_bytes} unreadable bytes skipped, "
+               f"{replayer.rejected} rows refused and moved to {replayer.reject_path})")
+
+@app.cli.command('archive')
+@click.option('--older-than', type=int, default=None,
+              help='Archive whole days older than this many days [default: ARCHIVE_AFTER_DAYS or 90]')
+@click.option('--keep-rows', is_flag=True, help='Export only: leave the archived rows in attack_logs')
+def archive_command(older_than, keep_rows):
+    """Move old attack logs into the columnar archive in ARCHIVE_DIR"""
+    import os
+    from datetime import datetime, timedelta
+    from archive import attack_archive
+    if attack_archive is None:
+        raise click.UsageError("Set ARCHIVE_DIR to enable the archive")
+    if older_than is None:
+        older_than = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    total = attack_archive.archive_before(db.engine, today - timedelta(days=older_than), keep_rows=keep_rows)
+    response_cache.bump()
+    click.echo(f"Archived {total} attack rows ({attack_archive.file_format}) to {attack_archive.directory}")
+
+@app.cli.command('partition-attack-logs')
+@click.option('--period', type=click.Choice(['day', 'week']), default=None,
+              help='Partition span [default: ATTACK_PARTITION_PERIOD or day]')
+def partition_attack_logs_command(period):
+    """Convert attack_logs into time partitions (stop the sensor first; this rewrites the table)"""
+    import dimensions
+    import partitions
+    from migrations import pending_migrations
+    with db.engine.connect() as connection:
+        if dimensions.is_normalized(connection):
+            raise click.UsageError("Normalized attack_logs cannot be partitioned")
+    if pending_migrations(db.engine):
+        raise click.UsageError("Run 'flask migrate' first")
+    period = period or partitions.PARTITION_PERIOD or 'day'
+    count = partitions.partition_attack_logs(db.engine, period)
+    if count is None:
+        click.echo("attack_logs is already partitioned")
+        return
+    response_cache.bump()
+    click.echo(f"Moved {count} attack rows into {period} partitions")
+
+@app.cli.command('maintain-partitions')
+@click.option('--retention-days', type=int, default=None,
+              help='Drop partitions wholly older than this many days, 0 to keep all [default: ATTACK_RETENTION_DAYS]')
+def maintain_partitions_command(retention_days):
+    """Create upcoming attack_logs partitions and drop expired ones (archiving them first when ARCHIVE_DIR is set)"""
+    import partitions
+    from archive import attack_archive
+    if retention_days is None:
+        retention_days = partitions.RETENTION_DAYS
+    created, dropped = partitions.maintain(db.engine, retention_days, archive=attack_archive)
+    if dropped:
+        response_cache.bump()
+    click.echo(f"Created {created} partitions, dropped {len(dropped)}{': ' + ', '.join(dropped) if dropped else ''}")
+
+@app.cli.command('normalize-attack-logs')
+def normalize_attack_logs_command():
+    """Move attack_logs' repeated text columns into dimension tables (stop the sensor first; this rewrites the table)"""
+    import dimensions
+    import partitions
+    from migrations import pending_migrations
+    with db.engine.connect() as connection:
+        if partitions.is_partitioned(connection):
+            raise click.UsageError("Partitioned attack_logs cannot be normalized")
+    if pending_migrations(db.engine):
+        raise click.UsageError("Run 'flask migrate' first")
+    count = dimensions.normalize_attack_logs(db.engine)
+    if count is None:
+        click.echo("attack_logs is already normalized")
+        return
+    response_cache.bump()
+    click.echo(f"Normalized {count} attack rows into dimension tables")
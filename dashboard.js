@@ -1,9 +1,27 @@
+// Attacker-supplied values (credentials, locations) must be escaped before going into HTML
+function escapeHtml(value) {
+    return String(value)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
 class HoneypotDashboard {
     constructor() {
         this.charts = {};
         this.map = null;
         this.updateInterval = 30000; // 30 seconds
+        this.resyncInterval = 300000; // full reload at least this often while deltas arrive
         this.autoUpdateEnabled = true;
+        this.liveFeed = null;
+        this.liveConnected = false;
+        this.liveFeedOpened = false;
+        this.lastDeltaAt = 0;
+        this.lastLoadAt = 0;
+        this.timelineHours = [];
+        this.mapLocations = new Map();
         this.init();
     }
 
@@ -11,6 +29,7 @@ class HoneypotDashboard {
         this.initializeCharts();
         this.initializeMap();
         this.startAutoUpdate();
+        this.startLiveFeed();
         this.bindEvents();
         this.loadInitialData();
     }
@@ -134,8 +153,10 @@ class HoneypotDashboard {
                 this.autoUpdateEnabled = e.target.checked;
                 if (this.autoUpdateEnabled) {
                     this.startAutoUpdate();
+                    this.startLiveFeed();
                 } else {
                     this.stopAutoUpdate();
+                    this.stopLiveFeed();
                 }
             });
         }
@@ -164,11 +185,22 @@ class HoneypotDashboard {
         
         if (this.autoUpdateEnabled) {
             this.updateTimer = setInterval(() => {
-                this.loadInitialData();
+                if (!this.liveFeedCurrent()) {
+                    this.loadInitialData();
+                }
             }, this.updateInterval);
         }
     }
 
+    liveFeedCurrent() {
+        // Deltas keep the page current only while they actually arrive; a connected
+        // feed that stays quiet may be served by a process that never sees them
+        const now = Date.now();
+        return this.liveConnected &&
+            now - this.lastDeltaAt < this.updateInterval &&
+            now - this.lastLoadAt < this.resyncInterval;
+    }
+
     stopAutoUpdate() {
         if (this.updateTimer) {
             clearInterval(this.updateTimer);
@@ -176,7 +208,179 @@ class HoneypotDashboard {
         }
     }
 
+    startLiveFeed() {
+        if (!window.EventSource || this.liveFeed || !this.autoUpdateEnabled) {
+            return;
+        }
+
+        this.liveFeed = new EventSource('/api/live');
+
+        this.liveFeed.addEventListener('open', () => {
+            const reconnected = this.liveFeedOpened && !this.liveConnected;
+            this.liveFeedOpened = true;
+            this.liveConnected = true;
+            if (reconnected) {
+                // Deltas published while disconnected were missed
+                this.loadInitialData();
+            }
+        });
+
+        this.liveFeed.addEventListener('error', () => {
+            // EventSource reconnects on its own; poll at the normal rate meanwhile
+            this.liveConnected = false;
+        });
+
+        this.liveFeed.addEventListener('attacks', (e) => {
+            this.lastDeltaAt = Date.now();
+            this.applyAttackDeltas(JSON.parse(e.data).attacks);
+        });
+
+        this.liveFeed.addEventListener('locations', (e) => {
+            this.lastDeltaAt = Date.now();
+            this.applyLocationDeltas(JSON.parse(e.data).locations);
+        });
+    }
+
+    stopLiveFeed() {
+        if (this.liveFeed) {
+            this.liveFeed.close();
+            this.liveFeed = null;
+        }
+        this.liveConnected = false;
+        this.liveFeedOpened = false;
+    }
+
+    applyAttackDeltas(attacks) {
+        if (!attacks || attacks.length === 0) {
+            return;
+        }
+
+        attacks.forEach(attack => {
+            this.incrementTimeline(attack.timestamp);
+            if (attack.country) {
+                this.incrementChartValue(this.charts.country, attack.country, 20);
+            }
+            if (attack.username) {
+                this.incrementChartValue(this.charts.credentials, attack.username, 10);
+            }
+            this.addMapAttack(attack);
+        });
+
+        ['timeline', 'country', 'credentials'].forEach(name => {
+            if (this.charts[name]) {
+                this.charts[name].update('none');
+            }
+        });
+
+        // Newest first, like /api/attacks/recent
+        this.prependRecentAttacks(attacks.slice().reverse());
+    }
+
+    applyLocationDeltas(locations) {
+        if (!locations || locations.length === 0) {
+            return;
+        }
+
+        locations.forEach(location => {
+            if (location.country) {
+                this.incrementChartValue(this.charts.country, location.country, 20);
+            }
+            this.addMapAttack(location);
+        });
+
+        if (this.charts.country) {
+            this.charts.country.update('none');
+        }
+    }
+
+    incrementTimeline(timestamp) {
+        const chart = this.charts.timeline;
+        if (!chart || !timestamp) {
+            return;
+        }
+
+        // Same key format as /api/attacks/by-hour
+        const hour = `${timestamp.slice(0, 13).replace('T', ' ')}:00:00`;
+        let index = this.timelineHours.indexOf(hour);
+        if (index === -1) {
+            this.timelineHours.push(hour);
+            chart.data.labels.push(this.formatHourLabel(hour));
+            chart.data.datasets[0].data.push(0);
+            index = this.timelineHours.length - 1;
+        }
+        chart.data.datasets[0].data[index] += 1;
+    }
+
+    incrementChartValue(chart, label, limit) {
+        if (!chart) {
+            return;
+        }
+
+        const labels = chart.data.labels;
+        const counts = chart.data.datasets[0].data;
+        const index = labels.indexOf(label);
+        if (index === -1) {
+            labels.push(label);
+            counts.push(1);
+        } else {
+            counts[index] += 1;
+        }
+
+        // Keep the chart ordered by count and capped like the API response
+        const entries = labels.map((value, i) => [value, counts[i]])
+            .sort((a, b) => b[1] - a[1])
+            .slice(0, limit);
+        chart.data.labels = entries.map(entry => entry[0]);
+        chart.data.datasets[0].data = entries.map(entry => entry[1]);
+    }
+
+    addMapAttack(attack) {
+        if (!this.map || !this.attackMarkers || !attack.latitude || !attack.longitude) {
+            return;
+        }
+
+        const key = `${attack.latitude},${attack.longitude}`;
+        let location = this.mapLocations.get(key);
+        if (!location) {
+            location = {
+                latitude: attack.latitude,
+                longitude: attack.longitude,
+                city: attack.city,
+                country: attack.country,
+                count: 0,
+                recent_attacks: []
+            };
+            location.marker = this.createMapMarker(location);
+            this.attackMarkers.addLayer(location.marker);
+            this.mapLocations.set(key, location);
+        }
+
+        location.count += 1;
+        location.recent_attacks.unshift(attack);
+        location.recent_attacks.length = Math.min(location.recent_attacks.length, 5);
+        location.marker.setRadius(this.mapMarkerRadius(location.count));
+        location.marker.setPopupContent(this.mapPopupContent(location));
+    }
+
+    prependRecentAttacks(attacks) {
+        const container = document.getElementById('recentAttacks');
+        if (!container) {
+            return;
+        }
+
+        if (!container.querySelector('.attack-item')) {
+            container.innerHTML = '';
+        }
+        attacks.slice(0, 10).reverse().forEach(attack => {
+            container.insertBefore(this.createAttackElement(attack), container.firstChild);
+        });
+        while (container.children.length > 10) {
+            container.removeChild(container.lastChild);
+        }
+    }
+
     async loadInitialData() {
+        this.lastLoadAt = Date.now();
         this.showLoading();
         
         try {
@@ -202,12 +406,10 @@ class HoneypotDashboard {
             const data = await response.json();
 
             if (this.charts.timeline) {
-                const labels = data.map(item => {
-                    const date = new Date(item.hour);
-                    return date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
-                });
+                const labels = data.map(item => this.formatHourLabel(item.hour));
                 const counts = data.map(item => item.count);
 
+                this.timelineHours = data.map(item => item.hour);
                 this.charts.timeline.data.labels = labels;
                 this.charts.timeline.data.datasets[0].data = counts;
                 this.charts.timeline.update();
@@ -217,6 +419,11 @@ class HoneypotDashboard {
         }
     }
 
+    formatHourLabel(hour) {
+        const date = new Date(hour);
+        return date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+    }
+
     async updateCountryChart() {
         try {
             const response = await fetch('/api/attacks/by-country');
@@ -260,38 +467,13 @@ class HoneypotDashboard {
 
             if (this.map && this.attackMarkers) {
                 this.attackMarkers.clearLayers();
+                this.mapLocations.clear();
 
                 data.forEach(location => {
                     if (location.latitude && location.longitude) {
-                        const marker = L.circleMarker([location.latitude, location.longitude], {
-                            radius: Math.min(8 + Math.log(location.count), 20),
-                            fillColor: '#ff0000',
-                            color: '#ff0000',
-                            weight: 1,
-                            opacity: 0.8,
-                            fillOpacity: 0.6
-                        });
-
-                        const popupContent = `
-                            <div>
-                                <h6>${location.city}, ${location.country}</h6>
-                                <p><strong>Attacks:</strong> ${location.count}</p>
-                                <div class="recent-attacks">
-                                    <strong>Recent attacks:</strong>
-                                    <ul class="list-unstyled mt-1">
-                                        ${location.recent_attacks.slice(0, 3).map(attack => 
-                                            `<li class="small">
-                                                ${attack.source_ip} (${attack.username || 'unknown'})
-                                                <br><small class="text-muted">${new Date(attack.timestamp).toLocaleString()}</small>
-                                            </li>`
-                                        ).join('')}
-                                    </ul>
-                                </div>
-                            </div>
-                        `;
-
-                        marker.bindPopup(popupContent);
-                        this.attackMarkers.addLayer(marker);
+                        location.marker = this.createMapMarker(location);
+                        this.attackMarkers.addLayer(location.marker);
+                        this.mapLocations.set(`${location.latitude},${location.longitude}`, location);
                     }
                 });
             }
@@ -300,6 +482,43 @@ class HoneypotDashboard {
         }
     }
 
+    mapMarkerRadius(count) {
+        return Math.min(8 + Math.log(count), 20);
+    }
+
+    createMapMarker(location) {
+        const marker = L.circleMarker([location.latitude, location.longitude], {
+            radius: this.mapMarkerRadius(Math.max(location.count, 1)),
+            fillColor: '#ff0000',
+            color: '#ff0000',
+            weight: 1,
+            opacity: 0.8,
+            fillOpacity: 0.6
+        });
+        marker.bindPopup(this.mapPopupContent(location));
+        return marker;
+    }
+
+    mapPopupContent(location) {
+        return `
+            <div>
+                <h6>${escapeHtml(location.city || 'Unknown')}, ${escapeHtml(location.country || 'Unknown')}</h6>
+                <p><strong>Attacks:</strong> ${escapeHtml(location.count)}</p>
+                <div class="recent-attacks">
+                    <strong>Recent attacks:</strong>
+                    <ul class="list-unstyled mt-1">
+                        ${location.recent_attacks.slice(0, 3).map(attack => 
+                            `<li class="small">
+                                ${escapeHtml(attack.source_ip)} (${escapeHtml(attack.username || 'unknown')})
+                                <br><small class="text-muted">${escapeHtml(new Date(attack.timestamp).toLocaleString())}</small>
+                            </li>`
+                        ).join('')}
+                    </ul>
+                </div>
+            </div>
+        `;
+    }
+
     async updateRecentAttacks() {
         try {
             const response = await fetch('/api/attacks/recent?hours=1');
@@ -315,26 +534,7 @@ class HoneypotDashboard {
                 }
 
                 data.slice(0, 10).forEach(attack => {
-                    const attackElement = document.createElement('div');
-                    attackElement.className = 'attack-item';
-                    attackElement.innerHTML = `
-                        <div class="d-flex justify-content-between align-items-start">
-                            <div>
-                                <div class="fw-bold ip-address">${attack.source_ip}:${attack.source_port}</div>
-                                <div class="small">
-                                    <span class="credential">${attack.username || 'unknown'}</span> / 
-                                    <span class="credential">${attack.password || 'unknown'}</span>
-                                </div>
-                                <div class="small text-muted">
-                                    ${attack.city || 'Unknown'}, ${attack.country || 'Unknown'}
-                                </div>
-                            </div>
-                            <div class="small timestamp">
-                                ${new Date(attack.timestamp).toLocaleString()}
-                            </div>
-                        </div>
-                    `;
-                    container.appendChild(attackElement);
+                    container.appendChild(this.createAttackElement(attack));
                 });
             }
         } catch (error) {
@@ -342,6 +542,29 @@ class HoneypotDashboard {
         }
     }
 
+    createAttackElement(attack) {
+        const attackElement = document.createElement('div');
+        attackElement.className = 'attack-item';
+        attackElement.innerHTML = `
+            <div class="d-flex justify-content-between align-items-start">
+                <div>
+                    <div class="fw-bold ip-address">${escapeHtml(attack.source_ip)}:${escapeHtml(attack.source_port)}</div>
+                    <div class="small">
+                        <span class="credential">${escapeHtml(attack.username || 'unknown')}</span> / 
+                        <span class="credential">${escapeHtml(attack.password || 'unknown')}</span>
+                    </div>
+                    <div class="small text-muted">
+                        ${escapeHtml(attack.city || 'Unknown')}, ${escapeHtml(attack.country || 'Unknown')}
+                    </div>
+                </div>
+                <div class="small timestamp">
+                    ${escapeHtml(new Date(attack.timestamp).toLocaleString())}
+                </div>
+            </div>
+        `;
+        return attackElement;
+    }
+
     showLoading() {
         const spinner = document.querySelector('.loading-spinner');
         if (spinner) {
@@ -361,7 +584,7 @@ class HoneypotDashboard {
         if (errorContainer) {
             errorContainer.innerHTML = `
                 <div class="alert alert-danger alert-dismissible fade show" role="alert">
-                    ${message}
+                    ${escapeHtml(message)}
                     <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
                 </div>
             `;
@@ -376,15 +599,17 @@ document.addEventListener('DOMContentLoaded', function() {
 
 // Utility functions for other pages
 window.HoneypotUtils = {
+    escapeHtml: escapeHtml,
+
     formatTimestamp: function(timestamp) {
         return new Date(timestamp).toLocaleString();
     },
 
     formatIP: function(ip) {
-        return `<span class="ip-address">${ip}</span>`;
+        return `<span class="ip-address">${escapeHtml(ip)}</span>`;
     },
 
     formatCredential: function(credential) {
-        return `<span class="credential">${credential || 'unknown'}</span>`;
+        return `<span class="credential">${escapeHtml(credential || 'unknown')}</span>`;
     }
 };
@@ -0,0 +1,229 @@
+"""Normalized attack_logs: repetitive text columns stored once, rows keep integer ids.
+
+With ATTACK_LOG_DIMENSIONS=1 a new database stores username, password,
+country, city and user_agent in one value table each (attack_usernames, ...)
+and the attack rows in attack_log_rows with an id per column; an existing
+database is converted with 'flask normalize-attack-logs'. attack_logs becomes
+a view joining the values back, so every reader, the models and to_dict see
+the same columns as before. Whether a database is normalized is read from the
+database itself.
+
+Writes go to attack_log_rows (storage.py). A ValueInterner per storage
+keeps the value -> id mappings it has seen, so a batch whose values are all
+known costs no extra statements; unseen values are inserted (or looked up, if
+another process got there first) in a short transaction of their own before
+the batch is written, and only cached once that has committed. The top-N
+endpoints group on the ids and join the few winning values afterwards
+(value_counts).
+
+Cannot be combined with time partitioning (partitions.py), which takes
+precedence for new databases.
+"""
+import logging
+import os
+import threading
+from sqlalchemy import select, insert, func, desc, text
+from sqlalchemy.dialects import postgresql, sqlite
+from schema import attack_logs, attack_log_rows, dimension_tables, dimension_metadata
+
+logger = logging.getLogger(__name__)
+
+# attack_logs columns kept in value tables, in column order
+DIMENSION_COLUMNS = [name for name in attack_logs.c.keys() if name in dimension_tables]
+
+# Lay out new databases normalized
+NORMALIZED = os.environ.get('ATTACK_LOG_DIMENSIONS', '0') == '1'
+
+# Cached values per column; a column's cache starts over when it grows past this
+INTERN_CACHE_SIZE = int(os.environ.get('DIMENSION_CACHE_SIZE', 100000))
+
+_layouts = {}  # database URL -> True if attack_logs is the normalized view there
+
+def _bind(connection):
+    # Works for a Connection or an ORM Session
+    return connection.engine if hasattr(connection, 'engine') else connection.get_bind()
+
+def is_normalized(connection):
+    """True when attack_logs is the view over attack_log_rows in this database"""
+    bind = _bind(connection)
+    key = str(bind.url)
+    normalized = _layouts.get(key)
+    if normalized is None:
+        dialect = bind.dialect.name
+        if dialect == 'sqlite':
+            kinds = dict(connection.execute(
+                text("SELECT name, type FROM sqlite_master WHERE name IN (:view, :rows)"),
+                {'view': attack_logs.name, 'rows': attack_log_rows.name}
+            ).all())
+            normalized = kinds.get(attack_logs.name) == 'view' and attack_log_rows.name in kinds
+        elif dialect == 'postgresql':
+            normalized = connection.execute(
+                text("SELECT relkind FROM pg_class WHERE relname = :name"), {'name': attack_logs.name}
+            ).scalar() == 'v'
+        else:
+            normalized = False
+        _layouts[key] = normalized
+    return normalized
+
+def forget(engine):
+    """Drop what this process remembers about an engine's layout"""
+    _layouts.pop(str(engine.url), None)
+
+def _dialect_insert(connection, table):
+    if connection.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+def _view_sql():
+    """attack_logs as a view: attack_log_rows with each id replaced by its value"""
+    rows = attack_log_rows.name
+    columns, joins = [], []
+    for column in attack_logs.columns:
+        if column.name in dimension_tables:
+            table = dimension_tables[column.name].name
+            columns.append(f"{table}.value AS {column.name}")
+            joins.append(f"LEFT OUTER JOIN {table} ON {table}.id = {rows}.{column.name}_id")
+        else:
+            columns.append(f"{rows}.{column.name}")
+    return f"CREATE VIEW {attack_logs.name} AS SELECT {', '.join(columns)} FROM {rows} {' '.join(joins)}"
+
+def create_layout(engine):
+    """Lay out a new, empty database normalized (before create_all adds the other tables)"""
+    with engine.begin() as connection:
+        dimension_metadata.create_all(connection)
+        connection.execute(text(_view_sql()))
+    forget(engine)
+    logger.info("attack_logs normalized into dimension tables")
+
+def normalize_attack_logs(engine):
+    """Convert an existing single attack_logs table in one transaction; returns the row count"""
+    rows = attack_log_rows
+    # Outside the transaction on SQLite (pysqlite runs DDL before any DML in autocommit); harmless if left over
+    dimension_metadata.create_all(engine)
+    with engine.begin() as connection:
+        if is_normalized(connection) or connection.execute(
+                select(func.count()).select_from(rows)).scalar():
+            return None
+        for name, table in dimension_tables.items():
+            connection.execute(insert(table).from_select(
+                ['value'], select(attack_logs.c[name]).where(attack_logs.c[name].isnot(None)).distinct()
+            ))
+        source = attack_logs
+        columns = []
+        for column in attack_logs.columns:
+            if column.name in dimension_tables:
+                table = dimension_tables[column.name]
+                source = source.outerjoin(table, table.c.value == column)
+                columns.append(table.c.id)
+            else:
+                columns.append(column)
+        connection.execute(insert(rows).from_select(
+            [f"{name}_id" if name in dimension_tables else name for name in attack_logs.c.keys()],
+            select(*columns).select_from(source)
+        ))
+        count = connection.execute(select(func.count()).select_from(rows)).scalar()
+        connection.execute(text(f"DROP TABLE {attack_logs.name}"))
+        connection.execute(text(_view_sql()))
+        if connection.dialect.name == 'postgresql':
+            connection.execute(
+                text("SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                     "(SELECT coalesce(max(id), 0) + 1 FROM attack_log_rows), false)"),
+                {'table': rows.name}
+            )
+    forget(engine)
+    logger.info(f"Normalized {count} attack rows")
+    return count
+
+def value_counts(session, name):
+    """Query of (value, count) for one attack_logs text column, most frequent first
+
+    Grouped on the ids of a normalized database, joining the values in only
+    for the groups; on the strings otherwise.
+    """
+    if not is_normalized(session):
+        column = attack_logs.c[name]
+        return session.query(column, func.count(attack_logs.c.id).label('count')).filter(
+            column.isnot(None)
+        ).group_by(column).order_by(desc('count'))
+    value_id = attack_log_rows.c[f"{name}_id"]
+    counts = select(value_id.label('value_id'), func.count().label('count')).where(
+        value_id.isnot(None)
+    ).group_by(value_id).subquery()
+    table = dimension_tables[name]
+    return session.query(table.c.value, counts.c.count).join(
+        table, table.c.id == counts.c.value_id
+    ).order_by(desc(counts.c.count))
+
+class ValueInterner:
+    """value -> id caches for the dimension tables of one database, filled on a miss"""
+
+    def __init__(self, max_size=INTERN_CACHE_SIZE):
+        self.max_size = max_size
+        self.ids = {name: {} for name in dimension_tables}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def intern(self, engine, values):
+        """{column: {value: id}} for {column: values}, storing unseen values first"""
+        # The dicts as of now: a full cache is replaced rather than cleared, so these keep their entries
+        caches = {name: self.ids[name] for name in values}
+        missing = {}
+        for name, column_values in values.items():
+            cache = caches[name]
+            unseen = {value for value in column_values if value is not None and value not in cache}
+            if unseen:
+                missing[name] = unseen
+        self.misses += sum(len(unseen) for unseen in missing.values())
+
+        found = {}
+        if missing:
+            with engine.begin() as connection:
+                for name, unseen in missing.items():
+                    table = dimension_tables[name]
+                    # Concurrent writers may add the same value; keep whichever landed first
+                    connection.execute(
+                        _dialect_insert(connection, table).on_conflict_do_nothing(index_elements=['value']),
+                        [{'value': value} for value in unseen]
+                    )
+                    unseen = list(unseen)
+                    found[name] = {}
+                    for start in range(0, len(unseen), 500):
+                        found[name].update((value, value_id) for value_id, value in connection.execute(
+                            select(table.c.id, table.c.value).where(table.c.value.in_(unseen[start:start + 500]))
+                        ))
+            with self._lock:
+                for name, ids in found.items():
+                    if len(self.ids[name]) + len(ids) > self.max_size:
+                        self.ids[name] = {}
+                    self.ids[name].update(ids)
+
+        result = {}
+        for name, column_values in values.items():
+            cache = caches[name]
+            ids = found.get(name, {})
+            result[name] = {
+                value: ids[value] if value in ids else cache[value]
+                for value in column_values if value is not None
+            }
+            self.hits += len(result[name]) - len(ids)
+        return result
+
+    def normalize_rows(self, engine, rows):
+        """attack_log_rows rows for a batch of attack_logs rows"""
+        ids = self.intern(engine, {name: {row.get(name) for row in rows} for name in DIMENSION_COLUMNS})
+        normalized = []
+        for row in rows:
+            row = dict(row)
+            for name in DIMENSION_COLUMNS:
+                value = row.pop(name, None)
+                row[f"{name}_id"] = None if value is None else ids[name][value]
+            normalized.append(row)
+        return normalized
+
+    def get_stats(self):
+        return {
+            'cached_values': {name: len(ids) for name, ids in self.ids.items()},
+            'hits': self.hits,
+            'misses': self.misses
+        }
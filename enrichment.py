@@ -0,0 +1,219 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from events import event_bus
+from response_cache import response_cache
+from geolocation import resolve_ip_locations, geolocation_service
+from metrics import metrics
+from recent_buffer import recent_buffer
+
+logger = logging.getLogger(__name__)
+
+# 'async' writes attack rows with geo fields pending and back-fills them later,
+# 'inline' resolves the location before the row is queued (the original behaviour)
+ENRICHMENT_MODE = os.environ.get('GEO_ENRICHMENT', 'async')
+
+def apply_geo_updates(updates):
+    """Back-fill geolocation for every pending row of each resolved IP in one executemany"""
+    if not updates:
+        return 0
+
+    # Imported on first use: processes that never write (runner workers) skip SQLAlchemy entirely
+    from storage import storage
+    from sketch_rollups import sketch_aggregator
+    resolved = dict(updates)
+    pending_rows, rowcount = storage.backfill_locations(resolved)
+    if recent_buffer and pending_rows:
+        try:
+            recent_buffer.fill_locations(resolved)
+        except Exception as e:
+            logger.error(f"Failed to back-fill locations in the recent buffer: {e}")
+    sketch_aggregator.update_countries(
+        (timestamp, resolved[source_ip].get('country')) for timestamp, source_ip in pending_rows
+    )
+
+    if pending_rows:
+        response_cache.bump()
+        # Live dashboards count these countries now that the rows have them
+        event_bus.publish('locations', {'locations': [{
+            'timestamp': timestamp.isoformat(),
+            'source_ip': source_ip,
+            'country': resolved[source_ip].get('country'),
+            'city': resolved[source_ip].get('city'),
+            'latitude': resolved[source_ip].get('latitude'),
+            'longitude': resolved[source_ip].get('longitude')
+        } for timestamp, source_ip in pending_rows]})
+    return rowcount
+
+def find_pending_ips(limit=1000):
+    """Return distinct source IPs that still have rows without geolocation"""
+    from storage import storage
+    return storage.pending_source_ips(limit)
+
+class GeoEnrichmentWorker:
+    """Background stage that deduplicates source IPs, resolves them and back-fills geo columns"""
+
+    def __init__(self, resolver=resolve_ip_locations, peek=geolocation_service.cache.get,
+                 updater=apply_geo_updates, pending_finder=find_pending_ips, batch_size=100,
+                 interval=1.0, sweep_interval=30.0, max_pending=50000):
+        self.resolver = resolver  # takes a batch of IPs, returns {ip: location or None}
+        self.peek = peek  # non-blocking lookup of already resolved IPs
+        self.updater = updater
+        self.pending_finder = pending_finder
+        self.batch_size = batch_size
+        self.interval = interval
+        self.sweep_interval = sweep_interval
+        self.max_pending = max_pending
+
+        self.pending = OrderedDict()  # insertion-ordered set of IPs awaiting resolution
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        self.last_sweep = 0
+
+        # Counters
+        self.submitted = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.resolved = 0
+        self.deferred = 0
+        self.rows_updated = 0
+
+    def start(self):
+        """Start the enrichment thread"""
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name='geo-enrichment', daemon=True)
+        self.thread.start()
+        logger.info("Geolocation enrichment worker started")
+
+    def submit(self, ip_address):
+        """Mark an IP as needing geolocation; duplicates collapse into one lookup"""
+        with self.lock:
+            self.submitted += 1
+            if ip_address in self.pending:
+                self.deduplicated += 1
+                return True
+            if len(self.pending) >= self.max_pending:
+                # The periodic sweep will pick dropped IPs up from the table later
+                self.dropped += 1
+                return False
+            self.pending[ip_address] = None
+            if len(self.pending) >= self.batch_size:
+                self.wakeup.set()
+        return True
+
+    def lookup_resolved(self, ip_address):
+        """Return the location if the IP is already resolved, without blocking"""
+        return self.peek(ip_address)
+
+    def fill_resolved(self, rows):
+        """Fill geo fields of queued rows whose IP was resolved after they were submitted
+
+        Used by the ingest queue right before a batch is written, so an IP resolved while
+        its row was still queued doesn't have to wait for the next sweep.
+        """
+        for row in rows:
+            if row.get('country') is None:
+                geo_data = self.peek(row['source_ip'])
+                if geo_data:
+                    row.update(geo_data)
+        return rows
+
+    def _take_batch(self):
+        with self.lock:
+            batch = []
+            while self.pending and len(batch) < self.batch_size:
+                batch.append(self.pending.popitem(last=False)[0])
+            return batch
+
+    def process_pending(self, deadline=None):
+        """Resolve queued IPs and write their locations back in bulk
+
+        Runs until the queue is empty or, when given, the deadline (a time.monotonic()
+        value) passes; without one it also returns once the worker is stopped.
+        """
+        while time.monotonic() < deadline if deadline is not None else self.running:
+            batch = self._take_batch()
+            if not batch:
+                return
+
+            try:
+                resolved = self.resolver(batch)
+            except Exception as e:
+                logger.error(f"Failed to resolve {len(batch)} IPs: {e}")
+                resolved = {}
+            # IPs no provider could answer stay pending in the table; the sweep brings them back
+            updates = [(ip_address, geo_data) for ip_address, geo_data in resolved.items() if geo_data]
+            self.resolved += len(updates)
+            self.deferred += len(batch) - len(updates)
+
+            try:
+                self.rows_updated += self.updater(updates) or 0
+            except Exception as e:
+                logger.error(f"Failed to back-fill geolocation for {len(updates)} IPs: {e}")
+
+    def sweep(self):
+        """Queue IPs whose rows were written after (or were missed by) their enrichment pass"""
+        self.last_sweep = time.monotonic()
+        try:
+            for ip_address in self.pending_finder(self.max_pending // 10):
+                self.submit(ip_address)
+        except Exception as e:
+            logger.error(f"Failed to sweep for pending geolocation: {e}")
+
+    def _run(self):
+        while self.running:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+            self.process_pending()
+            if self.running and time.monotonic() - self.last_sweep >= self.sweep_interval:
+                self.sweep()
+
+    def stop(self, timeout=30):
+        """Stop the worker, resolving what is still queued for at most timeout seconds
+
+        No sweep here: rows left pending are found again by the next run's sweep.
+        """
+        if not self.running:
+            return
+        deadline = time.monotonic() + timeout
+        self.running = False
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout)
+        self.process_pending(deadline)
+        with self.lock:
+            left = len(self.pending)
+        logger.info(f"Geolocation enrichment worker stopped ({self.rows_updated} rows updated, "
+                    f"{left} IPs left for the next sweep)")
+
+    def get_stats(self):
+        """Return enrichment counters for monitoring"""
+        with self.lock:
+            return {
+                'mode': ENRICHMENT_MODE,
+                'pending': len(self.pending),
+                'submitted': self.submitted,
+                'deduplicated': self.deduplicated,
+                'dropped': self.dropped,
+                'resolved': self.resolved,
+                'deferred': self.deferred,
+                'rows_updated': self.rows_updated
+            }
+
+# Global instance
+geo_enricher = GeoEnrichmentWorker(
+    batch_size=int(os.environ.get('GEO_ENRICHMENT_BATCH_SIZE', 100)),
+    interval=float(os.environ.get('GEO_ENRICHMENT_INTERVAL', 1.0)),
+    sweep_interval=float(os.environ.get('GEO_ENRICHMENT_SWEEP_INTERVAL', 30.0))
+)
+
+metrics.gauge('geolocation_enrichment_pending', 'Source IPs waiting for the enrichment worker',
+              function=lambda: len(geo_enricher.pending))
@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class Subscription:
+    """A subscriber's bounded mailbox of pre-serialized events"""
+
+    def __init__(self, bus, max_pending):
+        self.bus = bus
+        self.events = deque(maxlen=max_pending)  # oldest events fall off a slow subscriber
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def deliver(self, message):
+        with self.condition:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append(message)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Next message, or None if nothing arrived within the timeout"""
+        with self.condition:
+            if not self.events and not self.closed:
+                self.condition.wait(timeout)
+            return self.events.popleft() if self.events else None
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.bus.unsubscribe(self)
+
+class SharedEventLog:
+    """SQLite-backed log of serialized events, appended by publishers and tailed by subscribers"""
+
+    def __init__(self, path, keep=1000):
+        self.path = path
+        self.keep = keep  # events kept for tailers that fall behind
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS live_events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, message TEXT NOT NULL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, message):
+        conn = self._connection()
+        event_id = conn.execute("INSERT INTO live_events (message) VALUES (?)", (message,)).lastrowid
+        if event_id % 100 == 0:
+            conn.execute("DELETE FROM live_events WHERE id <= ?", (event_id - self.keep,))
+
+    def last_id(self):
+        return self._connection().execute("SELECT coalesce(max(id), 0) FROM live_events").fetchone()[0]
+
+    def read_after(self, event_id, limit=100):
+        """(id, message) of the events after event_id, oldest first"""
+        return self._connection().execute(
+            "SELECT id, message FROM live_events WHERE id > ? ORDER BY id LIMIT ?", (event_id, limit)
+        ).fetchall()
+
+class EventBus:
+    """Publish/subscribe bus fanning each event out to every subscriber
+
+    Events are serialized once at publish time, so the cost of a delta does not grow
+    with the number of connected dashboards. With a shared log they are appended
+    to it and reach subscribers in every process through its tailing thread.
+    """
+
+    def __init__(self, max_pending=1000, shared_path=None, poll_interval=0.5):
+        self.max_pending = max_pending
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.published = 0
+        # A path, or a function returning it (processes that never publish or subscribe don't resolve it)
+        self.shared_path = shared_path
+        self.poll_interval = poll_interval
+        self._shared = None
+        self._tailing = False
+        self._last_id = 0
+
+    @property
+    def shared(self):
+        """The shared log, opened on first use; None when disabled or it could not be opened"""
+        if self._shared is None and self.shared_path:
+            with self.lock:
+                if self._shared is None and self.shared_path:
+                    path = self.shared_path() if callable(self.shared_path) else self.shared_path
+                    try:
+                        self._shared = SharedEventLog(path)
+                    except Exception as e:
+                        logger.error(f"Shared live events disabled ({path}): {e}")
+                        self.shared_path = None
+        return self._shared
+
+    def subscribe(self):
+        subscription = Subscription(self, self.max_pending)
+        shared = self.shared
+        start = shared.last_id() if shared and not self._tailing else None
+        with self.lock:
+            self.subscribers.add(subscription)
+            if shared and not self._tailing:
+                # Subscribers only see what is published after they join (or, if the
+                # tailing thread just exited, resume where it stopped)
+                if start is not None:
+                    self._last_id = start
+                self._tailing = True
+                threading.Thread(target=self._tail, name='live-events', daemon=True).start()
+        return subscription
+
+    def _tail(self):
+        """Deliver the shared log's new events to this process's subscribers until none are left"""
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self._tailing = False
+                    return
+                subscribers = list(self.subscribers)
+            try:
+                events = self._shared.read_after(self._last_id)
+            except Exception as e:
+                logger.error(f"Reading live events failed: {e}")
+                events = []
+            for event_id, message in events:
+                self._last_id = event_id
+                for subscription in subscribers:
+                    subscription.deliver(message)
+            if not events:
+                time.sleep(self.poll_interval)
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def publish(self, event, payload):
+        """Send a named event with a JSON-serializable payload to all subscribers
+
+        Returns how many subscribers of this process it was delivered to; with a
+        shared log delivery happens on the tailing threads, and this returns 0.
+        """
+        with self.lock:
+            subscribers = list(self.subscribers)
+            self.published += 1
+        shared = self.shared
+        if shared:
+            try:
+                shared.append(format_sse(event, payload))
+                return 0
+            except Exception as e:
+                logger.error(f"Publishing a live event failed: {e}")
+        if not subscribers:
+            return 0
+
+        message = format_sse(event, payload)
+        for subscription in subscribers:
+            subscription.deliver(message)
+        return len(subscribers)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'subscribers': len(self.subscribers),
+                'published': self.published,
+                'dropped': sum(s.dropped for s in self.subscribers),
+                'shared': self._shared is not None
+            }
+
+def format_sse(event, payload):
+    """Encode one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+def attack_delta(row):
+    """The fields of an ingested attack row the dashboard needs to apply it incrementally"""
+    timestamp = row.get('timestamp')
+    return {
+        'timestamp': timestamp.isoformat() if timestamp else None,
+        'source_ip': row.get('source_ip'),
+        'source_port': row.get('source_port'),
+        'username': row.get('username'),
+        'password': row.get('password'),
+        'country': row.get('country'),
+        'city': row.get('city'),
+        'latitude': row.get('latitude'),
+        'longitude': row.get('longitude')
+    }
+
+def default_shared_path():
+    """One log per database, whichever processes write to it and serve its dashboard"""
+    from storage import sidecar_path
+    return sidecar_path('live_events.db')
+
+# Global instance. Attack rows are usually written by another process than the one
+# serving /api/live (the runner's supervisor, a separate sensor), so events go through
+# a file shared by every process on the host; LIVE_EVENTS_PATH= keeps them in-process.
+event_bus = EventBus(
+    max_pending=int(os.environ.get('LIVE_MAX_PENDING', 1000)),
+    shared_path=os.environ.get('LIVE_EVENTS_PATH', default_shared_path) or None,
+    poll_interval=float(os.environ.get('LIVE_POLL_INTERVAL', 0.5))
+)
@@ -0,0 +1,681 @@
+"""Emulated post-login shell for the SSH honeypot.
+
+The filesystem is one read-only tree built at import time and shared by every
+session. A session only holds its working directory, a small bounded overlay for
+files it creates or deletes, and the command lines it ran. Common reconnaissance
+commands are answered from responses rendered once at import.
+"""
+import os
+import posixpath
+import re
+import shlex
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+HOSTNAME = os.environ.get('SHELL_HOSTNAME', 'srv04')
+
+# Per-session resource caps
+SHELL_LIMITS = {
+    'max_line_length': int(os.environ.get('SHELL_MAX_LINE_LENGTH', 4096)),
+    'max_commands': int(os.environ.get('SHELL_MAX_COMMANDS', 500)),
+    'max_overlay_bytes': int(os.environ.get('SHELL_MAX_OVERLAY_BYTES', 65536)),
+    'command_rate': float(os.environ.get('SHELL_COMMAND_RATE', 5)),  # commands per second
+    'command_burst': int(os.environ.get('SHELL_COMMAND_BURST', 20)),
+}
+
+KERNEL = '3.10.0-1160.el7.x86_64'
+FILE_DATE = 'Nov 12  2022'
+
+Node = namedtuple('Node', 'is_dir mode size content children')
+
+TEXT_RUN = re.compile(rb'[^\x00-\x08\x0a-\x1f\x7f]+')  # no control characters except tab
+COMMAND_SEPARATOR = re.compile(r';|&&|\|\|')
+
+def executable(size):
+    """Tree spec for a binary: listed with its size, unreadable as text"""
+    return ('-rwxr-xr-x', size)
+
+PASSWD = '\n'.join([
+    'root:x:0:0:root:/root:/bin/bash',
+    'bin:x:1:1:bin:/bin:/sbin/nologin',
+    'daemon:x:2:2:daemon:/sbin:/sbin/nologin',
+    'adm:x:3:4:adm:/var/adm:/sbin/nologin',
+    'lp:x:4:7:lp:/var/spool/lpd:/sbin/nologin',
+    'sync:x:5:0:sync:/sbin:/bin/sync',
+    'shutdown:x:6:0:shutdown:/sbin:/sbin/shutdown',
+    'halt:x:7:0:halt:/sbin:/sbin/halt',
+    'mail:x:8:12:mail:/var/spool/mail:/sbin/nologin',
+    'operator:x:11:0:operator:/root:/sbin/nologin',
+    'nobody:x:99:99:Nobody:/:/sbin/nologin',
+    'systemd-network:x:192:192:systemd Network Management:/:/sbin/nologin',
+    'dbus:x:81:81:System message bus:/:/sbin/nologin',
+    'sshd:x:74:74:Privilege-separated SSH:/var/empty/sshd:/sbin/nologin',
+    'postfix:x:89:89::/var/spool/postfix:/sbin/nologin',
+    'mysql:x:27:27:MariaDB Server:/var/lib/mysql:/sbin/nologin',
+]) + '\n'
+
+CPUINFO = ''.join(
+    f"processor\t: {cpu}\nvendor_id\t: GenuineIntel\ncpu family\t: 6\nmodel\t\t: 85\n"
+    f"model name\t: Intel(R) Xeon(R) Gold 6148 CPU @ 2.40GHz\nstepping\t: 4\ncpu MHz\t\t: 2394.374\n"
+    f"cache size\t: 28160 KB\nphysical id\t: 0\nsiblings\t: 4\ncore id\t\t: {cpu}\ncpu cores\t: 4\n"
+    f"flags\t\t: fpu vme de pse tsc msr pae mce cx8 apic sep mtrr pge mca cmov pat pse36 clflush mmx "
+    f"fxsr sse sse2 ss ht syscall nx pdpe1gb rdtscp lm constant_tsc rep_good nopl xtopology "
+    f"cpuid pni pclmulqdq ssse3 fma cx16 pcid sse4_1 sse4_2 x2apic movbe popcnt aes xsave avx "
+    f"f16c rdrand hypervisor lahf_lm abm 3dnowprefetch avx2 avx512f avx512dq\nbogomips\t: 4788.74\n\n"
+    for cpu in range(4)
+)
+
+MEMINFO = """MemTotal:        8008632 kB
+MemFree:          412204 kB
+MemAvailable:    5123876 kB
+Buffers:          210492 kB
+Cached:          4402160 kB
+SwapCached:            0 kB
+SwapTotal:       2097148 kB
+SwapFree:        2097148 kB
+"""
+
+FILESYSTEM_TREE = {
+    'bin': {name: executable(size) for name, size in (
+        ('bash', 964536), ('cat', 54080), ('chmod', 58592), ('cp', 155176), ('echo', 33128),
+        ('ls', 117608), ('mkdir', 79768), ('mv', 130360), ('ps', 100112), ('rm', 62872),
+        ('sh', 964536), ('uname', 33200), ('wget', 549568), ('curl', 156760), ('busybox', 1007496)
+    )},
+    'dev': {'null': '', 'shm': {}},
+    'etc': {
+        'hostname': HOSTNAME + '\n',
+        'hosts': f"127.0.0.1   localhost localhost.localdomain\n::1         localhost6\n10.0.3.14   {HOSTNAME}\n",
+        'issue': '\\S\nKernel \\r on an \\m\n\n',
+        'os-release': ('NAME="CentOS Linux"\nVERSION="7 (Core)"\nID="centos"\nID_LIKE="rhel fedora"\n'
+                       'VERSION_ID="7"\nPRETTY_NAME="CentOS Linux 7 (Core)"\nHOME_URL="https://www.centos.org/"\n'),
+        'redhat-release': 'CentOS Linux release 7.9.2009 (Core)\n',
+        'centos-release': 'CentOS Linux release 7.9.2009 (Core)\n',
+        'passwd': PASSWD,
+        'group': 'root:x:0:\nbin:x:1:\ndaemon:x:2:\nwheel:x:10:\nsshd:x:74:\nmysql:x:27:\n',
+        'resolv.conf': 'nameserver 10.0.0.2\nsearch ec2.internal\n',
+        'crontab': 'SHELL=/bin/bash\nPATH=/sbin:/bin:/usr/sbin:/usr/bin\nMAILTO=root\n',
+        'ssh': {'sshd_config': 'Port 22\nPermitRootLogin yes\nPasswordAuthentication yes\nUsePAM yes\n'},
+    },
+    'home': {},
+    'opt': {},
+    'proc': {
+        'cpuinfo': CPUINFO,
+        'meminfo': MEMINFO,
+        'version': f"Linux version {KERNEL} (mockbuild@kbuilder.bsys.centos.org) (gcc version 4.8.5 20150623 "
+                   "(Red Hat 4.8.5-44) (GCC) ) #1 SMP Wed Sep 14 18:47:25 UTC 2022\n",
+        'uptime': '3487622.42 13601237.71\n',
+        'mounts': 'rootfs / rootfs rw 0 0\n/dev/vda1 / xfs rw,relatime,attr2,inode64,noquota 0 0\n',
+    },
+    'root': {
+        '.bash_history': '',
+        '.bash_profile': '[ -f ~/.bashrc ] && . ~/.bashrc\nPATH=$PATH:$HOME/bin\nexport PATH\n',
+        '.bashrc': "alias rm='rm -i'\nalias cp='cp -i'\nalias mv='mv -i'\n[ -f /etc/bashrc ] && . /etc/bashrc\n",
+        '.ssh': {'authorized_keys': ''},
+    },
+    'sbin': {name: executable(size) for name, size in (
+        ('ifconfig', 82000), ('ip', 493968), ('iptables', 95184), ('reboot', 1600248)
+    )},
+    'tmp': {},
+    'usr': {
+        'bin': {name: executable(size) for name, size in (
+            ('crontab', 57656), ('free', 20040), ('id', 37400), ('nohup', 28992), ('perl', 11560),
+            ('python', 7144), ('top', 107448), ('uptime', 11384), ('w', 20352), ('whoami', 28840)
+        )},
+        'local': {'bin': {}},
+    },
+    'var': {
+        'log': {'messages': '', 'secure': '', 'cron': '', 'wtmp': ''},
+        'tmp': {},
+        'www': {'html': {}},
+    },
+}
+
+class FakeFilesystem:
+    """Read-only directory tree shared by all shell sessions"""
+
+    def __init__(self, tree):
+        nodes = {}
+        self._build('/', tree, nodes)
+        self.nodes = MappingProxyType(nodes)
+
+    def _build(self, path, spec, nodes):
+        if isinstance(spec, dict):
+            for name, child in spec.items():
+                self._build(posixpath.join(path, name), child, nodes)
+            nodes[path] = Node(True, 'drwxr-xr-x', 4096, None, tuple(sorted(spec)))
+        elif isinstance(spec, tuple):
+            mode, size = spec
+            nodes[path] = Node(False, mode, size, None, ())
+        else:
+            content = spec.encode()
+            nodes[path] = Node(False, '-rw-r--r--', len(content), content, ())
+
+# Built once per process; sessions only ever read it
+FILESYSTEM = FakeFilesystem(FILESYSTEM_TREE)
+
+# Exact command lines answered without interpretation
+STATIC_RESPONSES = {command: output.encode() for command, output in {
+    'uname': 'Linux\n',
+    'uname -s': 'Linux\n',
+    'uname -r': KERNEL + '\n',
+    'uname -m': 'x86_64\n',
+    'uname -n': HOSTNAME + '\n',
+    'uname -a': f"Linux {HOSTNAME} {KERNEL} #1 SMP Wed Sep 14 18:47:25 UTC 2022 x86_64 x86_64 x86_64 GNU/Linux\n",
+    'uname -s -r': f"Linux {KERNEL}\n",
+    'uname -s -v -n -r -m': f"Linux {HOSTNAME} {KERNEL} #1 SMP Wed Sep 14 18:47:25 UTC 2022 x86_64\n",
+    'arch': 'x86_64\n',
+    'nproc': '4\n',
+    'uptime': ' 14:02:11 up 40 days,  8:47,  1 user,  load average: 0.08, 0.03, 0.05\n',
+    'w': (' 14:02:11 up 40 days,  8:47,  1 user,  load average: 0.08, 0.03, 0.05\n'
+          'USER     TTY      FROM             LOGIN@   IDLE   JCPU   PCPU WHAT\n'
+          'root     pts/0    10.0.3.1         14:01    0.00s  0.01s  0.00s w\n'),
+    'free': ('              total        used        free      shared  buff/cache   available\n'
+             'Mem:        8008632     2983776      412204       17228     4612652     5123876\n'
+             'Swap:       2097148           0     2097148\n'),
+    'free -m': ('              total        used        free      shared  buff/cache   available\n'
+                'Mem:           7820        2913         402          16        4504        5003\n'
+                'Swap:          2047           0        2047\n'),
+    'free -h': ('              total        used        free      shared  buff/cache   available\n'
+                'Mem:           7.6G        2.8G        402M         16M        4.4G        4.9G\n'
+                'Swap:          2.0G          0B        2.0G\n'),
+    'df -h': ('Filesystem      Size  Used Avail Use% Mounted on\n'
+              'devtmpfs        3.8G     0  3.8G   0% /dev\n'
+              'tmpfs           3.9G     0  3.9G   0% /dev/shm\n'
+              '/dev/vda1        80G   23G   58G  29% /\n'),
+    'lscpu': ('Architecture:          x86_64\nCPU op-mode(s):        32-bit, 64-bit\nByte Order:            Little Endian\n'
+              'CPU(s):                4\nThread(s) per core:    1\nCore(s) per socket:    4\nSocket(s):             1\n'
+              'Vendor ID:             GenuineIntel\nModel name:            Intel(R) Xeon(R) Gold 6148 CPU @ 2.40GHz\n'
+              'Hypervisor vendor:     KVM\nVirtualization type:   full\n'),
+    'ifconfig': ('eth0: flags=4163<UP,BROADCAST,RUNNING,MULTICAST>  mtu 1500\n'
+                 '        inet 10.0.3.14  netmask 255.255.255.0  broadcast 10.0.3.255\n'
+                 '        ether 52:54:00:3e:81:0c  txqueuelen 1000  (Ethernet)\n\n'
+                 'lo: flags=73<UP,LOOPBACK,RUNNING>  mtu 65536\n'
+                 '        inet 127.0.0.1  netmask 255.0.0.0\n'),
+    'ip a': ('1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536 qdisc noqueue state UNKNOWN\n'
+             '    inet 127.0.0.1/8 scope host lo\n'
+             '2: eth0: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 qdisc pfifo_fast state UP qlen 1000\n'
+             '    link/ether 52:54:00:3e:81:0c brd ff:ff:ff:ff:ff:ff\n'
+             '    inet 10.0.3.14/24 brd 10.0.3.255 scope global eth0\n'),
+    'ps': ('  PID TTY          TIME CMD\n'
+           ' 2306 pts/0    00:00:00 bash\n'
+           ' 2331 pts/0    00:00:00 ps\n'),
+    'ps aux': ('USER       PID %CPU %MEM    VSZ   RSS TTY      STAT START   TIME COMMAND\n'
+               'root         1  0.0  0.0 193984  6932 ?        Ss   Sep08   2:41 /usr/lib/systemd/systemd\n'
+               'root       912  0.0  0.0 112920  4352 ?        Ss   Sep08   0:00 /usr/sbin/sshd -D\n'
+               'mysql     1204  0.2  4.9 1121536 398112 ?     Sl   Sep08 121:09 /usr/libexec/mysqld\n'
+               'root      1310  0.0  0.0 126384  1680 ?        Ss   Sep08   0:12 /usr/sbin/crond -n\n'
+               'root      2306  0.0  0.0 115544  2076 pts/0    Ss   14:01   0:00 -bash\n'
+               'root      2331  0.0  0.0 155448  1860 pts/0    R+   14:02   0:00 ps aux\n'),
+    'crontab -l': 'no crontab for root\n',
+    'history -c': '',
+}.items()}
+STATIC_RESPONSES['ip addr'] = STATIC_RESPONSES['ip a']
+STATIC_RESPONSES['ps -ef'] = STATIC_RESPONSES['ps aux']
+STATIC_RESPONSES['cat /proc/cpuinfo | grep name | wc -l'] = b'4\n'
+
+# Commands that succeed silently
+SILENT_COMMANDS = {
+    'alias', 'cd', 'chattr', 'chmod', 'chown', 'cp', 'export', 'history', 'kill', 'killall', 'ln',
+    'mv', 'pkill', 'service', 'set', 'sleep', 'source', 'systemctl', 'true', 'ulimit', 'umask',
+    'unalias', 'unset', ':', '.'
+}
+# Prefixes that just run the rest of the line
+WRAPPER_COMMANDS = {'sudo', 'nohup', 'exec', 'time', 'command', 'builtin', 'nice'}
+DOWNLOAD_COMMANDS = {'wget', 'curl', 'tftp', 'ftpget', 'scp'}
+BUSYBOX_APPLETS = {'cat', 'cd', 'chmod', 'echo', 'ftpget', 'ls', 'mkdir', 'rm', 'tftp', 'wget'}
+
+class ShellSession:
+    """One attacker's emulated bash session
+
+    Fed raw channel bytes: with a pty it echoes input, edits the line and prints
+    prompts like an interactive terminal, without one it reads newline-separated
+    commands silently. Every command line is appended to commands; when the
+    command rate exceeds the cap, throttle accumulates the seconds the caller
+    should hold back output.
+    """
+
+    def __init__(self, username='root', interactive=True, filesystem=FILESYSTEM,
+                 max_line_length=4096, max_commands=500, max_overlay_bytes=65536,
+                 command_rate=5, command_burst=20, clock=time.monotonic):
+        self.username = username or 'root'
+        self.interactive = interactive
+        self.filesystem = filesystem
+        self.max_line_length = max_line_length
+        self.max_commands = max_commands
+        self.max_overlay_bytes = max_overlay_bytes
+        self.command_rate = command_rate
+        self.command_burst = command_burst
+        self.clock = clock
+
+        self.home = '/root' if self.username == 'root' else f"/home/{self.username}"
+        self.cwd = self.home
+        self.commands = []
+        self.exit_status = 0
+        self.closed = False
+        self.throttle = 0.0
+        self.tokens = float(command_burst)
+        self.last_refill = clock()
+
+        self.overlay = {}  # path -> Node for files and directories this session created
+        self.removed = set()
+        self.overlay_bytes = 0
+        self.line = bytearray()
+        self._escape = 0  # position inside an ANSI escape sequence
+        self._last_byte = None
+        if self.home not in filesystem.nodes:
+            self.overlay[self.home] = Node(True, 'drwx------', 4096, None, ())
+
+    # --- Terminal ---
+
+    @property
+    def prompt(self):
+        directory = '~' if self.cwd == self.home else posixpath.basename(self.cwd) or '/'
+        return f"[{self.username}@{HOSTNAME} {directory}]{'#' if self.username == 'root' else '$'} ".encode()
+
+    def start(self):
+        """Output shown when the shell starts"""
+        if not self.interactive:
+            return b''
+        return b'Last login: Mon Nov 14 09:12:44 2022 from 10.0.3.1\r\n' + self.prompt
+
+    def feed(self, data):
+        """Consume keystrokes (or piped input) and return what the terminal shows"""
+        output = []
+        position = 0
+        while position < len(data) and not self.closed:
+            if not self._escape:
+                # Plain text is taken (and echoed) a run at a time
+                run = TEXT_RUN.match(data, position)
+                if run:
+                    text = data[position:run.end()][:max(self.max_line_length - len(self.line), 0)]
+                    self.line += text
+                    if self.interactive:
+                        output.append(text)
+                    self._last_byte = data[run.end() - 1]
+                    position = run.end()
+                    continue
+            byte = data[position]
+            position += 1
+            if self._escape:
+                # Skip cursor keys and other CSI sequences
+                if self._escape == 1:
+                    self._escape = 2 if byte == 0x5b else 0
+                elif 0x40 <= byte <= 0x7e:
+                    self._escape = 0
+                continue
+            if byte in (0x0d, 0x0a):
+                if byte == 0x0a and self._last_byte == 0x0d:
+                    self._last_byte = byte
+                    continue
+                line = self.line.decode('utf-8', 'replace')
+                self.line = bytearray()
+                if self.interactive:
+                    output.append(b'\r\n')
+                output.append(self._run_line(line))
+                if self.interactive and not self.closed:
+                    output.append(self.prompt)
+            elif not self.interactive:
+                if len(self.line) < self.max_line_length:
+                    self.line.append(byte)
+            elif byte in (0x7f, 0x08):
+                if self.line:
+                    self.line.pop()
+                    output.append(b'\x08 \x08')
+            elif byte == 0x03:
+                self.line = bytearray()
+                output.append(b'^C\r\n' + self.prompt)
+            elif byte == 0x04:
+                if not self.line:
+                    output.append(b'logout\r\n')
+                    self.closed = True
+            elif byte == 0x15:
+                output.append(b'\x08 \x08' * len(self.line))
+                self.line = bytearray()
+            elif byte == 0x1b:
+                self._escape = 1
+            self._last_byte = byte
+        return b''.join(output)
+
+    def execute(self, command):
+        """Run a single command line (an exec request) and return its output"""
+        return self._run_line(command[:self.max_line_length])
+
+    def _run_line(self, line):
+        line = line.strip()
+        if not line:
+            return b''
+        self.commands.append(line)
+        self._take_token()
+        output = self._run(line)
+        if len(self.commands) >= self.max_commands:
+            self.closed = True
+        if self.interactive:
+            output = output.replace(b'\n', b'\r\n')
+        return output
+
+    def _take_token(self):
+        """Token bucket over command executions; overdraft turns into throttle time"""
+        now = self.clock()
+        self.tokens = min(self.command_burst, self.tokens + (now - self.last_refill) * self.command_rate) - 1
+        self.last_refill = now
+        if self.tokens < 0:
+            self.throttle = max(self.throttle, -self.tokens / self.command_rate)
+
+    def take_throttle(self):
+        throttle, self.throttle = self.throttle, 0.0
+        return throttle
+
+    # --- Command interpretation ---
+
+    def _run(self, line):
+        static = STATIC_RESPONSES.get(line)
+        if static is not None:
+            self.exit_status = 0
+            return static
+        output = []
+        for segment in _split_commands(line):
+            if self.closed:
+                break
+            output.append(self._run_pipeline(segment))
+        return b''.join(output)
+
+    def _run_pipeline(self, segment):
+        data = b''
+        for position, stage in enumerate(segment.split('|')):
+            if '"' in stage or "'" in stage or '\\' in stage:
+                try:
+                    argv = shlex.split(stage)
+                except ValueError:
+                    argv = stage.split()
+            else:
+                argv = stage.split()
+            argv, redirect = _strip_redirections(argv)
+            if not argv:
+                continue
+            data = self._run_command(argv, data if position else None)
+            if redirect:
+                self._write_file(redirect[0], data, append=redirect[1])
+                data = b''
+        return data
+
+    def _run_command(self, argv, stdin):
+        while argv and argv[0] in WRAPPER_COMMANDS:
+            argv = argv[1:]
+        if not argv:
+            return b''
+        name = posixpath.basename(argv[0])
+        if name in ('sh', 'bash') and len(argv) > 2 and argv[1] == '-c':
+            return self._run(argv[2])
+        if stdin is not None:
+            filtered = _filter(name, argv[1:], stdin)
+            if filtered is not None:
+                return filtered
+        static = STATIC_RESPONSES.get(' '.join(argv))
+        self.exit_status = 0
+        if static is not None:
+            return static
+        handler = getattr(self, f"_cmd_{name}", None)
+        if handler:
+            return handler(argv[1:])
+        if name in SILENT_COMMANDS:
+            return b''
+        if name in DOWNLOAD_COMMANDS:
+            return self._download(name, argv[1:])
+        self.exit_status = 127
+        return f"-bash: {argv[0]}: command not found\n".encode()
+
+    def _cmd_exit(self, args):
+        self.closed = True
+        return b'logout\n' if self.interactive else b''
+
+    _cmd_logout = _cmd_exit
+    _cmd_quit = _cmd_exit
+
+    def _cmd_cd(self, args):
+        path = self._resolve(args[0] if args else self.home)
+        node = self._node(path)
+        if node is None or not node.is_dir:
+            self.exit_status = 1
+            return f"-bash: cd: {args[0]}: No such file or directory\n".encode()
+        self.cwd = path
+        return b''
+
+    def _cmd_pwd(self, args):
+        return (self.cwd + '\n').encode()
+
+    def _cmd_whoami(self, args):
+        return (self.username + '\n').encode()
+
+    def _cmd_id(self, args):
+        if self.username == 'root':
+            return b'uid=0(root) gid=0(root) groups=0(root)\n'
+        return f"uid=1000({self.username}) gid=1000({self.username}) groups=1000({self.username})\n".encode()
+
+    def _cmd_hostname(self, args):
+        return (HOSTNAME + '\n').encode()
+
+    def _cmd_echo(self, args):
+        newline = '\n'
+        if args and args[0] == '-n':
+            newline = ''
+            args = args[1:]
+        elif args and args[0] == '-e':
+            args = [arg.encode().decode('unicode_escape', 'replace') for arg in args[1:]]
+        return (' '.join(args) + newline).encode('utf-8', 'replace')
+
+    def _cmd_cat(self, args):
+        output = []
+        for arg in args:
+            if arg.startswith('-'):
+                continue
+            node = self._node(self._resolve(arg))
+            if node is None:
+                self.exit_status = 1
+                output.append(f"cat: {arg}: No such file or directory\n".encode())
+            elif node.is_dir:
+                self.exit_status = 1
+                output.append(f"cat: {arg}: Is a directory\n".encode())
+            elif node.content is not None:
+                output.append(node.content)
+        return b''.join(output)
+
+    def _cmd_ls(self, args):
+        flags = ''.join(arg[1:] for arg in args if arg.startswith('-'))
+        paths = [arg for arg in args if not arg.startswith('-')] or ['.']
+        show_all = 'a' in flags
+        output = []
+        for arg in paths:
+            path = self._resolve(arg)
+            node = self._node(path)
+            if node is None:
+                self.exit_status = 2
+                output.append(f"ls: cannot access {arg}: No such file or directory\n".encode())
+                continue
+            entries = [(posixpath.basename(path), node)]
+            if node.is_dir:
+                names = self._children(path)
+                if not show_all:
+                    names = [name for name in names if not name.startswith('.')]
+                entries = [(name, self._node(posixpath.join(path, name))) for name in names]
+                if show_all:
+                    entries = [('.', node), ('..', node)] + entries
+            if 'l' in flags:
+                output.append(f"total {sum(entry.size for _, entry in entries) // 1024}\n".encode())
+                for name, entry in entries:
+                    output.append(f"{entry.mode} {2 if entry.is_dir else 1} root root "
+                                  f"{entry.size:>8} {FILE_DATE} {name}\n".encode())
+            elif entries:
+                output.append(('  '.join(name for name, _ in entries) + '\n').encode())
+        return b''.join(output)
+
+    def _cmd_which(self, args):
+        output = []
+        for name in args:
+            for directory in ('/usr/local/bin', '/usr/bin', '/bin', '/usr/sbin', '/sbin'):
+                if self._node(posixpath.join(directory, name)):
+                    output.append(f"{directory}/{name}\n".encode())
+                    break
+            else:
+                self.exit_status = 1
+        return b''.join(output)
+
+    def _cmd_mkdir(self, args):
+        for arg in args:
+            if not arg.startswith('-'):
+                self._store(self._resolve(arg), Node(True, 'drwxr-xr-x', 4096, None, ()))
+        return b''
+
+    def _cmd_touch(self, args):
+        for arg in args:
+            path = self._resolve(arg)
+            if not arg.startswith('-') and self._node(path) is None:
+                self._write_file(arg, b'')
+        return b''
+
+    def _cmd_rm(self, args):
+        for arg in args:
+            if not arg.startswith('-'):
+                path = self._resolve(arg)
+                if self.overlay.pop(path, None) is None and path in self.filesystem.nodes:
+                    self.removed.add(path)
+        return b''
+
+    def _cmd_passwd(self, args):
+        self.exit_status = 1
+        return b'passwd: Authentication token manipulation error\n'
+
+    def _cmd_busybox(self, args):
+        if not args:
+            return b'BusyBox v1.30.1 (2019-10-28 11:24:56 UTC) multi-call binary.\n'
+        if args[0] not in BUSYBOX_APPLETS:
+            # Mirai-style probes check for this exact reply
+            self.exit_status = 127
+            return f"{args[0]}: applet not found\n".encode()
+        return self._run_command(args, None)
+
+    def _download(self, name, args):
+        urls = [arg for arg in args if '://' in arg or ('.' in arg and not arg.startswith('-'))]
+        host = urls[0].split('://')[-1].split('/')[0] if urls else ''
+        self.exit_status = 1
+        if name == 'curl':
+            return f"curl: (7) Failed connect to {host}; Connection timed out\n".encode()
+        if name == 'wget' and host:
+            return (f"--2022-11-14 14:02:11--  {urls[0]}\nResolving {host}... failed: "
+                    f"Temporary failure in name resolution.\nwget: unable to resolve host address '{host}'\n").encode()
+        return f"{name}: network unreachable\n".encode()
+
+    # --- Filesystem view: shared tree plus this session's overlay ---
+
+    def _resolve(self, path):
+        if path == '~' or path.startswith('~/'):
+            path = self.home + path[1:]
+        return posixpath.normpath(posixpath.join(self.cwd, path)).replace('//', '/')
+
+    def _node(self, path):
+        if path in self.removed:
+            return None
+        node = self.overlay.get(path)
+        return node if node is not None else self.filesystem.nodes.get(path)
+
+    def _children(self, path):
+        node = self.filesystem.nodes.get(path)
+        names = set(node.children if node and path not in self.removed else ())
+        names.update(posixpath.basename(child) for child in self.overlay if posixpath.dirname(child) == path)
+        return sorted(name for name in names if posixpath.join(path, name) not in self.removed)
+
+    def _write_file(self, target, data, append=False):
+        path = self._resolve(target)
+        if path == '/dev/null':
+            return
+        node = self._node(path)
+        if node is not None and node.is_dir:
+            return
+        if append and node is not None and node.content is not None:
+            data = node.content + data
+        self._store(path, Node(False, '-rw-r--r--', len(data), data, ()))
+
+    def _store(self, path, node):
+        """Add to the overlay within the session's byte budget"""
+        parent = self._node(posixpath.dirname(path))
+        if parent is None or not parent.is_dir:
+            return
+        previous = self.overlay.get(path)
+        cost = _overlay_cost(path, node) - (_overlay_cost(path, previous) if previous else 0)
+        if self.overlay_bytes + cost > self.max_overlay_bytes:
+            self.exit_status = 1
+            return
+        self.overlay[path] = node
+        self.overlay_bytes += cost
+        self.removed.discard(path)
+
+def _overlay_cost(path, node):
+    return len(path) + len(node.content or b'')
+
+def _split_commands(line):
+    """Split on ;, && and || outside quotes (each part runs regardless of the others' status)"""
+    if '"' not in line and "'" not in line:
+        return [part.strip() for part in COMMAND_SEPARATOR.split(line) if part.strip()]
+    parts = []
+    current = []
+    quote = None
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+        elif char == ';' or line[i:i + 2] in ('&&', '||'):
+            parts.append(''.join(current))
+            current = []
+            i += 1 if char == ';' else 2
+            continue
+        current.append(char)
+        i += 1
+    parts.append(''.join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+def _strip_redirections(argv):
+    """Remove redirection tokens; returns (argv, (stdout target, append) or None)"""
+    remaining = []
+    redirect = None
+    tokens = iter(argv)
+    for token in tokens:
+        if token in ('>', '>>', '1>'):
+            redirect = (next(tokens, '/dev/null'), token == '>>')
+        elif token.startswith('>>'):
+            redirect = (token[2:], True)
+        elif token.startswith('>') or token.startswith('1>'):
+            redirect = (token.split('>', 1)[1], False)
+        elif token.startswith('2>') or token == '&':
+            if token in ('2>', '2>>'):
+                next(tokens, None)
+        else:
+            remaining.append(token)
+    return remaining, redirect
+
+def _filter(name, args, data):
+    """The few text filters scripts pipe output through; None if the command is not one"""
+    lines = data.splitlines(keepends=True)
+    if name == 'grep':
+        patterns = [arg for arg in args if not arg.startswith('-')]
+        if not patterns:
+            return b''
+        pattern = patterns[0].encode()
+        invert = '-v' in args
+        return b''.join(line for line in lines if (pattern in line) != invert)
+    if name == 'wc':
+        return f"{len(lines) if '-l' in args else len(data)}\n".encode()
+    if name in ('head', 'tail'):
+        count = 10
+        for arg in args:
+            if arg.lstrip('-').isdigit():
+                count = int(arg.lstrip('-'))
+        return b''.join(lines[:count] if name == 'head' else lines[-count:])
+    if name == 'sort':
+        return b''.join(sorted(lines))
+    if name in ('cat', 'uniq', 'tee', 'more', 'less'):
+        return data
+    return None
@@ -0,0 +1,277 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class _Inflight:
+    """A lookup in progress that concurrent callers for the same IP wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+class PersistentGeoCache:
+    """SQLite-backed cache tier shared by every process on the host and kept across restarts"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS geo_cache ("
+                "ip TEXT PRIMARY KEY, country TEXT, city TEXT, "
+                "latitude REAL, longitude REAL, expires_at REAL NOT NULL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, ip_address, now):
+        """Return (geo, expires_at) if a live entry exists"""
+        row = self._connection().execute(
+            "SELECT country, city, latitude, longitude, expires_at FROM geo_cache WHERE ip = ?",
+            (ip_address,)
+        ).fetchone()
+        if row is None or row[4] <= now:
+            return None
+        return {
+            'country': row[0],
+            'city': row[1],
+            'latitude': row[2],
+            'longitude': row[3]
+        }, row[4]
+
+    def put(self, ip_address, geo_data, expires_at):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO geo_cache (ip, country, city, latitude, longitude, expires_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (ip_address, geo_data.get('country'), geo_data.get('city'),
+             geo_data.get('latitude'), geo_data.get('longitude'), expires_at)
+        )
+
+    def purge_expired(self, now):
+        return self._connection().execute("DELETE FROM geo_cache WHERE expires_at <= ?", (now,)).rowcount
+
+class GeoCache:
+    """Thread-safe LRU cache for geolocation results with TTLs and request coalescing"""
+
+    def __init__(self, capacity=100000, ttl=86400, negative_ttl=300, persistent_path=None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl  # failed lookups ("Unknown") are retried sooner
+        self.entries = OrderedDict()  # ip -> (expires_at, geo_data), least recently used first
+        self.inflight = {}
+        self.lock = threading.Lock()
+        # A path, or a function returning it (processes that never look anything up don't resolve it)
+        self.persistent_path = persistent_path
+        self.persistent = None  # opened on first use
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.persistent_hits = 0
+
+    def _expiry_for(self, geo_data, now):
+        if not geo_data or geo_data.get('country') in (None, 'Unknown'):
+            return now + self.negative_ttl
+        return now + self.ttl
+
+    def _store(self, ip_address, geo_data, expires_at):
+        with self.lock:
+            self.entries[ip_address] = (expires_at, geo_data)
+            self.entries.move_to_end(ip_address)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, ip_address):
+        """Return a live cached entry without loading, or None"""
+        with self.lock:
+            entry = self.entries.get(ip_address)
+            if entry and entry[0] > time.time():
+                return entry[1]
+        return None
+
+    def get_or_load(self, ip_address, loader):
+        """Return the cached location, calling loader at most once per IP across concurrent callers"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(ip_address)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(ip_address)
+                    self.hits += 1
+                    return entry[1]
+                del self.entries[ip_address]
+                self.expirations += 1
+
+            inflight = self.inflight.get(ip_address)
+            if inflight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                inflight = self.inflight[ip_address] = _Inflight()
+                self.misses += 1
+                leader = True
+
+        if not leader:
+            inflight.event.wait()
+            return inflight.result
+
+        geo_data = None
+        try:
+            cached = self._get_persistent(ip_address, now)
+            if cached is not None:
+                self.persistent_hits += 1
+                geo_data, expires_at = cached
+            else:
+                geo_data = loader(ip_address)
+                expires_at = self._expiry_for(geo_data, time.time())
+                self._put_persistent(ip_address, geo_data, expires_at)
+            self._store(ip_address, geo_data, expires_at)
+            return geo_data
+        finally:
+            inflight.result = geo_data
+            with self.lock:
+                self.inflight.pop(ip_address, None)
+            inflight.event.set()
+
+    def get_or_load_many(self, ip_addresses, loader):
+        """Batch get_or_load: loader takes the IPs nobody has (or is) looking up and returns {ip: location}
+
+        A None location means no provider could answer just now; it is returned
+        but not cached, so the IP is looked up again next time.
+        """
+        now = time.time()
+        results = {}
+        leading = {}
+        waiting = {}
+        with self.lock:
+            for ip_address in dict.fromkeys(ip_addresses):
+                entry = self.entries.get(ip_address)
+                if entry is not None:
+                    if entry[0] > now:
+                        self.entries.move_to_end(ip_address)
+                        self.hits += 1
+                        results[ip_address] = entry[1]
+                        continue
+                    del self.entries[ip_address]
+                    self.expirations += 1
+
+                inflight = self.inflight.get(ip_address)
+                if inflight is not None:
+                    self.coalesced += 1
+                    waiting[ip_address] = inflight
+                else:
+                    leading[ip_address] = self.inflight[ip_address] = _Inflight()
+                    self.misses += 1
+
+        try:
+            missing = []
+            for ip_address in leading:
+                cached = self._get_persistent(ip_address, now)
+                if cached is not None:
+                    self.persistent_hits += 1
+                    results[ip_address] = cached[0]
+                    self._store(ip_address, *cached)
+                else:
+                    missing.append(ip_address)
+            if missing:
+                loaded = loader(missing)
+                expires_now = time.time()
+                for ip_address in missing:
+                    geo_data = results[ip_address] = loaded.get(ip_address)
+                    if geo_data is not None:
+                        expires_at = self._expiry_for(geo_data, expires_now)
+                        self._put_persistent(ip_address, geo_data, expires_at)
+                        self._store(ip_address, geo_data, expires_at)
+        finally:
+            with self.lock:
+                for ip_address in leading:
+                    self.inflight.pop(ip_address, None)
+            for ip_address, inflight in leading.items():
+                inflight.result = results.get(ip_address)
+                inflight.event.set()
+
+        for ip_address, inflight in waiting.items():
+            inflight.event.wait()
+            results[ip_address] = inflight.result
+        return results
+
+    def _open_persistent(self):
+        """The persistent tier, opening its file the first time it is needed"""
+        if self.persistent is None and self.persistent_path:
+            with self.lock:
+                if self.persistent is None and self.persistent_path:
+                    path = self.persistent_path() if callable(self.persistent_path) else self.persistent_path
+                    try:
+                        self.persistent = PersistentGeoCache(path)
+                    except Exception as e:
+                        logger.error(f"Persistent geolocation cache disabled ({path}): {e}")
+                        self.persistent_path = None
+        return self.persistent
+
+    def _get_persistent(self, ip_address, now):
+        if not self._open_persistent():
+            return None
+        try:
+            return self.persistent.get(ip_address, now)
+        except Exception as e:
+            logger.debug(f"Persistent geolocation cache read failed for {ip_address}: {e}")
+            return None
+
+    def _put_persistent(self, ip_address, geo_data, expires_at):
+        if not geo_data or not self._open_persistent():
+            return
+        try:
+            self.persistent.put(ip_address, geo_data, expires_at)
+        except Exception as e:
+            logger.debug(f"Persistent geolocation cache write failed for {ip_address}: {e}")
+
+    def clear(self):
+        """Drop every in-memory entry (the persistent tier is left intact)"""
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        """Return cache counters for monitoring"""
+        with self.lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'size': len(self.entries),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'persistent_hits': self.persistent_hits,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0
+            }
+
+def default_persistent_path():
+    """One file per database, whatever directory the process was started from"""
+    from storage import sidecar_path
+    return sidecar_path('geo_cache.db')
+
+def create_geo_cache():
+    """Build the process-wide cache from environment settings"""
+    return GeoCache(
+        capacity=int(os.environ.get('GEO_CACHE_SIZE', 100000)),
+        ttl=float(os.environ.get('GEO_CACHE_TTL', 86400)),
+        negative_ttl=float(os.environ.get('GEO_CACHE_NEGATIVE_TTL', 300)),
+        persistent_path=os.environ.get('GEO_CACHE_PATH', default_persistent_path) or None
+    )
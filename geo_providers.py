@@ -0,0 +1,326 @@
+"""Remote geolocation providers behind pooled connections, rate limits and circuit breakers.
+
+GeoResolver tries the providers in order, each with the IPs the previous ones
+could not place, in batches as large as the provider takes (100 for ip-api's
+batch endpoint, otherwise one). Every provider has a token bucket shared by all
+threads of the process and a circuit breaker that stops calling it after
+repeated failures; a provider that is open or would keep the caller waiting
+longer than max_wait is skipped. An IP that no provider answered comes back as
+None (try again later) rather than "Unknown", which is reserved for IPs the
+providers answered but could not place.
+
+requests is imported on first use: sensors on the stub or local provider never
+load it.
+"""
+import logging
+import os
+import threading
+import time
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+REQUEST_SECONDS = metrics.histogram('geolocation_http_request_seconds', 'Requests to remote geolocation providers',
+                                    ['provider', 'outcome'])
+
+UNKNOWN_LOCATION = {
+    'country': 'Unknown',
+    'city': 'Unknown',
+    'latitude': 0.0,
+    'longitude': 0.0
+}
+
+class ProviderUnavailable(Exception):
+    """The provider cannot be asked right now (circuit open, rate limited, or the request failed)"""
+
+class TokenBucket:
+    """Thread-safe token bucket: rate tokens per second, bursts of up to burst
+
+    Callers reserve a token and sleep until it is due, so concurrent callers are
+    spaced out in arrival order instead of racing for the next token.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take a token, waiting for it unless that would take longer than timeout seconds"""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+            if timeout is not None and wait > timeout:
+                return False
+            self.tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures; after reset_timeout one trial call decides"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.lock = threading.Lock()
+
+    def ready(self):
+        """Whether a call could be let through now (without claiming the half-open trial)"""
+        return self.state == self.CLOSED or (
+            self.state == self.OPEN and self.clock() >= self.opened_at + self.reset_timeout)
+
+    def allow(self):
+        """Claim permission for one call"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() >= self.opened_at + self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opens += 1
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+def create_http_session(pool_size=10):
+    """requests.Session keeping up to pool_size connections per host alive"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+class GeoProvider:
+    """One HTTP geolocation service; subclasses build the requests and parse the answers"""
+
+    name = None
+    batch_size = 1
+
+    def __init__(self, session, base_url, rate_per_minute, burst=1, timeout=5.0, max_wait=10.0, breaker=None):
+        self.session = session
+        self.base_url = base_url.rstrip('/')
+        self.limiter = TokenBucket(rate_per_minute / 60.0, burst)
+        self.timeout = timeout
+        self.max_wait = max_wait
+        self.breaker = breaker or CircuitBreaker()
+
+    def resolve(self, ip_addresses):
+        """{ip: location, or None if the provider has no answer for it}; raises ProviderUnavailable"""
+        return {ip_address: self.lookup(ip_address) for ip_address in ip_addresses}
+
+    def lookup(self, ip_address):
+        raise NotImplementedError
+
+    def _request(self, method, url, limiter=None, **kwargs):
+        """Send one rate-limited, circuit-checked request and return its decoded JSON"""
+        if not self.breaker.ready():
+            raise ProviderUnavailable(f"{self.name}: circuit open")
+        if not (limiter or self.limiter).acquire(self.max_wait):
+            raise ProviderUnavailable(f"{self.name}: rate limited")
+        if not self.breaker.allow():
+            raise ProviderUnavailable(f"{self.name}: circuit open")
+
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            if response.status_code != 200:
+                raise ProviderUnavailable(f"{self.name}: HTTP {response.status_code}")
+            data = response.json()
+            self._check(data)
+        except Exception as e:
+            self.breaker.record_failure()
+            REQUEST_SECONDS.labels(self.name, 'error').observe(time.perf_counter() - start)
+            if isinstance(e, ProviderUnavailable):
+                raise
+            raise ProviderUnavailable(f"{self.name}: {e}") from e
+        self.breaker.record_success()
+        REQUEST_SECONDS.labels(self.name, 'ok').observe(time.perf_counter() - start)
+        return data
+
+    def _check(self, data):
+        """Raise ProviderUnavailable for answers that mean the service itself refused (quota, key)"""
+
+class IpApiProvider(GeoProvider):
+    """ip-api.com: 45 single lookups a minute, or 15 batches of up to 100 IPs"""
+
+    name = 'ip-api'
+    batch_size = 100
+    FIELDS = 'status,message,country,city,lat,lon,query'
+
+    def __init__(self, session, base_url, rate_per_minute, burst=1, batch_rate_per_minute=15, **kwargs):
+        super().__init__(session, base_url, rate_per_minute, burst, **kwargs)
+        self.batch_limiter = TokenBucket(batch_rate_per_minute / 60.0, burst)
+
+    def resolve(self, ip_addresses):
+        if len(ip_addresses) == 1:
+            return super().resolve(ip_addresses)
+        data = self._request('POST', f'{self.base_url}/batch', limiter=self.batch_limiter,
+                             params={'fields': self.FIELDS}, json=list(ip_addresses))
+        results = dict.fromkeys(ip_addresses)
+        for item in data:
+            if item.get('query') in results:
+                results[item['query']] = self._parse(item)
+        return results
+
+    def lookup(self, ip_address):
+        return self._parse(self._request('GET', f'{self.base_url}/json/{ip_address}',
+                                         params={'fields': self.FIELDS}))
+
+    def _parse(self, data):
+        if data.get('status') != 'success':
+            return None
+        return {
+            'country': data.get('country', 'Unknown'),
+            'city': data.get('city', 'Unknown'),
+            'latitude': float(data.get('lat', 0)) if data.get('lat') else 0.0,
+            'longitude': float(data.get('lon', 0)) if data.get('lon') else 0.0
+        }
+
+class IpapiCoProvider(GeoProvider):
+    """ipapi.co: no key, a small daily quota"""
+
+    name = 'ipapi.co'
+
+    def lookup(self, ip_address):
+        data = self._request('GET', f'{self.base_url}/{ip_address}/json/')
+        if 'error' in data:
+            return None
+        return {
+            'country': data.get('country_name', 'Unknown'),
+            'city': data.get('city', 'Unknown'),
+            'latitude': float(data.get('latitude', 0)) if data.get('latitude') else 0.0,
+            'longitude': float(data.get('longitude', 0)) if data.get('longitude') else 0.0
+        }
+
+    def _check(self, data):
+        if data.get('reason') == 'RateLimited':
+            raise ProviderUnavailable(f"{self.name}: quota exhausted")
+
+class IpstackProvider(GeoProvider):
+    """ipstack.com: needs IPSTACK_API_KEY"""
+
+    name = 'ipstack'
+
+    def __init__(self, session, base_url, rate_per_minute, api_key, **kwargs):
+        super().__init__(session, base_url, rate_per_minute, **kwargs)
+        self.api_key = api_key
+
+    def lookup(self, ip_address):
+        data = self._request('GET', f'{self.base_url}/{ip_address}', params={'access_key': self.api_key})
+        if 'error' in data:
+            return None
+        return {
+            'country': data.get('country_name', 'Unknown'),
+            'city': data.get('city', 'Unknown'),
+            'latitude': float(data.get('latitude', 0)) if data.get('latitude') else 0.0,
+            'longitude': float(data.get('longitude', 0)) if data.get('longitude') else 0.0
+        }
+
+    def _check(self, data):
+        # 101-105: missing or invalid key, inactive account, usage limit reached
+        if isinstance(data.get('error'), dict) and 101 <= data['error'].get('code', 0) <= 105:
+            raise ProviderUnavailable(f"{self.name}: {data['error'].get('type')}")
+
+class GeoResolver:
+    """Resolves IPs through the providers in fallback order"""
+
+    def __init__(self, providers):
+        self.providers = providers
+
+    def resolve(self, ip_addresses):
+        """{ip: location}; None for IPs no provider could be asked about"""
+        results = {}
+        remaining = list(dict.fromkeys(ip_addresses))
+        answered = set()
+        for provider in self.providers:
+            if not remaining:
+                break
+            for start in range(0, len(remaining), provider.batch_size):
+                chunk = remaining[start:start + provider.batch_size]
+                try:
+                    found = provider.resolve(chunk)
+                except ProviderUnavailable as e:
+                    logger.debug(f"Skipping geolocation provider: {e}")
+                    break  # the rest goes to the next provider
+                answered.update(chunk)
+                results.update((ip_address, geo_data) for ip_address, geo_data in found.items() if geo_data)
+            remaining = [ip_address for ip_address in remaining if ip_address not in results]
+
+        for ip_address in remaining:
+            results[ip_address] = dict(UNKNOWN_LOCATION) if ip_address in answered else None
+        return results
+
+    def get_stats(self):
+        return {provider.name: {'circuit': provider.breaker.state, 'opens': provider.breaker.opens}
+                for provider in self.providers}
+
+# Defaults are the providers' free tiers; GEOLOCATION_<NAME>_URL / _RATE (requests a minute) override them
+PROVIDER_SETTINGS = {
+    'ip-api': ('IP_API', 'http://ip-api.com', 45),
+    'ipapi.co': ('IPAPI_CO', 'https://ipapi.co', 30),
+    'ipstack': ('IPSTACK', 'http://api.ipstack.com', 60),
+}
+
+def create_geo_resolver(api_key=''):
+    """Build the remote providers from environment settings, in GEOLOCATION_PROVIDERS order"""
+    session = create_http_session(int(os.environ.get('GEOLOCATION_HTTP_POOL', 10)))
+    options = {
+        'timeout': float(os.environ.get('GEOLOCATION_TIMEOUT', 5.0)),
+        'max_wait': float(os.environ.get('GEOLOCATION_MAX_WAIT', 10.0)),
+    }
+    failures = int(os.environ.get('GEOLOCATION_BREAKER_FAILURES', 5))
+    reset_timeout = float(os.environ.get('GEOLOCATION_BREAKER_RESET', 30.0))
+
+    providers = []
+    for name in os.environ.get('GEOLOCATION_PROVIDERS', 'ip-api,ipapi.co,ipstack').split(','):
+        name = name.strip()
+        if name not in PROVIDER_SETTINGS:
+            logger.warning(f"Unknown geolocation provider {name}, skipping it")
+            continue
+        key, default_url, default_rate = PROVIDER_SETTINGS[name]
+        url = os.environ.get(f'GEOLOCATION_{key}_URL', default_url)
+        rate = float(os.environ.get(f'GEOLOCATION_{key}_RATE', default_rate))
+        breaker = CircuitBreaker(failures, reset_timeout)
+        if name == 'ip-api':
+            providers.append(IpApiProvider(
+                session, url, rate, breaker=breaker,
+                batch_rate_per_minute=float(os.environ.get('GEOLOCATION_IP_API_BATCH_RATE', 15)), **options))
+        elif name == 'ipapi.co':
+            providers.append(IpapiCoProvider(session, url, rate, breaker=breaker, **options))
+        elif api_key:
+            providers.append(IpstackProvider(session, url, rate, api_key, breaker=breaker, **options))
+
+    resolver = GeoResolver(providers)
+    metrics.gauge('geolocation_provider_circuit_open', 'Whether a provider is being skipped after failures',
+                  ['provider'], function=lambda: {(p.name,): int(p.breaker.state != CircuitBreaker.CLOSED)
+                                                  for p in resolver.providers})
+    return resolver
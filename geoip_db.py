@@ -0,0 +1,225 @@
+import array
+import bisect
+import csv
+import ipaddress
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'HPGEOIP1'
+HEADER = struct.Struct('<8sIII')  # magic, IPv4 ranges, IPv6 ranges, location table bytes
+
+class _FixedWidthKeys:
+    """Sequence view over packed 16-byte big-endian IPv6 addresses, ordered like the integers they encode"""
+
+    def __init__(self, buffer, count):
+        self.buffer = buffer
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        offset = index * 16
+        return bytes(self.buffer[offset:offset + 16])
+
+class GeoIPDatabase:
+    """Sorted, array-backed IP range table answering lookups by binary search"""
+
+    def __init__(self, v4_starts, v4_ends, v4_locations, v6_starts, v6_ends, v6_locations,
+                 locations, path=None, mapping=None):
+        self.v4_starts = v4_starts
+        self.v4_ends = v4_ends
+        self.v4_locations = v4_locations
+        self.v6_starts = v6_starts
+        self.v6_ends = v6_ends
+        self.v6_locations = v6_locations
+        self.locations = locations  # interned location tuples indexed by id
+        self.path = path
+        self.mapping = mapping
+
+    @property
+    def range_count(self):
+        return len(self.v4_starts) + len(self.v6_starts)
+
+    def lookup(self, ip_address):
+        """Return the location for an IP, or None if no range covers it"""
+        try:
+            ip = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+
+        if ip.version == 4:
+            key = int(ip)
+            index = bisect.bisect_right(self.v4_starts, key) - 1
+            if index < 0 or key > self.v4_ends[index]:
+                return None
+            location_id = self.v4_locations[index]
+        else:
+            key = ip.packed
+            index = bisect.bisect_right(self.v6_starts, key) - 1
+            if index < 0 or key > self.v6_ends[index]:
+                return None
+            location_id = self.v6_locations[index]
+
+        country, city, latitude, longitude = self.locations[location_id]
+        return {
+            'country': country,
+            'city': city,
+            'latitude': latitude,
+            'longitude': longitude
+        }
+
+    @classmethod
+    def from_csv(cls, csv_path):
+        """Build an in-memory table from a CSV of start_ip,end_ip,country,city,latitude,longitude"""
+        v4_ranges = []
+        v6_ranges = []
+        locations = []
+        location_ids = {}
+
+        with open(csv_path, newline='') as f:
+            for row in csv.reader(f):
+                if not row or row[0].startswith('#') or row[0] == 'start_ip':
+                    continue
+                start = ipaddress.ip_address(row[0].strip())
+                end = ipaddress.ip_address(row[1].strip())
+                location = (
+                    row[2] or 'Unknown',
+                    row[3] or 'Unknown',
+                    float(row[4]) if row[4] else 0.0,
+                    float(row[5]) if row[5] else 0.0
+                )
+                # Intern repeated locations so each range stores only an integer id
+                location_id = location_ids.get(location)
+                if location_id is None:
+                    location_id = location_ids[location] = len(locations)
+                    locations.append(location)
+
+                if start.version == 4:
+                    v4_ranges.append((int(start), int(end), location_id))
+                else:
+                    v6_ranges.append((start.packed, end.packed, location_id))
+
+        v4_ranges.sort()
+        v6_ranges.sort()
+        return cls(
+            array.array('I', (r[0] for r in v4_ranges)),
+            array.array('I', (r[1] for r in v4_ranges)),
+            array.array('I', (r[2] for r in v4_ranges)),
+            _FixedWidthKeys(b''.join(r[0] for r in v6_ranges), len(v6_ranges)),
+            _FixedWidthKeys(b''.join(r[1] for r in v6_ranges), len(v6_ranges)),
+            array.array('I', (r[2] for r in v6_ranges)),
+            locations,
+            path=csv_path
+        )
+
+    def save(self, path):
+        """Write the compiled binary format that open() can memory-map"""
+        location_blob = json.dumps(self.locations, separators=(',', ':')).encode()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(self.v4_starts), len(self.v6_starts), len(location_blob)))
+            for column in (self.v4_starts, self.v4_ends, self.v4_locations):
+                f.write(_little_endian(column))
+            f.write(bytes(self.v6_starts.buffer))
+            f.write(bytes(self.v6_ends.buffer))
+            f.write(_little_endian(self.v6_locations))
+            f.write(location_blob)
+        # Readers reloading the path never see a half-written file
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path, use_mmap=True):
+        """Load a compiled database, memory-mapping it so startup cost is independent of size"""
+        if path.endswith('.csv'):
+            return cls.from_csv(path)
+
+        with open(path, 'rb') as f:
+            if use_mmap:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = f.read()
+
+        magic, v4_count, v6_count, location_bytes = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled GeoIP database")
+
+        view = memoryview(data)
+        offset = HEADER.size
+        columns = []
+        for _ in range(3):
+            columns.append(_uint32_column(view[offset:offset + v4_count * 4]))
+            offset += v4_count * 4
+        v6_starts = _FixedWidthKeys(view[offset:offset + v6_count * 16], v6_count)
+        offset += v6_count * 16
+        v6_ends = _FixedWidthKeys(view[offset:offset + v6_count * 16], v6_count)
+        offset += v6_count * 16
+        v6_locations = _uint32_column(view[offset:offset + v6_count * 4])
+        offset += v6_count * 4
+        locations = [tuple(location) for location in json.loads(bytes(view[offset:offset + location_bytes]))]
+
+        return cls(columns[0], columns[1], columns[2], v6_starts, v6_ends, v6_locations,
+                   locations, path=path, mapping=data if use_mmap else None)
+
+def _uint32_column(buffer):
+    """View a little-endian uint32 column without copying when the host byte order allows"""
+    if sys.byteorder == 'little':
+        return buffer.cast('I')
+    column = array.array('I', bytes(buffer))
+    column.byteswap()
+    return column
+
+def _little_endian(column):
+    data = array.array('I', column)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+class LocalGeoIPBackend:
+    """Holds the active GeoIPDatabase and swaps in a new file atomically when it changes"""
+
+    def __init__(self, path, check_interval=60):
+        self.path = path
+        self.check_interval = check_interval
+        self.database = None
+        self.loaded_mtime = None
+        self.last_check = 0
+        self._reload_lock = threading.Lock()
+        self.reload()
+
+    def reload(self, path=None):
+        """Load a database file and replace the active one in a single reference swap"""
+        path = path or self.path
+        with self._reload_lock:
+            mtime = os.path.getmtime(path)
+            database = GeoIPDatabase.open(path)
+            # In-flight lookups keep using the old table until they return
+            self.database = database
+            self.path = path
+            self.loaded_mtime = mtime
+            logger.info(f"Loaded GeoIP database {path} ({database.range_count} ranges)")
+
+    def maybe_reload(self, now):
+        """Reload if the file on disk was replaced since it was loaded"""
+        if now - self.last_check < self.check_interval:
+            return
+        self.last_check = now
+        try:
+            if os.path.getmtime(self.path) != self.loaded_mtime:
+                self.reload()
+        except Exception as e:
+            logger.error(f"Failed to reload GeoIP database {self.path}: {e}")
+
+    def lookup(self, ip_address):
+        return self.database.lookup(ip_address)
+
+if __name__ == '__main__':
+    # python geoip_db.py ranges.csv ranges.bin
+    GeoIPDatabase.from_csv(sys.argv[1]).save(sys.argv[2])
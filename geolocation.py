@@ -1,123 +1,160 @@
-import requests
 import logging
 import os
+import threading
 import time
-from functools import lru_cache
+import hashlib
+from geo_cache import create_geo_cache
+from geo_providers import UNKNOWN_LOCATION, create_geo_resolver
+from metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+PROVIDER_SECONDS = metrics.histogram('geolocation_provider_seconds',
+                                     'Cache misses handed to the provider (one IP or a batch), by provider', ['provider'])
+
 class GeolocationService:
     """Service for getting IP geolocation data"""
     
+    # Deterministic locations served by the offline stub provider
+    STUB_LOCATIONS = [
+        ('China', 'Beijing', 39.9042, 116.4074),
+        ('United States', 'Ashburn', 39.0438, -77.4874),
+        ('Russia', 'Moscow', 55.7558, 37.6173),
+        ('Brazil', 'Sao Paulo', -23.5505, -46.6333),
+        ('India', 'Mumbai', 19.0760, 72.8777),
+        ('Germany', 'Frankfurt', 50.1109, 8.6821),
+        ('Netherlands', 'Amsterdam', 52.3676, 4.9041),
+        ('Vietnam', 'Hanoi', 21.0278, 105.8342),
+    ]
+    
     def __init__(self):
         self.api_key = os.environ.get('IPSTACK_API_KEY', '')
-        self.last_request_time = 0
-        self.rate_limit_delay = 1  # 1 second between requests
+        
+        # 'remote' queries the HTTP providers, 'local' uses an offline GeoIP database
+        # file and 'stub' answers from a fixed table for offline runs
+        self.provider = os.environ.get('GEOLOCATION_PROVIDER', 'remote')
+        self.stub_latency = float(os.environ.get('GEOLOCATION_STUB_LATENCY', 0))
+        self.cache = create_geo_cache()
+        self.local_db = None
+        if self.provider == 'local':
+            from geoip_db import LocalGeoIPBackend
+            self.local_db = LocalGeoIPBackend(
+                os.environ.get('GEOIP_DATABASE', 'geoip.bin'),
+                check_interval=float(os.environ.get('GEOIP_RELOAD_INTERVAL', 60))
+            )
+        self.resolver = None  # remote providers, built on first use
+        self._resolver_lock = threading.Lock()
     
-    @lru_cache(maxsize=1000)
     def get_location_cached(self, ip_address):
         """Get location data with caching to avoid repeated API calls"""
-        return self._get_location_from_api(ip_address)
+        return self.cache.get_or_load(ip_address, self._load_location)
+    
+    def get_locations_cached(self, ip_addresses):
+        """Batch get_location_cached: {ip: location}, None where no provider could answer yet"""
+        return self.cache.get_or_load_many(ip_addresses, self._load_locations)
+    
+    def _load_location(self, ip_address):
+        """Cache loader: the provider lookup, timed"""
+        start = time.perf_counter()
+        try:
+            return self._get_location_from_api(ip_address)
+        finally:
+            PROVIDER_SECONDS.labels(self.provider).observe(time.perf_counter() - start)
+    
+    def _load_locations(self, ip_addresses):
+        """Batch cache loader: remote providers get the IPs in batches, the others one at a time"""
+        start = time.perf_counter()
+        try:
+            if self.provider == 'remote':
+                return self._get_locations_from_remote(ip_addresses)
+            return {ip_address: self._get_location_from_api(ip_address) for ip_address in ip_addresses}
+        finally:
+            PROVIDER_SECONDS.labels(self.provider).observe(time.perf_counter() - start)
     
     def _get_location_from_api(self, ip_address):
         """Get location data from IP geolocation API"""
-        try:
-            # Rate limiting
-            current_time = time.time()
-            time_since_last = current_time - self.last_request_time
-            if time_since_last < self.rate_limit_delay:
-                time.sleep(self.rate_limit_delay - time_since_last)
-            
-            self.last_request_time = time.time()
-            
-            # Skip private/local IPs
+        if self.provider == 'stub':
+            return self._get_location_from_stub(ip_address)
+        if self.provider == 'local':
+            return self._get_location_from_local_db(ip_address)
+        return self._get_locations_from_remote([ip_address])[ip_address] or dict(UNKNOWN_LOCATION)
+    
+    def _remote_resolver(self):
+        # Only the remote provider needs requests; importing it costs a sensor ~0.1s of startup
+        with self._resolver_lock:
+            if self.resolver is None:
+                self.resolver = create_geo_resolver(self.api_key)
+            return self.resolver
+    
+    def _get_locations_from_remote(self, ip_addresses):
+        """Resolve through the HTTP providers; private addresses never leave the host"""
+        results = {}
+        public = []
+        for ip_address in ip_addresses:
             if self._is_private_ip(ip_address):
-                return {
+                results[ip_address] = {
                     'country': 'Local',
                     'city': 'Private Network',
                     'latitude': 0.0,
                     'longitude': 0.0
                 }
-            
-            # Try multiple free services
-            geo_data = None
-            
-            # Try ipapi.co first (no API key required)
-            try:
-                response = requests.get(
-                    f'https://ipapi.co/{ip_address}/json/',
-                    timeout=5
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    if 'error' not in data:
-                        geo_data = {
-                            'country': data.get('country_name', 'Unknown'),
-                            'city': data.get('city', 'Unknown'),
-                            'latitude': float(data.get('latitude', 0)) if data.get('latitude') else 0.0,
-                            'longitude': float(data.get('longitude', 0)) if data.get('longitude') else 0.0
-                        }
-            except Exception as e:
-                logger.debug(f"ipapi.co failed for {ip_address}: {e}")
-            
-            # Try ip-api.com as fallback
-            if not geo_data:
-                try:
-                    response = requests.get(
-                        f'http://ip-api.com/json/{ip_address}',
-                        timeout=5
-                    )
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('status') == 'success':
-                            geo_data = {
-                                'country': data.get('country', 'Unknown'),
-                                'city': data.get('city', 'Unknown'),
-                                'latitude': float(data.get('lat', 0)) if data.get('lat') else 0.0,
-                                'longitude': float(data.get('lon', 0)) if data.get('lon') else 0.0
-                            }
-                except Exception as e:
-                    logger.debug(f"ip-api.com failed for {ip_address}: {e}")
-            
-            # If we have an API key, try ipstack as fallback
-            if not geo_data and self.api_key:
-                try:
-                    response = requests.get(
-                        f'http://api.ipstack.com/{ip_address}?access_key={self.api_key}',
-                        timeout=5
-                    )
-                    if response.status_code == 200:
-                        data = response.json()
-                        if 'error' not in data:
-                            geo_data = {
-                                'country': data.get('country_name', 'Unknown'),
-                                'city': data.get('city', 'Unknown'),
-                                'latitude': float(data.get('latitude', 0)) if data.get('latitude') else 0.0,
-                                'longitude': float(data.get('longitude', 0)) if data.get('longitude') else 0.0
-                            }
-                except Exception as e:
-                    logger.debug(f"ipstack failed for {ip_address}: {e}")
-            
-            # Default response if all services fail
-            if not geo_data:
-                geo_data = {
-                    'country': 'Unknown',
-                    'city': 'Unknown',
-                    'latitude': 0.0,
-                    'longitude': 0.0
-                }
-            
-            logger.debug(f"Geolocation for {ip_address}: {geo_data}")
-            return geo_data
-            
+            else:
+                public.append(ip_address)
+        if not public:
+            return results
+        
+        try:
+            results.update(self._remote_resolver().resolve(public))
         except Exception as e:
-            logger.error(f"Error getting geolocation for {ip_address}: {e}")
+            logger.error(f"Error getting geolocation for {len(public)} IP(s): {e}")
+            results.update(dict.fromkeys(public))
+        return results
+    
+    def _get_location_from_local_db(self, ip_address):
+        """Look the IP up in the offline range database, no network involved"""
+        if self._is_private_ip(ip_address):
             return {
-                'country': 'Unknown',
-                'city': 'Unknown',
+                'country': 'Local',
+                'city': 'Private Network',
                 'latitude': 0.0,
                 'longitude': 0.0
             }
+        
+        try:
+            self.local_db.maybe_reload(time.time())
+            geo_data = self.local_db.lookup(ip_address)
+        except Exception as e:
+            logger.error(f"Local GeoIP lookup failed for {ip_address}: {e}")
+            geo_data = None
+        
+        return geo_data or {
+            'country': 'Unknown',
+            'city': 'Unknown',
+            'latitude': 0.0,
+            'longitude': 0.0
+        }
+    
+    def _get_location_from_stub(self, ip_address):
+        """Answer from a fixed table keyed by a hash of the IP, optionally simulating provider latency"""
+        if self.stub_latency:
+            time.sleep(self.stub_latency)
+        
+        if self._is_private_ip(ip_address):
+            return {
+                'country': 'Local',
+                'city': 'Private Network',
+                'latitude': 0.0,
+                'longitude': 0.0
+            }
+        
+        digest = hashlib.md5(ip_address.encode()).digest()
+        country, city, latitude, longitude = self.STUB_LOCATIONS[digest[0] % len(self.STUB_LOCATIONS)]
+        return {
+            'country': country,
+            'city': city,
+            'latitude': latitude,
+            'longitude': longitude
+        }
     
     def _is_private_ip(self, ip_address):
         """Check if IP address is private/local"""
@@ -132,6 +169,24 @@ class GeolocationService:
 # Global instance
 geolocation_service = GeolocationService()
 
+def _cache_lookups():
+    stats = geolocation_service.cache.get_stats()
+    return {
+        ('hit',): stats['hits'],
+        ('coalesced',): stats['coalesced'],
+        ('persistent_hit',): stats['persistent_hits'],
+        ('miss',): stats['misses'] - stats['persistent_hits']
+    }
+
+metrics.counter('geolocation_cache_lookups_total', 'Geolocation cache lookups by outcome', ['result'],
+                function=_cache_lookups)
+metrics.gauge('geolocation_cache_entries', 'Locations held in memory',
+              function=lambda: len(geolocation_service.cache.entries))
+
 def get_ip_geolocation(ip_address):
     """Get geolocation data for an IP address"""
     return geolocation_service.get_location_cached(ip_address)
+
+def resolve_ip_locations(ip_addresses):
+    """Get geolocation data for many IP addresses at once: {ip: location, or None to retry later}"""
+    return geolocation_service.get_locations_cached(ip_addresses)
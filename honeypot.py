@@ -1,50 +1,153 @@
+import os
 import socket
 import threading
+import asyncio
 import logging
 import time
 import hashlib
 from datetime import datetime
-import random
-import string
-from app import app, db
-from models import AttackLog
+from concurrent.futures import ThreadPoolExecutor
 from geolocation import get_ip_geolocation
+from ingest import attack_queue
+from enrichment import geo_enricher, ENRICHMENT_MODE
+from ssh_protocol import SSHServerSession, describe_client
+from ssh_crypto import load_host_key
+from fake_shell import ShellSession, SHELL_LIMITS
+from admission import ACCEPT, TARPIT, junk_line, create_admission_controller, create_tarpit
+from metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+CONNECTIONS = metrics.counter('honeypot_connections_total', 'Connections by admission action', ['action'])
+REJECTED_SESSIONS = metrics.counter('honeypot_rejected_sessions_total', 'Admitted connections closed at the session cap')
+ACTIVE_SESSIONS = metrics.gauge('honeypot_active_sessions', 'Sessions in progress')
+ACCEPT_SECONDS = metrics.histogram('honeypot_accept_seconds',
+                                   'Time from accepting a connection to handing it to its session')
+HANDSHAKE_SECONDS = metrics.histogram('honeypot_handshake_seconds', 'Time from connect to the end of key exchange',
+                                      buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+SESSION_SECONDS = metrics.histogram('honeypot_session_seconds', 'Session duration',
+                                    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+
+# Seconds asyncio mode waits for sessions in progress to finish when stopping
+SHUTDOWN_GRACE = float(os.environ.get('HONEYPOT_SHUTDOWN_GRACE', 5))
+
+# Threads running key exchanges off the event loop in asyncio mode
+KEX_WORKERS = int(os.environ.get('HONEYPOT_KEX_WORKERS', 2))
+
+_host_key = None
+_host_key_lock = threading.Lock()
+
+def get_host_key():
+    """Process-wide SSH host key, loaded (or generated) on first use"""
+    global _host_key
+    with _host_key_lock:
+        if _host_key is None:
+            _host_key = load_host_key(os.environ.get('SSH_HOST_KEY_PATH', 'ssh_host_ed25519.key'))
+        return _host_key
+
+def _clip(value, length=255):
+    """Truncate attacker-supplied text to the column width (None: unbounded), dropping the NUL
+    characters PostgreSQL refuses in text columns"""
+    return value.replace('\x00', '')[:length] if value else value
+
+def queue_attack_rows(ip, rows):
+    """Add geolocation to rows from one source address and queue them for batched insertion"""
+    if ENRICHMENT_MODE == 'inline':
+        # Get geolocation data
+        geo_data = get_ip_geolocation(ip)
+    else:
+        # Written with geo fields pending unless already known; the enrichment
+        # worker back-fills them
+        geo_data = geo_enricher.lookup_resolved(ip) or {}
+        if not geo_data:
+            geo_enricher.submit(ip)
+    
+    queued = 0
+    for row in rows:
+        row.update({
+            'country': geo_data.get('country'),
+            'city': geo_data.get('city'),
+            'latitude': geo_data.get('latitude'),
+            'longitude': geo_data.get('longitude')
+        })
+        queued += attack_queue.submit(row)
+    if queued < len(rows):
+        logger.warning(f"Ingest queue full, dropped {len(rows) - queued} attack attempt(s) from {ip}")
+    return queued
+
 class SSHHoneypot:
-    """SSH Honeypot simulation"""
+    """SSH Honeypot speaking the real transport protocol, optionally letting attackers into a fake shell"""
+    
+    SERVER_VERSION = 'SSH-2.0-OpenSSH_7.4'
+    MAX_AUTH_ATTEMPTS = 3
+    RECV_SIZE = 4096
     
-    SSH_BANNER = b"SSH-2.0-OpenSSH_7.4\r\n"
+    # States before key exchange completes (a client may send KEXINIT and its ECDH init together)
+    KEX_STATES = ('version', 'kexinit', 'kex')
     
-    def __init__(self, client_socket, client_address):
+    # Tarpit delays (seconds)
+    HANDSHAKE_DELAY = 0.5
+    AUTH_DELAY = 1
+    
+    def __init__(self, client_socket, client_address, timeout=30, shell=False,
+                 shell_accept_attempt=1, shell_idle_timeout=120):
         self.client_socket = client_socket
         self.client_address = client_address
+        self.timeout = timeout
+        self.shell_idle_timeout = shell_idle_timeout
         self.session_id = self.generate_session_id()
-        self.username = None
-        self.password = None
+        self.connected_at = time.perf_counter()
+        self.session = SSHServerSession(
+            get_host_key(),
+            server_version=self.SERVER_VERSION,
+            max_password_attempts=self.MAX_AUTH_ATTEMPTS,
+            shell_factory=self.create_shell if shell else None,
+            accept_password_attempt=shell_accept_attempt
+        )
+        self.commands = []  # (timestamp, command line) in execution order
         
     def generate_session_id(self):
         """Generate a unique session ID"""
         return hashlib.md5(f"{self.client_address}{time.time()}".encode()).hexdigest()
     
+    def create_shell(self, username, interactive):
+        """Shell for an accepted login; the filesystem tree is shared, the limits come from SHELL_LIMITS"""
+        return ShellSession(username, interactive, **SHELL_LIMITS)
+    
+    @property
+    def read_timeout(self):
+        """Seconds to wait for the client: the handshake timeout, or the shell's idle timeout"""
+        return self.shell_idle_timeout if self.session.shell else self.timeout
+    
+    @property
+    def username(self):
+        """Username of the most recent authentication attempt"""
+        attempts = self.session.auth_attempts
+        return attempts[-1]['username'] if attempts else None
+    
     def handle_connection(self):
         """Handle incoming SSH connection"""
         try:
-            logger.info(f"New SSH connection from {self.client_address[0]}:{self.client_address[1]}")
+            logger.debug(f"New SSH connection from {self.client_address[0]}:{self.client_address[1]}")
             
-            # Send SSH banner
-            self.client_socket.send(self.SSH_BANNER)
+            # Version string and KEXINIT go out immediately, like a real sshd
+            self.client_socket.settimeout(self.timeout)
+            self.client_socket.sendall(self.session.start())
             
-            # Read client banner
-            try:
-                client_banner = self.client_socket.recv(1024)
-                logger.debug(f"Client banner: {client_banner}")
-            except:
-                client_banner = b"Unknown"
-            
-            # Simulate SSH handshake
-            self.simulate_ssh_handshake()
+            while not self.session.closed:
+                try:
+                    self.client_socket.settimeout(self.read_timeout)
+                    data = self.client_socket.recv(self.RECV_SIZE)
+                except socket.timeout:
+                    break
+                if not data:
+                    break
+                
+                output, delay = self.process(data)
+                if delay:
+                    time.sleep(delay)
+                if output:
+                    self.client_socket.sendall(output)
             
             # Log the connection attempt
             self.log_attack_attempt()
@@ -53,144 +156,488 @@ class SSHHoneypot:
             logger.error(f"Error handling SSH connection: {e}")
         finally:
             self.client_socket.close()
+            SESSION_SECONDS.observe(time.perf_counter() - self.connected_at)
+    
+    def process(self, data):
+        """Feed received bytes to the protocol session; returns (reply, tarpit delay)"""
+        state = self.session.state
+        attempts = len(self.session.auth_attempts)
+        output = self.session.receive(data)
+        
+        now = datetime.utcnow()
+        for attempt in self.session.auth_attempts[attempts:]:
+            attempt['timestamp'] = now
+        if self.session.error:
+            logger.debug(f"SSH session from {self.client_address[0]} ended: {self.session.error}")
+        if state in self.KEX_STATES and self.session.state not in self.KEX_STATES:
+            HANDSHAKE_SECONDS.observe(time.perf_counter() - self.connected_at)
+        
+        shell = self.session.shell
+        if shell:
+            for command in shell.commands[len(self.commands):]:
+                self.commands.append((now, command))
+            # Command rate cap: hold the output back instead of answering at once
+            throttle = shell.take_throttle()
+            if throttle:
+                return output, throttle
+        if len(self.session.auth_attempts) > attempts:
+            return output, self.AUTH_DELAY
+        if state == 'kex' and self.session.state != 'kex':
+            # Slow down the key exchange reply
+            return output, self.HANDSHAKE_DELAY
+        return output, 0
+    
+    def attack_rows(self):
+        """One AttackLog row per authentication attempt (or one for a session that never got that far),
+        then one per shell command"""
+        user_agent = _clip(describe_client(self.session.client_version, self.session.client_kexinit), 500)
+        attempts = self.session.auth_attempts or [{'method': None, 'username': None}]
+        rows = []
+        for attempt in attempts:
+            publickey = attempt['method'] == 'publickey'
+            rows.append({
+                'timestamp': attempt.get('timestamp') or datetime.utcnow(),
+                'source_ip': self.client_address[0],
+                'source_port': self.client_address[1],
+                'username': _clip(attempt['username']),
+                'password': _clip(attempt.get('password')),
+                # Offered public keys are recorded by type and fingerprint
+                'command': _clip(f"{attempt['key_type']} {attempt['key_fingerprint']}", None) if publickey else None,
+                'session_id': self.session_id,
+                'attack_type': 'ssh_publickey' if publickey else (
+                    'ssh_login_accepted' if attempt.get('accepted') else 'ssh_login'),
+                'user_agent': user_agent
+            })
+        for timestamp, command in self.commands:
+            # Credentials stay on the login row so command rows don't skew their counts
+            rows.append({
+                'timestamp': timestamp,
+                'source_ip': self.client_address[0],
+                'source_port': self.client_address[1],
+                'username': None,
+                'password': None,
+                'command': _clip(command, None),
+                'session_id': self.session_id,
+                'attack_type': 'ssh_command',
+                'user_agent': user_agent
+            })
+        return rows
+    
+    def log_attack_attempt(self):
+        """Queue the session's attack attempts for batched insertion into the database"""
+        try:
+            queued = queue_attack_rows(self.client_address[0], self.attack_rows())
+            if queued:
+                logger.info(f"Logged {queued} attack attempt(s) from {self.client_address[0]} (Username: {self.username})")
+                
+        except Exception as e:
+            logger.error(f"Failed to log attack attempt: {e}")
+
+class AsyncSSHHoneypot(SSHHoneypot):
+    """SSH Honeypot driven by asyncio streams instead of a blocking socket"""
     
-    def simulate_ssh_handshake(self):
-        """Simulate SSH protocol handshake"""
+    def __init__(self, reader, writer, timeout=30, kex_executor=None, **shell_options):
+        super().__init__(None, writer.get_extra_info('peername'), timeout=timeout, **shell_options)
+        self.reader = reader
+        self.writer = writer
+        self.kex_executor = kex_executor
+    
+    async def handle_connection(self):
+        """Handle incoming SSH connection without blocking the event loop"""
         try:
-            # Send key exchange init
-            kexinit = self.generate_kexinit()
-            self.client_socket.send(kexinit)
+            logger.debug(f"New SSH connection from {self.client_address[0]}:{self.client_address[1]}")
             
-            # Wait for client response
-            time.sleep(0.5)
+            self.writer.write(self.session.start())
+            await self.writer.drain()
             
-            # Try to receive more data (login attempts)
-            for _ in range(3):  # Allow up to 3 login attempts
+            while not self.session.closed:
                 try:
-                    data = self.client_socket.recv(1024)
-                    if not data:
-                        break
-                    
-                    # Try to extract credentials (simplified)
-                    self.parse_ssh_data(data)
-                    
-                    # Send authentication failure
-                    auth_failure = b"\x00\x00\x00\x0c\x0a\x33Authentication failed\r\n"
-                    self.client_socket.send(auth_failure)
-                    
-                    time.sleep(1)
-                    
-                except socket.timeout:
+                    data = await asyncio.wait_for(self.reader.read(self.RECV_SIZE), self.read_timeout)
+                except asyncio.TimeoutError:
                     break
-                except Exception as e:
-                    logger.debug(f"Error in SSH simulation: {e}")
+                if not data:
                     break
-                    
-        except Exception as e:
-            logger.error(f"Error in SSH handshake simulation: {e}")
-    
-    def generate_kexinit(self):
-        """Generate a fake SSH KEXINIT packet"""
-        # Simplified KEXINIT packet
-        packet = b"\x00\x00\x01\x2c\x0a\x14" + b"A" * 16  # Fake random data
-        packet += b"diffie-hellman-group14-sha1"
-        packet += b"\x00" * 50  # Padding
-        return packet
-    
-    def parse_ssh_data(self, data):
-        """Try to extract username/password from SSH data (simplified)"""
-        try:
-            # This is a very simplified approach - real SSH parsing would be much more complex
-            data_str = data.decode('utf-8', errors='ignore')
-            
-            # Look for common patterns that might indicate credentials
-            if 'admin' in data_str.lower():
-                self.username = 'admin'
-            elif 'root' in data_str.lower():
-                self.username = 'root'
-            elif 'user' in data_str.lower():
-                self.username = 'user'
-            
-            # Generate a random password if we found a username
-            if self.username and not self.password:
-                common_passwords = ['123456', 'password', 'admin', 'root', '12345', 'qwerty']
-                self.password = random.choice(common_passwords)
-                
-        except Exception as e:
-            logger.debug(f"Error parsing SSH data: {e}")
-    
-    def log_attack_attempt(self):
-        """Log the attack attempt to database"""
-        try:
-            with app.app_context():
-                # Get geolocation data
-                geo_data = get_ip_geolocation(self.client_address[0])
-                
-                attack_log = AttackLog(
-                    source_ip=self.client_address[0],
-                    source_port=self.client_address[1],
-                    username=self.username,
-                    password=self.password,
-                    session_id=self.session_id,
-                    attack_type='ssh_login',
-                    country=geo_data.get('country'),
-                    city=geo_data.get('city'),
-                    latitude=geo_data.get('latitude'),
-                    longitude=geo_data.get('longitude')
-                )
-                
-                db.session.add(attack_log)
-                db.session.commit()
-                
-                logger.info(f"Logged attack attempt from {self.client_address[0]} (Username: {self.username})")
                 
+                if self.kex_executor and self.session.state in self.KEX_STATES:
+                    # X25519 and the host key signature are pure-Python math (~15 ms), which
+                    # would stall every other session if run on the loop
+                    output, delay = await asyncio.get_running_loop().run_in_executor(
+                        self.kex_executor, self.process, data)
+                else:
+                    output, delay = self.process(data)
+                if delay:
+                    await asyncio.sleep(delay)
+                if output:
+                    self.writer.write(output)
+                    await self.writer.drain()
+            
         except Exception as e:
-            logger.error(f"Failed to log attack attempt: {e}")
+            logger.error(f"Error handling SSH connection: {e}")
+        finally:
+            self.writer.close()
+            SESSION_SECONDS.observe(time.perf_counter() - self.connected_at)
 
 class HoneypotServer:
-    """Main honeypot server"""
+    """Main honeypot server
+
+    In asyncio mode key exchanges run on a pool of KEX_WORKERS threads so the
+    event loop keeps serving other sessions, timeouts and the tarpit meanwhile.
+    The exchange is pure Python and holds the GIL, so one process still completes
+    only about 65 handshakes per second per core; run more processes (runner.py)
+    for more.
+    """
     
-    def __init__(self, host='0.0.0.0', port=2222):
+    MODES = ('thread', 'asyncio')
+    
+    def __init__(self, host='0.0.0.0', port=2222, mode='thread', backlog=128,
+                 max_sessions=10000, session_timeout=30, shell=False, shell_accept_attempt=1,
+                 shell_idle_timeout=120, admission=None, tarpit=None, reuse_port=False,
+                 geo_enrichment=True):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown honeypot mode: {mode}")
+        if reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+            raise ValueError("SO_REUSEPORT is not supported on this platform")
+        
         self.host = host
-        self.port = port
-        self.server_socket = None
+        # One port or a list of them, all served by this process
+        self.ports = [port] if isinstance(port, int) else list(port)
+        self.port = self.ports[0]
+        self.mode = mode
+        self.backlog = backlog
+        self.max_sessions = max_sessions
+        self.session_timeout = session_timeout
+        self.shell_options = {
+            'shell': shell,
+            'shell_accept_attempt': shell_accept_attempt,
+            'shell_idle_timeout': shell_idle_timeout
+        }
+        # Lets several processes listen on the same ports, with the kernel spreading connections
+        self.reuse_port = reuse_port
+        # Runner workers leave geolocation to the supervisor that writes their rows
+        self.geo_enrichment = geo_enrichment
+        self.server_sockets = []
         self.running = False
         
+        # Per-source admission policy (None admits everything) and where tarpitted sockets go
+        self.admission = admission
+        self.tarpit = tarpit
+        self.tarpitted_async = 0
+        self._admission_lock = threading.Lock()
+        
+        # Session accounting
+        self.active_sessions = 0
+        self.total_sessions = 0
+        self.rejected_sessions = 0
+        self._sessions_lock = threading.Lock()
+        
+        # asyncio mode state
+        self.loop = None
+        self._stop_event = None
+        self._log_executor = None
+        self._kex_executor = None
+        self._client_tasks = set()
+        
     def start(self):
         """Start the honeypot server"""
+        attack_queue.start()
+        if ENRICHMENT_MODE != 'inline' and self.geo_enrichment:
+            attack_queue.prepare = geo_enricher.fill_resolved
+            geo_enricher.start()
+        if self.tarpit is not None and self.mode == 'thread':
+            self.tarpit.start()
+        try:
+            if self.mode == 'asyncio':
+                self._start_asyncio()
+            else:
+                self._start_threaded()
+        finally:
+            if self.tarpit is not None and self.mode == 'thread':
+                self.tarpit.stop()
+            if self.admission:
+                self.report_suppressed(*self.admission.drain_suppressed())
+            # Flush any attack rows still waiting in the write-behind queue,
+            # then resolve what locations it can within the stop timeout
+            attack_queue.stop()
+            geo_enricher.stop()
+    
+    def _acquire_session(self):
+        """Reserve a session slot, returning False when the concurrency cap is reached"""
+        with self._sessions_lock:
+            if self.active_sessions >= self.max_sessions:
+                self.rejected_sessions += 1
+                REJECTED_SESSIONS.inc()
+                return False
+            self.active_sessions += 1
+            self.total_sessions += 1
+        ACTIVE_SESSIONS.inc()
+        return True
+    
+    def _release_session(self):
+        """Free a session slot"""
+        with self._sessions_lock:
+            self.active_sessions -= 1
+        ACTIVE_SESSIONS.dec()
+    
+    def _admit(self, ip):
+        """Admission decision for a new connection; also reports suppressed counts when due"""
+        if self.admission is None:
+            CONNECTIONS.labels(ACCEPT).inc()
+            return ACCEPT
+        # Thread mode runs one accept loop per port, and the controller itself isn't locked
+        with self._admission_lock:
+            action = self.admission.admit(ip)
+            report = self.admission.drain_suppressed() if self.admission.report_due() else None
+        CONNECTIONS.labels(action).inc()
+        if report:
+            entries, overflow = report
+            if self.mode == 'asyncio':
+                self._submit_log(self.report_suppressed, entries, overflow)
+            else:
+                threading.Thread(target=self.report_suppressed, args=(entries, overflow), daemon=True).start()
+        return action
+    
+    def report_suppressed(self, entries, overflow):
+        """Log connections the admission policy turned away as one row per source network"""
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(10)
+            now = datetime.utcnow()
+            for network, ip, count in entries:
+                queue_attack_rows(ip, [{
+                    'timestamp': now,
+                    'source_ip': ip,
+                    'source_port': 0,
+                    'username': None,
+                    'password': None,
+                    'command': f"{count} connection(s) from {network} not logged individually",
+                    'session_id': None,
+                    'attack_type': 'ssh_suppressed',
+                    'user_agent': None
+                }])
+            if entries:
+                logger.info(f"Suppressed {sum(entry[2] for entry in entries) + overflow} connection(s) "
+                            f"from {len(entries)} network(s)")
+            if overflow:
+                logger.warning(f"{overflow} suppressed connection(s) beyond the per-network table were only counted")
+        except Exception as e:
+            logger.error(f"Failed to log suppressed connections: {e}")
+    
+    def _listen(self, port):
+        """Bind a listening socket for one port"""
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((self.host, port))
+        server_socket.listen(self.backlog)
+        self.server_sockets.append(server_socket)
+        return server_socket
+    
+    def _start_threaded(self):
+        """Run the accept loops with one thread per connection"""
+        try:
+            server_sockets = [self._listen(port) for port in self.ports]
             self.running = True
             
-            logger.info(f"Honeypot server listening on {self.host}:{self.port}")
+            logger.info(f"Honeypot server listening on {self.host}:{','.join(map(str, self.ports))} (thread mode)")
             
-            while self.running:
-                try:
-                    client_socket, client_address = self.server_socket.accept()
-                    
-                    # Handle each connection in a separate thread
-                    honeypot = SSHHoneypot(client_socket, client_address)
-                    client_thread = threading.Thread(
-                        target=honeypot.handle_connection,
-                        daemon=True
-                    )
-                    client_thread.start()
-                    
-                except Exception as e:
-                    if self.running:
-                        logger.error(f"Error accepting connection: {e}")
+            # Extra ports get their own accept thread; the first one is served here
+            for server_socket in server_sockets[1:]:
+                threading.Thread(target=self._accept_loop, args=(server_socket,), daemon=True).start()
+            self._accept_loop(server_sockets[0])
                         
         except Exception as e:
             logger.error(f"Failed to start honeypot server: {e}")
         finally:
             self.stop()
     
+    def _accept_loop(self, server_socket):
+        """Accept connections on one listening socket until the server stops"""
+        while self.running:
+            try:
+                client_socket, client_address = server_socket.accept()
+                accepted_at = time.perf_counter()
+                
+                action = self._admit(client_address[0])
+                if action != ACCEPT:
+                    if action == TARPIT and self.tarpit is not None:
+                        self.tarpit.add(client_socket)
+                    else:
+                        client_socket.close()
+                    continue
+                
+                if not self._acquire_session():
+                    client_socket.close()
+                    continue
+                
+                # Handle each connection in a separate thread
+                honeypot = SSHHoneypot(client_socket, client_address,
+                                       timeout=self.session_timeout, **self.shell_options)
+                client_thread = threading.Thread(
+                    target=self._run_threaded_session,
+                    args=(honeypot,),
+                    daemon=True
+                )
+                client_thread.start()
+                ACCEPT_SECONDS.observe(time.perf_counter() - accepted_at)
+                
+            except Exception as e:
+                if self.running:
+                    logger.error(f"Error accepting connection: {e}")
+    
+    def _run_threaded_session(self, honeypot):
+        """Thread target wrapping a single session"""
+        try:
+            honeypot.handle_connection()
+        finally:
+            self._release_session()
+    
+    def _start_asyncio(self):
+        """Run all sessions as coroutines on a single event loop"""
+        try:
+            asyncio.run(self._serve_asyncio())
+        except Exception as e:
+            logger.error(f"Failed to start honeypot server: {e}")
+        finally:
+            self.stop()
+    
+    async def _serve_asyncio(self):
+        """Event loop entry point for asyncio mode"""
+        self.loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        
+        # Database writes stay blocking, so they run on a small dedicated pool
+        self._log_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='honeypot-log')
+        self._kex_executor = ThreadPoolExecutor(max_workers=KEX_WORKERS, thread_name_prefix='honeypot-kex')
+        
+        servers = [await asyncio.start_server(
+            self._handle_async_client,
+            self.host,
+            port,
+            backlog=self.backlog,
+            reuse_address=True,
+            reuse_port=self.reuse_port or None,
+            limit=4096
+        ) for port in self.ports]
+        self.running = True
+        
+        logger.info(f"Honeypot server listening on {self.host}:{','.join(map(str, self.ports))} (asyncio mode)")
+        
+        try:
+            await self._stop_event.wait()
+        finally:
+            for server in servers:
+                server.close()
+            # wait_closed() doesn't wait for the handlers before Python 3.12, and their rows
+            # have to reach the log pool before it shuts down
+            tasks = set(self._client_tasks)
+            if tasks:
+                _, pending = await asyncio.wait(tasks, timeout=SHUTDOWN_GRACE)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            for server in servers:
+                await server.wait_closed()
+        
+        self._kex_executor.shutdown(wait=True)
+        self._log_executor.shutdown(wait=True)
+    
+    def _submit_log(self, function, *args):
+        """Run a blocking logging call on the log pool, or inline once the pool has shut down"""
+        try:
+            self._log_executor.submit(function, *args)
+        except RuntimeError:
+            function(*args)
+    
+    async def _handle_async_client(self, reader, writer):
+        """Coroutine handling a single session in asyncio mode"""
+        task = asyncio.current_task()
+        self._client_tasks.add(task)
+        try:
+            await self._serve_async_client(reader, writer)
+        except asyncio.CancelledError:
+            # Cut off at shutdown (its row is logged); the stream callback would report it as an error
+            pass
+        finally:
+            self._client_tasks.discard(task)
+    
+    async def _serve_async_client(self, reader, writer):
+        accepted_at = time.perf_counter()
+        action = self._admit(writer.get_extra_info('peername')[0])
+        if action != ACCEPT:
+            if action == TARPIT and self.tarpit is not None:
+                await self._tarpit_async(writer)
+            else:
+                writer.close()
+            return
+        
+        if not self._acquire_session():
+            writer.close()
+            return
+        
+        try:
+            honeypot = AsyncSSHHoneypot(reader, writer, timeout=self.session_timeout,
+                                        kex_executor=self._kex_executor, **self.shell_options)
+            ACCEPT_SECONDS.observe(time.perf_counter() - accepted_at)
+            try:
+                await honeypot.handle_connection()
+            finally:
+                # Sessions cut off at shutdown still log what they captured
+                self._submit_log(honeypot.log_attack_attempt)
+        finally:
+            self._release_session()
+    
+    async def _tarpit_async(self, writer):
+        """Drip junk banner lines to a tarpitted client until it leaves or its time is up"""
+        if self.tarpitted_async >= self.tarpit.max_connections:
+            writer.close()
+            return
+        self.tarpitted_async += 1
+        try:
+            deadline = time.monotonic() + self.tarpit.duration
+            while time.monotonic() < deadline and not self._stop_event.is_set():
+                writer.write(junk_line())
+                await writer.drain()
+                await asyncio.sleep(self.tarpit.interval)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.tarpitted_async -= 1
+            writer.close()
+    
+    def get_stats(self):
+        """Return session counters for monitoring"""
+        with self._sessions_lock:
+            stats = {
+                'mode': self.mode,
+                'active_sessions': self.active_sessions,
+                'total_sessions': self.total_sessions,
+                'rejected_sessions': self.rejected_sessions
+            }
+        if self.admission:
+            stats['admission'] = self.admission.get_stats()
+            stats['tarpitted'] = self.tarpitted_async if self.mode == 'asyncio' else len(self.tarpit or ())
+        return stats
+    
     def stop(self):
         """Stop the honeypot server"""
         self.running = False
-        if self.server_socket:
-            self.server_socket.close()
+        if self.loop and self._stop_event and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+        for server_socket in self.server_sockets:
+            server_socket.close()
         logger.info("Honeypot server stopped")
+
+def create_honeypot_server(host='0.0.0.0', port=2222, **options):
+    """Build a honeypot server from environment settings; keyword options override them"""
+    settings = {
+        'mode': os.environ.get('HONEYPOT_MODE', 'thread'),
+        'backlog': int(os.environ.get('HONEYPOT_BACKLOG', 128)),
+        'max_sessions': int(os.environ.get('HONEYPOT_MAX_SESSIONS', 10000)),
+        'session_timeout': float(os.environ.get('HONEYPOT_SESSION_TIMEOUT', 30)),
+        'shell': os.environ.get('HONEYPOT_SHELL', '0') == '1',
+        'shell_accept_attempt': int(os.environ.get('HONEYPOT_SHELL_ACCEPT_ATTEMPT', 1)),
+        'shell_idle_timeout': float(os.environ.get('HONEYPOT_SHELL_IDLE_TIMEOUT', 120))
+    }
+    settings.update(options)
+    settings.setdefault('admission', create_admission_controller())
+    settings.setdefault('tarpit', create_tarpit())
+    return HoneypotServer(host=host, port=port, **settings)
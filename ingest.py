@@ -0,0 +1,205 @@
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from events import event_bus, attack_delta
+from response_cache import response_cache
+from spool import create_attack_spool
+from recent_buffer import recent_buffer
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+WRITE_SECONDS = metrics.histogram('ingest_db_write_seconds', 'Attack row batch inserts, rollups included')
+WRITTEN_ROWS = metrics.counter('ingest_db_rows_total', 'Attack rows inserted')
+
+def write_attack_rows(rows):
+    """Bulk insert a batch of attack rows, fold them into the rollups and push them to live dashboards
+    and the shared recent-attack buffer"""
+    # Imported on first use: processes that never write (runner workers) skip SQLAlchemy entirely
+    from storage import storage
+    from sketch_rollups import sketch_aggregator
+    start = time.perf_counter()
+    ids = storage.write_attack_rows(rows)
+    WRITE_SECONDS.observe(time.perf_counter() - start)
+    WRITTEN_ROWS.inc(len(rows))
+    if recent_buffer:
+        try:
+            recent_buffer.append(rows, ids)
+        except Exception as e:
+            # The rows are committed; the buffer stops vouching for anything before now
+            logger.error(f"Failed to add {len(rows)} attack rows to the recent buffer: {e}")
+    sketch_aggregator.update(rows)
+    if sketch_aggregator.flush_due():
+        flush_sketches()
+    response_cache.bump()
+    event_bus.publish('attacks', {'attacks': [attack_delta(row) for row in rows]})
+
+def flush_sketches():
+    """Merge this process's pending sketch counts; the rows themselves are already written"""
+    from sketch_rollups import sketch_aggregator
+    try:
+        sketch_aggregator.flush()
+    except Exception as e:
+        logger.error(f"Failed to flush attack sketches: {e}")
+
+class AttackIngestQueue:
+    """Bounded write-behind queue that flushes attack rows to the database in batches"""
+
+    def __init__(self, writer=write_attack_rows, max_size=10000, batch_size=500,
+                 flush_interval=1.0, block_timeout=0.0, prepare=None, spool=None):
+        self.writer = writer
+        self.prepare = prepare  # optional callable applied to each batch before it is written
+        self.spool = spool  # optional AttackSpool: batches go to disk and its replayer writes them
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout  # how long submit() may block before dropping
+        self.queue = queue.Queue(maxsize=max_size)
+        self.running = False
+        self.stopped = False  # set by stop(): later submissions are dropped rather than restarting the writer
+        self.thread = None
+        self._lock = threading.Condition()  # guards the state and the counters
+        self._submitting = 0  # submit() calls putting a row right now
+
+        # Counters
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        """Start the background writer thread"""
+        with self._lock:
+            self.stopped = False
+            self._start()
+
+    def _start(self):
+        if self.running:
+            return
+        self.running = True
+        if self.spool:
+            self.spool.start()
+        self.thread = threading.Thread(target=self._run, name='attack-ingest', daemon=True)
+        self.thread.start()
+        logger.info("Attack ingest queue started")
+
+    def submit(self, row):
+        """Queue an attack row; returns False if it was dropped because the queue is full or stopped"""
+        with self._lock:
+            if self.stopped:
+                # The final flush has run (or is running); a restarted writer would outlive the database
+                self.dropped += 1
+                logger.warning(f"Dropped an attack row from {row.get('source_ip')}: ingest queue stopped")
+                return False
+            self._start()
+            self._submitting += 1
+
+        row.setdefault('timestamp', datetime.utcnow())
+        try:
+            if self.block_timeout > 0:
+                self.queue.put(row, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(row)
+            queued = True
+        except queue.Full:
+            queued = False
+        with self._lock:
+            self._submitting -= 1
+            if queued:
+                self.submitted += 1
+            else:
+                self.dropped += 1
+            self._lock.notify_all()
+        return queued
+
+    def _run(self):
+        """Collect rows until the batch is full or the flush interval elapses, then write"""
+        while self.running or not self.queue.empty():
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    if self.running:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        batch.append(self.queue.get(timeout=remaining))
+                    else:
+                        # Draining on shutdown: don't wait for the interval
+                        batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        """Hand a batch to the writer, counting rather than raising on failure"""
+        try:
+            if self.prepare:
+                batch = self.prepare(batch)
+            if self.spool:
+                self.spool.append(batch)
+            else:
+                self.writer(batch)
+            with self._lock:
+                self.written += len(batch)
+                self.batches += 1
+            logger.debug(f"Flushed {len(batch)} attack rows")
+        except Exception as e:
+            with self._lock:
+                self.failed += len(batch)
+            logger.error(f"Failed to write {len(batch)} attack rows: {e}")
+
+    def stop(self, timeout=30):
+        """Stop the writer after flushing everything still queued"""
+        with self._lock:
+            self.stopped = True
+            if not self.running:
+                return
+            # Rows being put right now still make the final flush
+            self._lock.wait_for(lambda: self._submitting == 0, timeout)
+            self.running = False
+        if self.thread:
+            self.thread.join(timeout)
+        if self.spool:
+            self.spool.stop(timeout)
+        if self.spool or self.writer is write_attack_rows:
+            flush_sketches()
+        logger.info(f"Attack ingest queue stopped ({self.written} written, {self.dropped} dropped)")
+
+    def get_stats(self):
+        """Return ingest counters for monitoring"""
+        with self._lock:
+            stats = {
+                'queue_depth': self.queue.qsize(),
+                'submitted': self.submitted,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches
+            }
+        if self.spool:
+            stats['spool'] = self.spool.get_stats()
+        return stats
+
+# Global instance
+attack_queue = AttackIngestQueue(
+    max_size=int(os.environ.get('INGEST_QUEUE_SIZE', 10000)),
+    batch_size=int(os.environ.get('INGEST_BATCH_SIZE', 500)),
+    flush_interval=float(os.environ.get('INGEST_FLUSH_INTERVAL', 1.0)),
+    block_timeout=float(os.environ.get('INGEST_BLOCK_TIMEOUT', 0.0)),
+    spool=create_attack_spool(write_attack_rows)
+)
+
+metrics.gauge('ingest_queue_depth', 'Attack rows waiting in the write-behind queue',
+              function=lambda: attack_queue.queue.qsize())
+metrics.counter('ingest_rows_dropped_total', 'Attack rows dropped because the ingest queue was full',
+                function=lambda: attack_queue.dropped)
+metrics.counter('ingest_rows_failed_total', 'Attack rows in batches the writer failed on',
+                function=lambda: attack_queue.failed)
+metrics.gauge('ingest_spool_backlog_bytes', 'Spooled attack rows not yet in the database',
+              function=lambda: attack_queue.spool.get_stats()['backlog_bytes'] if attack_queue.spool else 0)
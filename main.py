@@ -1,23 +1,26 @@
+import os
 import threading
 import logging
 from app import app
-from honeypot import HoneypotServer
+from honeypot import create_honeypot_server
 
 logger = logging.getLogger(__name__)
 
 def start_honeypot():
     """Start the honeypot server in a separate thread"""
     try:
-        honeypot = HoneypotServer(host='0.0.0.0', port=2222)
+        honeypot = create_honeypot_server(host='0.0.0.0', port=2222)
         honeypot.start()
     except Exception as e:
         logger.error(f"Failed to start honeypot: {e}")
 
 if __name__ == "__main__":
-    # Start honeypot server in background thread
-    honeypot_thread = threading.Thread(target=start_honeypot, daemon=True)
-    honeypot_thread.start()
-    logger.info("Honeypot server started on port 2222")
+    # Set HONEYPOT_EMBEDDED=0 when the listener runs separately (python runner.py)
+    if os.environ.get('HONEYPOT_EMBEDDED', '1') == '1':
+        # Start honeypot server in background thread
+        honeypot_thread = threading.Thread(target=start_honeypot, daemon=True)
+        honeypot_thread.start()
+        logger.info("Honeypot server started on port 2222")
     
     # Start Flask web dashboard
     logger.info("Starting web dashboard on port 5000")
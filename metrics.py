@@ -0,0 +1,401 @@
+"""Process metrics in the Prometheus text format, without a client library.
+
+Counters, gauges and histograms live in one registry per process. Hot paths
+only touch a lock-guarded number or bucket list; counters the code already
+keeps (geolocation cache hits, dropped rows) are read through callbacks when
+/metrics is scraped, so they cost nothing in between.
+
+Across processes: runner workers send their snapshot to the supervisor along
+with their stats, and every process started with METRICS_DIR set writes its
+snapshot there every METRICS_EXPORT_INTERVAL seconds, so /metrics on any of them
+(the dashboard or `runner.py --metrics-port`) reports the sum over the
+dashboard's gunicorn workers and the sensor. Snapshots of processes that have
+stopped keep counting toward counters and histograms, not gauges.
+
+METRICS_ENABLED=0 swaps every metric for a no-op.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds: the Prometheus client defaults with finer steps below 5 ms for in-process work
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Value:
+    """One counter or gauge series"""
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+class _Buckets:
+    """One histogram series: a count per bucket (the last one is +Inf) and the sum"""
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def get(self):
+        with self._lock:
+            return [list(self.counts), self.sum]
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function  # read at scrape time: a number, or {label values tuple: number}
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames and function is None:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """The series for these label values (strings, in labelnames order)"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        return _Value()
+
+    def samples(self):
+        if self.function is not None:
+            value = self.function()
+            return list(value.items()) if isinstance(value, dict) else [((), value)]
+        return [(values, child.get()) for values, child in list(self._children.items())]
+
+    def snapshot(self):
+        return {
+            'type': self.kind,
+            'help': self.documentation,
+            'labelnames': list(self.labelnames),
+            'samples': [[list(values), value] for values, value in self.samples()]
+        }
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot['buckets'] = list(self.buckets)
+        return snapshot
+
+class _NullMetric:
+    """Stands in for every metric when metrics are disabled"""
+
+    def labels(self, *values):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+_NULL_METRIC = _NullMetric()
+
+def merge_snapshots(snapshots, gauges=True):
+    """Sum snapshots series by series; gauges=False leaves gauges out (for processes that are gone)"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            if metric['type'] == 'gauge' and not gauges:
+                continue
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = dict(metric, samples={})
+            elif target['type'] != metric['type'] or target.get('buckets') != metric.get('buckets'):
+                logger.warning(f"Metric {name} differs between processes, keeping the first definition")
+                continue
+            samples = target['samples']
+            for values, value in metric['samples']:
+                key = tuple(values)
+                current = samples.get(key)
+                if current is None:
+                    samples[key] = value
+                elif metric['type'] == 'histogram':
+                    samples[key] = [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1]]
+                else:
+                    samples[key] = current + value
+    for metric in merged.values():
+        metric['samples'] = [[list(values), value] for values, value in metric['samples'].items()]
+    return merged
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def render_text(snapshot):
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        documentation = metric['help'].replace('\\', '\\\\').replace('\n', '\\n')
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric['labelnames']
+        for values, value in sorted(metric['samples'], key=lambda sample: [str(v) for v in sample[0]]):
+            labels = list(zip(labelnames, values))
+            if metric['type'] != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(metric['buckets'] + [float('inf')], counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + [('le', _format_value(float(bound)))])} "
+                             f"{cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(total))}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+class MetricsRegistry:
+    """This process's metrics, plus whatever other processes report through collectors or METRICS_DIR"""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, enabled=True, directory=None, export_interval=5.0):
+        self.enabled = enabled
+        self.directory = directory
+        self.export_interval = export_interval
+        self.metrics = {}
+        self.collectors = []  # callables returning a list of snapshots from other processes
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()  # the exporter thread and the exit hook share the temp file
+        self._exporter = None
+        self._exporter_pid = None
+
+    def _register(self, cls, name, documentation, **kwargs):
+        if not self.enabled:
+            return _NULL_METRIC
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, documentation, **kwargs)
+            elif kwargs.get('function') is not None:
+                metric.function = kwargs['function']  # the latest owner reports
+        return metric
+
+    def counter(self, name, documentation, labelnames=(), function=None):
+        return self._register(Counter, name, documentation, labelnames=labelnames, function=function)
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self._register(Gauge, name, documentation, labelnames=labelnames, function=function)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames=labelnames, buckets=buckets)
+
+    def add_collector(self, function):
+        """Merge the snapshots function() returns into this process's (runner workers, say)"""
+        self.collectors.append(function)
+
+    def snapshot(self):
+        """This process's own metrics as a JSON-friendly dict"""
+        with self._lock:
+            metrics = list(self.metrics.values())
+        snapshot = {}
+        for metric in metrics:
+            try:
+                snapshot[metric.name] = metric.snapshot()
+            except Exception as e:
+                logger.error(f"Failed to read metric {metric.name}: {e}")
+        return snapshot
+
+    def local_snapshot(self):
+        """Own metrics plus the collectors' (what this process exports)"""
+        snapshots = [self.snapshot()]
+        for collector in self.collectors:
+            try:
+                snapshots.extend(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+        return merge_snapshots(snapshots)
+
+    def collect(self):
+        """Everything: this process, its collectors and the other processes' exports"""
+        snapshots = [self.local_snapshot()]
+        if self.directory:
+            snapshots.extend(self._read_exports())
+        return merge_snapshots(snapshots)
+
+    def render(self):
+        return render_text(self.collect())
+
+    def _export_path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def export(self):
+        """Write this process's snapshot to METRICS_DIR"""
+        path = self._export_path(os.getpid())
+        temporary = path + '.tmp'
+        snapshot = self.local_snapshot()
+        with self._export_lock:
+            with open(temporary, 'w') as f:
+                json.dump({'pid': os.getpid(), 'written_at': time.time(), 'metrics': snapshot}, f)
+            os.replace(temporary, path)
+
+    def _read_exports(self):
+        own = os.path.basename(self._export_path(os.getpid()))
+        stale_before = time.time() - 3 * self.export_interval
+        snapshots = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return snapshots
+        for name in names:
+            if name == own or not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    exported = json.load(f)
+            except (OSError, ValueError):
+                continue  # being replaced or removed
+            if exported['written_at'] < stale_before:
+                snapshots.append(merge_snapshots([exported['metrics']], gauges=False))
+            else:
+                snapshots.append(exported['metrics'])
+        return snapshots
+
+    def start_exporter(self):
+        """Export to METRICS_DIR periodically and at exit (no-op without it); restarts in forked children"""
+        if not (self.enabled and self.directory):
+            return
+        with self._lock:
+            if self._exporter is not None and self._exporter_pid == os.getpid():
+                return
+            first = self._exporter is None
+            self._exporter_pid = os.getpid()
+            self._exporter = threading.Thread(target=self._run_exporter, name='metrics-export', daemon=True)
+        os.makedirs(self.directory, exist_ok=True)
+        self._exporter.start()
+        if first:
+            atexit.register(self._export_quietly)
+            # gunicorn --preload forks workers after the app module started the thread
+            os.register_at_fork(after_in_child=self.start_exporter)
+
+    def _export_quietly(self):
+        try:
+            self.export()
+        except Exception as e:
+            logger.error(f"Failed to export metrics: {e}")
+
+    def _run_exporter(self):
+        while True:
+            self._export_quietly()
+            time.sleep(self.export_interval)
+
+def serve_metrics(registry, port, host='0.0.0.0'):
+    """Serve registry.render() at /metrics from a background thread (for processes without Flask)"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', registry.CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"Serving metrics on {host}:{server.server_address[1]}/metrics")
+    return server
+
+# Global instance
+metrics = MetricsRegistry(
+    enabled=os.environ.get('METRICS_ENABLED', '1') == '1',
+    directory=os.environ.get('METRICS_DIR') or None,
+    export_interval=float(os.environ.get('METRICS_EXPORT_INTERVAL', 5.0))
+)
+
+metrics.gauge('process_threads', 'Threads alive', function=threading.active_count)
@@ -0,0 +1,130 @@
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import func, desc, select, and_
+from schema import attack_logs, schema_migrations
+
+logger = logging.getLogger(__name__)
+
+def _create_indexes(*names):
+    """Migration step creating named indexes declared on the models, skipping ones that exist"""
+    def apply(connection):
+        indexes = {index.name: index for index in attack_logs.indexes}
+        for name in names:
+            indexes[name].create(connection, checkfirst=True)
+            logger.info(f"Created index {name}")
+    return apply
+
+# Ordered list of (version, description, step); steps receive a connection inside a transaction
+MIGRATIONS = [
+    (1, 'attack_logs indexes for dashboard and API query patterns', _create_indexes(
+        'ix_attack_logs_timestamp',
+        'ix_attack_logs_source_ip_timestamp',
+        'ix_attack_logs_country',
+        'ix_attack_logs_username',
+        'ix_attack_logs_password',
+        'ix_attack_logs_located',
+        'ix_attack_logs_pending_geo'
+    )),
+    (2, 'attack_logs session index for shell command transcripts', _create_indexes(
+        'ix_attack_logs_session_id_timestamp'
+    )),
+]
+
+def current_version(engine):
+    """Highest applied migration version (0 for a database never migrated)"""
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return connection.execute(select(func.coalesce(func.max(schema_migrations.c.version), 0))).scalar()
+
+def pending_migrations(engine):
+    version = current_version(engine)
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+def upgrade(engine, target=None):
+    """Apply pending migrations in order, each in its own transaction"""
+    applied = []
+    for version, description, step in pending_migrations(engine):
+        if target is not None and version > target:
+            break
+        with engine.begin() as connection:
+            step(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+        logger.info(f"Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+def stamp_current(engine):
+    """Mark every migration as applied, for databases just created from the schema"""
+    pending = pending_migrations(engine)
+    if pending:
+        with engine.begin() as connection:
+            connection.execute(schema_migrations.insert(), [
+                {'version': version, 'description': description, 'applied_at': datetime.utcnow()}
+                for version, description, step in pending
+            ])
+
+def route_queries():
+    """Representative statements issued by the dashboard routes, for plan inspection"""
+    since = datetime.utcnow() - timedelta(days=1)
+    logs = attack_logs.c
+    located = and_(
+        logs.latitude.isnot(None),
+        logs.longitude.isnot(None),
+        logs.latitude != 0,
+        logs.longitude != 0
+    )
+    return {
+        'index: unique ips': select(func.count(func.distinct(logs.source_ip))),
+        'index: last 24h count': select(func.count(logs.id)).where(logs.timestamp >= since),
+        'index: recent logs': select(attack_logs).order_by(desc(logs.timestamp)).limit(10),
+        'logs: page': select(attack_logs).order_by(desc(logs.timestamp)).limit(50).offset(500),
+        'recent: window': select(attack_logs).where(logs.timestamp >= since).order_by(desc(logs.timestamp)),
+        'by-hour: window': select(logs.timestamp).where(logs.timestamp >= since),
+        'by-country': select(logs.country, func.count(logs.id).label('count')).where(
+            logs.country.isnot(None)
+        ).group_by(logs.country).order_by(desc('count')).limit(20),
+        'top usernames': select(logs.username, func.count(logs.id).label('count')).where(
+            logs.username.isnot(None)
+        ).group_by(logs.username).order_by(desc('count')).limit(10),
+        'top passwords': select(logs.password, func.count(logs.id).label('count')).where(
+            logs.password.isnot(None)
+        ).group_by(logs.password).order_by(desc('count')).limit(10),
+        'map-data: locations': select(
+            logs.latitude, logs.longitude, func.count(logs.id).label('count')
+        ).where(located).group_by(logs.latitude, logs.longitude),
+        'enrichment: pending ips': select(logs.source_ip).where(logs.country.is_(None)).distinct(),
+        'session: transcript': select(attack_logs).where(logs.session_id == 'x').order_by(logs.timestamp),
+    }
+
+def explain(connection, statement):
+    """Return the database's query plan for a statement as a list of lines"""
+    dialect = connection.dialect
+    compiled = statement.compile(dialect=dialect)
+    if compiled.positiontup:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+
+    if dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+        return [row[-1] for row in rows]
+    rows = connection.exec_driver_sql(f"EXPLAIN {compiled}", params).all()
+    return [row[0] for row in rows]
+
+def is_full_scan(plan_lines):
+    """True if the plan reads attack_logs without any index"""
+    for line in plan_lines:
+        if line.startswith('SCAN attack_logs') and 'INDEX' not in line:
+            return True
+        if 'Seq Scan on attack_logs' in line:
+            return True
+    return False
+
+def check_query_plans(connection):
+    """EXPLAIN every route query; returns {name: (plan_lines, full_scan)}"""
+    return {
+        name: (plan, is_full_scan(plan))
+        for name, plan in ((name, explain(connection, statement)) for name, statement in route_queries().items())
+    }
@@ -1,24 +1,9 @@
-from datetime import datetime
 from app import db
+import schema
 
 class AttackLog(db.Model):
     """Model for storing attack attempt logs"""
-    __tablename__ = 'attack_logs'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    source_ip = db.Column(db.String(45), nullable=False)  # IPv6 compatible
-    source_port = db.Column(db.Integer, nullable=False)
-    username = db.Column(db.String(255), nullable=True)
-    password = db.Column(db.String(255), nullable=True)
-    command = db.Column(db.Text, nullable=True)
-    session_id = db.Column(db.String(64), nullable=True)
-    attack_type = db.Column(db.String(50), default='ssh_login', nullable=False)
-    country = db.Column(db.String(100), nullable=True)
-    city = db.Column(db.String(100), nullable=True)
-    latitude = db.Column(db.Float, nullable=True)
-    longitude = db.Column(db.Float, nullable=True)
-    user_agent = db.Column(db.String(500), nullable=True)
+    __table__ = schema.attack_logs
     
     def __repr__(self):
         return f'<AttackLog {self.source_ip}:{self.source_port} at {self.timestamp}>'
@@ -44,16 +29,35 @@ class AttackLog(db.Model):
 
 class HoneypotStats(db.Model):
     """Model for storing honeypot statistics"""
-    __tablename__ = 'honeypot_stats'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, default=datetime.utcnow().date, nullable=False, unique=True)
-    total_attacks = db.Column(db.Integer, default=0)
-    unique_ips = db.Column(db.Integer, default=0)
-    successful_logins = db.Column(db.Integer, default=0)
-    failed_logins = db.Column(db.Integer, default=0)
-    top_username = db.Column(db.String(255), nullable=True)
-    top_password = db.Column(db.String(255), nullable=True)
+    __table__ = schema.honeypot_stats
     
     def __repr__(self):
         return f'<HoneypotStats {self.date}: {self.total_attacks} attacks>'
+
+class AttackRollup(db.Model):
+    """Pre-aggregated attack counters per hour or day bucket"""
+    __table__ = schema.attack_rollups
+    
+    def __repr__(self):
+        return f'<AttackRollup {self.granularity} {self.bucket_start}: {self.attacks} attacks>'
+
+class AttackRollupDimension(db.Model):
+    """Pre-aggregated attack counts per country, username or password within a bucket"""
+    __table__ = schema.attack_rollup_dimensions
+    
+    def __repr__(self):
+        return f'<AttackRollupDimension {self.dimension}={self.value}: {self.count}>'
+
+class AttackSketch(db.Model):
+    """Mergeable top-k summary of one dimension within a bucket"""
+    __table__ = schema.attack_sketches
+    
+    def __repr__(self):
+        return f'<AttackSketch {self.granularity} {self.bucket_start} {self.dimension}>'
+
+class SchemaMigration(db.Model):
+    """Versioned schema changes applied by the migrate command"""
+    __table__ = schema.schema_migrations
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.version}: {self.description}>'
@@ -0,0 +1,64 @@
+from datetime import datetime
+from sqlalchemy import or_, asc, desc
+
+class KeysetPage:
+    """One page of a newest-first keyset (cursor) pagination over (timestamp, id)"""
+
+    def __init__(self, items, has_next, has_prev, per_page, total=None, total_is_estimate=False):
+        self.items = items
+        self.has_next = has_next  # older entries exist
+        self.has_prev = has_prev  # newer entries exist
+        self.per_page = per_page
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.items[-1]) if self.items and self.has_next else None
+
+    @property
+    def prev_cursor(self):
+        return encode_cursor(self.items[0]) if self.items and self.has_prev else None
+
+def encode_cursor(row):
+    """Opaque-enough cursor for a row: '<iso timestamp>_<id>'"""
+    return f"{row.timestamp.isoformat()}_{row.id}"
+
+def decode_cursor(cursor):
+    """Parse a cursor back into (timestamp, id); returns None if it is malformed"""
+    try:
+        timestamp, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+def keyset_page(query, model, per_page, before=None, after=None):
+    """Fetch the page older than `before` or newer than `after` (cursors), newest first
+
+    Seeks straight to the cursor position through the (timestamp) index instead of
+    skipping OFFSET rows, so deep pages cost the same as the first one.
+    """
+    before_key = decode_cursor(before) if before else None
+    after_key = decode_cursor(after) if after and not before_key else None
+
+    if after_key:
+        timestamp, row_id = after_key
+        rows = query.filter(
+            model.timestamp >= timestamp,
+            or_(model.timestamp > timestamp, model.id > row_id)
+        ).order_by(asc(model.timestamp), asc(model.id)).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(items, has_next=True, has_prev=has_prev, per_page=per_page)
+
+    if before_key:
+        timestamp, row_id = before_key
+        # The plain range term lets the planner seek the timestamp index
+        query = query.filter(
+            model.timestamp <= timestamp,
+            or_(model.timestamp < timestamp, model.id < row_id)
+        )
+
+    rows = query.order_by(desc(model.timestamp), desc(model.id)).limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page], has_next=len(rows) > per_page,
+                      has_prev=before_key is not None, per_page=per_page)
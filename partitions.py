@@ -0,0 +1,398 @@
+"""Time-partitioned attack_logs with retention by dropping whole partitions.
+
+With ATTACK_PARTITION_PERIOD set to day or week, a new database stores
+attack_logs as one table per period; an existing one is converted with
+'flask partition-attack-logs'. Whether a database is partitioned is read from
+the database itself, so processes started without the setting still use it.
+
+On PostgreSQL attack_logs is a native range-partitioned table on timestamp
+(its primary key becomes (id, timestamp), as partition keys must be part of
+it): inserts, updates and deletes are routed by the server and time-ranged
+queries are pruned by the planner. On SQLite each period is an ordinary table,
+attack_logs_pYYYYMMDD with its own copy of the indexes, and attack_logs is a
+UNION ALL view over them for reads. Writes go to the partitions directly
+(storage.py) under ids drawn from attack_log_ids, so ids stay unique across
+partitions, and time-ranged counts run per overlapping partition
+(tables_for) because SQLite cannot aggregate through the view without
+reading every row of it.
+
+Partitions are listed in attack_log_partitions. The write path creates the
+one a row needs along with ATTACK_PARTITIONS_AHEAD upcoming ones, and
+'flask maintain-partitions' does the same ahead of time and drops partitions
+wholly older than ATTACK_RETENTION_DAYS, exporting their days to the archive
+first when ARCHIVE_DIR is set. As with the archive, the rollups keep counting
+dropped rows.
+"""
+import logging
+import os
+import threading
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import MetaData, Table, Column, PrimaryKeyConstraint, select, insert, update, delete, func, text
+from sqlalchemy.dialects import postgresql, sqlite
+from schema import attack_logs, attack_log_partitions, attack_log_ids, attack_log_rows
+import dimensions
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+
+# Period new databases are partitioned by; unset keeps attack_logs a single table
+PARTITION_PERIOD = os.environ.get('ATTACK_PARTITION_PERIOD') or None
+
+# Partitions kept ready past the current one, so a period rollover never waits on DDL
+PARTITIONS_AHEAD = int(os.environ.get('ATTACK_PARTITIONS_AHEAD', 2))
+
+# maintain-partitions drops partitions wholly older than this many days (0 keeps everything)
+RETENTION_DAYS = int(os.environ.get('ATTACK_RETENTION_DAYS', 0))
+
+# SQLite rejects compound SELECTs with more terms than SQLITE_MAX_COMPOUND_SELECT (500)
+VIEW_TERMS = 400
+
+DAY = timedelta(days=1)
+
+Partition = namedtuple('Partition', 'name start end')
+
+_lock = threading.Lock()
+_layouts = {}     # database URL -> dialect name if attack_logs is partitioned there, else ''
+_partitions = {}  # database URL -> partitions the write path has seen, oldest first
+_tables = {}      # partition name -> Core table (SQLite)
+_catalogs = {}    # database URL -> (SQLite schema version, partitions) for read-side pruning
+
+def period_start(timestamp, period):
+    """Start of the day or week (from Monday) holding a timestamp"""
+    day = datetime(timestamp.year, timestamp.month, timestamp.day)
+    if period == 'week':
+        day -= timedelta(days=day.weekday())
+    return day
+
+def partition_name(start):
+    return f"{attack_logs.name}_p{start:%Y%m%d}"
+
+def partition_table(name):
+    """Core table for a partition: attack_logs' columns, and its indexes renamed after the partition"""
+    table = _tables.get(name)
+    if table is None:
+        table = attack_logs.to_metadata(MetaData(), name=name)
+        for index in table.indexes:
+            index.name = index.name.replace(attack_logs.name, name, 1)
+        _tables[name] = table
+    return table
+
+def _bind(connection):
+    # Works for a Connection or an ORM Session
+    return connection.engine if hasattr(connection, 'engine') else connection.get_bind()
+
+def is_partitioned(connection):
+    """Dialect name ('sqlite' or 'postgresql') when attack_logs is partitioned in this database, else None"""
+    bind = _bind(connection)
+    key = str(bind.url)
+    layout = _layouts.get(key)
+    if layout is None:
+        dialect = bind.dialect.name
+        if dialect == 'sqlite':
+            kinds = dict(connection.execute(
+                text("SELECT name, type FROM sqlite_master WHERE name IN (:view, :rows)"),
+                {'view': attack_logs.name, 'rows': attack_log_rows.name}
+            ).all())
+            # The normalized layout (dimensions.py) makes attack_logs a view too, over attack_log_rows
+            layout = dialect if kinds.get(attack_logs.name) == 'view' and attack_log_rows.name not in kinds else ''
+        elif dialect == 'postgresql':
+            kind = connection.execute(
+                text("SELECT relkind FROM pg_class WHERE relname = :name"), {'name': attack_logs.name}
+            ).scalar()
+            layout = dialect if kind == 'p' else ''
+        else:
+            layout = ''
+        _layouts[key] = layout
+    return layout or None
+
+def forget(engine):
+    """Drop what this process remembers about an engine's layout and partitions"""
+    key = str(engine.url)
+    with _lock:
+        _layouts.pop(key, None)
+        _partitions.pop(key, None)
+
+def list_partitions(connection):
+    """Partitions of attack_logs, oldest first"""
+    table = attack_log_partitions
+    return [Partition(*row) for row in connection.execute(
+        select(table.c.name, table.c.range_start, table.c.range_end).order_by(table.c.range_start)
+    )]
+
+def database_period(partitions):
+    """'day' or 'week', read off an existing partition's span"""
+    for period, span in PERIODS.items():
+        if partitions and partitions[0].end - partitions[0].start == span:
+            return period
+    return PARTITION_PERIOD or 'day'
+
+def tables_for(connection, since=None, until=None):
+    """Tables that can hold attack rows in [since, until), with attack_logs' id and timestamp columns
+
+    The overlapping partitions on a partitioned SQLite database; attack_log_rows
+    on a normalized one; attack_logs itself otherwise, including on PostgreSQL,
+    whose planner prunes partitions.
+    """
+    if is_partitioned(connection) != 'sqlite':
+        # A normalized database's rows, without the view's joins
+        return [attack_log_rows] if dimensions.is_normalized(connection) else [attack_logs]
+    # Creating or dropping a partition changes the schema, so its version tells when the catalog did
+    key = str(_bind(connection).url)
+    version = connection.execute(text("PRAGMA schema_version")).scalar()
+    cached = _catalogs.get(key)
+    if cached is None or cached[0] != version:
+        cached = (version, list_partitions(connection))
+        _catalogs[key] = cached
+    return [
+        partition_table(partition.name) for partition in cached[1]
+        if (since is None or partition.end > since) and (until is None or partition.start < until)
+    ]
+
+def count_rows(connection, since, until=None):
+    """Attacks with a timestamp in [since, until), summed over the partitions it overlaps in one statement"""
+    counts = []
+    for table in tables_for(connection, since, until):
+        conditions = [table.c.timestamp >= since]
+        if until is not None:
+            conditions.append(table.c.timestamp < until)
+        counts.append(select(func.count()).select_from(table).where(*conditions).scalar_subquery())
+    if not counts:
+        return 0
+    return connection.execute(select(sum(counts[1:], counts[0]))).scalar()
+
+def _edge_timestamp(connection, aggregate, tables):
+    for table in tables:
+        value = connection.execute(select(aggregate(table.c.timestamp))).scalar()
+        if value is not None:
+            return datetime.fromisoformat(value) if isinstance(value, str) else value
+    return None
+
+def oldest_timestamp(connection):
+    """Timestamp of the oldest row in attack_logs, or None when it is empty"""
+    return _edge_timestamp(connection, func.min, tables_for(connection))
+
+def newest_timestamp(connection):
+    """Timestamp of the newest row in attack_logs, or None when it is empty"""
+    return _edge_timestamp(connection, func.max, reversed(tables_for(connection)))
+
+def _rebuild_view(connection):
+    """Point the SQLite attack_logs view at the partitions listed in the catalog"""
+    columns = ', '.join(column.name for column in attack_logs.columns)
+    selects = [f"SELECT {columns} FROM {partition.name}" for partition in list_partitions(connection)]
+    if not selects:
+        raise RuntimeError("attack_logs has no partitions left")
+    # Nest long unions so no single compound SELECT goes over SQLite's limit
+    while len(selects) > VIEW_TERMS:
+        selects = [
+            f"SELECT {columns} FROM ({' UNION ALL '.join(selects[i:i + VIEW_TERMS])})"
+            for i in range(0, len(selects), VIEW_TERMS)
+        ]
+    connection.execute(text(f"DROP VIEW IF EXISTS {attack_logs.name}"))
+    connection.execute(text(f"CREATE VIEW {attack_logs.name} AS {' UNION ALL '.join(selects)}"))
+
+def _create_partitions(connection, starts, period):
+    """Create the partitions beginning at `starts` that are missing; returns how many were created"""
+    dialect = connection.dialect.name
+    table = attack_log_partitions
+    existing = {partition.start for partition in list_partitions(connection)}
+    missing = sorted(set(starts) - existing)
+    if not missing:
+        return 0
+    span = PERIODS[period]
+    rows = [{'name': partition_name(start), 'range_start': start, 'range_end': start + span} for start in missing]
+    if dialect == 'postgresql':
+        # One creator at a time, so concurrent writers never race on the same partition
+        connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {'name': table.name})
+        statement = postgresql.insert(table).on_conflict_do_nothing()
+    else:
+        # A write first: pysqlite only opens the transaction (and takes the write lock) on DML,
+        # and the DDL below has to run inside it
+        statement = sqlite.insert(table).on_conflict_do_nothing()
+    connection.execute(statement, rows)
+
+    for row in rows:
+        if dialect == 'postgresql':
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {row['name']} PARTITION OF {attack_logs.name} "
+                f"FOR VALUES FROM ('{row['range_start']:%Y-%m-%d %H:%M:%S}') TO ('{row['range_end']:%Y-%m-%d %H:%M:%S}')"
+            ))
+        else:
+            partition_table(row['name']).create(connection, checkfirst=True)
+        logger.info(f"Created attack_logs partition {row['name']}")
+    if dialect == 'sqlite':
+        _rebuild_view(connection)
+    return len(rows)
+
+def _upcoming(now, period, ahead):
+    start = period_start(now, period)
+    return [start + PERIODS[period] * i for i in range(ahead + 1)]
+
+def ensure_partitions(connection, timestamps, ahead=PARTITIONS_AHEAD):
+    """Partitions covering every timestamp, creating missing ones and the upcoming ones with them;
+    returns the database's partitions, oldest first"""
+    key = str(_bind(connection).url)
+    timestamps = list(timestamps)
+    partitions = _partitions.get(key)
+    if partitions is not None:
+        period = database_period(partitions)
+        if {period_start(timestamp, period) for timestamp in timestamps} <= {partition.start for partition in partitions}:
+            return partitions
+
+    partitions = list_partitions(connection)
+    period = database_period(partitions)
+    starts = {period_start(timestamp, period) for timestamp in timestamps}
+    if not starts <= {partition.start for partition in partitions}:
+        starts |= set(_upcoming(datetime.utcnow(), period, ahead))
+        _create_partitions(connection, starts, period)
+        partitions = list_partitions(connection)
+    with _lock:
+        _partitions[key] = partitions
+    return partitions
+
+def insert_rows(connection, rows):
+    """Insert a batch into the SQLite partitions under ids from attack_log_ids; returns the ids in row order"""
+    partitions = ensure_partitions(connection, [row['timestamp'] for row in rows])
+    counter = attack_log_ids
+    connection.execute(update(counter).where(counter.c.id == 1).values(next_id=counter.c.next_id + len(rows)))
+    first = connection.execute(select(counter.c.next_id).where(counter.c.id == 1)).scalar() - len(rows)
+    ids = list(range(first, first + len(rows)))
+
+    starts = [partition.start for partition in partitions]
+    batches = {}
+    for attack_id, row in zip(ids, rows):
+        partition = partitions[bisect_right(starts, row['timestamp']) - 1]
+        batches.setdefault(partition.name, []).append(dict(row, id=attack_id))
+    for name, batch in batches.items():
+        connection.execute(insert(partition_table(name)), batch)
+    return ids
+
+def _parent_table():
+    """attack_logs as a PostgreSQL range-partitioned table; its key has to include the partition column"""
+    return Table(
+        attack_logs.name, MetaData(),
+        *(Column(column.name, column.type, nullable=column.nullable, autoincrement=column.name == 'id')
+          for column in attack_logs.columns),
+        PrimaryKeyConstraint('id', 'timestamp'),
+        postgresql_partition_by='RANGE (timestamp)'
+    )
+
+def _lay_out(connection, period, now, legacy=None):
+    """Create the partitioned attack_logs, copying the rows of a renamed single table if there is one"""
+    dialect = connection.dialect.name
+    attack_log_partitions.create(connection, checkfirst=True)
+    attack_log_ids.create(connection, checkfirst=True)
+    next_id = 1
+    starts = set(_upcoming(now, period, PARTITIONS_AHEAD))
+    if legacy is not None:
+        old = Table(legacy, MetaData(), *(Column(column.name, column.type) for column in attack_logs.columns))
+        last_id, oldest = connection.execute(select(func.max(old.c.id), func.min(old.c.timestamp))).one()
+        next_id = (last_id or 0) + 1
+        current = min(starts)
+        start = period_start(oldest, period) if oldest else current
+        while start < current:
+            # Only periods that have rows; later writes create any others they need
+            if connection.execute(select(old.c.id).where(
+                    old.c.timestamp >= start, old.c.timestamp < start + PERIODS[period]).limit(1)).first():
+                starts.add(start)
+            start += PERIODS[period]
+
+    if dialect == 'postgresql':
+        _parent_table().create(connection)
+        _create_partitions(connection, starts, period)
+        if legacy is not None:
+            connection.execute(insert(attack_logs).from_select(list(old.c.keys()), select(*old.c)))
+            connection.execute(text(f"DROP TABLE {legacy}"))
+            connection.execute(
+                text("SELECT setval(pg_get_serial_sequence(:table, 'id'), :value, false)"),
+                {'table': attack_logs.name, 'value': next_id}
+            )
+        # Indexes on the parent cascade to every partition, present and future
+        for index in attack_logs.indexes:
+            index.create(connection)
+    else:
+        connection.execute(insert(attack_log_ids).values(id=1, next_id=next_id))
+        _create_partitions(connection, starts, period)
+        if legacy is not None:
+            for partition in list_partitions(connection):
+                connection.execute(insert(partition_table(partition.name)).from_select(
+                    list(old.c.keys()),
+                    select(*old.c).where(old.c.timestamp >= partition.start, old.c.timestamp < partition.end)
+                ))
+            connection.execute(text(f"DROP TABLE {legacy}"))
+
+def create_layout(engine, period, now=None):
+    """Lay out a new, empty database's attack_logs as partitions (before create_all adds the rest)"""
+    with engine.begin() as connection:
+        _lay_out(connection, period, now or datetime.utcnow())
+    forget(engine)
+    logger.info(f"attack_logs partitioned by {period}")
+
+def partition_attack_logs(engine, period, now=None):
+    """Convert an existing single attack_logs table into partitions in one transaction; returns the row count"""
+    legacy = f"{attack_logs.name}_unpartitioned"
+    with engine.begin() as connection:
+        if is_partitioned(connection):
+            return None
+        count = connection.execute(select(func.count()).select_from(attack_logs)).scalar()
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text(f"ALTER TABLE {attack_logs.name} RENAME TO {legacy}"))
+            connection.execute(text(f"ALTER TABLE {legacy} RENAME CONSTRAINT {attack_logs.name}_pkey TO {legacy}_pkey"))
+            # The old indexes go with the old table; free their names for the new ones
+            for index in attack_logs.indexes:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        else:
+            # pysqlite opens the transaction on the first DML, so the DDL below can roll back
+            connection.execute(delete(attack_log_ids))
+            connection.execute(text(f"ALTER TABLE {attack_logs.name} RENAME TO {legacy}"))
+        _lay_out(connection, period, now or datetime.utcnow(), legacy=legacy)
+    forget(engine)
+    logger.info(f"Converted {count} attack rows into {period} partitions")
+    return count
+
+def create_upcoming(engine, now=None, ahead=PARTITIONS_AHEAD):
+    """Create the current and the next `ahead` partitions; returns how many were missing"""
+    with engine.begin() as connection:
+        if not is_partitioned(connection):
+            return 0
+        period = database_period(list_partitions(connection))
+        created = _create_partitions(connection, _upcoming(now or datetime.utcnow(), period, ahead), period)
+    forget(engine)
+    return created
+
+def drop_partitions(engine, cutoff, archive=None):
+    """Drop every partition that ends at or before cutoff, exporting its days to the archive first;
+    returns the names dropped"""
+    with engine.connect() as connection:
+        if not is_partitioned(connection):
+            return []
+        expired = [partition for partition in list_partitions(connection) if partition.end <= cutoff]
+    dropped = []
+    for partition in expired:
+        if archive is not None:
+            day = partition.start
+            while day < partition.end:
+                archive.archive_day(engine, day, keep_rows=True)
+                day += DAY
+        with engine.begin() as connection:
+            # Catalog first: on SQLite that opens the transaction, and the view is rebuilt without it
+            connection.execute(delete(attack_log_partitions).where(attack_log_partitions.c.name == partition.name))
+            if connection.dialect.name == 'sqlite':
+                _rebuild_view(connection)
+            connection.execute(text(f"DROP TABLE IF EXISTS {partition.name}"))
+        logger.info(f"Dropped attack_logs partition {partition.name}")
+        dropped.append(partition.name)
+    forget(engine)
+    return dropped
+
+def maintain(engine, retention_days=RETENTION_DAYS, archive=None, now=None):
+    """Create upcoming partitions and drop those past retention; returns (created, dropped names)"""
+    now = now or datetime.utcnow()
+    created = create_upcoming(engine, now)
+    dropped = []
+    if retention_days:
+        today = datetime(now.year, now.month, now.day)
+        dropped = drop_partitions(engine, today - timedelta(days=retention_days), archive)
+    return created, dropped
@@ -0,0 +1,399 @@
+"""Shared-memory ring of the most recent attacks for the live dashboard views.
+
+Every process that writes attack rows appends them here right after the
+database commit, and every dashboard worker maps the same file (in /dev/shm
+when the host has it), so the index page's timeline and 24h count and the
+polled /api/attacks/recent?hours=1 are answered from memory instead of
+re-reading rows that were written moments ago.
+
+The file holds a header, a slot index of (timestamp, id, running maximum
+timestamp), per-minute attack counts for the last RECENT_BUFFER_HOURS hours,
+and fixed-width struct-packed records. Writers serialize on an flock; readers
+take no lock: the writer makes a version counter odd while it changes anything
+and readers retry when it moved under them. The running maximum lets a
+newest-first scan stop after O(k) slots even when replayed rows arrive out of
+timestamp order.
+
+Every row newer than the header's horizon (the newest timestamp evicted, or the
+moment the buffer was created) and no older than RECENT_BUFFER_HOURS is in the
+ring; reads reaching past that return None and the caller falls back to SQL, as
+it does for rows whose text does not fit a record.
+"""
+import fcntl
+import hashlib
+import heapq
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'HPRING01'
+
+# magic, record size, slots, minute buckets, version (odd while a writer is busy),
+# rows appended, horizon, created, newest timestamp appended (timestamps in microseconds)
+HEADER = struct.Struct('<8sIII4xQQqqq')
+VERSION = struct.Struct('<Q')
+VERSION_OFFSET = 24
+INDEX = struct.Struct('<qqq')  # timestamp, id, running maximum timestamp
+BUCKET = struct.Struct('<qq')  # minute since the epoch, attacks in it
+
+# Text columns and the bytes a record keeps of each; longer values mark the record truncated
+TEXT_FIELDS = [('source_ip', 45), ('username', 64), ('password', 64), ('command', 128),
+               ('session_id', 64), ('attack_type', 50), ('country', 100), ('city', 100),
+               ('user_agent', 128)]
+# id, source_port, latitude, longitude, null/truncated flags, then length-prefixed text
+RECORD = struct.Struct('<qiddH' + ''.join(f'{width + 1}p' for _, width in TEXT_FIELDS))
+IP_OFFSET = struct.calcsize('<qiddH')
+# Flag bits: 1 << i when the i-th text field is None, then these
+NO_PORT, NO_LATITUDE, NO_LONGITUDE = 1 << 9, 1 << 10, 1 << 11
+TRUNCATED = 1 << 15
+NO_COUNTRY = 1 << [name for name, _ in TEXT_FIELDS].index('country')
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+MINUTE_US = 60 * 1000000
+
+# Attempts at a consistent read before giving the query to the database
+READ_RETRIES = 3
+
+READS = metrics.counter('recent_buffer_reads_total', 'Recent-attack reads by whether the shared buffer covered them',
+                        ['result'])
+
+def _to_us(timestamp):
+    return (timestamp - EPOCH) // MICROSECOND
+
+def _now_us():
+    return int(time.time() * 1000000)
+
+class RecentAttack:
+    """A row read back from the buffer; the attributes and to_dict() of an AttackLog"""
+    __slots__ = ('id', 'timestamp', 'source_ip', 'source_port', 'username', 'password', 'command',
+                 'session_id', 'attack_type', 'country', 'city', 'latitude', 'longitude', 'user_agent')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'source_ip': self.source_ip,
+            'source_port': self.source_port,
+            'username': self.username,
+            'password': self.password,
+            'command': self.command,
+            'session_id': self.session_id,
+            'attack_type': self.attack_type,
+            'country': self.country,
+            'city': self.city,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'user_agent': self.user_agent
+        }
+
+def pack_record(attack_id, row):
+    flags = 0
+    texts = []
+    for bit, (name, width) in enumerate(TEXT_FIELDS):
+        value = row.get(name)
+        data = b''
+        if value is None:
+            flags |= 1 << bit
+        else:
+            data = value.encode('utf-8', 'replace')
+            if len(data) > width:
+                flags |= TRUNCATED
+                data = b''
+        texts.append(data)
+    port, latitude, longitude = row.get('source_port'), row.get('latitude'), row.get('longitude')
+    flags |= (port is None) * NO_PORT | (latitude is None) * NO_LATITUDE | (longitude is None) * NO_LONGITUDE
+    return RECORD.pack(attack_id, port or 0, latitude or 0.0, longitude or 0.0, flags, *texts)
+
+def unpack_record(buffer, timestamp):
+    """RecentAttack of a packed record, or None if the record was truncated"""
+    (attack_id, port, latitude, longitude, flags, source_ip, username, password, command,
+     session_id, attack_type, country, city, user_agent) = RECORD.unpack(buffer)
+    if flags & TRUNCATED:
+        return None
+    # Spelled out: this runs for every row a request returns
+    attack = RecentAttack()
+    attack.id = attack_id
+    attack.timestamp = EPOCH + timestamp * MICROSECOND
+    attack.source_port = None if flags & NO_PORT else port
+    attack.latitude = None if flags & NO_LATITUDE else latitude
+    attack.longitude = None if flags & NO_LONGITUDE else longitude
+    attack.source_ip = None if flags & 1 else source_ip.decode('utf-8', 'replace')
+    attack.username = None if flags & 2 else username.decode('utf-8', 'replace')
+    attack.password = None if flags & 4 else password.decode('utf-8', 'replace')
+    attack.command = None if flags & 8 else command.decode('utf-8', 'replace')
+    attack.session_id = None if flags & 16 else session_id.decode('utf-8', 'replace')
+    attack.attack_type = None if flags & 32 else attack_type.decode('utf-8', 'replace')
+    attack.country = None if flags & 64 else country.decode('utf-8', 'replace')
+    attack.city = None if flags & 128 else city.decode('utf-8', 'replace')
+    attack.user_agent = None if flags & 256 else user_agent.decode('utf-8', 'replace')
+    return attack
+
+class RecentAttackBuffer:
+    """Ring of the last `capacity` attack rows and per-minute counts of the last `hours` hours"""
+
+    def __init__(self, path, capacity=10000, hours=24):
+        self.path = path
+        self.capacity = capacity
+        self.hours = hours
+        self.window_us = hours * 3600 * 1000000
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+        self._layout = None
+
+        # Counters
+        self.hits = 0
+        self.fallbacks = 0
+
+    def _open(self):
+        """Map the file, creating or re-initializing it if missing or in another layout
+
+        Mapped once per process: after a fork the child opens its own descriptor,
+        since flock locks belong to the open file and would otherwise be shared.
+        """
+        if self._pid == os.getpid():
+            return self._map
+        with self._lock:
+            if self._pid == os.getpid():
+                return self._map
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, HEADER.size, 0)
+                capacity, minutes = self.capacity, self.hours * 60 + 1
+                if len(header) == HEADER.size:
+                    magic, record_size, file_capacity, file_minutes = HEADER.unpack(header)[:4]
+                    if magic == MAGIC and record_size == RECORD.size and \
+                            os.fstat(fd).st_size == self._size(file_capacity, file_minutes):
+                        # Whoever created the buffer sized it; later processes adopt that
+                        capacity, minutes = file_capacity, file_minutes
+                        header = None
+                if header is not None:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self._size(capacity, minutes))
+                    now = _now_us()
+                    os.pwrite(fd, HEADER.pack(MAGIC, RECORD.size, capacity, minutes, 0, 0, now - 1, now, 0), 0)
+                    logger.info(f"Recent attack buffer created at {self.path} ({capacity} rows)")
+                mapping = mmap.mmap(fd, self._size(capacity, minutes))
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = fd
+            self._map = mapping
+            index = HEADER.size
+            buckets = index + capacity * INDEX.size
+            self._layout = (capacity, minutes, index, buckets, buckets + minutes * BUCKET.size)
+            self._pid = os.getpid()
+            return mapping
+
+    @staticmethod
+    def _size(capacity, minutes):
+        return HEADER.size + capacity * (INDEX.size + RECORD.size) + minutes * BUCKET.size
+
+    @contextmanager
+    def _writing(self):
+        """Exclusive access for a writer, with the version odd for as long as it lasts"""
+        mapping = self._open()
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                version = VERSION.unpack_from(mapping, VERSION_OFFSET)[0]
+                VERSION.pack_into(mapping, VERSION_OFFSET, version + 1)
+                try:
+                    yield mapping
+                finally:
+                    VERSION.pack_into(mapping, VERSION_OFFSET, version + 2)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def append(self, rows, ids):
+        """Add rows just committed to the database under the ids they were stored with"""
+        with self._writing() as mapping:
+            capacity, minutes, index, buckets, records = self._layout
+            magic, record_size, _, _, version, head, horizon, created, newest = HEADER.unpack_from(mapping)
+            try:
+                for attack_id, row in zip(ids, rows):
+                    timestamp = _to_us(row.get('timestamp') or datetime.utcnow())
+                    slot = head % capacity
+                    if head >= capacity:
+                        horizon = max(horizon, INDEX.unpack_from(mapping, index + slot * INDEX.size)[0])
+                    newest = max(newest, timestamp)
+                    offset = records + slot * RECORD.size
+                    mapping[offset:offset + RECORD.size] = pack_record(attack_id, row)
+                    INDEX.pack_into(mapping, index + slot * INDEX.size, timestamp, attack_id, newest)
+                    head += 1
+
+                    minute = timestamp // MINUTE_US
+                    offset = buckets + (minute % minutes) * BUCKET.size
+                    bucket_minute, count = BUCKET.unpack_from(mapping, offset)
+                    if bucket_minute == minute:
+                        BUCKET.pack_into(mapping, offset, minute, count + 1)
+                    elif bucket_minute < minute:
+                        BUCKET.pack_into(mapping, offset, minute, 1)
+            except Exception:
+                # Rows of this batch are missing: nothing before now can be answered from here
+                created = horizon = _now_us()
+                raise
+            finally:
+                HEADER.pack_into(mapping, 0, magic, record_size, capacity, minutes, version,
+                                 head, horizon, created, newest)
+
+    def fill_locations(self, resolved):
+        """Copy back-filled geolocation ({ip: geo}) into the buffered rows still without a country"""
+        patterns = {bytes([len(ip)]) + ip.encode(): geo for ip, geo in resolved.items() if len(ip) <= 45}
+        with self._writing() as mapping:
+            capacity, _, _, _, records = self._layout
+            head = HEADER.unpack_from(mapping)[5]
+            for slot in range(min(head, capacity)):
+                offset = records + slot * RECORD.size
+                length = mapping[offset + IP_OFFSET]
+                geo = patterns.get(mapping[offset + IP_OFFSET:offset + IP_OFFSET + length + 1])
+                if geo is None:
+                    continue
+                attack_id, port, _, _, flags, *texts = RECORD.unpack_from(mapping, offset)
+                if not flags & NO_COUNTRY or flags & TRUNCATED:
+                    continue
+                row = {name: None if flags & (1 << bit) else data.decode('utf-8', 'replace')
+                       for bit, ((name, _), data) in enumerate(zip(TEXT_FIELDS, texts))}
+                row['source_port'] = None if flags & NO_PORT else port
+                row.update(country=geo.get('country'), city=geo.get('city'),
+                           latitude=geo.get('latitude'), longitude=geo.get('longitude'))
+                mapping[offset:offset + RECORD.size] = pack_record(attack_id, row)
+
+    def _read(self, read):
+        """Run read(mapping, header) until no writer interfered; None if that kept failing"""
+        mapping = self._open()
+        for _ in range(READ_RETRIES):
+            version = VERSION.unpack_from(mapping, VERSION_OFFSET)[0]
+            if version & 1:
+                time.sleep(0.001)
+                continue
+            result = read(mapping, HEADER.unpack_from(mapping))
+            if VERSION.unpack_from(mapping, VERSION_OFFSET)[0] == version:
+                return result
+        return None
+
+    def _counted(self, result):
+        if result is None:
+            self.fallbacks += 1
+            READS.labels('fallback').inc()
+        else:
+            self.hits += 1
+            READS.labels('hit').inc()
+        return result
+
+    def recent(self, limit, since=None):
+        """The newest `limit` attacks (at or after since, if given) newest first, like ORDER BY
+        timestamp DESC, id DESC; None when the buffer cannot vouch for the whole answer"""
+        since_us = None if since is None else _to_us(since)
+
+        def read(mapping, header):
+            capacity, _, index, _, records = self._layout
+            head, horizon = header[5], header[6]
+            floor = max(horizon, _now_us() - self.window_us)  # every row newer than this is in the ring
+            bound = floor + 1 if since_us is None else max(since_us, floor + 1)
+            found = []
+            for position in range(head - 1, max(head - capacity, 0) - 1, -1):
+                slot = position % capacity
+                timestamp, attack_id, running_max = INDEX.unpack_from(mapping, index + slot * INDEX.size)
+                # No row appended before this one is newer than running_max
+                if running_max < bound or (limit and len(found) == limit and running_max < found[0][0]):
+                    break
+                if timestamp < bound:
+                    continue
+                key = (timestamp, attack_id, slot)
+                if not limit:
+                    found.append(key)
+                elif len(found) < limit:
+                    heapq.heappush(found, key)
+                else:
+                    heapq.heappushpop(found, key)
+            if not (since_us is not None and since_us > floor or limit and len(found) == limit):
+                return None
+            found.sort(reverse=True)
+            return [(timestamp, mapping[records + slot * RECORD.size:records + (slot + 1) * RECORD.size])
+                    for timestamp, _, slot in found]
+
+        packed = self._read(read)
+        attacks = None
+        if packed is not None:
+            attacks = [unpack_record(record, timestamp) for timestamp, record in packed]
+            if None in attacks:
+                attacks = None
+        return self._counted(attacks)
+
+    def count_since(self, since, partial):
+        """Attacks at or after since from the minute counts, or None if they don't reach back that far
+
+        partial(start, end) counts the rows of the first minute from `since` on when
+        it starts mid-minute, since the buckets can't split it.
+        """
+        since_us = _to_us(since)
+        since_minute = since_us // MINUTE_US
+
+        def read(mapping, header):
+            _, minutes, _, buckets, _ = self._layout
+            created = header[7]
+            if since_us < created or since_minute <= _now_us() // MINUTE_US - minutes:
+                return None
+            later = first = 0
+            for minute, count in BUCKET.iter_unpack(mapping[buckets:buckets + minutes * BUCKET.size]):
+                if minute > since_minute:
+                    later += count
+                elif minute == since_minute:
+                    first = count
+            return later, first
+
+        counts = self._counted(self._read(read))
+        if counts is None:
+            return None
+        later, first = counts
+        if first and since_us % MINUTE_US:
+            first = partial(since, EPOCH + (since_minute + 1) * MINUTE_US * MICROSECOND)
+        return later + first
+
+    def get_stats(self):
+        """Return buffer occupancy and read counters for monitoring"""
+        header = HEADER.unpack_from(self._open())
+        capacity, head, horizon = header[2], header[5], header[6]
+        floor = max(horizon, _now_us() - self.window_us)
+        return {
+            'capacity': capacity,
+            'size': min(head, capacity),
+            'appended': head,
+            'covers_since': (EPOCH + floor * MICROSECOND).isoformat(),
+            'hits': self.hits,
+            'fallbacks': self.fallbacks
+        }
+
+def default_buffer_path():
+    """A file per database in /dev/shm (or the temp directory), so every process of one deployment shares it"""
+    database = os.environ.get('DATABASE_URL', 'sqlite:///honeypot.db')
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, f"honeypot-recent-{hashlib.sha1(database.encode()).hexdigest()[:12]}")
+
+def create_recent_buffer():
+    """Build the buffer from environment settings; None when RECENT_BUFFER_SIZE is 0"""
+    capacity = int(os.environ.get('RECENT_BUFFER_SIZE', 10000))
+    if capacity <= 0:
+        return None
+    return RecentAttackBuffer(
+        os.environ.get('RECENT_BUFFER_PATH') or default_buffer_path(),
+        capacity=capacity,
+        hours=int(os.environ.get('RECENT_BUFFER_HOURS', 24))
+    )
+
+# Global instance
+recent_buffer = create_recent_buffer()
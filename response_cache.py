@@ -0,0 +1,247 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+class SharedResponseStore:
+    """SQLite-backed generation counter and response bodies shared by every worker on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_generation ("
+                "id INTEGER PRIMARY KEY CHECK (id = 1), generation INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO cache_generation (id, generation) VALUES (1, 0)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, generation INTEGER NOT NULL, expires_at REAL NOT NULL, "
+                "etag TEXT NOT NULL, mimetype TEXT NOT NULL, body BLOB NOT NULL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def generation(self):
+        return self._connection().execute("SELECT generation FROM cache_generation WHERE id = 1").fetchone()[0]
+
+    def bump(self):
+        """Advance the generation and drop the responses it invalidates"""
+        conn = self._connection()
+        conn.execute("UPDATE cache_generation SET generation = generation + 1 WHERE id = 1")
+        generation = self.generation()
+        conn.execute("DELETE FROM response_cache WHERE generation < ?", (generation,))
+        return generation
+
+    def get(self, key, generation, now):
+        """Return (expires_at, etag, mimetype, body) if a live entry for this generation exists"""
+        row = self._connection().execute(
+            "SELECT expires_at, etag, mimetype, body FROM response_cache WHERE key = ? AND generation = ?",
+            (key, generation)
+        ).fetchone()
+        if row is None or row[0] <= now:
+            return None
+        return row[0], row[1], row[2], bytes(row[3])
+
+    def put(self, key, generation, entry):
+        expires_at, etag, mimetype, body = entry
+        self._connection().execute(
+            "INSERT OR REPLACE INTO response_cache (key, generation, expires_at, etag, mimetype, body) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, generation, expires_at, etag, mimetype, body)
+        )
+
+class ResponseCache:
+    """Cache of rendered API responses, invalidated whenever the ingest path bumps the generation
+
+    Entries also expire after `ttl` seconds because some responses depend on the
+    current time (sliding windows such as ?hours=24) as well as on the data.
+    """
+
+    def __init__(self, capacity=1000, ttl=60, shared_path=None, enabled=True):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.enabled = enabled
+        self.entries = OrderedDict()  # key -> (generation, (expires_at, etag, mimetype, body))
+        self.lock = threading.Lock()
+        self.local_generation = 0
+        # A path, or a function returning it (processes that never use the store don't resolve it)
+        self.shared_path = shared_path
+        self._shared = None
+        self._open_lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    @property
+    def shared(self):
+        """The shared store, opened on first use; None when disabled or it could not be opened"""
+        if self._shared is None and self.shared_path:
+            with self._open_lock:
+                if self._shared is None and self.shared_path:
+                    path = self.shared_path() if callable(self.shared_path) else self.shared_path
+                    try:
+                        self._shared = SharedResponseStore(path)
+                    except Exception as e:
+                        logger.error(f"Shared response cache disabled ({path}): {e}")
+                        self.shared_path = None
+        return self._shared
+
+    def generation(self):
+        if self.shared:
+            try:
+                return self.shared.generation()
+            except Exception as e:
+                logger.debug(f"Shared response cache generation read failed: {e}")
+        return self.local_generation
+
+    def bump(self):
+        """Invalidate every cached response; called after new attack data is committed"""
+        with self.lock:
+            self.local_generation += 1
+            self.entries.clear()
+            self.invalidations += 1
+        if self.shared:
+            try:
+                self.shared.bump()
+            except Exception as e:
+                logger.error(f"Shared response cache invalidation failed: {e}")
+
+    def get(self, key, generation):
+        now = time.time()
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None:
+                if cached[0] == generation and cached[1][0] > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return cached[1]
+                del self.entries[key]
+
+        if self.shared:
+            try:
+                entry = self.shared.get(key, generation, now)
+            except Exception as e:
+                logger.debug(f"Shared response cache read failed for {key}: {e}")
+                entry = None
+            if entry is not None:
+                self._store_local(key, generation, entry)
+                with self.lock:
+                    self.shared_hits += 1
+                return entry
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, generation, mimetype, body):
+        entry = (time.time() + self.ttl, make_etag(body), mimetype, body)
+        self._store_local(key, generation, entry)
+        if self.shared:
+            try:
+                self.shared.put(key, generation, entry)
+            except Exception as e:
+                logger.debug(f"Shared response cache write failed for {key}: {e}")
+        return entry
+
+    def _store_local(self, key, generation, entry):
+        with self.lock:
+            self.entries[key] = (generation, entry)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def get_stats(self):
+        """Return cache counters for monitoring (per worker process)"""
+        generation = self.generation()
+        with self.lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'pid': os.getpid(),
+                'size': len(self.entries),
+                'capacity': self.capacity,
+                'generation': generation,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'invalidations': self.invalidations,
+                'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0.0
+            }
+
+def make_etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def cache_key(arg_names):
+    """Endpoint path plus the listed query args, sorted, so equivalent requests share an entry"""
+    from flask import request
+    args = sorted((name, request.args.get(name)) for name in arg_names if request.args.get(name) not in (None, ''))
+    return request.path + '?' + '&'.join(f"{name}={value}" for name, value in args)
+
+def cached_response(*arg_names):
+    """Decorator serving a route from the response cache, with ETag / If-None-Match support
+
+    Only the query args named here are part of the key; successful responses are cached.
+    """
+    # Imported here so the ingest side, which only bumps the generation, stays free of Flask
+    from flask import request, Response
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not response_cache.enabled:
+                return view(*args, **kwargs)
+
+            key = cache_key(arg_names)
+            # Read before rendering so a concurrent ingest leaves this entry stale, not wrong
+            generation = response_cache.generation()
+            entry = response_cache.get(key, generation)
+            if entry is None:
+                response = view(*args, **kwargs)
+                if isinstance(response, tuple) or response.status_code != 200:
+                    return response
+                entry = response_cache.put(key, generation, response.mimetype, response.get_data())
+
+            _, etag, mimetype, body = entry
+            if request.if_none_match.contains(etag):
+                with response_cache.lock:
+                    response_cache.not_modified += 1
+                response = Response(status=304)
+            else:
+                response = Response(body, mimetype=mimetype)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def default_shared_path():
+    """One store per database, so every worker serving it invalidates the others wherever it was started"""
+    from storage import sidecar_path
+    return sidecar_path('response_cache.db')
+
+# Global instance
+response_cache = ResponseCache(
+    capacity=int(os.environ.get('RESPONSE_CACHE_SIZE', 1000)),
+    ttl=float(os.environ.get('RESPONSE_CACHE_TTL', 60)),
+    shared_path=os.environ.get('RESPONSE_CACHE_PATH', default_shared_path) or None,
+    enabled=os.environ.get('RESPONSE_CACHE', '1') == '1'
+)
@@ -0,0 +1,270 @@
+import logging
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import func, desc, select, insert, update, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from schema import attack_logs, attack_rollups, attack_rollup_dimensions, honeypot_stats
+from sketches import HyperLogLog
+import partitions
+
+logger = logging.getLogger(__name__)
+
+# Dashboard endpoints read from the rollup tables unless this is switched off
+ROLLUPS_ENABLED = os.environ.get('DASHBOARD_ROLLUPS', '1') == '1'
+
+GRANULARITIES = ('hour', 'day')
+DIMENSIONS = ('country', 'username', 'password', 'attack_type')
+
+# attack_type values counted as HoneypotStats' successful and failed logins
+SUCCESSFUL_LOGINS = ('ssh_login_accepted',)
+FAILED_LOGINS = ('ssh_login', 'ssh_publickey')
+
+def bucket_start(timestamp, granularity):
+    """Truncate a timestamp to the start of its hour or day bucket"""
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _dialect_insert(connection, table):
+    """INSERT construct supporting ON CONFLICT for the connection's database"""
+    # Works for a Connection or an ORM Session
+    dialect = connection.dialect.name if hasattr(connection, 'dialect') else connection.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Rollups do not support the {dialect} dialect")
+
+def _increment_dimensions(connection, counts):
+    """Add per-value counts to the dimension rollup table with a single upsert"""
+    if not counts:
+        return
+    table = attack_rollup_dimensions
+    statement = _dialect_insert(connection, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=['granularity', 'bucket_start', 'dimension', 'value'],
+        set_={'count': table.c.count + statement.excluded.count}
+    )
+    connection.execute(statement, [{
+        'granularity': granularity,
+        'bucket_start': bucket,
+        'dimension': dimension,
+        'value': value[:255],
+        'count': count
+    } for (granularity, bucket, dimension, value), count in counts.items()])
+
+def _merge_buckets(connection, buckets):
+    """Add attack counts and fold source IPs into each bucket's HyperLogLog"""
+    table = attack_rollups
+    for (granularity, bucket), (attacks, source_ips) in buckets.items():
+        rollup = connection.execute(
+            select(table.c.id, table.c.attacks, table.c.ip_sketch).where(
+                table.c.granularity == granularity,
+                table.c.bucket_start == bucket
+            ).with_for_update()
+        ).first()
+
+        sketch = HyperLogLog.from_bytes(rollup.ip_sketch if rollup else None)
+        sketch.update(source_ips)
+        values = {
+            'attacks': (rollup.attacks if rollup else 0) + attacks,
+            'ip_sketch': sketch.to_bytes(),
+            'unique_ips': sketch.count()
+        }
+        if rollup is None:
+            connection.execute(insert(table).values(granularity=granularity, bucket_start=bucket, **values))
+        else:
+            connection.execute(update(table).where(table.c.id == rollup.id).values(**values))
+
+def apply_attack_rows(connection, rows):
+    """Fold a batch of newly inserted attack rows into the rollups (caller commits)"""
+    buckets = defaultdict(lambda: [0, set()])
+    dimension_counts = Counter()
+    days = set()
+
+    for row in rows:
+        timestamp = row.get('timestamp') or datetime.utcnow()
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(timestamp, granularity)
+            entry = buckets[(granularity, bucket)]
+            entry[0] += 1
+            entry[1].add(row['source_ip'])
+            for dimension in DIMENSIONS:
+                value = row.get(dimension)
+                if value is None and dimension == 'attack_type':
+                    value = attack_logs.c.attack_type.default.arg  # filled in by the insert
+                if value is not None:
+                    dimension_counts[(granularity, bucket, dimension, value)] += 1
+        days.add(bucket_start(timestamp, 'day'))
+
+    _merge_buckets(connection, buckets)
+    _increment_dimensions(connection, dimension_counts)
+    refresh_daily_stats(connection, days)
+
+def apply_country_backfill(connection, located_rows):
+    """Count countries filled in after ingest; takes (timestamp, country) pairs (caller commits)"""
+    dimension_counts = Counter()
+    for timestamp, country in located_rows:
+        if country is None:
+            continue
+        for granularity in GRANULARITIES:
+            dimension_counts[(granularity, bucket_start(timestamp, granularity), 'country', country)] += 1
+    _increment_dimensions(connection, dimension_counts)
+
+def _top_value(connection, granularity, bucket, dimension):
+    table = attack_rollup_dimensions
+    return connection.execute(
+        select(table.c.value).where(
+            table.c.granularity == granularity,
+            table.c.bucket_start == bucket,
+            table.c.dimension == dimension
+        ).order_by(desc(table.c.count)).limit(1)
+    ).scalar()
+
+def _value_total(connection, granularity, bucket, dimension, values):
+    table = attack_rollup_dimensions
+    return connection.execute(
+        select(func.coalesce(func.sum(table.c.count), 0)).where(
+            table.c.granularity == granularity,
+            table.c.bucket_start == bucket,
+            table.c.dimension == dimension,
+            table.c.value.in_(values)
+        )
+    ).scalar()
+
+def refresh_daily_stats(connection, days):
+    """Copy the day rollups into HoneypotStats"""
+    for day in days:
+        rollup = connection.execute(
+            select(attack_rollups.c.attacks, attack_rollups.c.unique_ips).where(
+                attack_rollups.c.granularity == 'day',
+                attack_rollups.c.bucket_start == day
+            )
+        ).first()
+        if rollup is None:
+            continue
+
+        values = {
+            'total_attacks': rollup.attacks,
+            'unique_ips': rollup.unique_ips,
+            'successful_logins': _value_total(connection, 'day', day, 'attack_type', SUCCESSFUL_LOGINS),
+            'failed_logins': _value_total(connection, 'day', day, 'attack_type', FAILED_LOGINS),
+            'top_username': _top_value(connection, 'day', day, 'username'),
+            'top_password': _top_value(connection, 'day', day, 'password')
+        }
+        stats_id = connection.execute(
+            select(honeypot_stats.c.id).where(honeypot_stats.c.date == day.date())
+        ).scalar()
+        if stats_id is None:
+            connection.execute(insert(honeypot_stats).values(date=day.date(), **values))
+        else:
+            connection.execute(update(honeypot_stats).where(honeypot_stats.c.id == stats_id).values(**values))
+
+def rebuild_rollups(connection, chunk_size=10000):
+    """Recompute the rollups from attack_logs, walking the table in primary-key order
+
+    Only buckets from the day of the oldest row in attack_logs on are
+    recomputed: older ones count rows since archived or dropped with their
+    partitions (whole days), and are kept.
+    """
+    oldest = partitions.oldest_timestamp(connection)
+    if oldest is not None:
+        start = bucket_start(oldest, 'day')
+        connection.execute(delete(attack_rollup_dimensions).where(attack_rollup_dimensions.c.bucket_start >= start))
+        connection.execute(delete(attack_rollups).where(attack_rollups.c.bucket_start >= start))
+        connection.execute(delete(honeypot_stats).where(honeypot_stats.c.date >= start.date()))
+        connection.commit()
+
+    last_id = 0
+    total = 0
+    while True:
+        rows = connection.execute(
+            select(
+                attack_logs.c.id, attack_logs.c.timestamp, attack_logs.c.source_ip,
+                attack_logs.c.country, attack_logs.c.username, attack_logs.c.password,
+                attack_logs.c.attack_type
+            ).where(attack_logs.c.id > last_id).order_by(attack_logs.c.id).limit(chunk_size)
+        ).mappings().all()
+        if not rows:
+            break
+
+        apply_attack_rows(connection, [dict(row) for row in rows])
+        connection.commit()
+        last_id = rows[-1]['id']
+        total += len(rows)
+        logger.info(f"Rolled up {total} attack rows")
+
+    return total
+
+def covers_attack_logs(connection):
+    """True when the hour rollups hold the oldest and the newest row in attack_logs
+
+    False on a database that had rows before the rollups existed, or while
+    they were not kept up to date; 'flask backfill-rollups' fills them in.
+    """
+    oldest = partitions.oldest_timestamp(connection)
+    if oldest is None:
+        return True
+    newest = partitions.newest_timestamp(connection)
+    buckets = {bucket_start(oldest, 'hour'), bucket_start(newest, 'hour')}
+    found = connection.execute(
+        select(func.count()).select_from(attack_rollups).where(
+            attack_rollups.c.granularity == 'hour',
+            attack_rollups.c.bucket_start.in_(buckets)
+        )
+    ).scalar()
+    return found == len(buckets)
+
+def total_attacks(connection):
+    return connection.execute(
+        select(func.coalesce(func.sum(attack_rollups.c.attacks), 0)).where(attack_rollups.c.granularity == 'day')
+    ).scalar()
+
+def unique_ips(connection, since=None):
+    """Approximate distinct source IPs over all time, merged from the daily sketches, or since a
+    point in time from the hourly ones (including all of since's hour)"""
+    query = select(attack_rollups.c.ip_sketch)
+    if since is None:
+        query = query.where(attack_rollups.c.granularity == 'day')
+    else:
+        query = query.where(attack_rollups.c.granularity == 'hour',
+                            attack_rollups.c.bucket_start >= bucket_start(since, 'hour'))
+    merged = HyperLogLog()
+    for (sketch,) in connection.execute(query):
+        merged.merge(HyperLogLog.from_bytes(sketch))
+    return merged.count()
+
+def attacks_since(connection, since):
+    """Attacks since a point in time: whole hours from rollups plus an exact count for the first partial hour"""
+    edge = bucket_start(since, 'hour')
+    if edge < since:
+        edge += timedelta(hours=1)
+
+    whole_hours = connection.execute(
+        select(func.coalesce(func.sum(attack_rollups.c.attacks), 0)).where(
+            attack_rollups.c.granularity == 'hour',
+            attack_rollups.c.bucket_start >= edge
+        )
+    ).scalar()
+    return whole_hours + partitions.count_rows(connection, since, edge)
+
+def attack_counts(connection, granularity, since, until):
+    """(bucket_start, attacks) of the hour or day buckets starting in [since, until), oldest first"""
+    return connection.execute(
+        select(attack_rollups.c.bucket_start, attack_rollups.c.attacks).where(
+            attack_rollups.c.granularity == granularity,
+            attack_rollups.c.bucket_start >= since,
+            attack_rollups.c.bucket_start < until
+        ).order_by(attack_rollups.c.bucket_start)
+    ).all()
+
+def top_values(connection, dimension, limit=10):
+    """Most frequent values of a dimension over all time as (value, count) pairs"""
+    table = attack_rollup_dimensions
+    return connection.execute(
+        select(table.c.value, func.sum(table.c.count).label('count')).where(
+            table.c.granularity == 'day',
+            table.c.dimension == dimension
+        ).group_by(table.c.value).order_by(desc('count')).limit(limit)
+    ).all()
@@ -1,38 +1,109 @@
-from flask import render_template, jsonify, request
+from flask import render_template, jsonify, request, Response, stream_with_context, g, has_request_context
 from datetime import datetime, timedelta
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, and_, event
 from app import app, db
-from models import AttackLog, HoneypotStats
+from models import AttackLog
+import rollups
+import sketch_rollups
+import partitions
+import dimensions
+import timeseries
+from sketches import HyperLogLog
+from pagination import keyset_page
+from events import event_bus
+from response_cache import cached_response, response_cache
+from archive import attack_archive
+from recent_buffer import recent_buffer
+from metrics import metrics
+import json
 import logging
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
+# Rows fetched per round-trip when streaming large result sets
+STREAM_BATCH_SIZE = 1000
+
+# Seconds between keep-alive comments on idle live feeds
+LIVE_HEARTBEAT_INTERVAL = 15
+
+# Live feeds one process serves at once; each holds a worker thread while open
+LIVE_MAX_STREAMS = int(os.environ.get('LIVE_MAX_STREAMS', 50))
+
+REQUEST_SECONDS = metrics.histogram('http_request_seconds', 'Dashboard request time by endpoint', ['endpoint'])
+REQUEST_QUERIES = metrics.histogram('http_request_queries', 'SQL statements per dashboard request by endpoint',
+                                    ['endpoint'], buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100))
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.query_count = 0
+
+@app.teardown_request
+def record_request_metrics(exception):
+    """Streamed responses are timed (and their queries counted) up to the first chunk"""
+    # stream_with_context tears the request down a second time once the stream ends
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+    REQUEST_QUERIES.labels(endpoint).observe(g.query_count)
+
+def count_query(connection, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'query_count' in g:
+        g.query_count += 1
+
+if metrics.enabled:
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+
+def top_counts(query, column, limit, since=None):
+    """(value, count) pairs of a GROUP BY count query ordered by count, including archived rows"""
+    if attack_archive is None:
+        return query.limit(limit).all()
+    # Every hot-table group is needed to merge exactly with the archive's counts
+    return attack_archive.top_values(column, limit, hot_counts=query.all(), since=since, connection=db.session)
+
+def wants_approx():
+    """True when the request asked for sketch-based answers (?approx=true)"""
+    return request.args.get('approx', '').lower() in ('1', 'true', 'yes')
+
 @app.route('/')
 def index():
     """Main dashboard page"""
     try:
-        # Get recent statistics
-        total_attacks = db.session.query(AttackLog).count()
-        unique_ips = db.session.query(func.count(func.distinct(AttackLog.source_ip))).scalar()
-        
-        # Get attacks from last 24 hours
         yesterday = datetime.utcnow() - timedelta(days=1)
-        recent_attacks = db.session.query(AttackLog).filter(
-            AttackLog.timestamp >= yesterday
-        ).count()
-        
-        # Get top attacking countries
-        top_countries = db.session.query(
-            AttackLog.country,
-            func.count(AttackLog.id).label('count')
-        ).filter(
-            AttackLog.country.isnot(None)
-        ).group_by(AttackLog.country).order_by(desc('count')).limit(5).all()
+        
+        # The shared recent-attack buffer answers the 24h count when it reaches back that far
+        recent_attacks = recent_buffer.count_since(yesterday, count_between) if recent_buffer else None
+        
+        if rollups.ROLLUPS_ENABLED:
+            # Read the incrementally maintained rollups instead of scanning attack_logs
+            total_attacks = rollups.total_attacks(db.session)
+            unique_ips = rollups.unique_ips(db.session)
+            if recent_attacks is None:
+                recent_attacks = rollups.attacks_since(db.session, yesterday)
+            top_countries = rollups.top_values(db.session, 'country', limit=5)
+        else:
+            # Get recent statistics
+            total_attacks = db.session.query(AttackLog).count()
+            unique_ips = db.session.query(func.count(func.distinct(AttackLog.source_ip))).scalar()
+            
+            # Get attacks from last 24 hours
+            if recent_attacks is None:
+                recent_attacks = partitions.count_rows(db.session, yesterday)
+            
+            # Get top attacking countries
+            top_countries = dimensions.value_counts(db.session, 'country').limit(5).all()
         
         # Get recent attacks for the timeline
-        recent_logs = db.session.query(AttackLog).order_by(
-            desc(AttackLog.timestamp)
-        ).limit(10).all()
+        recent_logs = recent_buffer.recent(10) if recent_buffer else None
+        if recent_logs is None:
+            recent_logs = db.session.query(AttackLog).order_by(
+                desc(AttackLog.timestamp)
+            ).limit(10).all()
         
         stats = {
             'total_attacks': total_attacks,
@@ -47,22 +118,54 @@ def index():
         logger.error(f"Error loading dashboard: {e}")
         return render_template('index.html', stats={}, recent_logs=[], error=str(e))
 
+def count_between(start, end):
+    """Attacks in [start, end), for the edge of a window the recent buffer only counts per minute"""
+    return partitions.count_rows(db.session, start, end)
+
 @app.route('/logs')
 def logs():
-    """Attack logs page"""
+    """Attack logs page
+
+    Paginated by cursor (?before= / ?after=) rather than page number. ?count= picks
+    how the total is shown: 'estimate' (default), 'exact' or 'none'.
+    """
     try:
-        page = request.args.get('page', 1, type=int)
         per_page = 50
+        count_mode = request.args.get('count', 'estimate')
         
-        logs_query = db.session.query(AttackLog).order_by(desc(AttackLog.timestamp))
-        logs_pagination = logs_query.paginate(page=page, per_page=per_page, error_out=False)
+        logs_page = keyset_page(
+            db.session.query(AttackLog),
+            AttackLog,
+            per_page,
+            before=request.args.get('before'),
+            after=request.args.get('after')
+        )
         
-        return render_template('logs.html', logs=logs_pagination.items, pagination=logs_pagination)
+        if count_mode == 'exact':
+            logs_page.total = db.session.query(func.count(AttackLog.id)).scalar()
+        elif count_mode == 'estimate':
+            logs_page.total = estimate_attack_count()
+            logs_page.total_is_estimate = True
+        
+        return render_template('logs.html', logs=logs_page.items, pagination=logs_page, count_mode=count_mode)
         
     except Exception as e:
         logger.error(f"Error loading logs: {e}")
         return render_template('logs.html', logs=[], pagination=None, error=str(e))
 
+def estimate_attack_count():
+    """Cheap approximate row count of attack_logs that avoids a full COUNT(*)"""
+    if rollups.ROLLUPS_ENABLED:
+        return rollups.total_attacks(db.session)
+    if db.engine.dialect.name == 'postgresql':
+        estimate = db.session.execute(db.text(
+            "SELECT reltuples::bigint FROM pg_class WHERE relname = 'attack_logs'"
+        )).scalar()
+        if estimate and estimate > 0:
+            return estimate
+    # Ids are only ever appended, so their span bounds the row count
+    return db.session.query(func.coalesce(func.max(AttackLog.id) - func.min(AttackLog.id) + 1, 0)).scalar()
+
 @app.route('/analytics')
 def analytics():
     """Analytics and visualizations page"""
@@ -70,40 +173,110 @@ def analytics():
 
 @app.route('/api/attacks/recent')
 def api_recent_attacks():
-    """API endpoint for recent attacks data"""
+    """API endpoint for recent attacks data
+
+    Streamed from a server-side cursor so memory stays flat regardless of the
+    window size: a JSON array by default, or one object per line with
+    ?format=ndjson. ?limit= caps the number of rows. Windows the shared
+    recent-attack buffer covers are served from it without a query.
+    """
     try:
         hours = request.args.get('hours', 24, type=int)
+        limit = request.args.get('limit', type=int)
+        ndjson = request.args.get('format') == 'ndjson'
         since = datetime.utcnow() - timedelta(hours=hours)
         
-        attacks = db.session.query(AttackLog).filter(
-            AttackLog.timestamp >= since
-        ).order_by(desc(AttackLog.timestamp)).all()
+        session = None
+        attacks = recent_buffer.recent(limit, since=since) if recent_buffer else None
+        if attacks is None:
+            query = db.session.query(AttackLog).filter(
+                AttackLog.timestamp >= since
+            ).order_by(desc(AttackLog.timestamp), desc(AttackLog.id))
+            if limit:
+                query = query.limit(limit)
+            session = query.session
+            attacks = query.yield_per(STREAM_BATCH_SIZE)
+        
+        def generate():
+            try:
+                if ndjson:
+                    for attack in attacks:
+                        yield json.dumps(attack.to_dict()) + '\n'
+                    return
+                
+                separator = '['
+                for attack in attacks:
+                    yield separator + json.dumps(attack.to_dict())
+                    separator = ','
+                yield '[]' if separator == '[' else ']'
+            except Exception as e:
+                # Headers are already sent; the truncated body signals the failure
+                logger.error(f"Error streaming recent attacks: {e}")
+            finally:
+                # The view's session was removed before the stream started; iterating reopened it
+                if session is not None:
+                    session.close()
         
-        return jsonify([attack.to_dict() for attack in attacks])
+        mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+        return Response(stream_with_context(generate()), mimetype=mimetype)
         
     except Exception as e:
         logger.error(f"Error fetching recent attacks: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/live')
+def api_live():
+    """Server-Sent Events feed of newly ingested attacks and geolocation back-fills
+
+    Deltas are published once by the ingest pipeline and fanned out to every
+    connected dashboard, so open tabs add no database load. Each open stream
+    holds a worker thread, so serve the dashboard with threads or greenlets
+    (main.py's threaded server, gunicorn --worker-class gthread --threads N
+    or gevent); a sync worker would be tied up by a single tab. Past
+    LIVE_MAX_STREAMS per process the feed answers 503 and the dashboard
+    keeps polling.
+    """
+    if event_bus.get_stats()['subscribers'] >= LIVE_MAX_STREAMS:
+        return jsonify({'error': 'Too many live feeds open'}), 503
+    subscription = event_bus.subscribe()
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                message = subscription.get(timeout=LIVE_HEARTBEAT_INTERVAL)
+                # A comment line keeps proxies from closing idle connections
+                yield message if message is not None else ': keep-alive\n\n'
+        finally:
+            subscription.close()
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/attacks/by-hour')
+@cached_response('hours', 'resolution')
 def api_attacks_by_hour():
-    """API endpoint for attacks grouped by hour"""
+    """API endpoint for attacks over time
+
+    One point per bucket over the last ?hours=, empty buckets included.
+    ?resolution= is 1m, 5m, 1h (default), 1d or auto (the finest that fits);
+    long windows are downsampled to at most TIMESERIES_MAX_POINTS buckets.
+    Each point's 'hour' is the bucket start, whatever the resolution.
+    """
     try:
         hours = request.args.get('hours', 24, type=int)
-        since = datetime.utcnow() - timedelta(hours=hours)
+        resolution = request.args.get('resolution', '1h')
+        if resolution != 'auto' and resolution not in timeseries.RESOLUTIONS:
+            return jsonify({'error': f"Unknown resolution: {resolution}"}), 400
         
-        # Group attacks by hour
-        attacks_by_hour = db.session.query(
-            func.strftime('%Y-%m-%d %H:00:00', AttackLog.timestamp).label('hour'),
-            func.count(AttackLog.id).label('count')
-        ).filter(
-            AttackLog.timestamp >= since
-        ).group_by('hour').order_by('hour').all()
+        _, series = timeseries.attack_series(db.session, hours, resolution, archive=attack_archive)
         
         result = []
-        for hour, count in attacks_by_hour:
+        for bucket, count in series:
             result.append({
-                'hour': hour,
+                'hour': bucket.strftime('%Y-%m-%d %H:%M:%S'),
                 'count': count
             })
         
@@ -114,15 +287,23 @@ def api_attacks_by_hour():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/attacks/by-country')
+@cached_response('approx')
 def api_attacks_by_country():
-    """API endpoint for attacks grouped by country"""
+    """API endpoint for attacks grouped by country
+
+    With ?approx=true counts come from the top-k sketches and each carries its
+    largest possible overcount as 'error'.
+    """
     try:
-        attacks_by_country = db.session.query(
-            AttackLog.country,
-            func.count(AttackLog.id).label('count')
-        ).filter(
-            AttackLog.country.isnot(None)
-        ).group_by(AttackLog.country).order_by(desc('count')).limit(20).all()
+        if wants_approx():
+            top, _ = sketch_rollups.top_values(db.session, 'country', limit=20)
+            return jsonify([{'country': country, 'count': count, 'error': error}
+                            for country, count, error in top])
+        
+        if rollups.ROLLUPS_ENABLED:
+            attacks_by_country = rollups.top_values(db.session, 'country', limit=20)
+        else:
+            attacks_by_country = top_counts(dimensions.value_counts(db.session, 'country'), 'country', 20)
         
         result = []
         for country, count in attacks_by_country:
@@ -138,33 +319,91 @@ def api_attacks_by_country():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/attacks/map-data')
+@cached_response('limit', 'recent', 'zoom', 'precision')
 def api_map_data():
-    """API endpoint for map visualization data"""
+    """API endpoint for map visualization data
+
+    Aggregated in SQL so the payload is bounded by `limit` locations regardless of
+    table size. `zoom` (0-18) or `precision` (degrees) bins coordinates into a grid
+    for clustering; without either, attacks are grouped by exact coordinates.
+    """
     try:
-        # Get attacks with valid coordinates
-        attacks = db.session.query(AttackLog).filter(
+        limit = min(request.args.get('limit', 1000, type=int), 5000)
+        recent = min(request.args.get('recent', 5, type=int), 20)
+        zoom = request.args.get('zoom', type=int)
+        cell = request.args.get('precision', type=float)
+        if zoom is not None:
+            cell = 360.0 / (2 ** (min(max(zoom, 0), 18) + 3))
+        
+        # Grid cell (or exact coordinate) each attack belongs to; binned markers sit
+        # at the mean position of their attacks
+        if cell:
+            lat_key = func.round(AttackLog.latitude / cell)
+            lon_key = func.round(AttackLog.longitude / cell)
+            latitude = func.avg(AttackLog.latitude)
+            longitude = func.avg(AttackLog.longitude)
+        else:
+            lat_key = AttackLog.latitude
+            lon_key = AttackLog.longitude
+            latitude = func.min(AttackLog.latitude)
+            longitude = func.min(AttackLog.longitude)
+        
+        has_coordinates = and_(
             AttackLog.latitude.isnot(None),
             AttackLog.longitude.isnot(None),
             AttackLog.latitude != 0,
             AttackLog.longitude != 0
-        ).all()
+        )
+        
+        # Count per location, busiest first
+        locations = db.session.query(
+            lat_key.label('lat_key'),
+            lon_key.label('lon_key'),
+            func.count(AttackLog.id).label('count'),
+            latitude.label('latitude'),
+            longitude.label('longitude'),
+            func.min(AttackLog.country).label('country'),
+            func.min(AttackLog.city).label('city')
+        ).filter(has_coordinates).group_by('lat_key', 'lon_key').order_by(
+            desc('count')
+        ).limit(limit).subquery()
+        
+        # Latest attacks per location via a window function, kept only for the
+        # returned locations
+        ranked = db.session.query(
+            lat_key.label('lat_key'),
+            lon_key.label('lon_key'),
+            AttackLog.timestamp,
+            AttackLog.username,
+            AttackLog.source_ip,
+            func.row_number().over(
+                partition_by=(lat_key, lon_key),
+                order_by=desc(AttackLog.timestamp)
+            ).label('rank')
+        ).filter(has_coordinates).subquery()
+        
+        recent_attacks = db.session.query(ranked).join(
+            locations,
+            and_(ranked.c.lat_key == locations.c.lat_key, ranked.c.lon_key == locations.c.lon_key)
+        ).filter(
+            ranked.c.rank <= recent
+        ).order_by(ranked.c.rank).all()
         
-        # Group by coordinates to avoid overlapping markers
         location_counts = {}
-        for attack in attacks:
-            key = f"{attack.latitude},{attack.longitude}"
-            if key not in location_counts:
-                location_counts[key] = {
-                    'latitude': attack.latitude,
-                    'longitude': attack.longitude,
-                    'country': attack.country,
-                    'city': attack.city,
-                    'count': 0,
-                    'recent_attacks': []
-                }
-            location_counts[key]['count'] += 1
-            if len(location_counts[key]['recent_attacks']) < 5:
-                location_counts[key]['recent_attacks'].append({
+        for location in db.session.query(locations).order_by(desc(locations.c.count)):
+            location_counts[(location.lat_key, location.lon_key)] = {
+                'latitude': location.latitude,
+                'longitude': location.longitude,
+                'country': location.country,
+                'city': location.city,
+                'count': location.count,
+                'recent_attacks': []
+            }
+        
+        for attack in recent_attacks:
+            location = location_counts.get((attack.lat_key, attack.lon_key))
+            if location is not None:
+                location['recent_attacks'].append({
                     'timestamp': attack.timestamp.isoformat() if attack.timestamp else None,
                     'username': attack.username,
                     'source_ip': attack.source_ip
@@ -177,24 +416,26 @@ def api_map_data():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/top-credentials')
+@cached_response('approx')
 def api_top_credentials():
-    """API endpoint for most common usernames and passwords"""
+    """API endpoint for most common usernames and passwords (?approx=true reads the sketches)"""
     try:
-        # Top usernames
-        top_usernames = db.session.query(
-            AttackLog.username,
-            func.count(AttackLog.id).label('count')
-        ).filter(
-            AttackLog.username.isnot(None)
-        ).group_by(AttackLog.username).order_by(desc('count')).limit(10).all()
+        if wants_approx():
+            top_usernames, username_bound = sketch_rollups.top_values(db.session, 'username', limit=10)
+            top_passwords, password_bound = sketch_rollups.top_values(db.session, 'password', limit=10)
+            return jsonify({
+                'usernames': [{'username': u, 'count': c, 'error': e} for u, c, e in top_usernames],
+                'passwords': [{'password': p, 'count': c, 'error': e} for p, c, e in top_passwords],
+                'error_bounds': {'usernames': username_bound, 'passwords': password_bound}
+            })
         
-        # Top passwords
-        top_passwords = db.session.query(
-            AttackLog.password,
-            func.count(AttackLog.id).label('count')
-        ).filter(
-            AttackLog.password.isnot(None)
-        ).group_by(AttackLog.password).order_by(desc('count')).limit(10).all()
+        if rollups.ROLLUPS_ENABLED:
+            top_usernames = rollups.top_values(db.session, 'username', limit=10)
+            top_passwords = rollups.top_values(db.session, 'password', limit=10)
+        else:
+            # Grouped on the dimension ids when the database is normalized
+            top_usernames = top_counts(dimensions.value_counts(db.session, 'username'), 'username', 10)
+            top_passwords = top_counts(dimensions.value_counts(db.session, 'password'), 'password', 10)
         
         result = {
             'usernames': [{'username': u[0], 'count': u[1]} for u in top_usernames],
@@ -206,3 +447,60 @@ def api_top_credentials():
     except Exception as e:
         logger.error(f"Error fetching top credentials: {e}")
         return jsonify({'error': str(e)}), 500
+
+@app.route('/api/top-sources')
+@cached_response('hours', 'limit', 'approx')
+def api_top_sources():
+    """Most active source IPs and the number of distinct ones, over all time or the last ?hours=
+
+    ?approx=true answers from the top-k sketches and the rollups' HyperLogLogs:
+    counts carry their largest possible overcount and the distinct count its
+    relative standard error.
+    """
+    try:
+        hours = request.args.get('hours', type=int)
+        limit = min(request.args.get('limit', 10, type=int), 100)
+        since = datetime.utcnow() - timedelta(hours=hours) if hours else None
+        
+        if wants_approx():
+            top, error_bound = sketch_rollups.top_values(db.session, 'source_ip', limit=limit, since=since)
+            return jsonify({
+                'sources': [{'source_ip': ip, 'count': count, 'error': error} for ip, count, error in top],
+                'unique_ips': rollups.unique_ips(db.session, since=since),
+                'unique_ips_relative_error': HyperLogLog().relative_error,
+                'error_bound': error_bound
+            })
+        
+        top_query = db.session.query(AttackLog.source_ip, func.count(AttackLog.id).label('count'))
+        if since:
+            top_query = top_query.filter(AttackLog.timestamp >= since)
+        top_query = top_query.group_by(AttackLog.source_ip).order_by(desc('count'))
+        top = top_counts(top_query, 'source_ip', limit, since)
+        
+        if attack_archive is None:
+            unique_query = db.session.query(func.count(func.distinct(AttackLog.source_ip)))
+            if since:
+                unique_query = unique_query.filter(AttackLog.timestamp >= since)
+            unique_ips = unique_query.scalar()
+        else:
+            unique_ips = len({ip for ip, _ in top_query.all()} |
+                             attack_archive.value_counts('source_ip', since=since, connection=db.session).keys())
+        
+        return jsonify({
+            'sources': [{'source_ip': ip, 'count': count} for ip, count in top],
+            'unique_ips': unique_ips
+        })
+        
+    except Exception as e:
+        logger.error(f"Error fetching top sources: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape target: this process plus every other one exporting to METRICS_DIR"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/cache/stats')
+def api_cache_stats():
+    """Hit-rate counters of this worker's API response cache"""
+    return jsonify(response_cache.get_stats())
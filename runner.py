@@ -0,0 +1,263 @@
+"""Standalone multi-process honeypot listener.
+
+The supervisor starts N worker processes that each listen on every configured
+port with SO_REUSEPORT, so the kernel spreads incoming connections across them
+and each worker runs on its own core with its own GIL. Workers never write to
+the database: their write-behind queue forwards batches to the supervisor over
+one multiprocessing queue, and the supervisor is the only writer (and the only
+process running geo enrichment), so SQLite/PostgreSQL see one connection doing
+batched inserts however many workers there are. The supervisor restarts workers
+that die and sums the counters and metrics they report; --metrics-port serves
+the sum in the Prometheus format.
+
+Admission control runs inside each worker, so its thresholds apply per worker.
+
+    python runner.py --ports 22 2222 2022 --workers 4
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from honeypot import create_honeypot_server, get_host_key
+from ingest import attack_queue
+from enrichment import geo_enricher, ENRICHMENT_MODE
+from metrics import metrics, merge_snapshots, serve_metrics
+
+logger = logging.getLogger(__name__)
+
+class BatchForwarder:
+    """Ingest writer used in workers: hands each batch to the supervisor"""
+
+    def __init__(self, rows_queue, worker_id, timeout=5.0):
+        self.rows_queue = rows_queue
+        self.worker_id = worker_id
+        self.timeout = timeout
+
+    def __call__(self, rows):
+        # queue.Full propagates, so the worker's ingest queue counts the batch as failed
+        self.rows_queue.put(('rows', self.worker_id, rows), timeout=self.timeout)
+
+def run_worker(worker_id, ports, options, rows_queue, stats_interval, initializer=None):
+    """Worker process entry point: serve the ports until SIGTERM"""
+    # Ctrl-C reaches the whole process group; only the supervisor acts on it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+    if initializer:
+        initializer()
+
+    attack_queue.writer = BatchForwarder(rows_queue, worker_id)
+    attack_queue.spool = None  # the supervisor spools the rows it receives
+    server = create_honeypot_server(port=ports, reuse_port=True, geo_enrichment=False, **options)
+    stopped = threading.Event()
+
+    def report_stats():
+        while not stopped.wait(stats_interval):
+            rows_queue.put(('stats', worker_id, worker_stats(server)))
+
+    def shutdown(signum, frame):
+        stopped.set()
+        server.stop()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    threading.Thread(target=report_stats, name='worker-stats', daemon=True).start()
+    try:
+        server.start()
+    finally:
+        stopped.set()
+        rows_queue.put(('stats', worker_id, worker_stats(server)))
+
+def worker_stats(server):
+    return {'honeypot': server.get_stats(), 'ingest': attack_queue.get_stats(), 'metrics': metrics.snapshot()}
+
+def merge_stats(stats_list):
+    """Sum numeric counters across workers' stats dicts, recursing into nested dicts"""
+    merged = {}
+    for stats in stats_list:
+        for key, value in stats.items():
+            if isinstance(value, dict):
+                merged[key] = merge_stats([merged.get(key, {}), value])
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+            else:
+                merged.setdefault(key, value)
+    return merged
+
+class HoneypotSupervisor:
+    """Starts, watches and restarts honeypot worker processes, and writes the rows they forward"""
+
+    MIN_UPTIME = 10.0  # workers dying sooner than this are restarted with a growing delay
+
+    def __init__(self, ports, workers=None, options=None, stats_interval=5.0, log_interval=60.0,
+                 max_restart_delay=30.0, initializer=None, metrics_port=None):
+        self.ports = list(ports)
+        self.workers = workers or os.cpu_count() or 1
+        self.options = options or {}
+        self.stats_interval = stats_interval
+        self.log_interval = log_interval
+        self.max_restart_delay = max_restart_delay
+        self.initializer = initializer  # run first thing in every worker (must be picklable)
+
+        # Spawned rather than forked: the supervisor already runs threads when it restarts a worker
+        self.context = multiprocessing.get_context('spawn')
+        self.rows_queue = self.context.Queue(maxsize=1000)
+        self.processes = {}  # worker id -> Process
+        self.started_at = {}
+        self.restart_delay = {}
+        self.restart_at = {}
+        self.worker_stats = {}
+        self.worker_metrics = {}  # worker id -> latest metrics snapshot
+        self.retired_metrics = {}  # counters and histograms of workers that have been replaced
+        self.metrics_port = metrics_port
+        self.restarts = 0
+        self.rows_received = 0
+        self._stopped = threading.Event()
+        self._collector = None
+
+    def run(self):
+        """Run until stop() is called, then shut the workers down and flush their rows"""
+        get_host_key()  # generate it once here, not in N workers at the same time
+        attack_queue.start()
+        if ENRICHMENT_MODE != 'inline':
+            attack_queue.prepare = geo_enricher.fill_resolved
+            geo_enricher.start()
+        self._collector = threading.Thread(target=self._collect, name='row-collector', daemon=True)
+        self._collector.start()
+        metrics.add_collector(lambda: [self.retired_metrics, *self.worker_metrics.values()])
+        metrics.start_exporter()
+        if self.metrics_port:
+            serve_metrics(metrics, self.metrics_port)
+
+        for worker_id in range(self.workers):
+            self._start_worker(worker_id)
+        logger.info(f"Supervisor started {self.workers} worker(s) on port(s) {', '.join(map(str, self.ports))}")
+
+        next_log = time.monotonic() + self.log_interval
+        try:
+            while not self._stopped.wait(1.0):
+                self._check_workers()
+                if time.monotonic() >= next_log:
+                    next_log = time.monotonic() + self.log_interval
+                    self._log_stats()
+        finally:
+            self._shutdown()
+
+    def stop(self):
+        """Ask run() to return; safe to call from a signal handler"""
+        self._stopped.set()
+
+    def _start_worker(self, worker_id):
+        process = self.context.Process(
+            target=run_worker,
+            args=(worker_id, self.ports, self.options, self.rows_queue, self.stats_interval, self.initializer),
+            name=f'honeypot-worker-{worker_id}',
+            daemon=True
+        )
+        process.start()
+        self.processes[worker_id] = process
+        self.started_at[worker_id] = time.monotonic()
+
+    def _check_workers(self):
+        """Restart dead workers, backing off on ones that keep dying right after starting"""
+        now = time.monotonic()
+        for worker_id, process in self.processes.items():
+            if process.is_alive():
+                continue
+            if worker_id not in self.restart_at:
+                if now - self.started_at[worker_id] < self.MIN_UPTIME:
+                    delay = min(self.restart_delay.get(worker_id, 0.5) * 2, self.max_restart_delay)
+                else:
+                    delay = 0
+                self.restart_delay[worker_id] = delay
+                self.restart_at[worker_id] = now + delay
+                logger.warning(f"Worker {worker_id} exited with code {process.exitcode}, restarting in {delay:.0f}s")
+            if now >= self.restart_at[worker_id]:
+                del self.restart_at[worker_id]
+                retired = self.worker_metrics.pop(worker_id, None)
+                if retired:
+                    self.retired_metrics = merge_snapshots([self.retired_metrics, retired], gauges=False)
+                self.restarts += 1
+                self._start_worker(worker_id)
+
+    def _collect(self):
+        """Move forwarded rows into the supervisor's ingest queue and keep the latest worker counters"""
+        while True:
+            try:
+                kind, worker_id, payload = self.rows_queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopped.is_set() and not any(p.is_alive() for p in self.processes.values()):
+                    return
+                continue
+            except Exception as e:
+                logger.error(f"Failed to read from workers: {e}")
+                continue
+
+            if kind == 'stats':
+                self.worker_metrics[worker_id] = payload.pop('metrics')
+                self.worker_stats[worker_id] = payload
+                continue
+            self.rows_received += len(payload)
+            for row in payload:
+                attack_queue.submit(row)
+                if row.get('country') is None and ENRICHMENT_MODE != 'inline':
+                    geo_enricher.submit(row['source_ip'])
+
+    def _shutdown(self):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM: the worker stops accepting and flushes its rows
+        for process in self.processes.values():
+            process.join(15)
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop, killing it")
+                process.kill()
+                process.join()
+        self._collector.join(30)
+        attack_queue.stop()
+        geo_enricher.stop()
+        self._log_stats()
+        logger.info("Supervisor stopped")
+
+    def _log_stats(self):
+        stats = self.get_stats()
+        honeypot = stats['honeypot']
+        logger.info(f"Workers alive: {stats['workers_alive']}/{self.workers}, "
+                    f"sessions: {honeypot.get('total_sessions', 0)}, "
+                    f"rows written: {stats['ingest']['written']}, restarts: {self.restarts}")
+
+    def get_stats(self):
+        """Counters summed over the latest report of every worker, plus the supervisor's own"""
+        worker_stats = merge_stats(list(self.worker_stats.values()))
+        return {
+            'workers': self.workers,
+            'workers_alive': sum(p.is_alive() for p in self.processes.values()),
+            'restarts': self.restarts,
+            'rows_received': self.rows_received,
+            'honeypot': worker_stats.get('honeypot', {}),
+            'worker_ingest': worker_stats.get('ingest', {}),
+            'ingest': attack_queue.get_stats()
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the SSH honeypot as a multi-process listener')
+    parser.add_argument('--host', default=os.environ.get('HONEYPOT_HOST', '0.0.0.0'))
+    parser.add_argument('--ports', type=int, nargs='+',
+                        default=[int(p) for p in os.environ.get('HONEYPOT_PORTS', '2222').split(',')])
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('HONEYPOT_WORKERS', 0)) or None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--metrics-port', type=int, default=int(os.environ.get('METRICS_PORT', 0)) or None,
+                        help='serve Prometheus metrics on this port')
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+
+    supervisor = HoneypotSupervisor(args.ports, args.workers, options={'host': args.host},
+                                    metrics_port=args.metrics_port)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: supervisor.stop())
+    supervisor.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Table definitions, in plain SQLAlchemy Core.
+
+The dashboard maps its models (models.py) onto these tables; the sensor writes
+to them through storage.py without importing Flask.
+"""
+from datetime import datetime
+from sqlalchemy import (MetaData, Table, Column, Index, UniqueConstraint, Integer, String, Text, DateTime,
+                        Date, Float, LargeBinary, text)
+
+metadata = MetaData()
+
+attack_logs = Table(
+    'attack_logs', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('timestamp', DateTime, default=datetime.utcnow, nullable=False),
+    Column('source_ip', String(45), nullable=False),  # IPv6 compatible
+    Column('source_port', Integer, nullable=False),
+    Column('username', String(255), nullable=True),
+    Column('password', String(255), nullable=True),
+    Column('command', Text, nullable=True),
+    Column('session_id', String(64), nullable=True),
+    Column('attack_type', String(50), default='ssh_login', nullable=False),
+    Column('country', String(100), nullable=True),
+    Column('city', String(100), nullable=True),
+    Column('latitude', Float, nullable=True),
+    Column('longitude', Float, nullable=True),
+    Column('user_agent', String(500), nullable=True),
+    # Time-window filters and newest-first ordering
+    Index('ix_attack_logs_timestamp', 'timestamp'),
+    # Distinct/top source IPs, and per-IP history
+    Index('ix_attack_logs_source_ip_timestamp', 'source_ip', 'timestamp'),
+    # GROUP BY country/username/password (covering for count(*))
+    Index('ix_attack_logs_country', 'country'),
+    Index('ix_attack_logs_username', 'username'),
+    Index('ix_attack_logs_password', 'password'),
+    # Map aggregation only ever reads located rows
+    Index(
+        'ix_attack_logs_located', 'latitude', 'longitude', 'timestamp',
+        sqlite_where=text('latitude IS NOT NULL AND longitude IS NOT NULL'),
+        postgresql_where=text('latitude IS NOT NULL AND longitude IS NOT NULL')
+    ),
+    # A session's login and shell command rows, in order
+    Index('ix_attack_logs_session_id_timestamp', 'session_id', 'timestamp'),
+    # Rows still waiting for geolocation enrichment
+    Index(
+        'ix_attack_logs_pending_geo', 'source_ip',
+        sqlite_where=text('country IS NULL'),
+        postgresql_where=text('country IS NULL')
+    ),
+)
+
+honeypot_stats = Table(
+    'honeypot_stats', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('date', Date, default=datetime.utcnow().date, nullable=False, unique=True),
+    Column('total_attacks', Integer, default=0),
+    Column('unique_ips', Integer, default=0),
+    Column('successful_logins', Integer, default=0),
+    Column('failed_logins', Integer, default=0),
+    Column('top_username', String(255), nullable=True),
+    Column('top_password', String(255), nullable=True),
+)
+
+# Pre-aggregated attack counters per hour or day bucket
+attack_rollups = Table(
+    'attack_rollups', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('granularity', String(8), nullable=False),  # 'hour' or 'day'
+    Column('bucket_start', DateTime, nullable=False),
+    Column('attacks', Integer, default=0, nullable=False),
+    Column('unique_ips', Integer, default=0, nullable=False),  # HyperLogLog estimate
+    Column('ip_sketch', LargeBinary, nullable=True),
+    UniqueConstraint('granularity', 'bucket_start', name='uq_attack_rollups_bucket'),
+)
+
+# Pre-aggregated attack counts per country, username or password within a bucket
+attack_rollup_dimensions = Table(
+    'attack_rollup_dimensions', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('granularity', String(8), nullable=False),
+    Column('bucket_start', DateTime, nullable=False),
+    Column('dimension', String(16), nullable=False),  # 'country', 'username' or 'password'
+    Column('value', String(255), nullable=False),
+    Column('count', Integer, default=0, nullable=False),
+    UniqueConstraint('granularity', 'bucket_start', 'dimension', 'value',
+                     name='uq_attack_rollup_dimensions_value'),
+)
+
+# Mergeable top-k summaries (sketches.SpaceSaving) per dimension within a bucket
+attack_sketches = Table(
+    'attack_sketches', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('granularity', String(8), nullable=False),
+    Column('bucket_start', DateTime, nullable=False),
+    Column('dimension', String(16), nullable=False),  # 'country', 'username', 'password' or 'source_ip'
+    Column('sketch', LargeBinary, nullable=False),
+    UniqueConstraint('granularity', 'bucket_start', 'dimension', name='uq_attack_sketches_bucket'),
+)
+
+# Time partitions of attack_logs when it is partitioned (partitions.py), one row per partition
+attack_log_partitions = Table(
+    'attack_log_partitions', metadata,
+    Column('name', String(63), primary_key=True),
+    Column('range_start', DateTime, nullable=False, unique=True),
+    Column('range_end', DateTime, nullable=False),
+)
+
+# Next attack id for partitioned SQLite databases, whose partitions each number their own rows
+attack_log_ids = Table(
+    'attack_log_ids', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('next_id', Integer, nullable=False),
+)
+
+# Versioned schema changes applied by the migrate command
+schema_migrations = Table(
+    'schema_migrations', metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('description', String(255), nullable=False),
+    Column('applied_at', DateTime, default=datetime.utcnow, nullable=False),
+)
+
+# Tables of the optional normalized layout (dimensions.py), created only for databases that use it:
+# attack rows keep integer ids into one value table per repetitive text column
+dimension_metadata = MetaData()
+
+def _dimension_table(name, length):
+    return Table(
+        name, dimension_metadata,
+        Column('id', Integer, primary_key=True),
+        Column('value', String(length), nullable=False, unique=True),
+    )
+
+dimension_tables = {
+    'username': _dimension_table('attack_usernames', 255),
+    'password': _dimension_table('attack_passwords', 255),
+    'country': _dimension_table('attack_countries', 100),
+    'city': _dimension_table('attack_cities', 100),
+    'user_agent': _dimension_table('attack_user_agents', 500),
+}
+
+# attack_logs with the dimension columns as ids; attack_logs becomes a view joining them back
+attack_log_rows = Table(
+    'attack_log_rows', dimension_metadata,
+    Column('id', Integer, primary_key=True),
+    Column('timestamp', DateTime, default=datetime.utcnow, nullable=False),
+    Column('source_ip', String(45), nullable=False),
+    Column('source_port', Integer, nullable=False),
+    Column('username_id', Integer, nullable=True),
+    Column('password_id', Integer, nullable=True),
+    Column('command', Text, nullable=True),
+    Column('session_id', String(64), nullable=True),
+    Column('attack_type', String(50), default='ssh_login', nullable=False),
+    Column('country_id', Integer, nullable=True),
+    Column('city_id', Integer, nullable=True),
+    Column('latitude', Float, nullable=True),
+    Column('longitude', Float, nullable=True),
+    Column('user_agent_id', Integer, nullable=True),
+    # The attack_logs indexes, on the ids where attack_logs has strings
+    Index('ix_attack_log_rows_timestamp', 'timestamp'),
+    Index('ix_attack_log_rows_source_ip_timestamp', 'source_ip', 'timestamp'),
+    Index('ix_attack_log_rows_country_id', 'country_id'),
+    Index('ix_attack_log_rows_username_id', 'username_id'),
+    Index('ix_attack_log_rows_password_id', 'password_id'),
+    Index(
+        'ix_attack_log_rows_located', 'latitude', 'longitude', 'timestamp',
+        sqlite_where=text('latitude IS NOT NULL AND longitude IS NOT NULL'),
+        postgresql_where=text('latitude IS NOT NULL AND longitude IS NOT NULL')
+    ),
+    Index('ix_attack_log_rows_session_id_timestamp', 'session_id', 'timestamp'),
+    Index(
+        'ix_attack_log_rows_pending_geo', 'source_ip',
+        sqlite_where=text('country_id IS NULL'),
+        postgresql_where=text('country_id IS NULL')
+    ),
+)
@@ -0,0 +1,160 @@
+"""Approximate top-k counters per hour and day bucket.
+
+Ingest counts each batch exactly in memory; every flush_interval the counts are
+turned into SpaceSaving summaries and merged into attack_sketches, so the table
+holds at most capacity values per bucket and dimension however many distinct
+passwords arrive. Every process that writes attack rows merges into the same
+rows, and queries merge the buckets they span. Counts not yet flushed are lost
+if the process dies; `flask backfill-rollups` rebuilds everything.
+
+The approx=true mode of the dashboard endpoints reads these summaries (and the
+rollups' HyperLogLogs for distinct source IPs) and reports error bounds.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from sqlalchemy import select, insert, update, delete
+from schema import attack_logs, attack_sketches
+from sketches import SpaceSaving
+from rollups import GRANULARITIES, bucket_start
+
+logger = logging.getLogger(__name__)
+
+SKETCH_DIMENSIONS = ('country', 'username', 'password', 'source_ip')
+
+def merge_summaries(connection, summaries):
+    """Merge {(granularity, bucket, dimension): SpaceSaving} into attack_sketches (caller commits)"""
+    table = attack_sketches
+    for (granularity, bucket, dimension), summary in summaries.items():
+        stored = connection.execute(
+            select(table.c.id, table.c.sketch).where(
+                table.c.granularity == granularity,
+                table.c.bucket_start == bucket,
+                table.c.dimension == dimension
+            ).with_for_update()
+        ).first()
+        if stored is None:
+            connection.execute(insert(table).values(
+                granularity=granularity, bucket_start=bucket, dimension=dimension, sketch=summary.to_bytes()
+            ))
+        else:
+            merged = SpaceSaving.from_bytes(stored.sketch).merge(summary)
+            connection.execute(update(table).where(table.c.id == stored.id).values(sketch=merged.to_bytes()))
+
+class SketchAggregator:
+    """In-process exact counts per bucket and dimension, flushed to attack_sketches as summaries"""
+
+    def __init__(self, capacity=1000, flush_interval=10.0):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.pending = defaultdict(Counter)  # (granularity, bucket, dimension) -> value counts
+        self._lock = threading.Lock()
+        self._next_flush = time.monotonic() + flush_interval
+        self.flushes = 0
+
+    def update(self, rows):
+        """Count a batch of attack rows"""
+        with self._lock:
+            for row in rows:
+                timestamp = row.get('timestamp') or datetime.utcnow()
+                for granularity in GRANULARITIES:
+                    bucket = bucket_start(timestamp, granularity)
+                    for dimension in SKETCH_DIMENSIONS:
+                        value = row.get(dimension)
+                        if value is not None:
+                            self.pending[(granularity, bucket, dimension)][value] += 1
+
+    def update_countries(self, located_rows):
+        """Count countries filled in after ingest; takes (timestamp, country) pairs"""
+        with self._lock:
+            for timestamp, country in located_rows:
+                if country is None:
+                    continue
+                for granularity in GRANULARITIES:
+                    self.pending[(granularity, bucket_start(timestamp, granularity), 'country')][country] += 1
+
+    def flush_due(self):
+        return time.monotonic() >= self._next_flush
+
+    def flush(self, connection=None):
+        """Merge pending counts into attack_sketches; on a new transaction unless one is given"""
+        with self._lock:
+            pending, self.pending = self.pending, defaultdict(Counter)
+            self._next_flush = time.monotonic() + self.flush_interval
+        if not pending:
+            return
+        summaries = {key: SpaceSaving.from_counts(counts, self.capacity) for key, counts in pending.items()}
+        try:
+            if connection is not None:
+                merge_summaries(connection, summaries)
+            else:
+                # Imported on first use, like the ingest writer
+                from storage import storage
+                with storage.begin() as connection:
+                    merge_summaries(connection, summaries)
+            self.flushes += 1
+        except Exception:
+            # Keep the counts for the next flush rather than losing them
+            with self._lock:
+                for key, counts in pending.items():
+                    self.pending[key].update(counts)
+            raise
+
+def top_values(connection, dimension, limit=10, since=None):
+    """Approximate most frequent values as (value, count, error), plus the largest possible error
+
+    All time from the day summaries, or since a point in time from the hour
+    summaries (whole hours, so up to an hour earlier than since).
+    """
+    table = attack_sketches
+    query = select(table.c.sketch).where(table.c.dimension == dimension)
+    if since is None:
+        query = query.where(table.c.granularity == 'day')
+    else:
+        query = query.where(table.c.granularity == 'hour', table.c.bucket_start >= bucket_start(since, 'hour'))
+
+    summaries = [SpaceSaving.from_bytes(sketch) for (sketch,) in connection.execute(query)]
+    if not summaries:
+        return [], 0
+    merged = SpaceSaving.merge_all(summaries, max(summary.capacity for summary in summaries))
+    return merged.top(limit), merged.error_bound
+
+def rebuild_sketches(connection, chunk_size=10000, capacity=1000, flush_rows=1000000):
+    """Recompute attack_sketches from attack_logs, walking the table in primary-key order
+
+    Counts stay exact in memory for flush_rows rows at a time: fewer, larger
+    summaries are more accurate than merging one per chunk.
+    """
+    connection.execute(delete(attack_sketches))
+    connection.commit()
+
+    aggregator = SketchAggregator(capacity)
+    last_id = 0
+    total = 0
+    while True:
+        rows = connection.execute(
+            select(attack_logs.c.id, attack_logs.c.timestamp, *(attack_logs.c[d] for d in SKETCH_DIMENSIONS))
+            .where(attack_logs.c.id > last_id).order_by(attack_logs.c.id).limit(chunk_size)
+        ).mappings().all()
+        if not rows:
+            break
+        aggregator.update(rows)
+        last_id = rows[-1]['id']
+        total += len(rows)
+        if total % flush_rows < len(rows):
+            aggregator.flush(connection)
+            connection.commit()
+            logger.info(f"Sketched {total} attack rows")
+
+    aggregator.flush(connection)
+    connection.commit()
+    return total
+
+# Global instance
+sketch_aggregator = SketchAggregator(
+    capacity=int(os.environ.get('SKETCH_CAPACITY', 1000)),
+    flush_interval=float(os.environ.get('SKETCH_FLUSH_INTERVAL', 10.0))
+)
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import math
+import zlib
+
+# 2 ** -rank for every possible register value
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(65)]
+
+def hash64(value):
+    """Stable 64-bit hash, identical across processes (unlike hash())"""
+    if not isinstance(value, bytes):
+        value = str(value).encode('utf-8', errors='replace')
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+
+class HyperLogLog:
+    """HyperLogLog distinct counter; mergeable and serializable to a fixed-size byte string"""
+
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError(f"Expected {self.m} registers, got {len(self.registers)}")
+
+    @property
+    def relative_error(self):
+        """Standard error of count()"""
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, value):
+        h = hash64(value)
+        index = h >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        rest = h & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(map(_INVERSE_POWERS.__getitem__, self.registers))
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data:
+            return cls()
+        return cls(precision=data[0], registers=data[1:])
+
+    def __len__(self):
+        return self.count()
+
+class SpaceSaving:
+    """Mergeable top-k frequency summary in the Space-Saving family
+
+    Keeps at most capacity values with an upper-bound count and the most that
+    count can overstate the truth (error), so a value's real count lies in
+    [count - error, count]. A value not kept occurred at most floor times, and
+    no error exceeds total / capacity. Summaries are built from exact per-batch
+    counts and merged pairwise (a value missing from one side is charged that
+    side's floor), so any number of buckets or processes combine with the same
+    guarantee.
+    """
+
+    def __init__(self, capacity=1000, counts=None, errors=None, floor=0, total=0):
+        self.capacity = capacity
+        self.counts = counts or {}
+        self.errors = errors or {}
+        self.floor = floor
+        self.total = total
+
+    @classmethod
+    def from_counts(cls, counts, capacity=1000):
+        """Summary of exact counts ({value: count}), keeping the capacity most frequent"""
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+        kept = dict(ranked[:capacity])
+        floor = ranked[capacity][1] if len(ranked) > capacity else 0
+        return cls(capacity, kept, dict.fromkeys(kept, 0), floor, sum(counts.values()))
+
+    def update(self, counts):
+        """Fold exact counts of new occurrences into the summary"""
+        return self.merge(SpaceSaving.from_counts(counts, self.capacity))
+
+    def merge(self, other):
+        """Fold another summary into this one"""
+        merged = SpaceSaving.merge_all([self, other], self.capacity)
+        self.counts, self.errors, self.floor, self.total = merged.counts, merged.errors, merged.floor, merged.total
+        return self
+
+    @classmethod
+    def merge_all(cls, summaries, capacity=1000):
+        """One summary of many, in a single pass rather than pairwise"""
+        # A value missing from a summary is charged its floor: start everyone at the sum of floors
+        # and add what each summary holds above its own floor
+        base = sum(summary.floor for summary in summaries)
+        counts = {}
+        errors = {}
+        for summary in summaries:
+            floor = summary.floor
+            summary_errors = summary.errors
+            for value, count in summary.counts.items():
+                counts[value] = counts.get(value, base) + count - floor
+                errors[value] = errors.get(value, base) + summary_errors[value] - floor
+        floor = base
+        if len(counts) > capacity:
+            ranked = sorted(counts, key=counts.get, reverse=True)
+            floor = max(floor, counts[ranked[capacity]])
+            for value in ranked[capacity:]:
+                del counts[value]
+                del errors[value]
+        return cls(capacity, counts, errors, floor, sum(summary.total for summary in summaries))
+
+    def top(self, n=10):
+        """The n values with the highest counts as (value, count, error)"""
+        ranked = sorted(self.counts, key=lambda value: (-self.counts[value], value))[:n]
+        return [(value, self.counts[value], self.errors[value]) for value in ranked]
+
+    def estimate(self, value):
+        """(count, error) for any value; unknown values get (floor, floor)"""
+        return self.counts.get(value, self.floor), self.errors.get(value, self.floor)
+
+    @property
+    def error_bound(self):
+        """Largest possible overcount of any value"""
+        return max(self.floor, max(self.errors.values(), default=0))
+
+    def to_bytes(self):
+        values = list(self.counts)
+        return zlib.compress(json.dumps([
+            self.capacity, self.floor, self.total, values,
+            [self.counts[value] for value in values], [self.errors[value] for value in values]
+        ], separators=(',', ':')).encode(), 1)
+
+    @classmethod
+    def from_bytes(cls, data, capacity=1000):
+        if not data:
+            return cls(capacity)
+        capacity, floor, total, values, counts, errors = json.loads(zlib.decompress(data))
+        return cls(capacity, dict(zip(values, counts)), dict(zip(values, errors)), floor, total)
+
+    def __len__(self):
+        return len(self.counts)
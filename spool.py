@@ -0,0 +1,444 @@
+"""Durable on-disk spool between the ingest queue and the database.
+
+With INGEST_SPOOL_DIR set, each batch the write-behind queue flushes is
+appended to a segment file instead of going straight to the database, and a
+replayer thread bulk-loads what was appended into attack_logs. A slow or
+unreachable database then only grows the backlog on disk: nothing is dropped,
+and whatever is still spooled when the process stops is replayed on the next
+start.
+
+Segments are named by sequence number and hold length-prefixed records, one per
+appended batch: a (payload length, CRC-32) header and a payload of a row count
+followed by rows in a compact binary form (a fixed header with the numeric
+fields and string lengths, then the strings). The writer always starts a new segment when it opens, so
+a record torn by a crash is only ever at the end of a closed segment, where the
+replayer notices the bad length or checksum and skips the rest of that segment.
+Segments are read through mmap and removed once replayed. The replay position
+is kept in a checkpoint file; rows replayed again after a crash between the
+database commit and the checkpoint are skipped by their session_id (and
+timestamp), so replay is idempotent for every row that has a session.
+
+A batch the database refuses (a data error, as opposed to a lost connection)
+is split until the offending rows are isolated; those are appended to a
+reject file in the spool directory and replay moves past them.
+
+One process per spool directory.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.spool'
+CHECKPOINT_FILE = 'checkpoint'
+REJECT_FILE = 'rejected.jsonl'
+
+RECORD_HEADER = struct.Struct('<II')  # payload length, CRC-32 of the payload
+ROW_COUNT = struct.Struct('<I')
+
+# Fixed part of a spooled row: null flags, timestamp (microseconds since the epoch),
+# source_port, latitude, longitude, then the byte length of each TEXT_FIELDS value,
+# whose UTF-8 bytes follow. One unpack per row keeps replay scanning fast.
+ROW_HEADER = struct.Struct('<Bqidd3HI5H')
+TEXT_FIELDS = ['source_ip', 'username', 'password', 'command', 'session_id', 'attack_type',
+               'country', 'city', 'user_agent']
+TEXT_NULLS = [0xFFFF, 0xFFFF, 0xFFFF, 0xFFFFFFFF, 0xFFFF, 0xFFFF, 0xFFFF, 0xFFFF, 0xFFFF]
+NO_TIMESTAMP, NO_PORT, NO_LATITUDE, NO_LONGITUDE = 1, 2, 4, 8
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# Exceptions by which the database refuses the rows themselves, matched by class name so the
+# driver's own (psycopg2, sqlite3) and SQLAlchemy's wrappers of them both count
+DATA_ERRORS = ('DataError', 'IntegrityError')
+
+def is_data_error(error):
+    """Whether a failed write would fail again with the same rows; anything else (connection
+    loss, a locked database) is worth retrying unchanged"""
+    return isinstance(error, ValueError) or any(cls.__name__ in DATA_ERRORS for cls in type(error).__mro__)
+
+def encode_rows(rows):
+    """Serialize a batch of attack rows into one spool record payload"""
+    parts = [ROW_COUNT.pack(len(rows))]
+    for row in rows:
+        timestamp, port = row.get('timestamp'), row.get('source_port')
+        latitude, longitude = row.get('latitude'), row.get('longitude')
+        flags = ((timestamp is None) * NO_TIMESTAMP | (port is None) * NO_PORT |
+                 (latitude is None) * NO_LATITUDE | (longitude is None) * NO_LONGITUDE)
+        lengths = []
+        texts = []
+        for name, null in zip(TEXT_FIELDS, TEXT_NULLS):
+            value = row.get(name)
+            if value is None:
+                lengths.append(null)
+            else:
+                data = value.encode('utf-8', 'replace')[:null - 1]
+                lengths.append(len(data))
+                texts.append(data)
+        parts.append(ROW_HEADER.pack(
+            flags,
+            0 if timestamp is None else (timestamp - EPOCH) // MICROSECOND,
+            port or 0, latitude or 0.0, longitude or 0.0, *lengths
+        ))
+        parts.extend(texts)
+    return b''.join(parts)
+
+def decode_rows(buffer, offset=0):
+    """Rows of a record payload starting at offset in buffer (bytes or mmap)"""
+    count, = ROW_COUNT.unpack_from(buffer, offset)
+    offset += ROW_COUNT.size
+    rows = []
+    for _ in range(count):
+        flags, timestamp, port, latitude, longitude, *lengths = ROW_HEADER.unpack_from(buffer, offset)
+        offset += ROW_HEADER.size
+        row = {
+            'timestamp': None if flags & NO_TIMESTAMP else EPOCH + timestamp * MICROSECOND,
+            'source_port': None if flags & NO_PORT else port,
+            'latitude': None if flags & NO_LATITUDE else latitude,
+            'longitude': None if flags & NO_LONGITUDE else longitude
+        }
+        for name, length, null in zip(TEXT_FIELDS, lengths, TEXT_NULLS):
+            if length == null:
+                row[name] = None
+            else:
+                end = offset + length
+                row[name] = buffer[offset:end].decode('utf-8', 'replace')
+                offset = end
+        rows.append(row)
+    return rows
+
+def segment_path(directory, sequence):
+    return os.path.join(directory, f"{sequence:010d}{SEGMENT_SUFFIX}")
+
+def list_segments(directory):
+    """(sequence, path) of every segment in the directory, oldest first"""
+    segments = []
+    for name in os.listdir(directory):
+        if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit():
+            segments.append((int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(directory, name)))
+    return sorted(segments)
+
+def read_checkpoint(directory):
+    """Replay position (segment sequence, offset) saved in the directory; (0, 0) when there is none"""
+    try:
+        with open(os.path.join(directory, CHECKPOINT_FILE)) as f:
+            sequence, offset = f.read().split()
+        return int(sequence), int(offset)
+    except FileNotFoundError:
+        return 0, 0
+    except Exception as e:
+        logger.error(f"Unreadable spool checkpoint, replaying from the oldest segment: {e}")
+        return 0, 0
+
+def read_segment(path, offset=0):
+    """Yield (rows, end offset) for each intact record after offset, memory-mapping the file
+
+    Stops at the first incomplete or corrupt record; the caller compares the last
+    end offset with the file size to tell a clean end from a torn one.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= offset:
+            return
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as view:
+            while offset + RECORD_HEADER.size <= size:
+                length, checksum = RECORD_HEADER.unpack_from(view, offset)
+                start = offset + RECORD_HEADER.size
+                end = start + length
+                if end > size or zlib.crc32(view[start:end]) != checksum:
+                    return
+                yield decode_rows(view, start), end
+                offset = end
+
+class SpoolWriter:
+    """Appends record batches to the newest segment, rotating and fsyncing in batches
+
+    Each append() is one write() to the OS; fsync happens at most every
+    fsync_interval seconds (0 syncs every append), so a crash of the process
+    loses nothing and a crash of the machine loses at most that interval.
+    """
+
+    def __init__(self, directory, segment_size=64 * 1024 * 1024, fsync_interval=1.0):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._dirty = False
+        self._next_sync = 0.0
+        self.sequence = 0
+
+        # Counters
+        self.appended_rows = 0
+        self.appended_bytes = 0
+        self.syncs = 0
+        self.segments = 0
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if not self.sequence:
+            # Past every segment on disk and the checkpoint, which may point beyond removed ones
+            existing = list_segments(self.directory)
+            self.sequence = max(existing[-1][0] if existing else 0, read_checkpoint(self.directory)[0])
+        self.sequence += 1
+        self._file = open(segment_path(self.directory, self.sequence), 'ab', buffering=0)
+        self.segments += 1
+
+    def append(self, rows):
+        """Durably queue a batch of attack rows for the replayer"""
+        payload = encode_rows(rows)
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            elif self._file.tell() >= self.segment_size:
+                self._sync()
+                self._file.close()
+                self._open_segment()
+            self._file.write(record)
+            self._dirty = True
+            self.appended_rows += len(rows)
+            self.appended_bytes += len(record)
+            if time.monotonic() >= self._next_sync:
+                self._sync()
+
+    def _sync(self):
+        if self._dirty:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+            self.syncs += 1
+        self._next_sync = time.monotonic() + self.fsync_interval
+
+    def sync(self):
+        """fsync whatever was appended since the last sync"""
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+class SpoolReplayer:
+    """Loads spooled records into the database in batches, resuming from a checkpoint"""
+
+    def __init__(self, directory, writer, batch_size=5000, dedupe=True):
+        self.directory = directory
+        self.writer = writer
+        self.batch_size = batch_size
+        self.dedupe = dedupe
+        self.checkpoint_path = os.path.join(directory, CHECKPOINT_FILE)
+        self.reject_path = os.path.join(directory, REJECT_FILE)
+        self.position = read_checkpoint(directory)
+
+        # Counters
+        self.replayed = 0
+        self.duplicates = 0
+        self.batches = 0
+        self.corrupt_bytes = 0
+        self.rejected = 0
+
+    def _save_checkpoint(self, sequence, offset):
+        temporary = self.checkpoint_path + '.tmp'
+        with open(temporary, 'w') as f:
+            f.write(f"{sequence} {offset}\n")
+        os.replace(temporary, self.checkpoint_path)
+        self.position = sequence, offset
+
+    def replay(self, active_sequence=None):
+        """Write everything spooled after the checkpoint; returns the number of rows written
+
+        Segments older than active_sequence (or than the newest one) are complete:
+        they are deleted once replayed. Rows the database refuses are moved to the
+        reject file; other database errors propagate, leaving the checkpoint at the
+        last batch that was written.
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        segments = list_segments(self.directory)
+        if active_sequence is None and segments:
+            active_sequence = segments[-1][0]
+        written = 0
+        for sequence, path in segments:
+            if sequence < self.position[0]:
+                os.remove(path)  # replayed before a crash that came ahead of its removal
+                continue
+            offset = self.position[1] if sequence == self.position[0] else 0
+            batch = []
+            for rows, end in read_segment(path, offset):
+                batch.extend(rows)
+                offset = end
+                if len(batch) >= self.batch_size:
+                    written += self._write(batch, sequence, offset)
+                    batch = []
+            if batch:
+                written += self._write(batch, sequence, offset)
+            if sequence == active_sequence:
+                break
+            size = os.path.getsize(path)
+            if offset < size:
+                self.corrupt_bytes += size - offset
+                logger.warning(f"Skipped {size - offset} unreadable bytes at the end of spool segment {path}")
+            self._save_checkpoint(sequence + 1, 0)
+            os.remove(path)
+        return written
+
+    def _write(self, rows, sequence, offset):
+        if self.dedupe:
+            rows = self._skip_stored(rows)
+        written = self._write_rows(rows) if rows else 0
+        self._save_checkpoint(sequence, offset)
+        self.replayed += written
+        self.batches += 1
+        return written
+
+    def _write_rows(self, rows):
+        """Write rows, halving a refused batch until the rows the database rejects are isolated
+
+        Other errors propagate for the whole batch to be retried; the halves already
+        written by then are skipped as duplicates on the retry.
+        """
+        try:
+            self.writer(rows)
+            return len(rows)
+        except Exception as e:
+            if not is_data_error(e):
+                raise
+            if len(rows) == 1:
+                self._reject(rows[0], e)
+                return 0
+        half = len(rows) // 2
+        return self._write_rows(rows[:half]) + self._write_rows(rows[half:])
+
+    def _reject(self, row, error):
+        """Set a row aside in the reject file so the rows spooled after it still get replayed"""
+        reason = str(error).splitlines()[0] if str(error) else type(error).__name__
+        with open(self.reject_path, 'a') as f:
+            f.write(json.dumps({'error': reason, 'row': row}, default=str) + '\n')
+        self.rejected += 1
+        logger.error(f"Spooled attack row from {row.get('source_ip')} refused by the database, "
+                     f"moved to {self.reject_path}: {reason}")
+
+    def _skip_stored(self, rows):
+        """Drop rows whose (session_id, timestamp) is already in attack_logs"""
+        from storage import storage
+        stored = storage.stored_session_rows({row['session_id'] for row in rows if row['session_id']})
+        if not stored:
+            return rows
+        fresh = [row for row in rows if (row['session_id'], row['timestamp']) not in stored]
+        self.duplicates += len(rows) - len(fresh)
+        return fresh
+
+    def backlog_bytes(self):
+        """Spooled bytes not replayed yet"""
+        if not os.path.isdir(self.directory):
+            return 0
+        total = 0
+        for sequence, path in list_segments(self.directory):
+            if sequence >= self.position[0]:
+                total += os.path.getsize(path) - (self.position[1] if sequence == self.position[0] else 0)
+        return total
+
+class AttackSpool:
+    """Spool writer plus a background replayer thread; append() is the ingest queue's writer"""
+
+    def __init__(self, directory, writer, segment_size=64 * 1024 * 1024, fsync_interval=1.0,
+                 replay_batch_size=5000, retry_interval=1.0, max_retry_interval=60.0):
+        self.directory = directory
+        self.spool_writer = SpoolWriter(directory, segment_size, fsync_interval)
+        self.replayer = SpoolReplayer(directory, writer, replay_batch_size)
+        self.fsync_interval = fsync_interval
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.running = False
+        self.thread = None
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+        self.replay_failures = 0
+
+    def append(self, rows):
+        self.spool_writer.append(rows)
+        self._wake.set()
+
+    def start(self):
+        """Start the replayer thread, which first loads anything left over from earlier runs"""
+        with self._start_lock:
+            if self.running:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name='spool-replay', daemon=True)
+            self.thread.start()
+            logger.info(f"Attack spool started in {self.directory}")
+
+    def _replay(self):
+        """One replay pass; returns False after a database error other than refused rows"""
+        try:
+            self.replayer.replay(self.spool_writer.sequence or None)
+            return True
+        except Exception as e:
+            self.replay_failures += 1
+            logger.error(f"Spool replay failed, {self.replayer.backlog_bytes()} bytes waiting: {e}")
+            return False
+
+    def _run(self):
+        delay = self.retry_interval
+        while self.running:
+            self._wake.wait(self.fsync_interval or 1.0)
+            self._wake.clear()
+            self.spool_writer.sync()
+            if self._replay():
+                delay = self.retry_interval
+            elif self.running:
+                # Database down: back off instead of retrying on every append
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_interval)
+
+    def stop(self, timeout=30):
+        """Stop the replayer after a last pass; anything still spooled waits for the next start"""
+        if not self.running:
+            return
+        self.running = False
+        self._wake.set()
+        if self.thread:
+            self.thread.join(timeout)
+        self.spool_writer.close()
+        self._replay()
+        logger.info(f"Attack spool stopped ({self.replayer.replayed} rows replayed, "
+                    f"{self.replayer.backlog_bytes()} bytes left)")
+
+    def get_stats(self):
+        return {
+            'appended': self.spool_writer.appended_rows,
+            'appended_bytes': self.spool_writer.appended_bytes,
+            'syncs': self.spool_writer.syncs,
+            'segments': self.spool_writer.segments,
+            'replayed': self.replayer.replayed,
+            'duplicates_skipped': self.replayer.duplicates,
+            'corrupt_bytes': self.replayer.corrupt_bytes,
+            'rejected': self.replayer.rejected,
+            'replay_failures': self.replay_failures,
+            'backlog_bytes': self.replayer.backlog_bytes()
+        }
+
+def create_attack_spool(writer):
+    """Build the spool from environment settings; None unless INGEST_SPOOL_DIR is set"""
+    directory = os.environ.get('INGEST_SPOOL_DIR')
+    if not directory:
+        return None
+    return AttackSpool(
+        directory,
+        writer,
+        segment_size=int(os.environ.get('INGEST_SPOOL_SEGMENT_MB', 64)) * 1024 * 1024,
+        fsync_interval=float(os.environ.get('INGEST_SPOOL_FSYNC_INTERVAL', 1.0)),
+        replay_batch_size=int(os.environ.get('INGEST_SPOOL_REPLAY_BATCH', 5000))
+    )
@@ -0,0 +1,364 @@
+"""Pure-Python primitives for the SSH transport: X25519, Ed25519 signing,
+chacha20-poly1305@openssh.com and AES-CTR with HMAC.
+
+Speed is adequate for handshakes and login packets, which is all the honeypot
+ever encrypts; none of this is constant-time, which does not matter for a decoy.
+"""
+import hashlib
+import hmac
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+_P = 2 ** 255 - 19
+_MASK32 = 0xffffffff
+
+class MACError(Exception):
+    """Raised when a received packet fails integrity verification"""
+
+# --- X25519 (RFC 7748) ---
+
+def x25519(scalar, u_bytes):
+    """Montgomery ladder scalar multiplication on Curve25519"""
+    k = bytearray(scalar)
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    k = int.from_bytes(k, 'little')
+    x_1 = int.from_bytes(u_bytes, 'little') & ((1 << 255) - 1)
+    x_2, z_2, x_3, z_3 = 1, 0, x_1, 1
+    swap = 0
+    for t in range(254, -1, -1):
+        k_t = (k >> t) & 1
+        if swap ^ k_t:
+            x_2, x_3 = x_3, x_2
+            z_2, z_3 = z_3, z_2
+        swap = k_t
+        a = x_2 + z_2
+        aa = a * a % _P
+        b = x_2 - z_2
+        bb = b * b % _P
+        e = aa - bb
+        c = x_3 + z_3
+        d = x_3 - z_3
+        da = d * a % _P
+        cb = c * b % _P
+        x_3 = (da + cb) ** 2 % _P
+        z_3 = x_1 * (da - cb) ** 2 % _P
+        x_2 = aa * bb % _P
+        z_2 = e * (aa + 121665 * e) % _P
+    if swap:
+        x_2, z_2 = x_3, z_3
+    return (x_2 * pow(z_2, _P - 2, _P) % _P).to_bytes(32, 'little')
+
+X25519_BASE = (9).to_bytes(32, 'little')
+
+# --- Ed25519 signing (RFC 8032) ---
+
+_Q = 2 ** 252 + 27742317777372353535851937790883648493
+_D = -121665 * pow(121666, _P - 2, _P) % _P
+_SQRT_M1 = pow(2, (_P - 1) // 4, _P)
+
+def _point_add(p1, p2):
+    a = (p1[1] - p1[0]) * (p2[1] - p2[0]) % _P
+    b = (p1[1] + p1[0]) * (p2[1] + p2[0]) % _P
+    c = 2 * p1[3] * p2[3] * _D % _P
+    d = 2 * p1[2] * p2[2] % _P
+    e, f, g, h = b - a, d - c, d + c, b + a
+    return (e * f % _P, g * h % _P, f * g % _P, e * h % _P)
+
+def _point_mul(scalar, point):
+    result = (0, 1, 1, 0)
+    while scalar:
+        if scalar & 1:
+            result = _point_add(result, point)
+        point = _point_add(point, point)
+        scalar >>= 1
+    return result
+
+def _point_compress(point):
+    z_inv = pow(point[2], _P - 2, _P)
+    x = point[0] * z_inv % _P
+    y = point[1] * z_inv % _P
+    return (y | ((x & 1) << 255)).to_bytes(32, 'little')
+
+def _recover_x(y, sign):
+    x2 = (y * y - 1) * pow(_D * y * y + 1, _P - 2, _P)
+    x = pow(x2, (_P + 3) // 8, _P)
+    if (x * x - x2) % _P:
+        x = x * _SQRT_M1 % _P
+    if (x & 1) != sign:
+        x = _P - x
+    return x
+
+_G_Y = 4 * pow(5, _P - 2, _P) % _P
+_G_X = _recover_x(_G_Y, 0)
+_G = (_G_X, _G_Y, 1, _G_X * _G_Y % _P)
+
+def _sha512_mod_q(data):
+    return int.from_bytes(hashlib.sha512(data).digest(), 'little') % _Q
+
+class Ed25519PrivateKey:
+    """Ed25519 signing key derived from a 32-byte seed"""
+
+    def __init__(self, seed):
+        if len(seed) != 32:
+            raise ValueError("Ed25519 seed must be 32 bytes")
+        self.seed = seed
+        digest = hashlib.sha512(seed).digest()
+        scalar = int.from_bytes(digest[:32], 'little')
+        scalar &= (1 << 254) - 8
+        scalar |= 1 << 254
+        self._scalar = scalar
+        self._prefix = digest[32:]
+        self.public_key = _point_compress(_point_mul(scalar, _G))
+
+    def sign(self, message):
+        r = _sha512_mod_q(self._prefix + message)
+        encoded_r = _point_compress(_point_mul(r, _G))
+        h = _sha512_mod_q(encoded_r + self.public_key + message)
+        s = (r + h * self._scalar) % _Q
+        return encoded_r + s.to_bytes(32, 'little')
+
+def load_host_key(path):
+    """Load the persistent Ed25519 host key seed, creating it on first use
+
+    A stable key keeps the honeypot from presenting a new fingerprint on every restart.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return Ed25519PrivateKey(f.read())
+    except FileNotFoundError:
+        pass
+
+    seed = os.urandom(32)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(seed)
+        logger.info(f"Generated SSH host key {path}")
+    except OSError as e:
+        logger.error(f"Could not persist SSH host key to {path}, using an ephemeral key: {e}")
+    return Ed25519PrivateKey(seed)
+
+# --- ChaCha20 and Poly1305 ---
+
+def _rotl32(value, shift):
+    return ((value << shift) & _MASK32) | (value >> (32 - shift))
+
+def _chacha20_block(key_words, counter, nonce_words):
+    state = [0x61707865, 0x3320646e, 0x79622d32, 0x6b206574, *key_words,
+             counter & _MASK32, counter >> 32, *nonce_words]
+    x = list(state)
+    for _ in range(10):
+        for a, b, c, d in ((0, 4, 8, 12), (1, 5, 9, 13), (2, 6, 10, 14), (3, 7, 11, 15),
+                           (0, 5, 10, 15), (1, 6, 11, 12), (2, 7, 8, 13), (3, 4, 9, 14)):
+            x[a] = (x[a] + x[b]) & _MASK32
+            x[d] = _rotl32(x[d] ^ x[a], 16)
+            x[c] = (x[c] + x[d]) & _MASK32
+            x[b] = _rotl32(x[b] ^ x[c], 12)
+            x[a] = (x[a] + x[b]) & _MASK32
+            x[d] = _rotl32(x[d] ^ x[a], 8)
+            x[c] = (x[c] + x[d]) & _MASK32
+            x[b] = _rotl32(x[b] ^ x[c], 7)
+    return b''.join(((x[i] + state[i]) & _MASK32).to_bytes(4, 'little') for i in range(16))
+
+def _key_words(key):
+    return [int.from_bytes(key[i:i + 4], 'little') for i in range(0, 32, 4)]
+
+def _xor(data, keystream):
+    length = len(data)
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(keystream[:length], 'little')).to_bytes(length, 'little')
+
+def chacha20_xor(key_words, nonce, counter, data):
+    """Original (64-bit nonce, 64-bit counter) ChaCha20 as used by OpenSSH"""
+    nonce_words = [int.from_bytes(nonce[0:4], 'little'), int.from_bytes(nonce[4:8], 'little')]
+    blocks = (len(data) + 63) // 64
+    keystream = b''.join(_chacha20_block(key_words, counter + i, nonce_words) for i in range(blocks))
+    return _xor(data, keystream)
+
+def poly1305(key, message):
+    r = int.from_bytes(key[:16], 'little') & 0x0ffffffc0ffffffc0ffffffc0fffffff
+    s = int.from_bytes(key[16:32], 'little')
+    p = (1 << 130) - 5
+    accumulator = 0
+    for i in range(0, len(message), 16):
+        accumulator = (accumulator + int.from_bytes(bytes(message[i:i + 16]) + b'\x01', 'little')) * r % p
+    return ((accumulator + s) & ((1 << 128) - 1)).to_bytes(16, 'little')
+
+class ChaCha20Poly1305:
+    """chacha20-poly1305@openssh.com: the length and the rest of the packet use separate keys"""
+
+    block_size = 8
+    header_size = 4
+    mac_length = 16
+    aead = True
+
+    def __init__(self, key):
+        self.main_key = _key_words(key[:32])
+        self.header_key = _key_words(key[32:64])
+
+    def decrypt_length(self, sequence, header):
+        nonce = sequence.to_bytes(8, 'big')
+        return int.from_bytes(chacha20_xor(self.header_key, nonce, 0, bytes(header)), 'big')
+
+    def open(self, sequence, packet, tag):
+        """Verify and decrypt a whole packet (length field included); returns the plaintext after the length"""
+        nonce = sequence.to_bytes(8, 'big')
+        poly_key = _chacha20_block(self.main_key, 0, [int.from_bytes(nonce[0:4], 'little'),
+                                                      int.from_bytes(nonce[4:8], 'little')])
+        if not hmac.compare_digest(poly1305(poly_key, packet), bytes(tag)):
+            raise MACError("Poly1305 tag mismatch")
+        return chacha20_xor(self.main_key, nonce, 1, bytes(packet[4:]))
+
+    def seal(self, sequence, packet):
+        nonce = sequence.to_bytes(8, 'big')
+        encrypted = chacha20_xor(self.header_key, nonce, 0, packet[:4]) + chacha20_xor(self.main_key, nonce, 1, packet[4:])
+        poly_key = _chacha20_block(self.main_key, 0, [int.from_bytes(nonce[0:4], 'little'),
+                                                      int.from_bytes(nonce[4:8], 'little')])
+        return encrypted + poly1305(poly_key, encrypted)
+
+# --- AES (encryption direction only, which is all CTR mode needs) ---
+
+def _xtime(value):
+    value <<= 1
+    return value ^ 0x11b if value & 0x100 else value
+
+def _build_sbox():
+    sbox = [0] * 256
+    p = q = 1
+    while True:
+        p = p ^ _xtime(p)  # multiply by 3
+        q ^= q << 1  # divide by 3
+        q ^= q << 2
+        q ^= q << 4
+        q &= 0xff
+        if q & 0x80:
+            q ^= 0x09
+        rotated = q
+        affine = q
+        for _ in range(4):
+            rotated = ((rotated << 1) | (rotated >> 7)) & 0xff
+            affine ^= rotated
+        sbox[p] = affine ^ 0x63
+        if p == 1:
+            break
+    sbox[0] = 0x63
+    return sbox
+
+_SBOX = _build_sbox()
+_T0 = [(_xtime(s) << 24) | (s << 16) | (s << 8) | (_xtime(s) ^ s) for s in _SBOX]
+_T1 = [((t >> 8) | (t << 24)) & _MASK32 for t in _T0]
+_T2 = [((t >> 16) | (t << 16)) & _MASK32 for t in _T0]
+_T3 = [((t >> 24) | (t << 8)) & _MASK32 for t in _T0]
+
+def _sub_word(word):
+    return (_SBOX[word >> 24] << 24) | (_SBOX[(word >> 16) & 255] << 16) | \
+           (_SBOX[(word >> 8) & 255] << 8) | _SBOX[word & 255]
+
+class AES:
+    """AES-128/192/256 block encryption with T-tables"""
+
+    def __init__(self, key):
+        nk = len(key) // 4
+        if len(key) not in (16, 24, 32):
+            raise ValueError("AES key must be 16, 24 or 32 bytes")
+        self.rounds = nk + 6
+        words = [int.from_bytes(key[i:i + 4], 'big') for i in range(0, len(key), 4)]
+        rcon = 1
+        for i in range(nk, 4 * (self.rounds + 1)):
+            t = words[i - 1]
+            if i % nk == 0:
+                t = _sub_word(((t << 8) & _MASK32) | (t >> 24)) ^ (rcon << 24)
+                rcon = _xtime(rcon)
+            elif nk > 6 and i % nk == 4:
+                t = _sub_word(t)
+            words.append(words[i - nk] ^ t)
+        self.round_keys = words
+
+    def encrypt_block(self, block):
+        w = self.round_keys
+        value = int.from_bytes(block, 'big')
+        s0 = (value >> 96) ^ w[0]
+        s1 = ((value >> 64) & _MASK32) ^ w[1]
+        s2 = ((value >> 32) & _MASK32) ^ w[2]
+        s3 = (value & _MASK32) ^ w[3]
+        for r in range(1, self.rounds):
+            k = 4 * r
+            s0, s1, s2, s3 = (
+                _T0[s0 >> 24] ^ _T1[(s1 >> 16) & 255] ^ _T2[(s2 >> 8) & 255] ^ _T3[s3 & 255] ^ w[k],
+                _T0[s1 >> 24] ^ _T1[(s2 >> 16) & 255] ^ _T2[(s3 >> 8) & 255] ^ _T3[s0 & 255] ^ w[k + 1],
+                _T0[s2 >> 24] ^ _T1[(s3 >> 16) & 255] ^ _T2[(s0 >> 8) & 255] ^ _T3[s1 & 255] ^ w[k + 2],
+                _T0[s3 >> 24] ^ _T1[(s0 >> 16) & 255] ^ _T2[(s1 >> 8) & 255] ^ _T3[s2 & 255] ^ w[k + 3],
+            )
+        k = 4 * self.rounds
+        out = 0
+        for i, (a, b, c, d) in enumerate(((s0, s1, s2, s3), (s1, s2, s3, s0), (s2, s3, s0, s1), (s3, s0, s1, s2))):
+            word = (_SBOX[a >> 24] << 24) | (_SBOX[(b >> 16) & 255] << 16) | \
+                   (_SBOX[(c >> 8) & 255] << 8) | _SBOX[d & 255]
+            out = (out << 32) | (word ^ w[k + i])
+        return out.to_bytes(16, 'big')
+
+_MACS = {
+    'hmac-sha2-256': (hashlib.sha256, 32),
+    'hmac-sha1': (hashlib.sha1, 20),
+}
+
+class AESCTRHMAC:
+    """aes128-ctr / aes256-ctr with an encrypt-and-MAC HMAC, one instance per direction"""
+
+    block_size = 16
+    header_size = 16
+    aead = False
+
+    def __init__(self, key, iv, mac_key, mac_name):
+        self.aes = AES(key)
+        self.counter = int.from_bytes(iv, 'big')
+        self.digest, self.mac_length = _MACS[mac_name]
+        self.mac_key = mac_key[:self.mac_length]
+        self._first_block = None
+
+    def _keystream(self, length):
+        blocks = []
+        for _ in range(length // 16):
+            blocks.append(self.aes.encrypt_block(self.counter.to_bytes(16, 'big')))
+            self.counter = (self.counter + 1) & ((1 << 128) - 1)
+        return b''.join(blocks)
+
+    def _crypt(self, data):
+        if len(data) % 16:
+            raise ValueError("CTR data must be a multiple of the block size")
+        return _xor(data, self._keystream(len(data)))
+
+    def decrypt_length(self, sequence, header):
+        # The first block is decrypted exactly once; open() reuses it
+        self._first_block = self._crypt(bytes(header))
+        return int.from_bytes(self._first_block[:4], 'big')
+
+    def open(self, sequence, packet, tag):
+        plaintext = self._first_block + self._crypt(bytes(packet[16:]))
+        self._first_block = None
+        expected = hmac.new(self.mac_key, sequence.to_bytes(4, 'big') + plaintext, self.digest).digest()
+        if not hmac.compare_digest(expected, bytes(tag)):
+            raise MACError("HMAC mismatch")
+        return plaintext[4:]
+
+    def seal(self, sequence, packet):
+        mac = hmac.new(self.mac_key, sequence.to_bytes(4, 'big') + packet, self.digest).digest()
+        return self._crypt(packet) + mac
+
+# name -> (key length, IV length)
+CIPHERS = {
+    'chacha20-poly1305@openssh.com': (64, 0),
+    'aes128-ctr': (16, 16),
+    'aes256-ctr': (32, 16),
+}
+
+MAC_KEY_LENGTHS = {name: length for name, (_, length) in _MACS.items()}
+
+def create_cipher(name, key, iv, mac_name=None, mac_key=None):
+    """Instantiate a packet cipher for one direction from derived key material"""
+    if name == 'chacha20-poly1305@openssh.com':
+        return ChaCha20Poly1305(key)
+    return AESCTRHMAC(key, iv, mac_key, mac_name)
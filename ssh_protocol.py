@@ -0,0 +1,701 @@
+"""Incremental SSH transport parser and the server side of the handshake the honeypot speaks.
+
+SSHServerSession is sans-IO: feed it received bytes with receive() and write
+whatever it returns, so the threaded and asyncio honeypots, the benchmarks and
+the corpus replay all drive the same code. It negotiates real keys (curve25519
+key exchange, an ed25519 host key, chacha20-poly1305 or AES-CTR) so clients go
+on to send their actual credentials. These are refused, unless a shell is
+configured: then one password attempt is accepted and a single session channel
+is connected to the emulated shell.
+"""
+import base64
+import hashlib
+import logging
+import os
+from ssh_crypto import x25519, X25519_BASE, CIPHERS, MAC_KEY_LENGTHS, MACError, create_cipher
+
+logger = logging.getLogger(__name__)
+
+# Message numbers (RFC 4250)
+MSG_DISCONNECT = 1
+MSG_IGNORE = 2
+MSG_UNIMPLEMENTED = 3
+MSG_DEBUG = 4
+MSG_SERVICE_REQUEST = 5
+MSG_SERVICE_ACCEPT = 6
+MSG_EXT_INFO = 7
+MSG_KEXINIT = 20
+MSG_NEWKEYS = 21
+MSG_KEX_ECDH_INIT = 30
+MSG_KEX_ECDH_REPLY = 31
+MSG_USERAUTH_REQUEST = 50
+MSG_USERAUTH_FAILURE = 51
+MSG_USERAUTH_SUCCESS = 52
+MSG_GLOBAL_REQUEST = 80
+MSG_REQUEST_FAILURE = 82
+MSG_CHANNEL_OPEN = 90
+MSG_CHANNEL_OPEN_CONFIRMATION = 91
+MSG_CHANNEL_OPEN_FAILURE = 92
+MSG_CHANNEL_WINDOW_ADJUST = 93
+MSG_CHANNEL_DATA = 94
+MSG_CHANNEL_EXTENDED_DATA = 95
+MSG_CHANNEL_EOF = 96
+MSG_CHANNEL_CLOSE = 97
+MSG_CHANNEL_REQUEST = 98
+MSG_CHANNEL_SUCCESS = 99
+MSG_CHANNEL_FAILURE = 100
+
+DISCONNECT_PROTOCOL_ERROR = 2
+DISCONNECT_KEY_EXCHANGE_FAILED = 3
+DISCONNECT_MAC_ERROR = 5
+DISCONNECT_SERVICE_NOT_AVAILABLE = 7
+DISCONNECT_NO_MORE_AUTH_METHODS_AVAILABLE = 14
+
+OPEN_ADMINISTRATIVELY_PROHIBITED = 1
+
+KEXINIT_FIELDS = (
+    'kex_algorithms', 'server_host_key_algorithms',
+    'encryption_client_to_server', 'encryption_server_to_client',
+    'mac_client_to_server', 'mac_server_to_client',
+    'compression_client_to_server', 'compression_server_to_client',
+    'languages_client_to_server', 'languages_server_to_client'
+)
+
+# What the honeypot offers, in preference order
+SERVER_ALGORITHMS = {
+    'kex_algorithms': ['curve25519-sha256', 'curve25519-sha256@libssh.org'],
+    'server_host_key_algorithms': ['ssh-ed25519'],
+    'encryption_client_to_server': ['chacha20-poly1305@openssh.com', 'aes128-ctr', 'aes256-ctr'],
+    'encryption_server_to_client': ['chacha20-poly1305@openssh.com', 'aes128-ctr', 'aes256-ctr'],
+    'mac_client_to_server': ['hmac-sha2-256', 'hmac-sha1'],
+    'mac_server_to_client': ['hmac-sha2-256', 'hmac-sha1'],
+    'compression_client_to_server': ['none'],
+    'compression_server_to_client': ['none'],
+    'languages_client_to_server': [],
+    'languages_server_to_client': []
+}
+
+MAX_VERSION_LINE = 255
+MAX_PREAMBLE = 8192  # bytes of non-version lines tolerated before the version string
+MAX_PACKET_LENGTH = 35000  # RFC 4253 section 6.1
+
+# Channel flow control for the emulated shell
+CHANNEL_WINDOW = 65536
+CHANNEL_MAX_PACKET = 16384
+MAX_CHANNEL_BACKLOG = 262144  # output held back by the client's window before giving up
+
+class SSHProtocolError(Exception):
+    """Raised when the peer sends something that is not valid SSH"""
+
+# --- Encoding ---
+
+def encode_uint32(value):
+    return value.to_bytes(4, 'big')
+
+def encode_string(value):
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return len(value).to_bytes(4, 'big') + bytes(value)
+
+def encode_namelist(names):
+    return encode_string(','.join(names))
+
+def encode_mpint(value):
+    if value == 0:
+        return encode_uint32(0)
+    data = value.to_bytes((value.bit_length() + 8) // 8, 'big')  # leading zero keeps it positive
+    return encode_string(data)
+
+class SSHReader:
+    """Cursor over a packet payload; strings come back as memoryview slices, not copies"""
+
+    def __init__(self, data):
+        self.view = memoryview(data)
+        self.position = 0
+
+    def _take(self, length):
+        end = self.position + length
+        if end > len(self.view):
+            raise SSHProtocolError("Truncated message")
+        chunk = self.view[self.position:end]
+        self.position = end
+        return chunk
+
+    def read_byte(self):
+        return self._take(1)[0]
+
+    def read_bool(self):
+        return self.read_byte() != 0
+
+    def read_uint32(self):
+        return int.from_bytes(self._take(4), 'big')
+
+    def read_string(self):
+        return self._take(self.read_uint32())
+
+    def read_text(self):
+        return str(self.read_string(), 'utf-8', 'replace')
+
+    def read_namelist(self):
+        text = str(self.read_string(), 'ascii', 'replace')
+        return text.split(',') if text else []
+
+# --- Packet framing ---
+
+class SSHPacketBuffer:
+    """Incremental receive buffer: version line first, then binary packets
+
+    Received bytes accumulate in a single bytearray that is parsed in place through
+    memoryviews. Payloads of unencrypted packets are views into that buffer and stay
+    valid until the next feed(); decrypted payloads are necessarily new buffers.
+    """
+
+    def __init__(self, max_packet_length=MAX_PACKET_LENGTH):
+        self.max_packet_length = max_packet_length
+        self.buffer = bytearray()
+        self.offset = 0
+        self.cipher = None
+        self.sequence = 0
+        self._packet_length = None  # length of a packet whose header is decrypted but body incomplete
+
+    def feed(self, data):
+        try:
+            if self.offset:
+                del self.buffer[:self.offset]
+                self.offset = 0
+            self.buffer += data
+        except BufferError:
+            # A caller still holds a view of a previous payload; move to a fresh buffer
+            self.buffer = self.buffer[self.offset:] + data
+            self.offset = 0
+
+    @property
+    def pending(self):
+        return len(self.buffer) - self.offset
+
+    def read_line(self):
+        """Return the next CRLF/LF-terminated line without the terminator, or None if incomplete"""
+        end = self.buffer.find(b'\n', self.offset)
+        if end == -1:
+            if self.pending > MAX_PREAMBLE:
+                raise SSHProtocolError("No SSH version string received")
+            return None
+        line = bytes(self.buffer[self.offset:end]).rstrip(b'\r')
+        self.offset = end + 1
+        return line
+
+    def read_packet(self):
+        """Return the next payload as a memoryview, or None until a whole packet has arrived"""
+        available = self.pending
+        with memoryview(self.buffer) as view:
+            if self.cipher is None:
+                if available < 4:
+                    return None
+                packet_length = int.from_bytes(view[self.offset:self.offset + 4], 'big')
+                self._check_length(packet_length)
+                if available < 4 + packet_length:
+                    return None
+                body = view[self.offset + 4:self.offset + 4 + packet_length]
+                self.offset += 4 + packet_length
+            else:
+                cipher = self.cipher
+                if self._packet_length is None:
+                    if available < cipher.header_size:
+                        return None
+                    self._packet_length = cipher.decrypt_length(
+                        self.sequence, view[self.offset:self.offset + cipher.header_size])
+                    self._check_length(self._packet_length)
+                    aligned = self._packet_length if cipher.aead else 4 + self._packet_length
+                    if aligned % cipher.block_size:
+                        raise SSHProtocolError("Packet length is not a multiple of the cipher block size")
+                packet_end = self.offset + 4 + self._packet_length
+                if available < 4 + self._packet_length + cipher.mac_length:
+                    return None
+                try:
+                    body = memoryview(cipher.open(
+                        self.sequence, view[self.offset:packet_end],
+                        view[packet_end:packet_end + cipher.mac_length]))
+                except MACError as e:
+                    raise SSHProtocolError(str(e))
+                self.offset = packet_end + cipher.mac_length
+                self._packet_length = None
+
+        self.sequence = (self.sequence + 1) & 0xffffffff
+        padding_length = body[0]
+        if padding_length + 2 > len(body):
+            raise SSHProtocolError("Invalid padding length")  # also rejects an empty payload
+        return body[1:len(body) - padding_length]
+
+    def _check_length(self, packet_length):
+        if packet_length < 5 or packet_length > self.max_packet_length:
+            raise SSHProtocolError(f"Invalid packet length {packet_length}")
+
+class SSHPacketWriter:
+    """Frames (and once keys are active, encrypts) outgoing payloads"""
+
+    def __init__(self, random_bytes=os.urandom):
+        self.random_bytes = random_bytes
+        self.cipher = None
+        self.sequence = 0
+
+    def build(self, payload):
+        cipher = self.cipher
+        block_size = cipher.block_size if cipher else 8
+        # AEAD ciphers leave the length field out of the block alignment
+        aligned = 1 + len(payload) + (0 if cipher and cipher.aead else 4)
+        padding_length = block_size - aligned % block_size
+        if padding_length < 4:
+            padding_length += block_size
+        packet = (encode_uint32(1 + len(payload) + padding_length) + bytes([padding_length])
+                  + payload + self.random_bytes(padding_length))
+        if cipher:
+            packet = cipher.seal(self.sequence, packet)
+        self.sequence = (self.sequence + 1) & 0xffffffff
+        return packet
+
+# --- KEXINIT ---
+
+def build_kexinit(cookie, algorithms=SERVER_ALGORITHMS):
+    payload = bytes([MSG_KEXINIT]) + cookie
+    for field in KEXINIT_FIELDS:
+        payload += encode_namelist(algorithms[field])
+    return payload + b'\x00' + encode_uint32(0)
+
+def parse_kexinit(payload):
+    """Decode a KEXINIT payload into {field: [names]} plus first_kex_packet_follows"""
+    reader = SSHReader(payload)
+    if reader.read_byte() != MSG_KEXINIT:
+        raise SSHProtocolError("Expected KEXINIT")
+    reader._take(16)  # cookie
+    kexinit = {field: reader.read_namelist() for field in KEXINIT_FIELDS}
+    kexinit['first_kex_packet_follows'] = reader.read_bool()
+    return kexinit
+
+def negotiate(client, server=SERVER_ALGORITHMS):
+    """First client preference the server also supports, per RFC 4253 7.1; None where nothing matches"""
+    chosen = {}
+    for field in KEXINIT_FIELDS[:8]:
+        chosen[field] = next((name for name in client[field] if name in server[field]), None)
+    return chosen
+
+def hassh(kexinit):
+    """HASSH client fingerprint: MD5 of the offered kex;cipher;mac;compression lists"""
+    fingerprint = ';'.join(','.join(kexinit[field]) for field in (
+        'kex_algorithms', 'encryption_client_to_server',
+        'mac_client_to_server', 'compression_client_to_server'))
+    return hashlib.md5(fingerprint.encode()).hexdigest()
+
+def describe_client(version, kexinit, limit=500):
+    """One-line client identification for AttackLog.user_agent: version, HASSH and offered algorithms"""
+    parts = [version or 'unknown']
+    if kexinit:
+        parts.append(f"hassh={hassh(kexinit)}")
+        for label, field in (('kex', 'kex_algorithms'), ('hostkey', 'server_host_key_algorithms'),
+                             ('cipher', 'encryption_client_to_server'), ('mac', 'mac_client_to_server'),
+                             ('comp', 'compression_client_to_server')):
+            parts.append(f"{label}={','.join(kexinit[field])}")
+    return ' '.join(parts)[:limit]
+
+def key_fingerprint(key_blob):
+    """OpenSSH-style SHA256 fingerprint of a public key blob"""
+    digest = hashlib.sha256(bytes(key_blob)).digest()
+    return 'SHA256:' + base64.b64encode(digest).decode().rstrip('=')
+
+# --- Key exchange ---
+
+def compute_exchange_hash(client_version, server_version, client_kexinit, server_kexinit,
+                          host_key_blob, client_public, server_public, secret):
+    """Exchange hash H of the curve25519-sha256 key exchange (RFC 8731); secret is already an mpint"""
+    return hashlib.sha256(
+        encode_string(client_version) + encode_string(server_version)
+        + encode_string(client_kexinit) + encode_string(server_kexinit)
+        + encode_string(host_key_blob) + encode_string(client_public) + encode_string(server_public)
+        + secret
+    ).digest()
+
+def derive_ciphers(negotiated, secret, exchange_hash, session_identifier):
+    """Key derivation of RFC 4253 7.2, returning (client-to-server, server-to-client) ciphers"""
+    def derive(letter, length):
+        key = hashlib.sha256(secret + exchange_hash + letter + session_identifier).digest()
+        while len(key) < length:
+            key += hashlib.sha256(secret + exchange_hash + key).digest()
+        return key[:length]
+
+    ciphers = []
+    for direction, letters in (('client_to_server', b'ACE'), ('server_to_client', b'BDF')):
+        name = negotiated[f'encryption_{direction}']
+        mac_name = negotiated[f'mac_{direction}']
+        key_length, iv_length = CIPHERS[name]
+        mac_length = MAC_KEY_LENGTHS.get(mac_name, 0)
+        ciphers.append(create_cipher(
+            name,
+            derive(letters[1:2], key_length),
+            derive(letters[0:1], iv_length) if iv_length else None,
+            mac_name,
+            derive(letters[2:3], mac_length) if mac_length else None
+        ))
+    return ciphers
+
+# --- Server session ---
+
+class SSHServerSession:
+    """Server side of one SSH connection: handshake, user authentication and optionally a shell channel
+
+    shell_factory(username, interactive) must return an object with start(),
+    feed(data), execute(command) (each returning bytes to send), closed and
+    exit_status; accept_password_attempt is the password attempt number that
+    succeeds (ignored without a shell_factory).
+    """
+
+    def __init__(self, host_key, server_version='SSH-2.0-OpenSSH_7.4', max_password_attempts=3,
+                 max_auth_requests=20, random_bytes=os.urandom, shell_factory=None,
+                 accept_password_attempt=1):
+        self.host_key = host_key
+        self.server_version = server_version
+        self.max_password_attempts = max_password_attempts
+        self.max_auth_requests = max_auth_requests
+        self.random_bytes = random_bytes
+        self.shell_factory = shell_factory
+        self.accept_password_attempt = accept_password_attempt if shell_factory else None
+
+        self.reader = SSHPacketBuffer()
+        self.writer = SSHPacketWriter(random_bytes)
+        self.state = 'version'
+        self.server_kexinit = build_kexinit(random_bytes(16))
+        self.client_kexinit_payload = None
+        self.session_identifier = None
+        self._pending_keys = None
+        self._ignore_next_packet = False
+
+        # What the client revealed
+        self.client_version = None
+        self.client_kexinit = None
+        self.negotiated = None
+        self.auth_attempts = []  # dicts: method, username, password, key_type, key_fingerprint
+        self.password_attempts = 0
+        self.packets = 0
+        self.closed = False
+        self.error = None
+
+        # Session channel, once authenticated
+        self.username = None
+        self.shell = None
+        self.channel = None  # client's channel number
+        self.pty = False
+        self.local_window = CHANNEL_WINDOW
+        self.remote_window = 0
+        self.remote_max_packet = 0
+        self._backlog = bytearray()  # shell output waiting for window space
+        self._close_when_drained = False
+        self._channel_closing = False
+
+    def start(self):
+        """Bytes to send as soon as the connection is accepted: version line and KEXINIT"""
+        return self.server_version.encode() + b'\r\n' + self.writer.build(self.server_kexinit)
+
+    def receive(self, data):
+        """Consume received bytes and return the bytes to send back"""
+        if self.closed:
+            return b''
+        self.reader.feed(data)
+        output = []
+        try:
+            if self.state == 'version':
+                if not self._read_version(output):
+                    return b''.join(output)
+            while not self.closed:
+                payload = self.reader.read_packet()
+                if payload is None:
+                    break
+                self.packets += 1
+                try:
+                    self._dispatch(payload, output)
+                finally:
+                    payload.release()
+        except SSHProtocolError as e:
+            self.error = str(e)
+            self._disconnect(output, DISCONNECT_PROTOCOL_ERROR, 'Protocol error')
+        return b''.join(output)
+
+    def _read_version(self, output):
+        while True:
+            line = self.reader.read_line()
+            if line is None:
+                return False
+            if line.startswith(b'SSH-'):
+                break
+            # RFC 4253 4.2 allows other lines before the version string
+
+        self.client_version = line[:MAX_VERSION_LINE].decode('utf-8', 'replace')
+        if not (line.startswith(b'SSH-2.0-') or line.startswith(b'SSH-1.99-')):
+            self.closed = True
+            raise SSHProtocolError(f"Unsupported protocol version {self.client_version!r}")
+        self.state = 'kexinit'
+        return True
+
+    def _dispatch(self, payload, output):
+        message = payload[0]
+        if self._ignore_next_packet:
+            # The client guessed a different key exchange and sent its first packet early
+            self._ignore_next_packet = False
+            return
+        if message in (MSG_IGNORE, MSG_DEBUG, MSG_UNIMPLEMENTED):
+            return
+        if message == MSG_DISCONNECT:
+            self.closed = True
+            return
+
+        handler = {
+            'kexinit': self._on_kexinit,
+            'kex': self._on_kex_ecdh_init,
+            'newkeys': self._on_newkeys,
+            'service': self._on_service_request,
+            'userauth': self._on_userauth_request,
+            'connection': self._on_connection_message,
+        }[self.state]
+        handler(message, payload, output)
+
+    def _expect(self, message, expected):
+        if message != expected:
+            raise SSHProtocolError(f"Unexpected message {message} in state {self.state}")
+
+    def _on_kexinit(self, message, payload, output):
+        self._expect(message, MSG_KEXINIT)
+        self.client_kexinit_payload = bytes(payload)
+        self.client_kexinit = parse_kexinit(payload)
+        self.negotiated = negotiate(self.client_kexinit)
+        missing = [field for field, name in self.negotiated.items()
+                   if name is None and not (field.startswith('mac_') and self._aead(field))]
+        if missing:
+            self.error = f"No common algorithm for {', '.join(missing)}"
+            self._disconnect(output, DISCONNECT_KEY_EXCHANGE_FAILED, 'No matching algorithms')
+            return
+
+        if self.client_kexinit['first_kex_packet_follows']:
+            guessed = (self.client_kexinit['kex_algorithms'][:1] == [self.negotiated['kex_algorithms']] and
+                       self.client_kexinit['server_host_key_algorithms'][:1] ==
+                       [self.negotiated['server_host_key_algorithms']])
+            self._ignore_next_packet = not guessed
+        self.state = 'kex'
+
+    def _aead(self, mac_field):
+        cipher_field = mac_field.replace('mac_', 'encryption_')
+        return self.negotiated.get(cipher_field) == 'chacha20-poly1305@openssh.com'
+
+    def _on_kex_ecdh_init(self, message, payload, output):
+        self._expect(message, MSG_KEX_ECDH_INIT)
+        client_public = bytes(SSHReader(payload[1:]).read_string())
+        if len(client_public) != 32:
+            raise SSHProtocolError("Invalid curve25519 public key")
+
+        private = self.random_bytes(32)
+        server_public = x25519(private, X25519_BASE)
+        shared = x25519(private, client_public)
+        if shared == bytes(32):
+            raise SSHProtocolError("Degenerate curve25519 shared secret")
+        secret = encode_mpint(int.from_bytes(shared, 'big'))
+
+        host_key_blob = encode_string('ssh-ed25519') + encode_string(self.host_key.public_key)
+        exchange_hash = compute_exchange_hash(
+            self.client_version, self.server_version, self.client_kexinit_payload, self.server_kexinit,
+            host_key_blob, client_public, server_public, secret)
+        if self.session_identifier is None:
+            self.session_identifier = exchange_hash
+        signature = encode_string('ssh-ed25519') + encode_string(self.host_key.sign(exchange_hash))
+
+        output.append(self.writer.build(
+            bytes([MSG_KEX_ECDH_REPLY]) + encode_string(host_key_blob)
+            + encode_string(server_public) + encode_string(signature)))
+        output.append(self.writer.build(bytes([MSG_NEWKEYS])))
+
+        incoming, outgoing = derive_ciphers(self.negotiated, secret, exchange_hash, self.session_identifier)
+        self.writer.cipher = outgoing
+        self._pending_keys = incoming
+        self.state = 'newkeys'
+
+    def _on_newkeys(self, message, payload, output):
+        self._expect(message, MSG_NEWKEYS)
+        self.reader.cipher = self._pending_keys
+        self._pending_keys = None
+        self.state = 'service'
+
+    def _on_service_request(self, message, payload, output):
+        if message == MSG_EXT_INFO:
+            return
+        self._expect(message, MSG_SERVICE_REQUEST)
+        service = SSHReader(payload[1:]).read_text()
+        if service != 'ssh-userauth':
+            self._disconnect(output, DISCONNECT_SERVICE_NOT_AVAILABLE, 'Service not available')
+            return
+        output.append(self.writer.build(bytes([MSG_SERVICE_ACCEPT]) + encode_string(service)))
+        self.state = 'userauth'
+
+    def _on_userauth_request(self, message, payload, output):
+        if message != MSG_USERAUTH_REQUEST:
+            # Anything else before authentication is refused the way OpenSSH does
+            output.append(self.writer.build(bytes([MSG_UNIMPLEMENTED]) + encode_uint32(self.reader.sequence - 1)))
+            return
+
+        reader = SSHReader(payload[1:])
+        username = reader.read_text()
+        reader.read_string()  # service, always ssh-connection
+        method = reader.read_text()
+
+        attempt = None
+        if method == 'password':
+            reader.read_bool()  # password change request flag
+            attempt = {'method': 'password', 'username': username, 'password': reader.read_text()}
+            self.password_attempts += 1
+        elif method == 'publickey':
+            reader.read_bool()  # whether a signature is attached
+            key_type = reader.read_text()
+            attempt = {
+                'method': 'publickey',
+                'username': username,
+                'key_type': key_type,
+                'key_fingerprint': key_fingerprint(reader.read_string())
+            }
+        if attempt:
+            self.auth_attempts.append(attempt)
+
+        if method == 'password' and self.password_attempts == self.accept_password_attempt:
+            attempt['accepted'] = True
+            self.username = username
+            output.append(self.writer.build(bytes([MSG_USERAUTH_SUCCESS])))
+            self.state = 'connection'
+            return
+        if (self.password_attempts >= self.max_password_attempts or
+                len(self.auth_attempts) >= self.max_auth_requests):
+            self._disconnect(output, DISCONNECT_NO_MORE_AUTH_METHODS_AVAILABLE, 'Too many authentication failures')
+            return
+        output.append(self.writer.build(
+            bytes([MSG_USERAUTH_FAILURE]) + encode_namelist(['publickey', 'password']) + b'\x00'))
+
+    def _on_connection_message(self, message, payload, output):
+        reader = SSHReader(payload[1:])
+        if message == MSG_GLOBAL_REQUEST:
+            reader.read_string()  # keepalive@openssh.com, no-more-sessions@openssh.com, ...
+            if reader.read_bool():
+                output.append(self.writer.build(bytes([MSG_REQUEST_FAILURE])))
+        elif message == MSG_CHANNEL_OPEN:
+            self._on_channel_open(reader, output)
+        elif message in (MSG_KEXINIT, MSG_USERAUTH_REQUEST, MSG_SERVICE_REQUEST):
+            raise SSHProtocolError(f"Unsupported message {message} after authentication")
+        elif message < MSG_CHANNEL_WINDOW_ADJUST or message > MSG_CHANNEL_FAILURE:
+            output.append(self.writer.build(bytes([MSG_UNIMPLEMENTED]) + encode_uint32(self.reader.sequence - 1)))
+        elif self.channel is not None and (not self._channel_closing or message == MSG_CHANNEL_CLOSE):
+            reader.read_uint32()  # recipient channel; there is only ever ours
+            {
+                MSG_CHANNEL_WINDOW_ADJUST: self._on_window_adjust,
+                MSG_CHANNEL_DATA: self._on_channel_data,
+                MSG_CHANNEL_EXTENDED_DATA: lambda reader, output: None,
+                MSG_CHANNEL_EOF: self._on_channel_eof,
+                MSG_CHANNEL_CLOSE: self._on_channel_close,
+                MSG_CHANNEL_REQUEST: self._on_channel_request,
+                MSG_CHANNEL_SUCCESS: lambda reader, output: None,
+                MSG_CHANNEL_FAILURE: lambda reader, output: None,
+            }[message](reader, output)
+
+    def _on_channel_open(self, reader, output):
+        channel_type = reader.read_text()
+        sender = reader.read_uint32()
+        if channel_type != 'session' or self.channel is not None:
+            # Port forwarding (direct-tcpip) and further sessions are refused
+            output.append(self.writer.build(
+                bytes([MSG_CHANNEL_OPEN_FAILURE]) + encode_uint32(sender)
+                + encode_uint32(OPEN_ADMINISTRATIVELY_PROHIBITED) + encode_string('open failed')
+                + encode_string('')))
+            return
+        self.channel = sender
+        self.remote_window = reader.read_uint32()
+        self.remote_max_packet = max(1, min(reader.read_uint32(), CHANNEL_MAX_PACKET))
+        output.append(self.writer.build(
+            bytes([MSG_CHANNEL_OPEN_CONFIRMATION]) + encode_uint32(sender) + encode_uint32(0)
+            + encode_uint32(CHANNEL_WINDOW) + encode_uint32(CHANNEL_MAX_PACKET)))
+
+    def _on_channel_request(self, reader, output):
+        request = reader.read_text()
+        want_reply = reader.read_bool()
+        ok = False
+        data = b''
+        if request == 'pty-req' and self.shell is None:
+            self.pty = ok = True
+        elif request in ('env', 'window-change', 'x11-req', 'auth-agent-req@openssh.com'):
+            ok = True
+        elif request in ('shell', 'exec') and self.shell is None:
+            self.shell = self.shell_factory(self.username, self.pty)
+            if request == 'shell':
+                data = self.shell.start()
+            else:
+                data = self.shell.execute(reader.read_text())
+            ok = True
+
+        if want_reply:
+            reply = MSG_CHANNEL_SUCCESS if ok else MSG_CHANNEL_FAILURE
+            output.append(self.writer.build(bytes([reply]) + encode_uint32(self.channel)))
+        if data:
+            self._send_data(data, output)
+        if request == 'exec' and ok:
+            self._close_channel(output)
+
+    def _on_channel_data(self, reader, output):
+        data = reader.read_string()
+        if len(data) > self.local_window:
+            raise SSHProtocolError("Channel data exceeds the window")
+        self.local_window -= len(data)
+        if self.local_window < CHANNEL_WINDOW // 2:
+            output.append(self.writer.build(
+                bytes([MSG_CHANNEL_WINDOW_ADJUST]) + encode_uint32(self.channel)
+                + encode_uint32(CHANNEL_WINDOW - self.local_window)))
+            self.local_window = CHANNEL_WINDOW
+        if self.shell is None:
+            return
+        self._send_data(self.shell.feed(bytes(data)), output)
+        if self.shell.closed:
+            self._close_channel(output)
+
+    def _on_window_adjust(self, reader, output):
+        self.remote_window = min(self.remote_window + reader.read_uint32(), 0xffffffff)
+        self._send_data(b'', output)
+
+    def _on_channel_eof(self, reader, output):
+        self._close_channel(output)
+
+    def _on_channel_close(self, reader, output):
+        if not self._channel_closing:
+            output.append(self.writer.build(bytes([MSG_CHANNEL_CLOSE]) + encode_uint32(self.channel)))
+        self.closed = True
+
+    def _send_data(self, data, output):
+        """Send shell output as far as the client's window allows, holding back the rest"""
+        self._backlog += data
+        while self._backlog and self.remote_window:
+            size = min(len(self._backlog), self.remote_window, self.remote_max_packet)
+            output.append(self.writer.build(
+                bytes([MSG_CHANNEL_DATA]) + encode_uint32(self.channel) + encode_string(self._backlog[:size])))
+            del self._backlog[:size]
+            self.remote_window -= size
+        if len(self._backlog) > MAX_CHANNEL_BACKLOG:
+            raise SSHProtocolError("Client stopped reading channel output")
+        if self._close_when_drained and not self._backlog:
+            self._close_channel(output)
+
+    def _close_channel(self, output):
+        """exit-status, EOF and CLOSE; the connection ends once the client confirms"""
+        if self._channel_closing:
+            return
+        if self._backlog:
+            self._close_when_drained = True
+            return
+        self._channel_closing = True
+        exit_status = self.shell.exit_status if self.shell else 0
+        output.append(self.writer.build(
+            bytes([MSG_CHANNEL_REQUEST]) + encode_uint32(self.channel) + encode_string('exit-status')
+            + b'\x00' + encode_uint32(exit_status)))
+        output.append(self.writer.build(bytes([MSG_CHANNEL_EOF]) + encode_uint32(self.channel)))
+        output.append(self.writer.build(bytes([MSG_CHANNEL_CLOSE]) + encode_uint32(self.channel)))
+
+    def _disconnect(self, output, reason, description):
+        output.append(self.writer.build(
+            bytes([MSG_DISCONNECT]) + encode_uint32(reason) + encode_string(description) + encode_string('')))
+        self.closed = True
@@ -0,0 +1,264 @@
+"""Database access for the sensor without Flask.
+
+A plain SQLAlchemy Core engine on the same DATABASE_URL the dashboard uses.
+Tables are created on first use rather than at import, so a honeypot process
+only pays for the schema check when it writes its first batch.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from sqlalchemy import create_engine, inspect, insert, update, select, bindparam, func, text
+from sqlalchemy.engine import make_url
+import schema
+import partitions
+import dimensions
+from migrations import stamp_current
+from rollups import apply_attack_rows, apply_country_backfill
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE_URL = 'sqlite:///honeypot.db'
+
+# Relative SQLite paths resolve here, the same instance folder Flask-SQLAlchemy uses
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+# Columns written by the ingest pipeline, in COPY order
+ATTACK_COLUMNS = [
+    'timestamp', 'source_ip', 'source_port', 'username', 'password', 'command',
+    'session_id', 'attack_type', 'country', 'city', 'latitude', 'longitude', 'user_agent'
+]
+
+# The same for attack_log_rows in a normalized database
+ROW_COLUMNS = [f"{name}_id" if name in dimensions.DIMENSION_COLUMNS else name for name in ATTACK_COLUMNS]
+
+def resolve_database_url(url):
+    """Parse a database URL, anchoring relative SQLite files in the instance folder"""
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+            and not url.query.get('uri') and not os.path.isabs(url.database):
+        os.makedirs(INSTANCE_PATH, exist_ok=True)
+        url = url.set(database=os.path.join(INSTANCE_PATH, url.database))
+    return url
+
+def sidecar_path(name):
+    """A local file for every process on this host using DATABASE_URL: next to a SQLite
+    database file, otherwise one per database in the temp directory"""
+    url = storage.url
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+            and not url.query.get('uri'):
+        return f"{os.path.splitext(url.database)[0]}-{name}"
+    digest = hashlib.sha1(url.render_as_string(hide_password=False).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"honeypot-{digest}-{name}")
+
+class Storage:
+    """Lazily created engine plus the attack-log write path"""
+
+    def __init__(self, url, engine_options=None):
+        self.url = resolve_database_url(url)
+        self.engine_options = engine_options or {}
+        self._engine = None
+        self._schema_ready = False
+        self._lock = threading.RLock()
+        self.interner = dimensions.ValueInterner()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = create_engine(self.url, **self.engine_options)
+        return self._engine
+
+    def ensure_schema(self):
+        """Create missing tables once per process; a brand new database is stamped as fully migrated"""
+        if self._schema_ready:
+            return
+        with self._lock:
+            if self._schema_ready:
+                return
+            engine = self.engine
+            fresh_database = not inspect(engine).has_table('attack_logs')
+            if fresh_database and partitions.PARTITION_PERIOD:
+                partitions.create_layout(engine, partitions.PARTITION_PERIOD)
+            elif fresh_database and dimensions.NORMALIZED:
+                dimensions.create_layout(engine)
+            schema.metadata.create_all(engine)
+            if fresh_database:
+                stamp_current(engine)
+                logger.info("Database schema created")
+            else:
+                partitions.create_upcoming(engine)
+            self._schema_ready = True
+
+    def begin(self):
+        """Transaction on a pooled connection (commits on exit)"""
+        self.ensure_schema()
+        return self.engine.begin()
+
+    def connect(self):
+        self.ensure_schema()
+        return self.engine.connect()
+
+    def write_attack_rows(self, rows):
+        """Insert a batch of attack rows and fold them into the rollups in one transaction
+
+        Returns the ids the rows were stored under, in row order.
+        """
+        try:
+            with self.begin() as connection:
+                partitioned = partitions.is_partitioned(connection)
+                table, columns, values = schema.attack_logs, ATTACK_COLUMNS, rows
+                if not partitioned and dimensions.is_normalized(connection):
+                    # Unseen values are stored on a connection of their own before this one writes anything
+                    table, columns = schema.attack_log_rows, ROW_COLUMNS
+                    values = self.interner.normalize_rows(self.engine, rows)
+                if connection.dialect.name == 'postgresql':
+                    if partitioned:
+                        partitions.ensure_partitions(connection, [row['timestamp'] for row in rows])
+                    ids = _copy_attack_rows(connection, values, table, columns)
+                elif partitioned:
+                    ids = partitions.insert_rows(connection, rows)
+                else:
+                    connection.execute(insert(table), values)
+                    # The transaction holds SQLite's write lock, so the batch got consecutive ids
+                    last_id = connection.execute(select(func.max(table.c.id))).scalar()
+                    ids = list(range(last_id - len(rows) + 1, last_id + 1))
+                apply_attack_rows(connection, rows)
+        except Exception:
+            # The layout or a partition may have changed under this process (conversion, retention)
+            partitions.forget(self.engine)
+            dimensions.forget(self.engine)
+            raise
+        return ids
+
+    def backfill_locations(self, resolved):
+        """Fill geo columns of every pending row of each resolved IP ({ip: geo}) and count the
+        new countries in the rollups; returns the (timestamp, source_ip) rows located and the rowcount"""
+        params = [{
+            'b_ip': ip,
+            'b_country': geo.get('country'),
+            'b_city': geo.get('city'),
+            'b_latitude': geo.get('latitude'),
+            'b_longitude': geo.get('longitude')
+        } for ip, geo in resolved.items()]
+
+        with self.begin() as connection:
+            table = _pending_table(connection)
+            # Rows about to be located still have to be counted in the country rollups
+            pending_rows = connection.execute(
+                select(table.c.timestamp, table.c.source_ip).where(
+                    table.c.source_ip.in_(list(resolved)),
+                    _pending(table)
+                )
+            ).all()
+
+            rowcount = 0
+            if pending_rows and table is schema.attack_log_rows:
+                ids = self.interner.intern(self.engine, {
+                    'country': {geo.get('country') for geo in resolved.values()},
+                    'city': {geo.get('city') for geo in resolved.values()}
+                })
+                params = [dict(
+                    values,
+                    b_country=ids['country'].get(values['b_country']),
+                    b_city=ids['city'].get(values['b_city'])
+                ) for values in params]
+            if pending_rows:
+                # Only the partitions holding pending rows, on a partitioned SQLite database
+                since = min(timestamp for timestamp, _ in pending_rows)
+                until = max(timestamp for timestamp, _ in pending_rows) + timedelta(microseconds=1)
+                for partition in partitions.tables_for(connection, since, until):
+                    rowcount += connection.execute(_location_update(partition), params).rowcount
+            apply_country_backfill(
+                connection,
+                ((timestamp, resolved[source_ip].get('country')) for timestamp, source_ip in pending_rows)
+            )
+        return pending_rows, rowcount
+
+    def stored_session_rows(self, session_ids, chunk_size=500):
+        """(session_id, timestamp) of the rows already stored for the given sessions"""
+        table = schema.attack_logs
+        session_ids = list(session_ids)
+        stored = set()
+        with self.connect() as connection:
+            for start in range(0, len(session_ids), chunk_size):
+                stored.update(
+                    (session_id, timestamp) for session_id, timestamp in connection.execute(
+                        select(table.c.session_id, table.c.timestamp).where(
+                            table.c.session_id.in_(session_ids[start:start + chunk_size])
+                        )
+                    )
+                )
+        return stored
+
+    def pending_source_ips(self, limit=1000):
+        """Distinct source IPs that still have rows without geolocation"""
+        with self.connect() as connection:
+            table = _pending_table(connection)
+            rows = connection.execute(
+                select(table.c.source_ip).where(_pending(table)).distinct().limit(limit)
+            ).all()
+        return [row[0] for row in rows]
+
+def _pending_table(connection):
+    """Table to find rows awaiting geolocation in: attack_log_rows when normalized, whose
+    pending-geo index the attack_logs view cannot use"""
+    return schema.attack_log_rows if dimensions.is_normalized(connection) else schema.attack_logs
+
+def _pending(table):
+    # A normalized database keeps the country as a dimension id
+    return (table.c.country_id if 'country_id' in table.c else table.c.country).is_(None)
+
+def _location_update(table):
+    """UPDATE filling the geo columns of one IP's pending rows, run with backfill_locations' params"""
+    country, city = ('country_id', 'city_id') if 'country_id' in table.c else ('country', 'city')
+    return update(table).where(
+        table.c.source_ip == bindparam('b_ip'),
+        _pending(table)
+    ).values({
+        country: bindparam('b_country'),
+        city: bindparam('b_city'),
+        'latitude': bindparam('b_latitude'),
+        'longitude': bindparam('b_longitude')
+    })
+
+def _copy_field(value):
+    """A COPY CSV field: NULL is the bare empty field and every value is quoted, so no captured
+    text (an empty password, a literal \\N) can be read back as NULL"""
+    if value is None:
+        return ''
+    return '"' + str(value).replace('"', '""') + '"'
+
+def _copy_attack_rows(connection, rows, table=schema.attack_logs, columns=ATTACK_COLUMNS):
+    """Load a batch through PostgreSQL COPY, the cheapest bulk path psycopg2 offers; returns the ids"""
+    # COPY reports no ids, so draw them from the column's sequence up front
+    ids = connection.execute(
+        text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+        {'table': table.name, 'count': len(rows)}
+    ).scalars().all()
+    buffer = io.StringIO()
+    for attack_id, row in zip(ids, rows):
+        buffer.write(','.join([str(attack_id)] + [_copy_field(row.get(c)) for c in columns]) + '\n')
+    buffer.seek(0)
+
+    # The DBAPI connection inside the current transaction, so the COPY commits with the rollups
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} (id, {', '.join(columns)}) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+    return ids
+
+# Global instance
+storage = Storage(
+    os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL),
+    engine_options={'pool_recycle': 300, 'pool_pre_ping': True}
+)
@@ -0,0 +1,123 @@
+"""Attack counts over time in fixed-width buckets, bucketed natively by each database.
+
+A series covers whole buckets: from the one holding the start of the window
+through the current one, with empty buckets filled in as zero. Buckets are
+aligned to the epoch (so 1h and 1d buckets start on UTC hours and days) and
+their width is the requested resolution, widened when the window would
+otherwise need more than TIMESERIES_MAX_POINTS of them.
+
+Counting is done by the database with the cheapest bucket expression it has:
+integer division of the Unix time on SQLite, date_trunc on PostgreSQL (epoch
+division for widths it has no unit for). Hour- and day-multiple buckets are
+summed from the rollup tables instead when they are enabled; otherwise rows
+moved to the archive are counted from it.
+"""
+import math
+import os
+import sqlite3
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import Integer, cast, func, select
+import partitions
+import rollups
+
+# Bucket widths in seconds, by the names ?resolution= accepts
+RESOLUTIONS = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+
+# Series longer than this are downsampled to wider buckets
+MAX_POINTS = int(os.environ.get('TIMESERIES_MAX_POINTS', 500))
+
+# PostgreSQL date_trunc units for the widths it can truncate to directly
+DATE_TRUNC_UNITS = {60: 'minute', 3600: 'hour', 86400: 'day'}
+
+# unixepoch() arrived in SQLite 3.38; strftime('%s') is the older spelling
+SQLITE_UNIXEPOCH = sqlite3.sqlite_version_info >= (3, 38)
+
+EPOCH = datetime(1970, 1, 1)
+SECOND = timedelta(seconds=1)
+
+def choose_step(span, resolution=None, max_points=MAX_POINTS):
+    """Bucket width in seconds for a window of `span` seconds
+
+    Starts from the named resolution ('auto' or None: the finest one) and moves
+    to the next coarser one, then to multiples of a day, until the window fits
+    in max_points buckets.
+    """
+    if resolution in (None, 'auto'):
+        step = min(RESOLUTIONS.values())
+    elif resolution in RESOLUTIONS:
+        step = RESOLUTIONS[resolution]
+    else:
+        raise ValueError(f"Unknown resolution {resolution!r}; expected one of {', '.join(RESOLUTIONS)} or auto")
+    for width in sorted(RESOLUTIONS.values()):
+        # A window that starts mid-bucket touches one bucket more than it spans
+        if width >= step and math.ceil(span / width) + 1 <= max_points:
+            return width
+    day = RESOLUTIONS['1d']
+    return day * math.ceil(span / day / max(max_points - 1, 1))
+
+def bucket_expression(dialect, column, step):
+    """SQL for the start of the bucket a timestamp falls in: a timestamp or Unix seconds"""
+    if dialect == 'postgresql':
+        unit = DATE_TRUNC_UNITS.get(step)
+        if unit:
+            return func.date_trunc(unit, column)
+        return cast(func.floor(func.extract('epoch', column) / step), Integer) * step
+    if dialect == 'sqlite':
+        epoch = func.unixepoch(column) if SQLITE_UNIXEPOCH else func.strftime('%s', column)
+        return cast(epoch, Integer) // step * step
+    raise NotImplementedError(f"Time series do not support the {dialect} dialect")
+
+def _seconds(bucket):
+    """Unix seconds of a bucket start as returned by either bucket expression"""
+    if isinstance(bucket, datetime):
+        return (bucket - EPOCH) // SECOND
+    return int(bucket)
+
+def count_rows(connection, step, since, until):
+    """{bucket start in Unix seconds: attacks} counted over attack_logs rows in [since, until)"""
+    # Works for a Connection or an ORM Session
+    dialect = connection.dialect.name if hasattr(connection, 'dialect') else connection.get_bind().dialect.name
+    counts = Counter()
+    # One query per partition overlapping the window when SQLite stores attack_logs partitioned
+    for table in partitions.tables_for(connection, since, until):
+        bucket = bucket_expression(dialect, table.c.timestamp, step).label('bucket')
+        rows = connection.execute(
+            select(bucket, func.count().label('count')).where(
+                table.c.timestamp >= since,
+                table.c.timestamp < until
+            ).group_by('bucket')
+        ).all()
+        for start, count in rows:
+            counts[_seconds(start)] += count
+    return counts
+
+def count_rollups(connection, step, since, until):
+    """{bucket start in Unix seconds: attacks} summed from the hour or day rollups"""
+    granularity = 'day' if step % RESOLUTIONS['1d'] == 0 else 'hour'
+    counts = Counter()
+    for start, attacks in rollups.attack_counts(connection, granularity, since, until):
+        seconds = _seconds(start)
+        counts[seconds - seconds % step] += attacks
+    return counts
+
+def attack_series(connection, hours, resolution=None, now=None, max_points=MAX_POINTS, archive=None):
+    """(step, [(bucket start, attacks)]) covering the last `hours` hours in whole buckets, oldest first"""
+    now = now or datetime.utcnow()
+    step = choose_step(hours * 3600, resolution, max_points)
+    first = _seconds(now - timedelta(hours=hours))
+    first -= first % step
+    last = _seconds(now)
+    last -= last % step
+    since = EPOCH + first * SECOND
+    until = EPOCH + (last + step) * SECOND
+
+    if rollups.ROLLUPS_ENABLED and step % RESOLUTIONS['1h'] == 0:
+        counts = count_rollups(connection, step, since, until)
+    else:
+        counts = count_rows(connection, step, since, until)
+        if archive is not None:
+            # Archived rows are gone from attack_logs; the rollups above still count them
+            counts.update(archive.time_counts(step, since, until, connection))
+
+    return step, [(EPOCH + start * SECOND, counts.get(start, 0)) for start in range(first, last + step, step)]